@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks de LiquiVentas
+=========================
+
+Conjunto de datos sintético con la forma de PDVDATA (Eleventa) en SQLite,
+un backend que imita a isql sobre esos datos y escenarios cronometrados
+de las rutas más pesadas. No necesitan Firebird ni Tk:
+
+    python -m benchmarks generar --datos benchmarks/datos/bench.sqlite --dias 60
+    python -m benchmarks correr --datos benchmarks/datos/bench.sqlite --salida base.json
+    python -m benchmarks comparar benchmarks/resultados/actual.json base.json
+
+Ver `python -m benchmarks --help`.
+"""
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Backend SQLite que imita a isql sobre la réplica sintética de PDVDATA
+=====================================================================
+
+Traduce el dialecto de Firebird que usan las consultas del proyecto
+(``CAST(x AS DATE/TIME)``, ``SELECT FIRST n``, ``CONTAINING``, ``RDB$DATABASE``, ``SET ...``) y
+devuelve la salida con el formato de isql (encabezados, ``====`` y
+``<null>``) para que los parsers existentes funcionen sin cambios.
+
+Se instala con ``core.firebird.usar_backend(BackendSQLite(ruta))``.
+"""
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+_RE_CAST_FECHA = re.compile(r'CAST\(\s*([\w.]+)\s+AS\s+(DATE|TIME)\s*\)', re.IGNORECASE)
+_RE_FIRST = re.compile(r'\bSELECT\s+FIRST\s+(\d+)\s+', re.IGNORECASE)
+_RE_RDB_DATABASE = re.compile(r'\s+FROM\s+RDB\$DATABASE\b', re.IGNORECASE)
+_RE_CONTAINING = re.compile(r"\bCONTAINING\s+('(?:[^']|'')*'|\?)", re.IGNORECASE)
+
+# Sentencias de isql que no son SQL (se ignoran)
+_COMANDOS_ISQL = ('SET ', 'CONNECT ', 'QUIT', 'EXIT', 'COMMIT', 'SHOW ')
+
+
+def traducir_sql(sentencia: str) -> str:
+    """Una sentencia en dialecto Firebird a su equivalente en SQLite."""
+    sql = _RE_CAST_FECHA.sub(lambda m: f'{m.group(2).lower()}({m.group(1)})', sentencia)
+    sql = _RE_CONTAINING.sub(r"LIKE '%' || \1 || '%'", sql)
+    sql = _RE_RDB_DATABASE.sub('', sql)
+    m = _RE_FIRST.search(sql)
+    if m:
+        sql = sql[:m.start()] + 'SELECT ' + sql[m.end():] + f' LIMIT {m.group(1)}'
+    return sql
+
+
+def dividir_sentencias(script: str) -> List[str]:
+    """Separa un script por ';' fuera de comillas y quita los comandos de isql."""
+    sentencias, actual, en_cadena = [], [], False
+    for c in script:
+        if c == "'":
+            en_cadena = not en_cadena
+        if c == ';' and not en_cadena:
+            sentencias.append(''.join(actual))
+            actual = []
+        else:
+            actual.append(c)
+    sentencias.append(''.join(actual))
+    return [s.strip() for s in sentencias
+            if s.strip() and not s.strip().upper().startswith(_COMANDOS_ISQL)]
+
+
+def _valor_isql(valor: Any) -> str:
+    if valor is None:
+        return '<null>'
+    if isinstance(valor, float):
+        return f'{valor:.4f}'
+    return str(valor)
+
+
+def formatear_isql(columnas: Sequence[str], filas: Sequence[Sequence[Any]]) -> str:
+    """Resultado de un SELECT como lo imprime isql con SET HEADING ON."""
+    if not filas:
+        # isql no imprime nada (ni encabezados) si no hay filas
+        return ''
+    textos = [[_valor_isql(v) for v in fila] for fila in filas]
+    numericas = [all(isinstance(f[i], (int, float)) or f[i] is None for f in filas)
+                 for i in range(len(columnas))]
+    anchos = [max([len(c)] + [len(t[i]) for t in textos]) for i, c in enumerate(columnas)]
+
+    def linea(valores):
+        return ' '.join(v.rjust(a) if num else v.ljust(a)
+                        for v, a, num in zip(valores, anchos, numericas)).rstrip()
+
+    partes = ['', linea(columnas), ' '.join('=' * a for a in anchos)]
+    partes += [linea(t) for t in textos]
+    partes.append('')
+    return '\n'.join(partes) + '\n'
+
+
+class _CursorTraducido:
+    """Cursor DB-API que traduce el dialecto Firebird antes de ejecutar."""
+
+    def __init__(self, cursor: sqlite3.Cursor, contar: Callable[[], None]):
+        self._cursor = cursor
+        self._contar = contar
+
+    def execute(self, sql: str, parametros: Sequence[Any] = ()):
+        self._contar()
+        self._cursor.execute(traducir_sql(sql), tuple(parametros))
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class _ConexionTraducida:
+    def __init__(self, conexion: sqlite3.Connection, contar: Callable[[], None]):
+        self._conexion = conexion
+        self._contar = contar
+
+    def cursor(self) -> _CursorTraducido:
+        return _CursorTraducido(self._conexion.cursor(), self._contar)
+
+    def commit(self) -> None:
+        self._conexion.commit()
+
+    def close(self) -> None:
+        self._conexion.close()
+
+
+class BackendSQLite:
+    """
+    Ejecuta los scripts de isql contra la réplica SQLite.
+
+    Args:
+        ruta: archivo generado por benchmarks.datos_sinteticos
+        latencia_s: espera añadida por llamada (simula el arranque de isql y el attach)
+    """
+
+    nombre = 'sqlite'
+
+    def __init__(self, ruta: str, latencia_s: float = 0.0):
+        self.ruta = ruta
+        self.latencia_s = latencia_s
+        self.consultas = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _conexion(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.ruta)
+        return conn
+
+    def ejecutar(self, ruta_fdb: Optional[str], isql_path: Optional[str],
+                 sql: str) -> Tuple[bool, str, str]:
+        """Misma firma y salida que core.firebird.ejecutar_isql (las rutas se ignoran)."""
+        self._contar()
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        salida, errores = [], []
+        cursor = self._conexion().cursor()
+        for sentencia in dividir_sentencias(sql):
+            try:
+                cursor.execute(traducir_sql(sentencia))
+            except sqlite3.Error as e:
+                errores.append(f"Statement failed, SQLSTATE = 42000\n{e}")
+                continue
+            if cursor.description:
+                columnas = [d[0].split('.')[-1].upper() for d in cursor.description]
+                salida.append(formatear_isql(columnas, cursor.fetchall()))
+        stdout = ''.join(salida)
+        return (not errores or bool(stdout)), stdout, '\n'.join(errores)
+
+    def conectar(self) -> _ConexionTraducida:
+        """Conexión DB-API (en lugar de fdb.connect) para utils_devoluciones."""
+        return _ConexionTraducida(sqlite3.connect(self.ruta), self._contar)
+
+    def _contar(self) -> None:
+        with self._lock:
+            self.consultas += 1
+
+    def reiniciar_contador(self) -> int:
+        with self._lock:
+            n, self.consultas = self.consultas, 0
+        return n
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Línea de comandos de los benchmarks
+===================================
+
+Comandos:
+    generar   Crea la réplica sintética de PDVDATA y siembra la base del liquidador.
+    correr    Ejecuta los escenarios y guarda los tiempos en JSON (y opcionalmente
+              los compara contra una corrida base).
+    comparar  Compara dos corridas y marca las regresiones.
+    planes    Recorre las funciones de database_local sobre una base grande generada,
+              corre EXPLAIN QUERY PLAN sobre cada consulta que ejecutan y falla si
+              alguna recorre una tabla completa, no se puede preparar o no se alcanzó.
+
+``correr --grabar`` guarda las respuestas del backend en una grabación
+(core.grabacion) y ``correr --reproducir`` mide los escenarios sirviendo
+una grabación, p. ej. una sesión real capturada con LIQUIVENTAS_GRABAR.
+
+La base del liquidador de los benchmarks vive junto a la réplica
+(``<datos>.liquidador.db``) y se usa a través de LIQUIDADOR_DB, así que
+nunca se toca liquidador_data.db.
+
+Códigos de salida:
+    0  sin regresiones
+    1  hay regresiones, consultas que fallan la revisión de planes (o error general)
+    2  argumentos inválidos
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+from dataclasses import asdict, fields
+from typing import Any, Dict, List
+
+# Agregar el directorio del proyecto al path (igual que liquiventas)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from .datos_sinteticos import Escala  # noqa: E402
+
+SALIDA_OK = 0
+SALIDA_REGRESION = 1
+SALIDA_USO = 2
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+DATOS_DEFAULT = os.path.join(CARPETA, 'datos', 'bench.sqlite')
+RESULTADOS_DEFAULT = os.path.join(CARPETA, 'resultados')
+TOLERANCIA_DEFAULT = 0.25
+MINIMO_MS_DEFAULT = 1.0
+
+
+def _ruta_liquidador(datos: str) -> str:
+    return os.path.splitext(datos)[0] + '.liquidador.db'
+
+
+def _usar_base_liquidador(datos: str):
+    """Apunta database_local a la base de los benchmarks (antes de importarlo)."""
+    os.environ['LIQUIDADOR_DB'] = _ruta_liquidador(datos)
+    with contextlib.redirect_stdout(sys.stderr):   # avisos de inicialización del esquema
+        import database_local
+    return database_local
+
+
+def _escala_de(args) -> Escala:
+    valores = {f.name: getattr(args, f.name) for f in fields(Escala)
+               if getattr(args, f.name, None) is not None}
+    return Escala(**valores)
+
+
+def generar_datos(datos: str, escala: Escala) -> Dict[str, int]:
+    from .datos_sinteticos import generar, sembrar_liquidador
+    carpeta = os.path.dirname(datos)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    for ruta in (datos, _ruta_liquidador(datos)):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    filas = generar(datos, escala)
+    db = _usar_base_liquidador(datos)
+    filas['asignaciones'] = sembrar_liquidador(datos, escala, db)
+    return filas
+
+
+def _muestra(fechas: List[str], n: int, sin_ultima: bool = True) -> List[str]:
+    """n fechas repartidas en el rango (sin la última, que en la réplica tiene el turno abierto)."""
+    candidatas = (fechas[:-1] if sin_ultima else fechas) or fechas
+    if n >= len(candidatas):
+        return candidatas
+    paso = len(candidatas) / n
+    return [candidatas[int(i * paso)] for i in range(n)]
+
+
+def _backend_y_fechas(args):
+    """Backend de la corrida (réplica SQLite o grabación) y las fechas a medir."""
+    from core.grabacion import BackendGrabador, BackendReproductor
+    from .backend_sqlite import BackendSQLite
+    from .datos_sinteticos import leer_escala
+
+    if args.reproducir:
+        if not os.path.exists(args.reproducir):
+            raise ValueError(f"No existe la grabación {args.reproducir}")
+        backend = BackendReproductor(args.reproducir, respetar_duracion=args.respetar_duracion)
+        if not len(backend):
+            raise ValueError(f"La grabación {args.reproducir} está vacía")
+        return backend, None, _muestra(backend.fechas(), args.fechas, sin_ultima=False)
+
+    if not os.path.exists(args.datos):
+        print(f"Generando datos en {args.datos}…", file=sys.stderr)
+        generar_datos(args.datos, _escala_de(args))
+    escala = leer_escala(args.datos)
+    backend = BackendSQLite(args.datos, latencia_s=args.latencia_ms / 1000)
+    if args.grabar:
+        backend = BackendGrabador(args.grabar, backend)
+    return backend, escala, _muestra(escala.fechas(), args.fechas)
+
+
+def correr(args) -> Dict[str, Any]:
+    from core.firebird import usar_backend
+    from .escenarios import ESCENARIOS, Contexto, medir
+
+    backend, escala, fechas = _backend_y_fechas(args)
+    db = _usar_base_liquidador(args.datos)
+
+    anterior = usar_backend(backend)
+    try:
+        ctx = Contexto(backend=backend, db=db, fechas=fechas)
+        resultados = {}
+        for nombre in args.escenario or list(ESCENARIOS):
+            try:
+                resultados[nombre] = r = medir(nombre, ctx, args.repeticiones)
+            except Exception as e:
+                # p. ej. una grabación sin las consultas de ese escenario
+                resultados[nombre] = {'error': f"{type(e).__name__}: {e}"}
+                print(f"{nombre:<22} ✗ {resultados[nombre]['error']}", file=sys.stderr)
+                continue
+            print(f"{nombre:<22} mediana {r['mediana_ms']:>10.2f} ms  p95 {r['p95_ms']:>10.2f} ms  "
+                  f"consultas {r['consultas']}", file=sys.stderr)
+    finally:
+        usar_backend(anterior)
+    faltantes = getattr(backend, 'faltantes', None)
+    if faltantes:
+        print(f"⚠️ {len(faltantes)} consultas no estaban en la grabación", file=sys.stderr)
+    return {
+        'creado_en': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'backend': backend.nombre,
+        'grabacion': args.reproducir,
+        'latencia_ms': args.latencia_ms,
+        'escala': asdict(escala) if escala else None,
+        'fechas': ctx.fechas,
+        'escenarios': resultados,
+    }
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any], tolerancia: float = TOLERANCIA_DEFAULT,
+             minimo_ms: float = MINIMO_MS_DEFAULT) -> List[Dict[str, Any]]:
+    """
+    Compara la mediana y las consultas de cada escenario presente en ambas corridas.
+    Es regresión si la mediana crece más que `tolerancia` (y más de `minimo_ms`,
+    para no marcar ruido) o si el escenario hace más consultas que antes.
+    """
+    filas = []
+    for nombre, r in actual.get('escenarios', {}).items():
+        b = base.get('escenarios', {}).get(nombre)
+        if not b or 'error' in b or 'error' in r:
+            continue
+        ratio = r['mediana_ms'] / b['mediana_ms'] if b['mediana_ms'] else 1.0
+        regresion = ((ratio > 1 + tolerancia and r['mediana_ms'] - b['mediana_ms'] > minimo_ms)
+                     or r['consultas'] > b['consultas'])
+        filas.append({'escenario': nombre, 'base_ms': b['mediana_ms'], 'actual_ms': r['mediana_ms'],
+                      'ratio': round(ratio, 3), 'consultas_base': b['consultas'],
+                      'consultas_actual': r['consultas'], 'regresion': regresion})
+    return filas
+
+
+def _imprimir_comparacion(filas: List[Dict[str, Any]]) -> None:
+    print(f"{'escenario':<22} {'base ms':>10} {'actual ms':>10} {'ratio':>7} {'consultas':>12}")
+    for f in filas:
+        marca = '  ✗ REGRESIÓN' if f['regresion'] else ''
+        print(f"{f['escenario']:<22} {f['base_ms']:>10.2f} {f['actual_ms']:>10.2f} {f['ratio']:>7.2f} "
+              f"{f['consultas_base']:>5} → {f['consultas_actual']:<4}{marca}")
+
+
+def _leer_json(ruta: str) -> Dict[str, Any]:
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def revisar_planes(args) -> int:
+    """Comando planes: base temporal nueva, llenado, recorrido con EXPLAIN QUERY PLAN y resumen."""
+    import tempfile
+    from .planes import revisar_modulo
+
+    if 'database_local' in sys.modules:
+        raise ValueError("database_local ya está importado sobre otra base")
+    with tempfile.TemporaryDirectory() as carpeta:
+        os.environ['LIQUIDADOR_DB'] = os.path.join(carpeta, 'planes.liquidador.db')
+        with contextlib.redirect_stdout(sys.stderr):
+            import database_local
+        hallazgos, errores = revisar_modulo(database_local, args.filas)
+
+    for h in hallazgos:
+        c = h.consulta
+        if args.verbose and h.plan:
+            print(f"{c.funcion}:{c.linea}  {c.sql}")
+            for detalle in h.plan:
+                print(f"    {detalle}")
+        if h.sin_revisar:
+            print(f"✗ {c.funcion}:{c.linea}  consulta armada en ejecución que el recorrido no alcanzó "
+                  f"(ver benchmarks.planes.VALORES y LLAMADAS)")
+        elif h.error:
+            print(f"✗ {c.funcion}:{c.linea}  no se pudo preparar: {h.error}\n    {c.sql}")
+        elif h.recorridos:
+            print(f"✗ {c.funcion}:{c.linea}  {'; '.join(h.recorridos)}\n    {c.sql}")
+    if args.verbose:
+        for funcion, error in errores:
+            print(f"⚠️ {funcion}: {error}")
+    fallas = sum(1 for h in hallazgos if h.falla)
+    print(f"{len(hallazgos)} consultas revisadas con {args.filas} filas por tabla "
+          f"({len(errores)} llamadas del recorrido con error), {fallas} recorren tablas completas, "
+          f"no se pudieron preparar o no se alcanzaron", file=sys.stderr)
+    return SALIDA_REGRESION if fallas else SALIDA_OK
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    from .escenarios import ESCENARIOS
+
+    parser = argparse.ArgumentParser(prog='benchmarks',
+                                     description='Benchmarks de LiquiVentas con datos sintéticos.')
+    escala = argparse.ArgumentParser(add_help=False)
+    escala.add_argument('--datos', default=DATOS_DEFAULT, help=f'réplica SQLite (default {DATOS_DEFAULT})')
+    escala.add_argument('--tickets-por-dia', dest='tickets_por_dia', type=int)
+    escala.add_argument('--dias', type=int)
+    escala.add_argument('--repartidores', type=int)
+    escala.add_argument('--turnos-por-dia', dest='turnos_por_dia', type=int)
+    escala.add_argument('--ratio-cancelacion', dest='ratio_cancelacion', type=float)
+    escala.add_argument('--ratio-credito', dest='ratio_credito', type=float)
+    escala.add_argument('--ratio-dev-parcial', dest='ratio_dev_parcial', type=float)
+    escala.add_argument('--fecha-inicial', dest='fecha_inicial')
+    escala.add_argument('--semilla', type=int)
+
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('generar', parents=[escala], help='crear la réplica sintética')
+
+    run = sub.add_parser('correr', parents=[escala],
+                         help='ejecutar los escenarios (genera los datos si no existen)')
+    run.add_argument('--escenario', action='append', choices=list(ESCENARIOS),
+                     help='solo este escenario (repetible; default todos)')
+    run.add_argument('--repeticiones', type=int, default=5)
+    run.add_argument('--fechas', type=int, default=3, help='fechas medidas por repetición (default 3)')
+    run.add_argument('--latencia-ms', dest='latencia_ms', type=float, default=0.0,
+                     help='espera por llamada al backend, para simular el costo de isql')
+    run.add_argument('--grabar', metavar='GRABACION',
+                     help='guardar las respuestas del backend (gzip de líneas JSON)')
+    run.add_argument('--reproducir', metavar='GRABACION',
+                     help='medir sirviendo una grabación en lugar de la réplica SQLite')
+    run.add_argument('--respetar-duracion', dest='respetar_duracion', action='store_true',
+                     help='al reproducir, esperar lo que tardó cada consulta original')
+    run.add_argument('--salida', help=f'JSON de resultados (default {RESULTADOS_DEFAULT}/<fecha>.json)')
+    run.add_argument('--comparar', metavar='BASE', help='corrida base contra la que comparar')
+    run.add_argument('--tolerancia', type=float, default=TOLERANCIA_DEFAULT)
+
+    planes = sub.add_parser('planes', help='revisar los planes de consulta de database_local')
+    planes.add_argument('--filas', type=int, default=20000, help='filas por tabla (default 20000)')
+    planes.add_argument('-v', '--verbose', action='store_true', help='mostrar el plan de cada consulta')
+
+    cmp_ = sub.add_parser('comparar', help='comparar dos corridas')
+    cmp_.add_argument('actual')
+    cmp_.add_argument('base')
+    cmp_.add_argument('--tolerancia', type=float, default=TOLERANCIA_DEFAULT)
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    try:
+        args = construir_parser().parse_args(argv)
+    except SystemExit as e:
+        return SALIDA_USO if e.code else SALIDA_OK
+
+    if args.comando == 'generar':
+        filas = generar_datos(args.datos, _escala_de(args))
+        print(json.dumps(filas, indent=2))
+        return SALIDA_OK
+
+    if args.comando == 'planes':
+        try:
+            return revisar_planes(args)
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return SALIDA_REGRESION
+
+    if args.comando == 'comparar':
+        filas = comparar(_leer_json(args.actual), _leer_json(args.base), args.tolerancia)
+        _imprimir_comparacion(filas)
+        return SALIDA_REGRESION if any(f['regresion'] for f in filas) else SALIDA_OK
+
+    if args.grabar and args.reproducir:
+        print("--grabar y --reproducir son excluyentes", file=sys.stderr)
+        return SALIDA_USO
+    try:
+        resultado = correr(args)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return SALIDA_REGRESION
+    salida = args.salida or os.path.join(RESULTADOS_DEFAULT, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    carpeta = os.path.dirname(salida)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"Resultados en {salida}", file=sys.stderr)
+
+    if args.comparar:
+        filas = comparar(resultado, _leer_json(args.comparar), args.tolerancia)
+        _imprimir_comparacion(filas)
+        if any(f['regresion'] for f in filas):
+            return SALIDA_REGRESION
+    return SALIDA_OK
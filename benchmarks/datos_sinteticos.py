@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de datos sintéticos con la forma de PDVDATA (Eleventa)
+================================================================
+
+Crea una base SQLite con las tablas y columnas de Firebird que consultan
+la carga del día, el corte, la auditoría y la detección de bugs:
+VENTATICKETS, VENTATICKETS_ARTICULOS, DEVOLUCIONES, DEVOLUCIONES_ARTICULOS,
+TURNOS, CORTE_MOVIMIENTOS, MOVIMIENTOS y FACTURAS. La escala (tickets por día, días, repartidores, proporción
+de cancelaciones, créditos y devoluciones parciales) es configurable y la
+generación es determinista para una misma semilla.
+
+Incluye los casos que el código trata aparte: NOMBRE de varias palabras,
+"Ticket N"/MOSTRADOR, canceladas en otro día, turno abierto y artículos
+duplicados en CORTE_MOVIMIENTOS (bug de Eleventa).
+"""
+import json
+import random
+import sqlite3
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+ESQUEMA = """
+CREATE TABLE TURNOS (
+    ID INTEGER PRIMARY KEY,
+    INICIO_EN TIMESTAMP,
+    TERMINO_EN TIMESTAMP,
+    ID_CAJERO INTEGER,
+    DINERO_INICIAL NUMERIC(18, 2),
+    VENTAS_EFECTIVO NUMERIC(18, 2),
+    ABONOS_EFECTIVO NUMERIC(18, 2),
+    VENTAS_TARJETA NUMERIC(18, 2),
+    VENTAS_CREDITO NUMERIC(18, 2),
+    VENTAS_VALES NUMERIC(18, 2),
+    DEVOLUCIONES_VENTAS_EFECTIVO NUMERIC(18, 2),
+    DEVOLUCIONES_VENTAS_CREDITO NUMERIC(18, 2),
+    DEVOLUCIONES_VENTAS_TARJETA NUMERIC(18, 2),
+    DEVOLUCIONES_VENTAS_VALES NUMERIC(18, 2),
+    ACUMULADO_GANANCIA NUMERIC(18, 2)
+);
+CREATE TABLE VENTATICKETS (
+    ID INTEGER PRIMARY KEY,
+    TURNO_ID INTEGER,
+    FOLIO INTEGER,
+    NOMBRE VARCHAR(100),
+    SUBTOTAL NUMERIC(18, 2),
+    TOTAL NUMERIC(18, 2),
+    ESTA_CANCELADO CHAR(1),
+    CREDITO SMALLINT,
+    TOTAL_CREDITO NUMERIC(18, 2),
+    CREADO_EN TIMESTAMP,
+    VENDIDO_EN TIMESTAMP
+);
+CREATE TABLE VENTATICKETS_ARTICULOS (
+    ID INTEGER PRIMARY KEY,
+    TICKET_ID INTEGER,
+    PRODUCTO_NOMBRE VARCHAR(100),
+    CANTIDAD NUMERIC(18, 3),
+    PRECIO_FINAL NUMERIC(18, 2)
+);
+CREATE TABLE DEVOLUCIONES (
+    ID INTEGER PRIMARY KEY,
+    TURNO_ID INTEGER,
+    TICKET_ID INTEGER,
+    TIPO_DEVOLUCION CHAR(1),
+    PAGADO_EN TIMESTAMP,
+    DEVUELTO_EN TIMESTAMP,
+    CAJERO VARCHAR(50),
+    CAJA VARCHAR(50),
+    TOTAL_DEVUELTO NUMERIC(18, 2)
+);
+CREATE TABLE DEVOLUCIONES_ARTICULOS (
+    ID INTEGER PRIMARY KEY,
+    DEVOLUCION_ID INTEGER,
+    TICKET_ID INTEGER,
+    CODIGO_PRODUCTO VARCHAR(30),
+    DESCRIPCION_PRODUCTO VARCHAR(100),
+    CANTIDAD_DEVUELTA NUMERIC(18, 3),
+    DINERO_DEVUELTO NUMERIC(18, 2)
+);
+CREATE TABLE CORTE_MOVIMIENTOS (
+    ID INTEGER PRIMARY KEY,
+    ID_TURNO INTEGER,
+    TIPO VARCHAR(30),
+    MONTO NUMERIC(18, 2),
+    DESCRIPCION VARCHAR(200)
+);
+CREATE TABLE MOVIMIENTOS (
+    ID INTEGER PRIMARY KEY,
+    TIPO CHAR(1),
+    MONTO NUMERIC(18, 2),
+    COMENTARIOS VARCHAR(200),
+    CUANDO_FUE TIMESTAMP
+);
+CREATE TABLE FACTURAS (
+    ID INTEGER PRIMARY KEY,
+    FOLIO INTEGER,
+    CLIENTE VARCHAR(100),
+    SUBTOTAL NUMERIC(18, 2),
+    DESCUENTO NUMERIC(18, 2),
+    TOTAL NUMERIC(18, 2),
+    FORMAPAGO VARCHAR(20),
+    FECHA TIMESTAMP,
+    CANCELADO SMALLINT,
+    CANCELADO_FECHA TIMESTAMP,
+    VENDEDOR VARCHAR(50)
+);
+CREATE INDEX IDX_VENTATICKETS_TURNO ON VENTATICKETS (TURNO_ID);
+CREATE INDEX IDX_VENTATICKETS_CREADO ON VENTATICKETS (CREADO_EN);
+CREATE INDEX IDX_VT_ARTICULOS_TICKET ON VENTATICKETS_ARTICULOS (TICKET_ID);
+CREATE INDEX IDX_DEVOLUCIONES_TICKET ON DEVOLUCIONES (TICKET_ID);
+CREATE INDEX IDX_DEVOLUCIONES_TURNO ON DEVOLUCIONES (TURNO_ID);
+CREATE INDEX IDX_DEV_ARTICULOS_DEVOLUCION ON DEVOLUCIONES_ARTICULOS (DEVOLUCION_ID);
+CREATE INDEX IDX_CORTE_MOV_TURNO ON CORTE_MOVIMIENTOS (ID_TURNO);
+CREATE TABLE BENCH_META (CLAVE TEXT PRIMARY KEY, VALOR TEXT);
+"""
+
+CLIENTES = (
+    'ABARROTES LA ESPERANZA', 'MISCELANEA EL SOL', 'MARIA LOPEZ HERNANDEZ', 'TIENDA DON PEPE',
+    'JUAN CARLOS RAMIREZ', 'CREMERIA LA VAQUITA', 'DEPOSITO SAN JUDAS', 'FRUTERIA LOS ARCOS',
+    'ROSA MARTINEZ', 'SUPER 2000', 'ABARROTES GUADALUPE', 'MINISUPER LA PRIMAVERA',
+    'LUIS ALBERTO GOMEZ', 'TORTILLERIA LA GUERA', 'CARNICERIA EL TORO', 'TIENDITA DE LA ESQUINA',
+)
+CAJEROS = ('ADMIN', 'CAJERO 1', 'CAJERO 2')
+PRODUCTOS = (
+    ('7501000111', 'ACEITE 1 LT', 38.5), ('7501000222', 'ARROZ 1 KG', 27.0),
+    ('7501000333', 'FRIJOL NEGRO 1 KG', 41.0), ('7501000444', 'AZUCAR ESTANDAR 1 KG', 32.0),
+    ('7501000555', 'HARINA DE MAIZ 1 KG', 22.5), ('7501000666', 'REFRESCO COLA 2 LT', 36.0),
+)
+REPARTIDORES = ('JUAN', 'PEDRO', 'LUIS', 'MARCO', 'RAUL', 'ANDRES', 'JOSE', 'MIGUEL',
+                'CARLOS', 'JAVIER', 'OSCAR', 'HUGO')
+
+
+@dataclass
+class Escala:
+    """Parámetros del conjunto de datos."""
+    tickets_por_dia: int = 300
+    dias: int = 30
+    repartidores: int = 6
+    ratio_cancelacion: float = 0.03
+    ratio_credito: float = 0.15
+    ratio_dev_parcial: float = 0.02
+    ratio_mostrador: float = 0.2
+    ratio_duplicados: float = 0.1      # de las canceladas, cuántas quedan duplicadas en CORTE_MOVIMIENTOS
+    turnos_por_dia: int = 2
+    fecha_inicial: str = '2026-09-01'
+    semilla: int = 1234
+
+    def fechas(self) -> List[str]:
+        inicio = date.fromisoformat(self.fecha_inicial)
+        return [(inicio + timedelta(days=i)).isoformat() for i in range(self.dias)]
+
+    def nombres_repartidores(self) -> List[str]:
+        return [REPARTIDORES[i % len(REPARTIDORES)] + ('' if i < len(REPARTIDORES) else f' {i}')
+                for i in range(self.repartidores)]
+
+
+def _ts(dia: str, minuto: int) -> str:
+    return (datetime.fromisoformat(dia) + timedelta(minutes=minuto)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _monto(rnd: random.Random, minimo: float, maximo: float) -> float:
+    return round(rnd.uniform(minimo, maximo), 2)
+
+
+def generar(ruta: str, escala: Escala) -> Dict[str, int]:
+    """Crea (o reemplaza) la réplica en `ruta`. Retorna el número de filas por tabla."""
+    rnd = random.Random(escala.semilla)
+    conn = sqlite3.connect(ruta)
+    try:
+        tablas = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        for tabla in tablas:
+            conn.execute(f'DROP TABLE IF EXISTS {tabla}')
+        conn.executescript(ESQUEMA)
+
+        fechas = escala.fechas()
+        turnos, tickets, devoluciones, articulos, corte_mov, movimientos = [], [], [], [], [], []
+        ids = {'turno': 0, 'ticket': 0, 'dev': 0, 'art': 0, 'cm': 0, 'mov': 0}
+        folio = 10000
+        minutos_turno = (13 * 60) // max(1, escala.turnos_por_dia)   # de 08:00 a 21:00
+
+        def siguiente(clave: str) -> int:
+            ids[clave] += 1
+            return ids[clave]
+
+        # turno_id por (fecha, número de turno) para registrar devoluciones de otro día
+        turnos_dia: Dict[str, List[int]] = {}
+        acumulados: Dict[int, Dict[str, float]] = {}
+        for d, fecha in enumerate(fechas):
+            turnos_dia[fecha] = []
+            for t in range(escala.turnos_por_dia):
+                tid = siguiente('turno')
+                inicio = 8 * 60 + t * minutos_turno
+                ultimo = d == len(fechas) - 1 and t == escala.turnos_por_dia - 1
+                turnos.append([tid, _ts(fecha, inicio), None if ultimo else _ts(fecha, inicio + minutos_turno),
+                               1 + t % len(CAJEROS), 500.0])
+                turnos_dia[fecha].append(tid)
+                acumulados[tid] = {'efectivo': 0.0, 'credito': 0.0, 'dev_efectivo': 0.0,
+                                   'dev_credito': 0.0, 'ganancia': 0.0}
+
+        def registrar_devolucion(ticket, tipo: str, fecha_dev: str, monto: float) -> int:
+            tid = rnd.choice(turnos_dia[fecha_dev])
+            did = siguiente('dev')
+            devuelto_en = _ts(fecha_dev, 8 * 60 + rnd.randrange(13 * 60))
+            devoluciones.append([did, tid, ticket[0], tipo, devuelto_en, devuelto_en,
+                                 rnd.choice(CAJEROS), 'CAJA 1', monto])
+            campo = 'dev_credito' if ticket[7] else 'dev_efectivo'
+            acumulados[tid][campo] += monto
+            corte_mov.append([siguiente('cm'), tid, 'Devolucion', monto,
+                              f"Devolucion ticket #{ticket[2]}"])
+            return did
+
+        for d, fecha in enumerate(fechas):
+            for _ in range(escala.tickets_por_dia):
+                folio += 1
+                t = rnd.randrange(escala.turnos_por_dia)
+                tid = turnos_dia[fecha][t]
+                minuto = 8 * 60 + t * minutos_turno + rnd.randrange(minutos_turno)
+                if rnd.random() < escala.ratio_mostrador:
+                    nombre = rnd.choice((f'Ticket {folio}', 'MOSTRADOR'))
+                else:
+                    nombre = rnd.choice(CLIENTES)
+                total = _monto(rnd, 45, 3500)
+                credito = 1 if nombre in CLIENTES and rnd.random() < escala.ratio_credito else 0
+                creado = _ts(fecha, minuto)
+                ticket = [siguiente('ticket'), tid, folio, nombre, total, total, 'f',
+                          credito, total if credito else 0.0, creado, creado]
+                tickets.append(ticket)
+                acumulados[tid]['credito' if credito else 'efectivo'] += total
+                acumulados[tid]['ganancia'] += round(total * 0.22, 2)
+
+                dev_parcial = rnd.random() < escala.ratio_dev_parcial
+                devuelto = 0.0
+                if dev_parcial:
+                    codigo, descripcion, precio = rnd.choice(PRODUCTOS)
+                    cantidad = float(rnd.randint(1, 3))
+                    monto = min(round(precio * cantidad, 2), round(total / 2, 2))
+                    did = registrar_devolucion(ticket, 'P', fecha, monto)
+                    articulos.append([siguiente('art'), did, ticket[0], codigo, descripcion,
+                                      cantidad, monto])
+                    devuelto = monto
+
+                if rnd.random() < escala.ratio_cancelacion:
+                    ticket[6] = 't'
+                    # 30% se cancelan otro día (hasta 3 días después, dentro del rango)
+                    fecha_c = fecha
+                    if rnd.random() < 0.3:
+                        fecha_c = fechas[min(len(fechas) - 1, d + rnd.randint(1, 3))]
+                    registrar_devolucion(ticket, 'C', fecha_c, round(total - devuelto, 2))
+                    if rnd.random() < escala.ratio_duplicados:
+                        # Bug de Eleventa: al cancelar se vuelve a registrar la dev. parcial
+                        # (o el artículo) en CORTE_MOVIMIENTOS y TURNOS lo suma
+                        tid_c = devoluciones[-1][1]
+                        monto_dup = devuelto or corte_mov[-1][3]
+                        corte_mov.append([siguiente('cm'), tid_c, 'Devolucion', monto_dup,
+                                          f"Devolucion ticket #{folio}"])
+                        acumulados[tid_c]['dev_efectivo'] += monto_dup
+
+            for tid in turnos_dia[fecha]:
+                for tipo in ('Entrada', 'Salida'):
+                    for _ in range(rnd.randint(0, 2)):
+                        corte_mov.append([siguiente('cm'), tid, tipo, _monto(rnd, 50, 800),
+                                          f"{tipo} de efectivo"])
+            for _ in range(rnd.randint(1, 4)):
+                tipo = rnd.choice('ES')
+                movimientos.append([siguiente('mov'), tipo, _monto(rnd, 50, 1500),
+                                    'PAGO PROVEEDOR' if tipo == 'S' else 'FONDO EXTRA',
+                                    _ts(fecha, 8 * 60 + rnd.randrange(13 * 60))])
+
+        filas_turnos = []
+        for tid, inicio, termino, cajero, fondo in turnos:
+            a = acumulados[tid]
+            filas_turnos.append([tid, inicio, termino, cajero, fondo,
+                                 round(a['efectivo'], 2), 0.0, 0.0, round(a['credito'], 2), 0.0,
+                                 round(a['dev_efectivo'], 2), round(a['dev_credito'], 2), 0.0, 0.0,
+                                 round(a['ganancia'], 2)])
+
+        conn.executemany('INSERT INTO TURNOS VALUES (' + ','.join('?' * 15) + ')', filas_turnos)
+        conn.executemany('INSERT INTO VENTATICKETS VALUES (' + ','.join('?' * 11) + ')', tickets)
+        # Líneas de artículos con su propio generador: no altera el resto de los datos
+        rnd_art = random.Random(escala.semilla + 1)
+        lineas = []
+        for t in tickets:
+            for codigo, descripcion, precio in rnd_art.sample(PRODUCTOS, rnd_art.randint(1, 4)):
+                lineas.append([len(lineas) + 1, t[0], descripcion, float(rnd_art.randint(1, 12)), precio])
+        conn.executemany('INSERT INTO VENTATICKETS_ARTICULOS VALUES (?,?,?,?,?)', lineas)
+        conn.executemany('INSERT INTO DEVOLUCIONES VALUES (' + ','.join('?' * 9) + ')', devoluciones)
+        conn.executemany('INSERT INTO DEVOLUCIONES_ARTICULOS VALUES (' + ','.join('?' * 7) + ')', articulos)
+        conn.executemany('INSERT INTO CORTE_MOVIMIENTOS VALUES (?,?,?,?,?)', corte_mov)
+        conn.executemany('INSERT INTO MOVIMIENTOS VALUES (?,?,?,?,?)', movimientos)
+        # FACTURAS (auditoría) repite los tickets con la forma de pago y la fecha de cancelación
+        cancelado_en = {d[2]: d[5] for d in devoluciones if d[3] == 'C'}
+        facturas = [[t[0], t[2], t[3], t[4], 0.0, t[5], 'CREDITO' if t[7] else 'EFECTIVO', t[9],
+                     1 if t[6] == 't' else 0, cancelado_en.get(t[0]), CAJEROS[t[1] % len(CAJEROS)]]
+                    for t in tickets]
+        conn.executemany('INSERT INTO FACTURAS VALUES (' + ','.join('?' * 11) + ')', facturas)
+        conn.execute("INSERT INTO BENCH_META VALUES ('escala', ?)", (json.dumps(asdict(escala)),))
+        conn.commit()
+        return {'TURNOS': len(filas_turnos), 'VENTATICKETS': len(tickets),
+                'VENTATICKETS_ARTICULOS': len(lineas),
+                'DEVOLUCIONES': len(devoluciones), 'DEVOLUCIONES_ARTICULOS': len(articulos),
+                'CORTE_MOVIMIENTOS': len(corte_mov), 'MOVIMIENTOS': len(movimientos),
+                'FACTURAS': len(facturas)}
+    finally:
+        conn.close()
+
+
+def leer_escala(ruta: str) -> Escala:
+    """La escala con la que se generó una réplica."""
+    conn = sqlite3.connect(ruta)
+    try:
+        row = conn.execute("SELECT VALOR FROM BENCH_META WHERE CLAVE = 'escala'").fetchone()
+    finally:
+        conn.close()
+    return Escala(**json.loads(row[0])) if row else Escala()
+
+
+def sembrar_liquidador(ruta: str, escala: Escala, db) -> int:
+    """
+    Llena la base del liquidador (database_local) con asignaciones y gastos
+    coherentes con la réplica: cada cliente va siempre con el mismo repartidor.
+    Retorna el número de asignaciones.
+    """
+    reps = escala.nombres_repartidores()
+    rnd = random.Random(escala.semilla + 1)
+    rep_cliente = {c: reps[i % len(reps)] for i, c in enumerate(CLIENTES)}
+    origen = sqlite3.connect(ruta)
+    try:
+        filas = origen.execute(
+            "SELECT date(CREADO_EN), FOLIO, NOMBRE FROM VENTATICKETS ORDER BY ID").fetchall()
+    finally:
+        origen.close()
+    asignaciones = [(fecha, folio, rep_cliente[nombre]) for fecha, folio, nombre in filas
+                    if nombre in rep_cliente]
+
+    conn = db.get_connection()
+    try:
+        conn.execute('DELETE FROM asignaciones')
+        conn.execute('DELETE FROM gastos')
+        conn.executemany('INSERT INTO asignaciones (fecha, folio, repartidor) VALUES (?, ?, ?)',
+                         asignaciones)
+        conn.executemany(
+            'INSERT INTO gastos (fecha, repartidor, concepto, monto, observaciones) VALUES (?, ?, ?, ?, ?)',
+            [(fecha, rep, rnd.choice(('GASOLINA', 'COMIDA', 'CASETAS')), _monto(rnd, 50, 400), '')
+             for fecha in escala.fechas() for rep in reps])
+        conn.commit()
+    finally:
+        conn.close()
+    return len(asignaciones)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Escenarios cronometrados
+========================
+
+Cada escenario ejecuta una ruta real del proyecto (sin Tk) contra el
+backend instalado en core.firebird: carga del día, refresco de la
+liquidación, exportación del reporte, pestaña de créditos, corte de caja,
+auditoría, productos de la pestaña de descuentos y detección de bugs de
+Eleventa. Se mide cada repetición por
+separado y se cuentan las consultas que llegan al backend.
+"""
+import contextlib
+import io
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class Contexto:
+    """Estado compartido por los escenarios de una corrida."""
+    backend: Any
+    db: Any
+    fechas: List[str]
+    cache: Dict[str, Any] = field(default_factory=dict)
+
+    def ejecutar_sql(self, sql: str):
+        from core.firebird import ejecutar_sql
+        return ejecutar_sql('', '', sql)
+
+    def dia(self, fecha: str):
+        """VentasDia de una fecha (cargada una vez, fuera del tiempo medido)."""
+        if fecha not in self.cache:
+            from core.day_state import consultar_estado_dia
+            from core.liquidacion import ventas_desde_estado
+            self.cache[fecha] = ventas_desde_estado(consultar_estado_dia(self.ejecutar_sql, fecha), self.db)
+        return self.cache[fecha]
+
+
+def carga_dia(ctx: Contexto, fecha: str) -> None:
+    from core.day_state import consultar_estado_dia
+    consultar_estado_dia(ctx.ejecutar_sql, fecha)
+
+
+def refresco_liquidacion(ctx: Contexto, fecha: str) -> None:
+    from core.liquidacion import LiquidacionEngine
+    dia = ctx.dia(fecha)
+    motor = ctx.cache.setdefault(('motor', fecha), LiquidacionEngine(lambda _fecha: dia, ctx.db))
+    motor.invalidar(fecha)
+    motor.calcular_todos(fecha)
+
+
+def exportar_reporte(ctx: Contexto, fecha: str) -> None:
+    from core.reporte import construir_libro, datos_reporte, texto_reporte
+    dia = ctx.dia(fecha)
+    datos = datos_reporte(fecha, dia.ventas, ctx.db)
+    texto_reporte(datos, fecha)
+    try:
+        libro = construir_libro(datos, fecha)
+    except ImportError:
+        return  # sin openpyxl solo se mide el reporte de texto
+    libro.save(io.BytesIO())
+
+
+def creditos(ctx: Contexto, fecha: str) -> None:
+    from core.creditos import consultar_creditos_eleventa
+    consultar_creditos_eleventa(ctx.ejecutar_sql, ctx.db)
+
+
+def corte(ctx: Contexto, fecha: str) -> None:
+    from corte_cajero import CorteCajeroManager
+    CorteCajeroManager(db_path='', isql_path='').obtener_corte_dia(fecha)
+
+
+def auditoria(ctx: Contexto, fecha: str) -> None:
+    from core.auditoria import obtener_datos_auditoria
+    obtener_datos_auditoria(ctx.ejecutar_sql, fecha)
+
+
+def productos_descuentos(ctx: Contexto, fecha: str) -> None:
+    """Precarga del día y recorrido de las facturas como en la pestaña de descuentos."""
+    from core.productos_dia import CacheProductos, precargar_productos_dia, productos_factura
+    cache = CacheProductos()
+    precargar_productos_dia(ctx.ejecutar_sql, fecha, cache)
+    for venta in ctx.dia(fecha).ventas[:50]:
+        productos_factura(ctx.ejecutar_sql, venta['folio'], cache)
+
+
+def deteccion_bugs(ctx: Contexto, fecha: str) -> None:
+    from utils_devoluciones import detectar_bugs_devoluciones
+    detectar_bugs_devoluciones(fecha)
+
+
+ESCENARIOS: Dict[str, Callable[[Contexto, str], None]] = {
+    'carga_dia': carga_dia,
+    'refresco_liquidacion': refresco_liquidacion,
+    'exportar_reporte': exportar_reporte,
+    'creditos': creditos,
+    'corte': corte,
+    'auditoria': auditoria,
+    'productos_descuentos': productos_descuentos,
+    'deteccion_bugs': deteccion_bugs,
+}
+
+# Los créditos no dependen de la fecha: una ejecución por repetición
+_SIN_FECHA = {'creditos'}
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+
+def medir(nombre: str, ctx: Contexto, repeticiones: int = 5,
+          fechas: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Ejecuta un escenario y retorna sus estadísticas en milisegundos."""
+    escenario = ESCENARIOS[nombre]
+    fechas = fechas or ctx.fechas
+    if nombre in _SIN_FECHA:
+        fechas = fechas[:1]
+    tiempos, consultas = [], 0
+    # Los módulos del proyecto imprimen avisos; no deben ensuciar la medición
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        for fecha in fechas:           # calentamiento (y carga de la caché de días)
+            escenario(ctx, fecha)
+        for _ in range(repeticiones):
+            ctx.backend.reiniciar_contador()
+            inicio = time.perf_counter()
+            for fecha in fechas:
+                escenario(ctx, fecha)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas = ctx.backend.reiniciar_contador()
+    return {
+        'repeticiones': repeticiones,
+        'fechas': len(fechas),
+        'consultas': consultas,
+        'min_ms': round(min(tiempos), 3),
+        'mediana_ms': round(statistics.median(tiempos), 3),
+        'p95_ms': round(_percentil(tiempos, 0.95), 3),
+        'max_ms': round(max(tiempos), 3),
+    }
@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+"""
+Revisión de planes de consulta de database_local
+================================================
+
+Llena una base del liquidador con muchas filas generadas (y ANALYZE) y
+llama a cada función pública de database_local con argumentos de ejemplo
+(``recorrer_funciones``). Cada SQL que llega a ``execute``/``executemany``
+se captura tal como se ejecuta y se planea con ``EXPLAIN QUERY PLAN`` en la
+misma conexión, con sus parámetros, sus tablas temporales y los archivos
+anuales adjuntos. El recorrido pasa dos veces por el mismo día: antes y
+después de archivarlo.
+
+Falla si una consulta:
+    - recorre una tabla completa,
+    - SQLite no la puede preparar,
+    - se arma en tiempo de ejecución (f-string, variable) y el recorrido no
+      la alcanzó: hay que darle argumentos en ``VALORES`` o ``LLAMADAS``.
+
+Las consultas literales que el recorrido no alcanzó se planean desde su
+texto en el código fuente.
+
+No cuentan como recorrido de tabla completa:
+    - las consultas sin WHERE (leen toda la tabla a propósito), también las
+      de filtros opcionales que quedaron en ``WHERE 1=1``,
+    - las tablas de catálogo, que siempre tienen pocas filas,
+    - las tablas temporales (``temp.``) que arma la misma operación,
+    - los índices parciales, que solo guardan las filas de su condición,
+    - las tablas internas de SQLite (sqlite_master),
+    - las reconstrucciones completas de ``RECORRIDOS_PERMITIDOS``.
+"""
+import ast
+import contextlib
+import gc
+import inspect
+import io
+import itertools
+import random
+import re
+import sqlite3
+import sys
+import typing
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Tablas que por naturaleza tienen pocas filas (recorrerlas es lo correcto)
+CATALOGOS = {'configuracion', 'repartidores', 'conceptos_gastos', 'cartera_saldos', 'archivo_periodos'}
+# Leen todo a propósito: las reconstrucciones completas de las tablas
+# derivadas y la búsqueda por subcadena sin FTS5 (LIKE '%texto%' no usa índices)
+RECORRIDOS_PERMITIDOS = {'reconstruir_cartera', '_llenar_busqueda', '_llenar_sugerencias', '_buscar_global_like'}
+FILAS_CATALOGO = 50
+FILAS_DEFAULT = 20000
+DIAS_GENERADOS = 730              # dos años de fechas
+
+REPARTIDORES = [f'REPARTIDOR {i}' for i in range(20)]
+VALORES_CORTOS = ['A', 'B', 'C', 'D', 'E']
+
+# Día y folio del recorrido: lo bastante viejo para archivarlo entre las dos pasadas
+DIA = '2025-03-03'
+FOLIO = 100007
+
+# Argumentos de ejemplo por nombre de parámetro (los ids salen de la pasada)
+VALORES: Dict[str, Any] = {
+    'fecha': DIA, 'fecha_cancelacion': DIA, 'fecha_devolucion': DIA, 'fecha_venta': DIA,
+    'fecha_abono': DIA, 'fecha_limite': DIA, 'fecha_corte': DIA, 'desde': DIA, 'hasta': DIA,
+    'folio': FOLIO, 'folios': [FOLIO, FOLIO + 1],
+    'repartidor': REPARTIDORES[1], 'repartidor_viejo': REPARTIDORES[1], 'repartidor_nuevo': REPARTIDORES[2],
+    'nuevo_repartidor': REPARTIDORES[2], 'empleado': REPARTIDORES[1], 'socio': REPARTIDORES[1],
+    'destinatario': REPARTIDORES[1], 'beneficiario': REPARTIDORES[1], 'responsable': REPARTIDORES[1],
+    'proveedor': REPARTIDORES[1], 'cajero': REPARTIDORES[1], 'cajero_cancelo': REPARTIDORES[1],
+    'nombre': REPARTIDORES[1],
+    'cliente': 'CLIENTE 1', 'clientes': ['CLIENTE 1', 'CLIENTE 2'], 'texto': 'CLIENTE',
+    # PAGADO: el día no debe quedar con créditos pendientes para poder archivarlo
+    'estado': 'PAGADO', 'estado_anterior': 'PENDIENTE', 'estado_nuevo': 'PAGADO',
+    'origen': 'ELEVENTA', 'origenes': ['ELEVENTA', 'PUNTEADO'], 'dimension': 'CLIENTE',
+    'creditos': [('ELEVENTA', DIA, FOLIO), ('PUNTEADO', DIA, FOLIO)],
+    'conteo': {500: 2, 100: 3}, 'clave': 'planes', 'valor': 'planes', 'limite': 5,
+    'ventas': [{'folio': FOLIO, 'nombre': 'CLIENTE 1', 'subtotal': 100.0, 'repartidor': REPARTIDORES[1]}],
+    'cancelaciones': [{'folio': FOLIO, 'ticket_id': 1, 'cajero_cancelo': REPARTIDORES[1], 'monto': 10.0}],
+    'bugs': [{'turno_id': 1, 'tipo': 'duplicado_corte', 'descripcion': 'A', 'monto_bug': 1.0}],
+    'resumen': {REPARTIDORES[1]: {'total': 10.0, 'num': 1, 'detalle': {'efectivo': 10.0}}},
+    'totales_por_cajero': {REPARTIDORES[1]: 10.0},
+    'default': None, 'operacion': 'guardar_asignacion',
+    'tipo': 'ajuste', 'tipo_bug': 'duplicado_corte', 'extension': '.png', 'hash_contenido': '0' * 64,
+}
+# Llamadas propias de una función, en lugar de las combinaciones de opcionales:
+# una por dict, que se suma a los argumentos obligatorios
+LLAMADAS: Dict[str, List[Dict[str, Any]]] = {
+    'actualizar_anotacion': [{'titulo': 'A', 'color': '#FFFFFF'}, {'archivada': True}],
+    # Ida y vuelta: las dos llamadas cambian algo
+    'asignar_repartidor_creditos': [{'repartidor': REPARTIDORES[2]}, {}],
+    'cambiar_estado_creditos': [{'estado': 'PENDIENTE'}, {}],
+    # Se llama con una selección o con una fecha límite, nunca sin ninguna
+    'saldar_creditos': [{'creditos': VALORES['creditos']},
+                        {'fecha_limite': DIA, 'observacion': 'A'}],
+    'guardar_creditos_eleventa_bulk': [{'creditos': [{'folio': FOLIO + 1, 'id': 1, 'nombre': 'CLIENTE 1',
+                                                       'subtotal': 100.0, 'total_credito': 100.0}]}],
+}
+# Ni hooks ni contextos: no se llaman solas
+NO_LLAMAR = {'get_connection', 'leer_archivo', 'lote_escritura', 'ejecutar_coordinada',
+             'registrar_barrera_lectura', 'registrar_enrutador', 'registrar_borrado_adjuntos',
+             'archivar_periodos', 'archivar_si_corresponde'}
+# Orden dentro de una pasada: crear, leer, cambiar, borrar, reconstruir
+_ORDEN_PREFIJOS = (('init_', 'migrar_', 'agregar_', 'guardar_', 'registrar_', 'indexar_'),
+                   ('obtener_', 'es_', 'buscar_', 'sugerir_', 'fts5_', 'tablas_'),
+                   ('actualizar_', 'cambiar_', 'asignar_', 'saldar_', 'archivar_', 'restaurar_', 'reabrir_'),
+                   ('eliminar_', 'limpiar_', 'quitar_', 'purgar_', 'desactivar_'),
+                   ('reconstruir_', 'optimizar_', 'activar_'))
+_BORRAN = _ORDEN_PREFIJOS[3]
+_ANIDADOS = ('<listcomp>', '<dictcomp>', '<setcomp>', '<genexpr>', '<lambda>')
+# Con más parámetros opcionales que esto se prueban solo todos/ninguno
+MAX_OPCIONALES_COMBINADOS = 4
+
+_NO_PLANIFICABLES = ('CREATE', 'ALTER', 'DROP', 'PRAGMA', 'ANALYZE', 'VACUUM', 'BEGIN', 'COMMIT',
+                     'ROLLBACK', 'ATTACH', 'DETACH', 'REINDEX', 'SAVEPOINT', 'RELEASE')
+_RE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)(.*)$')
+_RE_USANDO_INDICE = re.compile(r'USING (?:COVERING )?INDEX (\S+)')
+# Tabla virtual (FTS5) que sí usa una restricción: MATCH, rowid...
+_RE_VIRTUAL_CON_INDICE = re.compile(r'VIRTUAL TABLE INDEX \d+:\S')
+_RE_WHERE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+# WHERE 1=1 sin ningún filtro opcional detrás
+_RE_WHERE_VACIO = re.compile(r'\bWHERE\s+1\s*=\s*1\b(?!\s+AND\b)', re.IGNORECASE)
+_RE_CHECK_IN = re.compile(r'(\w+)\s+[^,]*?CHECK\s*\(\s*\1\s+IN\s*\(([^)]*)\)', re.IGNORECASE)
+
+
+@dataclass
+class Consulta:
+    funcion: str
+    linea: int
+    sql: Optional[str]            # None: armada en ejecución y el recorrido no la alcanzó
+
+
+@dataclass
+class Hallazgo:
+    consulta: Consulta
+    plan: List[str] = field(default_factory=list)
+    recorridos: List[str] = field(default_factory=list)
+    error: Optional[str] = None     # SQLite no pudo preparar la consulta
+
+    @property
+    def sin_revisar(self) -> bool:
+        return self.consulta.sql is None
+
+    @property
+    def falla(self) -> bool:
+        return bool(self.recorridos) or self.sin_revisar or self.error is not None
+
+
+# ---------------------------------------------------------------------------
+# Consultas del código fuente
+# ---------------------------------------------------------------------------
+
+def _es_planificable(sql: str) -> bool:
+    sentencia = sql.strip().upper()
+    return bool(sentencia) and not sentencia.startswith(_NO_PLANIFICABLES)
+
+
+def _inicio_no_planificable(nodo: ast.AST) -> bool:
+    """f-string que empieza con una sentencia sin plan (PRAGMA {tabla}, ALTER...)."""
+    if not (isinstance(nodo, ast.JoinedStr) and nodo.values and isinstance(nodo.values[0], ast.Constant)):
+        return False
+    inicio = str(nodo.values[0].value).strip().upper()
+    return bool(inicio) and inicio.startswith(_NO_PLANIFICABLES)
+
+
+def extraer_consultas(ruta_modulo: str) -> List[Consulta]:
+    """
+    Cada execute/executemany del módulo: con el SQL si es un literal
+    planificable, con sql=None si se arma en tiempo de ejecución.
+    """
+    with open(ruta_modulo, encoding='utf-8') as f:
+        arbol = ast.parse(f.read(), filename=ruta_modulo)
+
+    consultas: List[Consulta] = []
+
+    def visitar(nodo: ast.AST, funcion: str) -> None:
+        for hijo in ast.iter_child_nodes(nodo):
+            if isinstance(hijo, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                visitar(hijo, hijo.name)
+                continue
+            if (isinstance(hijo, ast.Call) and isinstance(hijo.func, ast.Attribute)
+                    and hijo.func.attr in ('execute', 'executemany') and hijo.args):
+                argumento = hijo.args[0]
+                if not (isinstance(argumento, ast.Constant) and isinstance(argumento.value, str)):
+                    if not _inicio_no_planificable(argumento):
+                        consultas.append(Consulta(funcion, hijo.lineno, None))
+                elif _es_planificable(argumento.value):
+                    consultas.append(Consulta(funcion, hijo.lineno, ' '.join(argumento.value.split())))
+            visitar(hijo, funcion)
+
+    visitar(arbol, '<module>')
+    return consultas
+
+
+# ---------------------------------------------------------------------------
+# Base grande generada
+# ---------------------------------------------------------------------------
+
+def _valores_permitidos(sql_tabla: str) -> Dict[str, List[str]]:
+    """Columnas con CHECK(col IN (...)) y sus valores válidos."""
+    return {m.group(1).lower(): [v.strip().strip("'") for v in m.group(2).split(',')]
+            for m in _RE_CHECK_IN.finditer(sql_tabla or '')}
+
+
+def _generador(columna: str, tipo: str, rnd: random.Random, dias: List[str],
+               permitidos: Dict[str, List[str]]) -> Callable[[int], Any]:
+    """Función fila -> valor sintético para una columna, según su nombre y tipo."""
+    nombre, tipo = columna.lower(), tipo.upper()
+    if nombre in permitidos:
+        return lambda i: rnd.choice(permitidos[nombre])
+    if nombre.startswith('fecha') or nombre.endswith('_en') or tipo in ('DATE', 'TIMESTAMP'):
+        if tipo == 'DATE' or nombre == 'fecha':
+            return lambda i: rnd.choice(dias)
+        return lambda i: f'{rnd.choice(dias)} {rnd.randrange(24):02d}:00:00'
+    if nombre == 'folio':
+        return lambda i: 100000 + i
+    if nombre in ('repartidor', 'beneficiario', 'usuario', 'cajero', 'cajero_cancelo',
+                  'empleado', 'socio', 'destinatario'):
+        return lambda i: rnd.choice(REPARTIDORES)
+    if nombre in ('archivada', 'eliminada', 'activo', 'pagado') or nombre.startswith('es_'):
+        return lambda i: 1 if rnd.random() < 0.02 else 0
+    if nombre in ('estado', 'origen', 'tipo', 'tipo_bug', 'color', 'forma_pago'):
+        return lambda i: rnd.choice(VALORES_CORTOS)
+    if nombre.endswith('_id') or nombre.startswith('id_'):
+        return lambda i: i // 3
+    if nombre == 'prioridad':
+        return lambda i: rnd.randrange(4)
+    if 'INT' in tipo:
+        return lambda i: rnd.randrange(1000)
+    if any(t in tipo for t in ('REAL', 'NUM', 'DEC', 'FLOAT', 'DOUBLE')):
+        return lambda i: round(rnd.random() * 5000, 2)
+    if 'BLOB' in tipo:
+        return lambda i: b''
+    return lambda i: f'{nombre} {i}'
+
+
+def poblar_base(conn: sqlite3.Connection, filas: int, semilla: int = 1234) -> Dict[str, int]:
+    """Llena todas las tablas del liquidador con filas sintéticas y corre ANALYZE."""
+    rnd = random.Random(semilla)
+    inicio = date(2025, 1, 1)
+    dias = [(inicio + timedelta(days=d)).isoformat() for d in range(DIAS_GENERADOS)]
+    tablas = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()
+    # Las tablas virtuales (FTS5) y sus tablas internas se llenan solas por triggers
+    virtuales = [t for t, sql in tablas if (sql or '').upper().startswith('CREATE VIRTUAL')]
+    conteo = {}
+    for tabla, sql_tabla in tablas:
+        if any(tabla == v or tabla.startswith(v + '_') for v in virtuales):
+            continue
+        permitidos = _valores_permitidos(sql_tabla)
+        columnas = [(c[1], c[2] or '', c[5]) for c in conn.execute(f'PRAGMA table_info({tabla})')]
+        # La PK entera se autogenera
+        insertables = [(n, t) for n, t, pk in columnas if not (pk and 'INT' in t.upper())]
+        generadores = [_generador(col, tipo, rnd, dias, permitidos) for col, tipo in insertables]
+        n = FILAS_CATALOGO if tabla in CATALOGOS else filas
+        marcadores = ', '.join('?' * len(insertables))
+        nombres = ', '.join(col for col, _ in insertables)
+        conn.executemany(
+            f'INSERT OR IGNORE INTO {tabla} ({nombres}) VALUES ({marcadores})',
+            ([g(i) for g in generadores] for i in range(n)))
+        conteo[tabla] = conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+    conn.commit()
+    conn.execute('ANALYZE')
+    return conteo
+
+
+# ---------------------------------------------------------------------------
+# Captura del SQL ejecutado
+# ---------------------------------------------------------------------------
+
+def _tabla_de_alias(sql: str, alias: str) -> str:
+    """Nombre real de la tabla detrás de un alias del plan."""
+    m = re.search(rf'\b(\w+)\s+(?:AS\s+)?{re.escape(alias)}\b', sql, re.IGNORECASE)
+    if m and m.group(1).upper() not in ('FROM', 'JOIN', 'UPDATE', 'INTO'):
+        return m.group(1).lower()
+    return alias.lower()
+
+
+def _indices_parciales(conn: sqlite3.Connection) -> set:
+    return {nombre for (nombre,) in conn.cursor(sqlite3.Cursor).execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")}
+
+
+def _clasificar(hallazgo: Hallazgo, plan: Sequence[str], parciales: set) -> None:
+    """Guarda el plan y los recorridos de tabla completa que no están permitidos."""
+    consulta = hallazgo.consulta
+    lectura_completa = not _RE_WHERE.search(_RE_WHERE_VACIO.sub('', consulta.sql))
+    for detalle in plan:
+        hallazgo.plan.append(detalle)
+        m = _RE_SCAN.match(detalle)
+        if (not m or m.group(1).startswith('(') or m.group(1) == 'CONSTANT'
+                or _RE_VIRTUAL_CON_INDICE.search(m.group(2))):
+            continue
+        indice = _RE_USANDO_INDICE.search(m.group(2))
+        if indice and indice.group(1) in parciales:
+            continue
+        tabla = _tabla_de_alias(consulta.sql, m.group(1))
+        if (lectura_completa or tabla in CATALOGOS or tabla.startswith(('sqlite_', 'temp.'))
+                or consulta.funcion in RECORRIDOS_PERMITIDOS):
+            continue
+        hallazgo.recorridos.append(detalle)
+
+
+class Captura:
+    """SQL que ejecutan las funciones de un módulo, planeado en la conexión que lo ejecuta."""
+
+    def __init__(self, ruta_modulo: str):
+        self.ruta_modulo = ruta_modulo
+        self.hallazgos: Dict[Tuple[str, int, str], Hallazgo] = {}
+        self.ejecutadas: set = set()      # (función, línea) de todo lo ejecutado, planificable o no
+
+    def planear(self, conn: sqlite3.Connection, sql: str, parametros) -> None:
+        origen = self._origen()
+        if origen is None:
+            return
+        self.ejecutadas.add(origen)
+        if not _es_planificable(sql):
+            return
+        texto = ' '.join(sql.split())
+        clave = (*origen, texto)
+        if clave in self.hallazgos:
+            return
+        hallazgo = self.hallazgos[clave] = Hallazgo(Consulta(origen[0], origen[1], texto))
+        try:
+            # Cursor base: no vuelve a pasar por la captura
+            filas = conn.cursor(sqlite3.Cursor).execute('EXPLAIN QUERY PLAN ' + sql, parametros).fetchall()
+        except sqlite3.Error as e:
+            hallazgo.error = str(e)
+            return
+        _clasificar(hallazgo, [fila[3] for fila in filas], _indices_parciales(conn))
+
+    def alcanzadas(self) -> set:
+        return set(self.ejecutadas)
+
+    def _origen(self) -> Optional[Tuple[str, int]]:
+        """(función, línea) del módulo revisado que está ejecutando, o None."""
+        marco = sys._getframe(2)
+        while marco is not None and marco.f_code.co_filename != self.ruta_modulo:
+            marco = marco.f_back
+        if marco is None:
+            return None
+        linea = marco.f_lineno
+        # Comprensiones y lambdas: la función es la que las contiene (como en extraer_consultas)
+        while marco.f_code.co_name in _ANIDADOS and marco.f_back is not None:
+            marco = marco.f_back
+        return marco.f_code.co_name, linea
+
+
+class _CursorCapturado(sqlite3.Cursor):
+    def execute(self, sql, parametros=()):
+        self.connection.captura.planear(self.connection, sql, parametros)
+        return super().execute(sql, parametros)
+
+    def executemany(self, sql, filas):
+        filas = list(filas)
+        if filas:
+            self.connection.captura.planear(self.connection, sql, filas[0])
+        return super().executemany(sql, filas)
+
+
+class _ConexionCapturada(sqlite3.Connection):
+    captura: Optional[Captura] = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or _CursorCapturado)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, filas):
+        return self.cursor().executemany(sql, filas)
+
+
+@contextmanager
+def capturar(captura: Captura):
+    """Mientras dura, sqlite3.connect abre conexiones que pasan su SQL por `captura`."""
+    original = sqlite3.connect
+
+    def conectar(*args, **kwargs):
+        kwargs.setdefault('factory', _ConexionCapturada)
+        conn = original(*args, **kwargs)
+        conn.captura = captura
+        return conn
+
+    sqlite3.connect = conectar
+    try:
+        yield captura
+    finally:
+        sqlite3.connect = original
+
+
+# ---------------------------------------------------------------------------
+# Recorrido de las funciones
+# ---------------------------------------------------------------------------
+
+def _valor_por_tipo(anotacion) -> Any:
+    """Valor de ejemplo según la anotación del parámetro."""
+    tipo = typing.get_origin(anotacion) or anotacion
+    if tipo is typing.Union:
+        tipo = next(a for a in typing.get_args(anotacion) if a is not type(None))
+        tipo = typing.get_origin(tipo) or tipo
+    ejemplos = {str: 'A', int: 1, float: 1.0, bool: True, bytes: b'planes', dict: {}, list: [], tuple: ()}
+    if tipo not in ejemplos:
+        raise TypeError(f'sin valor de ejemplo para {anotacion!r}')
+    return ejemplos[tipo]
+
+
+def _valor(parametro: inspect.Parameter, identificador: int) -> Any:
+    nombre = parametro.name
+    if nombre in VALORES:
+        return VALORES[nombre]
+    if nombre.endswith('_id') or nombre.startswith('id_'):
+        return identificador
+    if parametro.annotation is not inspect.Parameter.empty:
+        return _valor_por_tipo(parametro.annotation)
+    raise TypeError(f'sin valor de ejemplo para el parámetro {nombre}')
+
+
+def _llamadas(fn: Callable, identificador: int) -> List[Dict[str, Any]]:
+    """
+    Argumentos de cada llamada: los obligatorios siempre; los opcionales que
+    cambian la consulta (default None o bool) en todas sus combinaciones, o
+    las llamadas de ``LLAMADAS`` si la función tiene.
+    """
+    parametros = [p for p in inspect.signature(fn).parameters.values()
+                  if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)]
+    fijos = {p.name: _valor(p, identificador) for p in parametros if p.default is inspect.Parameter.empty}
+    if fn.__name__ in LLAMADAS:
+        return [{**fijos, **extra} for extra in LLAMADAS[fn.__name__]]
+    opcionales = [p for p in parametros
+                  if p.default is None or isinstance(p.default, bool)]
+    if len(opcionales) > MAX_OPCIONALES_COMBINADOS:
+        combinaciones = [(), tuple(opcionales)]
+    else:
+        combinaciones = [c for n in range(len(opcionales) + 1) for c in itertools.combinations(opcionales, n)]
+    llamadas = []
+    for combinacion in combinaciones:
+        argumentos = dict(fijos)
+        for p in combinacion:
+            argumentos[p.name] = (not p.default) if isinstance(p.default, bool) else _valor(p, identificador)
+        llamadas.append(argumentos)
+    return llamadas
+
+
+def _orden(nombre: str) -> Tuple[int, str]:
+    for orden, prefijos in enumerate(_ORDEN_PREFIJOS):
+        if nombre.startswith(prefijos):
+            return orden, nombre
+    return 1, nombre
+
+
+def _funciones(db) -> List[Callable]:
+    """Funciones públicas de `db` que el recorrido llama (no las que reciben cursor o conexión)."""
+    funciones = []
+    for nombre, fn in inspect.getmembers(db, inspect.isfunction):
+        if (fn.__module__ != db.__name__ or nombre.startswith('_') or nombre in NO_LLAMAR
+                or {'cursor', 'conn'} & set(inspect.signature(fn).parameters)):
+            continue
+        funciones.append(fn)
+    return sorted(funciones, key=lambda fn: _orden(fn.__name__))
+
+
+def recorrer_funciones(db) -> List[Tuple[str, str]]:
+    """
+    Llama a cada función pública de `db` dos veces por el mismo día: en la
+    base caliente y, después de archivar los periodos viejos, en el archivo.
+    Las que borran solo van en la segunda pasada: en la primera dejarían el
+    día vacío y no habría nada archivado que traer de vuelta.
+
+    Returns:
+        [(función, error)] de las llamadas que lanzaron una excepción
+    """
+    errores = []
+    db.registrar_borrado_adjuntos(lambda _hash, _extension: None)
+    try:
+        for pasada in (1, 2):
+            for fn in _funciones(db):
+                if pasada == 1 and fn.__name__.startswith(_BORRAN):
+                    continue
+                try:
+                    llamadas = _llamadas(fn, pasada)
+                except (TypeError, StopIteration) as e:
+                    errores.append((fn.__name__, str(e)))
+                    continue
+                for argumentos in llamadas:
+                    try:
+                        fn(**argumentos)
+                    except Exception as e:
+                        errores.append((fn.__name__, f'{type(e).__name__}: {e}'))
+                    # Una función que falla a la mitad deja su conexión, con la
+                    # transacción abierta, en un ciclo de referencias: cerrarla ya
+                    gc.collect()
+            if pasada == 1:
+                db.archivar_periodos()
+                if not any(p['desde'] <= DIA <= p['hasta'] for p in db.obtener_periodos_archivados()):
+                    errores.append(('archivar_periodos', f'{DIA} no quedó archivado: la segunda pasada '
+                                                         'no revisa el archivo'))
+    finally:
+        db.registrar_borrado_adjuntos(None)
+    return errores
+
+
+# ---------------------------------------------------------------------------
+# Revisión
+# ---------------------------------------------------------------------------
+
+def revisar(conn: sqlite3.Connection, consultas: Sequence[Consulta]) -> List[Hallazgo]:
+    """Planea desde su texto las consultas del código que no se ejecutaron."""
+    hallazgos = []
+    parciales = _indices_parciales(conn)
+    for consulta in consultas:
+        hallazgo = Hallazgo(consulta)
+        hallazgos.append(hallazgo)
+        if consulta.sql is None:
+            continue
+        try:
+            filas = conn.execute('EXPLAIN QUERY PLAN ' + consulta.sql,
+                                 [None] * consulta.sql.count('?')).fetchall()
+        except sqlite3.Error as e:
+            hallazgo.error = str(e)
+            continue
+        _clasificar(hallazgo, [fila[3] for fila in filas], parciales)
+    return hallazgos
+
+
+def revisar_modulo(db, filas: int = FILAS_DEFAULT) -> Tuple[List[Hallazgo], List[Tuple[str, str]]]:
+    """
+    Llena la base de `db` (database_local ya importado sobre una base nueva),
+    recorre sus funciones capturando el SQL que ejecutan y revisa aparte las
+    consultas del código que el recorrido no alcanzó.
+
+    Returns:
+        (hallazgos, errores del recorrido)
+    """
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        poblar_base(conn, filas)
+    finally:
+        conn.close()
+
+    captura = Captura(db.__file__)
+    with capturar(captura), contextlib.redirect_stdout(io.StringIO()):
+        errores = recorrer_funciones(db)
+    alcanzadas = captura.alcanzadas()
+    faltantes = [c for c in extraer_consultas(db.__file__) if (c.funcion, c.linea) not in alcanzadas]
+
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        hallazgos = list(captura.hallazgos.values()) + revisar(conn, faltantes)
+    finally:
+        conn.close()
+    hallazgos.sort(key=lambda h: (h.consulta.linea, h.consulta.sql or ''))
+    return hallazgos, errores
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Almacén de adjuntos de anotaciones por contenido
+================================================
+
+Cada archivo adjunto se guarda una sola vez, con el sha256 de su contenido
+como nombre (``attachments/<ab>/<sha256><ext>``): el mismo recibo pegado
+dos veces, o adjuntado en dos notas, ocupa un solo archivo.
+
+- Las notas lo referencian en la tabla anotacion_adjuntos de
+  database_local (una fila por adjunto, índice por nota); agregar uno es
+  un INSERT, sin releer ni reescribir la lista de la nota.
+- adjuntos_objetos lleva la cuenta de referencias de cada contenido
+  (la mantienen triggers); ``purgar`` borra los archivos que llegaron a cero.
+- Las miniaturas (PNG de LADO_MINIATURA px) se guardan aparte, en
+  ``<RUTA_MINIATURAS>/<ab>/<sha256>_<lado>.png``. Dependen solo del
+  contenido, así que nunca hay que invalidarlas. Se generan la primera vez
+  que se piden, desde el executor (cola 'miniaturas'), nunca en el hilo de Tk.
+- Las notas viejas guardaban rutas con marca de tiempo en la columna JSON
+  ``attachments``; ``migrar_legado`` las pasa al almacén.
+
+Uso:
+    almacen = iniciar_almacen_adjuntos(db_local)
+    adjunto = almacen.adjuntar(nota_id, '/ruta/recibo.jpg')
+    executor.submit(almacen.miniatura, adjunto['hash'], adjunto['extension'],
+                    cola='miniaturas', on_ok=pintar)
+"""
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+from typing import Callable, Dict, Optional
+
+from .respaldo import sha256_archivo
+
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+
+LADO_MINIATURA = 64
+EXTENSIONES_IMAGEN = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+# Prefijo de marca de tiempo que les ponía la versión anterior a los nombres
+_RE_PREFIJO_LEGADO = re.compile(r'^\d{6,14}_')
+
+
+def es_imagen(adjunto: Dict) -> bool:
+    return (adjunto.get('extension') or '').lower() in EXTENSIONES_IMAGEN
+
+
+class AlmacenAdjuntos:
+    """Archivos adjuntos por contenido, con cuenta de referencias y miniaturas."""
+
+    def __init__(self, db, carpeta: str, carpeta_miniaturas: str):
+        """
+        Args:
+            db: database_local (registrar_adjunto, quitar_adjunto, purgar_adjuntos_sin_uso...)
+            carpeta: carpeta de los adjuntos (attachments/)
+            carpeta_miniaturas: carpeta del caché de miniaturas
+        """
+        self.db = db
+        self.carpeta = carpeta
+        self.carpeta_miniaturas = carpeta_miniaturas
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def adjuntar(self, nota_id: int, origen: str, nombre: str = None, legado: str = None) -> Optional[Dict]:
+        """
+        Guarda el archivo `origen` (si su contenido no está ya) y lo liga a la nota.
+
+        Args:
+            nombre: nombre a mostrar (por defecto el del archivo)
+            legado: ruta de la columna attachments que este adjunto reemplaza
+
+        Returns:
+            El adjunto registrado, o None si no se pudo ligar
+        """
+        hash_contenido = sha256_archivo(origen)
+        extension = self._guardar(hash_contenido, os.path.splitext(origen)[1],
+                                  lambda destino: shutil.copyfile(origen, destino))
+        return self.db.registrar_adjunto(nota_id, hash_contenido, extension, os.path.getsize(origen),
+                                         nombre or os.path.basename(origen), legado=legado)
+
+    def adjuntar_imagen(self, nota_id: int, imagen, nombre: str) -> Optional[Dict]:
+        """Guarda una imagen de Pillow (pegada del portapapeles) como PNG y la liga a la nota."""
+        if imagen.mode in ('RGBA', 'LA', 'P'):
+            imagen = imagen.convert('RGB')
+        buffer = io.BytesIO()
+        imagen.save(buffer, 'PNG')
+        datos = buffer.getvalue()
+        hash_contenido = hashlib.sha256(datos).hexdigest()
+
+        def escribir(destino):
+            with open(destino, 'wb') as f:
+                f.write(datos)
+
+        extension = self._guardar(hash_contenido, '.png', escribir)
+        return self.db.registrar_adjunto(nota_id, hash_contenido, extension, len(datos), nombre)
+
+    def quitar(self, adjunto_id: int) -> bool:
+        """Desliga el adjunto de su nota; el archivo se borra si ya ninguna nota lo usa."""
+        if not self.db.quitar_adjunto(adjunto_id):
+            return False
+        self.purgar()
+        return True
+
+    def purgar(self) -> int:
+        """Borra los contenidos sin referencias (archivo y miniatura). Retorna cuántos."""
+        return self.db.purgar_adjuntos_sin_uso()
+
+    def ruta(self, adjunto: Dict) -> str:
+        """Ruta absoluta del archivo del adjunto."""
+        return self._ruta_objeto(adjunto['hash'], adjunto['extension'])
+
+    def miniatura(self, hash_contenido: str, extension: str) -> Optional[str]:
+        """
+        Ruta de la miniatura PNG del contenido; la genera si falta (lento:
+        llamar desde el executor). None si no es imagen o no hay Pillow.
+        """
+        destino = self._ruta_miniatura(hash_contenido)
+        if os.path.exists(destino):
+            return destino
+        origen = self._ruta_objeto(hash_contenido, extension)
+        if not HAS_PIL or extension.lower() not in EXTENSIONES_IMAGEN or not os.path.exists(origen):
+            return None
+        with Image.open(origen) as imagen:
+            imagen.thumbnail((LADO_MINIATURA, LADO_MINIATURA))
+            if imagen.mode not in ('RGB', 'RGBA'):
+                imagen = imagen.convert('RGBA')
+            self._escribir_atomico(destino, lambda temporal: imagen.save(temporal, 'PNG'))
+        return destino
+
+    def migrar_legado(self) -> int:
+        """
+        Pasa al almacén los adjuntos guardados como rutas en la columna JSON
+        attachments. Las rutas cuyo archivo ya no existe se quedan donde
+        estaban. Retorna cuántos se migraron.
+        """
+        base = os.path.dirname(self.carpeta)
+        migrados = 0
+        originales = set()
+        for nota_id, ruta in self.db.obtener_adjuntos_legado():
+            completa = ruta if os.path.isabs(ruta) else os.path.join(base, ruta)
+            if not os.path.isfile(completa):
+                continue
+            nombre = _RE_PREFIJO_LEGADO.sub('', os.path.basename(completa))
+            try:
+                if self.adjuntar(nota_id, completa, nombre=nombre, legado=ruta):
+                    migrados += 1
+                    originales.add(completa)
+            except OSError as e:
+                print(f"⚠️ No se pudo migrar el adjunto {ruta}: {e}")
+        for completa in originales:
+            try:
+                os.remove(completa)
+            except OSError:
+                pass
+        if migrados:
+            print(f"✅ Adjuntos: {migrados} archivos pasados al almacén por contenido")
+        return migrados
+
+    # ------------------------------------------------------------------
+    # Archivos
+    # ------------------------------------------------------------------
+    def _ruta_objeto(self, hash_contenido: str, extension: str) -> str:
+        return os.path.join(self.carpeta, hash_contenido[:2], hash_contenido + extension)
+
+    def _ruta_miniatura(self, hash_contenido: str) -> str:
+        return os.path.join(self.carpeta_miniaturas, hash_contenido[:2],
+                            f"{hash_contenido}_{LADO_MINIATURA}.png")
+
+    def _buscar_objeto(self, hash_contenido: str) -> Optional[str]:
+        """Extensión con la que ya está guardado el contenido, o None."""
+        try:
+            nombres = os.listdir(os.path.join(self.carpeta, hash_contenido[:2]))
+        except OSError:
+            return None
+        for nombre in nombres:
+            if nombre.startswith(hash_contenido) and not nombre.endswith('.tmp'):
+                return nombre[len(hash_contenido):]
+        return None
+
+    def _guardar(self, hash_contenido: str, extension: str, escribir: Callable[[str], None]) -> str:
+        """Escribe el contenido si todavía no está; retorna la extensión con la que quedó."""
+        existente = self._buscar_objeto(hash_contenido)
+        if existente is not None:
+            return existente
+        extension = extension.lower()
+        self._escribir_atomico(self._ruta_objeto(hash_contenido, extension), escribir)
+        return extension
+
+    @staticmethod
+    def _escribir_atomico(destino: str, escribir: Callable[[str], None]) -> None:
+        carpeta = os.path.dirname(destino)
+        os.makedirs(carpeta, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=carpeta, suffix='.tmp')
+        os.close(descriptor)
+        try:
+            escribir(temporal)
+            os.replace(temporal, destino)
+        except BaseException:
+            try:
+                os.remove(temporal)
+            except OSError:
+                pass
+            raise
+
+    def _borrar_objeto(self, hash_contenido: str, extension: str) -> None:
+        for ruta in (self._ruta_objeto(hash_contenido, extension), self._ruta_miniatura(hash_contenido)):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# INSTANCIA COMPARTIDA
+# ══════════════════════════════════════════════════════════════════════════════
+
+_almacen: Optional[AlmacenAdjuntos] = None
+
+
+def get_almacen_adjuntos() -> Optional[AlmacenAdjuntos]:
+    """Almacén de adjuntos del proceso (None si no se inició)."""
+    return _almacen
+
+
+def iniciar_almacen_adjuntos(db) -> AlmacenAdjuntos:
+    """Crea el almacén sobre las carpetas de database_local. Llamadas repetidas retornan el mismo."""
+    global _almacen
+    if _almacen is None:
+        _almacen = AlmacenAdjuntos(db, db.RUTA_ADJUNTOS, db.RUTA_MINIATURAS)
+        # La purga puede llegar de otro proceso (coordinador): borra con este almacén
+        db.registrar_borrado_adjuntos(_almacen._borrar_objeto)
+    return _almacen
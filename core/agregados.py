@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Agregados del día en formato columnar
+=====================================
+
+Las ventas del día (lista de dicts) se convierten una sola vez en un
+"frame" columnar con folio, totales, banderas, repartidor y los datos
+por folio que viven en SQLite (dev. parciales, ajustes, punteados, no
+entregados). Todos los totales por repartidor y por estado salen de una
+sola reducción agrupada sobre ese frame.
+
+Usa pandas/numpy si están instalados (HAS_PANDAS); si no, hace la misma
+reducción en Python puro en una sola pasada.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import numpy as np
+    import pandas as pd
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+
+# Métricas que se calculan por fila y se suman por grupo
+METRICAS = (
+    'total_todas_facturas',       # TOTAL de las facturas del día (incluye canceladas del mismo día)
+    'total_canceladas',           # TOTAL de canceladas del mismo día
+    'total_canceladas_otro_dia',  # TOTAL de canceladas de otro día (informativas)
+    'total_vendido',              # TOTAL de facturas no canceladas
+    'monto_efectivo',             # TOTAL de facturas no canceladas y no a crédito
+    'total_credito',              # TOTAL_CREDITO de facturas a crédito
+    'total_credito_vigente',      # TOTAL_CREDITO de facturas a crédito no canceladas
+    'subtotal',
+    'subtotal_efectivo',          # SUBTOTAL de no canceladas y no crédito
+    'subtotal_canceladas',        # SUBTOTAL de canceladas (mismo día u otro día)
+    'dev_parciales',
+    'ajustes',
+    'num_facturas',
+    'num_asignadas',
+    'num_sin_asignar',
+    'num_canceladas',
+    'num_credito',
+    'num_punteados',
+    'num_no_entregados',
+)
+
+
+def _contribucion(v: Dict[str, Any], dev: float, ajuste: float,
+                  punteado: bool, no_entregado: bool) -> tuple:
+    """Aporte de una venta a cada métrica (mismo orden que METRICAS)."""
+    subtotal = v.get('subtotal', 0) or 0
+    total = v.get('total_original', subtotal) or 0
+    credito = v.get('total_credito', 0) or 0
+    canc = bool(v.get('cancelada', False))
+    cod = bool(v.get('cancelada_otro_dia', False))
+    es_cred = bool(v.get('es_credito', False))
+    anulada = canc or cod
+    asignada = bool((v.get('repartidor') or '').strip())
+    return (
+        0 if cod else total,
+        total if canc and not cod else 0,
+        total if cod else 0,
+        0 if anulada else total,
+        total if not anulada and not es_cred else 0,
+        credito if es_cred else 0,
+        credito if es_cred and not canc else 0,
+        subtotal,
+        subtotal if not anulada and not es_cred else 0,
+        subtotal if anulada else 0,
+        dev,
+        ajuste,
+        1,
+        1 if not anulada and asignada else 0,
+        1 if not anulada and not asignada else 0,
+        1 if anulada else 0,
+        1 if es_cred else 0,
+        1 if punteado else 0,
+        1 if no_entregado else 0,
+    )
+
+
+class FrameDia:
+    """
+    Vista columnar de las ventas de un día con reducciones agrupadas.
+
+    Args:
+        ventas: lista de ventas del DataStore (no se modifica)
+        dev_parciales: {folio: total devuelto}
+        ajustes: {folio: total de ajustes de precio}
+        punteados: folios marcados como crédito punteado
+        no_entregados: folios marcados como no entregados
+    """
+
+    def __init__(self, ventas: List[Dict[str, Any]],
+                 dev_parciales: Optional[Dict[int, float]] = None,
+                 ajustes: Optional[Dict[int, float]] = None,
+                 punteados: Iterable[int] = (),
+                 no_entregados: Iterable[int] = ()):
+        dev_parciales = dev_parciales or {}
+        ajustes = ajustes or {}
+        punteados = set(punteados)
+        no_entregados = set(no_entregados)
+
+        self.folios = [v['folio'] for v in ventas]
+        self.repartidores = [v.get('repartidor') or '' for v in ventas]
+        if HAS_PANDAS:
+            self._df = self._frame_pandas(ventas, dev_parciales, ajustes, punteados, no_entregados)
+            self._filas = None
+        else:
+            self._df = None
+            self._filas = [
+                _contribucion(v, dev_parciales.get(v['folio'], 0), ajustes.get(v['folio'], 0),
+                              v['folio'] in punteados, v['folio'] in no_entregados)
+                for v in ventas
+            ]
+
+    def _frame_pandas(self, ventas, dev_parciales, ajustes, punteados, no_entregados):
+        """Mismas métricas que _contribucion, calculadas por columna."""
+        folio = pd.Series(self.folios, dtype='int64')
+        subtotal = pd.Series([v.get('subtotal', 0) or 0 for v in ventas], dtype='float64')
+        total = pd.Series([v.get('total_original', v.get('subtotal', 0)) or 0 for v in ventas], dtype='float64')
+        credito = pd.Series([v.get('total_credito', 0) or 0 for v in ventas], dtype='float64')
+        canc = pd.Series([bool(v.get('cancelada', False)) for v in ventas], dtype=bool)
+        cod = pd.Series([bool(v.get('cancelada_otro_dia', False)) for v in ventas], dtype=bool)
+        es_cred = pd.Series([bool(v.get('es_credito', False)) for v in ventas], dtype=bool)
+        asignada = pd.Series([bool(r.strip()) for r in self.repartidores], dtype=bool)
+        anulada = canc | cod
+        efectivo = ~anulada & ~es_cred
+        cero = 0.0
+
+        df = pd.DataFrame({
+            'total_todas_facturas': total.where(~cod, cero),
+            'total_canceladas': total.where(canc & ~cod, cero),
+            'total_canceladas_otro_dia': total.where(cod, cero),
+            'total_vendido': total.where(~anulada, cero),
+            'monto_efectivo': total.where(efectivo, cero),
+            'total_credito': credito.where(es_cred, cero),
+            'total_credito_vigente': credito.where(es_cred & ~canc, cero),
+            'subtotal': subtotal,
+            'subtotal_efectivo': subtotal.where(efectivo, cero),
+            'subtotal_canceladas': subtotal.where(anulada, cero),
+            'dev_parciales': folio.map(dev_parciales).fillna(0.0).astype('float64'),
+            'ajustes': folio.map(ajustes).fillna(0.0).astype('float64'),
+            'num_facturas': np.ones(len(folio), dtype=np.int64),
+            'num_asignadas': (~anulada & asignada).astype('int64'),
+            'num_sin_asignar': (~anulada & ~asignada).astype('int64'),
+            'num_canceladas': anulada.astype('int64'),
+            'num_credito': es_cred.astype('int64'),
+            'num_punteados': folio.isin(list(punteados)).astype('int64'),
+            'num_no_entregados': folio.isin(list(no_entregados)).astype('int64'),
+        })
+        df['folio'] = folio
+        df['repartidor'] = self.repartidores
+        return df
+
+    def __len__(self) -> int:
+        return len(self.folios)
+
+    # --- reducciones ---
+    def totales(self, repartidor: Optional[str] = None,
+                folios: Optional[Iterable[int]] = None) -> Dict[str, float]:
+        """Suma de cada métrica, opcionalmente solo de un repartidor ('' = sin asignar)
+        y/o de un conjunto de folios."""
+        if self._df is not None:
+            df = self._df
+            mascara = np.ones(len(df), dtype=bool)
+            if repartidor is not None:
+                mascara &= (df['repartidor'] == repartidor).to_numpy()
+            if folios is not None:
+                mascara &= df['folio'].isin(list(folios)).to_numpy()
+            sumas = df.loc[mascara, list(METRICAS)].sum()
+            return {m: float(sumas[m]) if not m.startswith('num_') else int(sumas[m]) for m in METRICAS}
+
+        folios = set(folios) if folios is not None else None
+        acum = [0] * len(METRICAS)
+        for i, fila in enumerate(self._filas):
+            if repartidor is not None and self.repartidores[i] != repartidor:
+                continue
+            if folios is not None and self.folios[i] not in folios:
+                continue
+            for j, valor in enumerate(fila):
+                acum[j] += valor
+        return dict(zip(METRICAS, acum))
+
+    def por_repartidor(self) -> Dict[str, Dict[str, float]]:
+        """{repartidor: totales} en una sola reducción agrupada ('' = sin asignar)."""
+        if self._df is not None:
+            if not len(self._df):
+                return {}
+            agrupado = self._df.groupby('repartidor', sort=True)[list(METRICAS)].sum()
+            return {rep: {m: float(fila[m]) if not m.startswith('num_') else int(fila[m]) for m in METRICAS}
+                    for rep, fila in agrupado.iterrows()}
+
+        grupos: Dict[str, List[float]] = {}
+        for rep, fila in zip(self.repartidores, self._filas):
+            acum = grupos.setdefault(rep, [0] * len(METRICAS))
+            for j, valor in enumerate(fila):
+                acum[j] += valor
+        return {rep: dict(zip(METRICAS, grupos[rep])) for rep in sorted(grupos)}
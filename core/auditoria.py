@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Auditoría del corte de un día (tabla FACTURAS)
+==============================================
+
+Consultas y parseo de la pestaña de auditoría, sin interfaz. Las consultas
+van por el ejecutor compartido (core.firebird.ejecutar_sql), así que usan
+el FDB configurado y se pueden grabar y reproducir.
+"""
+from typing import Any, Callable, Dict, Tuple
+
+EjecutarSQL = Callable[[str], Tuple[bool, str, str]]
+
+
+def obtener_datos_auditoria(ejecutar_sql: EjecutarSQL, fecha: str) -> Dict[str, Any]:
+    """Obtiene todos los datos necesarios para la auditoría"""
+    def consultar(sql):
+        _, stdout, _ = ejecutar_sql(sql)
+        return stdout or ""
+
+    # 1. Total de facturas del día (TODAS)
+    sql_total = f"""
+    SET HEADING ON;
+    SELECT COUNT(*) AS TOTAL_FACTURAS, 
+           COALESCE(SUM(TOTAL), 0) AS TOTAL_MONTO
+    FROM FACTURAS 
+    WHERE CAST(FECHA AS DATE) = '{fecha}';
+    """
+
+    # 2. Facturas canceladas del mismo día
+    sql_canceladas_dia = f"""
+    SET HEADING ON;
+    SELECT COUNT(*) AS CANCELADAS_DIA,
+           COALESCE(SUM(TOTAL), 0) AS MONTO_CANCELADAS
+    FROM FACTURAS 
+    WHERE CAST(FECHA AS DATE) = '{fecha}'
+    AND CANCELADO = 1;
+    """
+
+    # 3. Facturas NO canceladas del día
+    sql_no_canceladas = f"""
+    SET HEADING ON;
+    SELECT COUNT(*) AS NO_CANCELADAS,
+           COALESCE(SUM(TOTAL), 0) AS MONTO_NO_CANCELADAS
+    FROM FACTURAS 
+    WHERE CAST(FECHA AS DATE) = '{fecha}'
+    AND (CANCELADO = 0 OR CANCELADO IS NULL);
+    """
+
+    # 4. Facturas de OTRO día canceladas EN esta fecha
+    sql_cancel_otro_dia = f"""
+    SET HEADING ON;
+    SELECT F.FOLIO, F.TOTAL, CAST(F.FECHA AS DATE) AS FECHA_CREACION,
+           CAST(F.CANCELADO_FECHA AS DATE) AS FECHA_CANCELACION
+    FROM FACTURAS F
+    WHERE CAST(F.CANCELADO_FECHA AS DATE) = '{fecha}'
+    AND CAST(F.FECHA AS DATE) <> '{fecha}'
+    AND F.CANCELADO = 1
+    ORDER BY F.FOLIO;
+    """
+
+    # 5. Detalle de facturas canceladas del día
+    sql_detalle_cancel = f"""
+    SET HEADING ON;
+    SELECT F.FOLIO, F.TOTAL, F.CLIENTE, F.FORMAPAGO
+    FROM FACTURAS F
+    WHERE CAST(F.FECHA AS DATE) = '{fecha}'
+    AND F.CANCELADO = 1
+    ORDER BY F.FOLIO;
+    """
+
+    # 6. Resumen por forma de pago (NO canceladas)
+    sql_por_formapago = f"""
+    SET HEADING ON;
+    SELECT FORMAPAGO, COUNT(*) AS CANTIDAD, COALESCE(SUM(TOTAL), 0) AS MONTO
+    FROM FACTURAS
+    WHERE CAST(FECHA AS DATE) = '{fecha}'
+    AND (CANCELADO = 0 OR CANCELADO IS NULL)
+    GROUP BY FORMAPAGO
+    ORDER BY FORMAPAGO;
+    """
+
+    # Ejecutar todas las consultas
+    result_total = consultar(sql_total)
+    result_cancel_dia = consultar(sql_canceladas_dia)
+    result_no_cancel = consultar(sql_no_canceladas)
+    result_otro_dia = consultar(sql_cancel_otro_dia)
+    result_detalle = consultar(sql_detalle_cancel)
+    result_formapago = consultar(sql_por_formapago)
+
+    # Parsear resultados
+    def parsear_numeros(texto, num_valores=2):
+        lineas = [l.strip() for l in texto.strip().split('\n') if l.strip() and not l.startswith('=')]
+        for linea in lineas:
+            if any(c.isdigit() for c in linea):
+                partes = linea.split()
+                valores = []
+                for p in partes:
+                    try:
+                        valores.append(float(p.replace(',', '')))
+                    except:
+                        pass
+                if len(valores) >= num_valores:
+                    return valores[:num_valores]
+        return [0] * num_valores
+
+    def parsear_tabla(texto):
+        lineas = [l for l in texto.strip().split('\n') if l.strip() and not l.startswith('=')]
+        filas = []
+        for linea in lineas:
+            if any(c.isdigit() for c in linea):
+                filas.append(linea)
+        return filas
+
+    total_facturas, monto_total = parsear_numeros(result_total)
+    cancel_dia, monto_cancel = parsear_numeros(result_cancel_dia)
+    no_cancel, monto_no_cancel = parsear_numeros(result_no_cancel)
+
+    return {
+        'total_facturas': int(total_facturas),
+        'monto_total': monto_total,
+        'canceladas_dia': int(cancel_dia),
+        'monto_canceladas': monto_cancel,
+        'no_canceladas': int(no_cancel),
+        'monto_no_canceladas': monto_no_cancel,
+        'facturas_otro_dia': parsear_tabla(result_otro_dia),
+        'detalle_canceladas': parsear_tabla(result_detalle),
+        'por_formapago': parsear_tabla(result_formapago),
+        'raw_otro_dia': result_otro_dia,
+        'raw_detalle': result_detalle,
+        'raw_formapago': result_formapago
+    }
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Coordinación entre procesos sobre liquidador_data.db
+====================================================
+
+El liquidador, la app de anotaciones (run_anotaciones.py) y cualquier otra
+instancia abren la misma base. Para que no se pisen:
+
+- Un solo proceso escritor (coordinador): el primero que toma el candado
+  del archivo ``<base>_coordinador.lock``. Abre un canal local
+  (multiprocessing.connection en 127.0.0.1 con clave aleatoria) y deja su
+  dirección en ``<base>_coordinador.json``.
+- Los demás procesos (clientes) mandan por el canal las escrituras
+  coordinadas: las funciones de database_local marcadas con
+  ``_escritura_coordinada``, las de tablas que escriben los dos programas
+  (anotaciones y adjuntos). El coordinador las ejecuta en orden y responde
+  el resultado. Las demás escrituras, y todas cuando no hay coordinador,
+  van directo (la base está en WAL con busy_timeout).
+- Una escritura se repite directo solo si no llegó a mandarse. Si se mandó
+  y no hubo respuesta, el coordinador pudo haberla hecho: se avisa el
+  error (EscrituraSinRespuesta) en vez de arriesgar hacerla dos veces.
+- Cada escritura coordinada se avisa a todos los procesos como
+  (tabla, pid); cada uno refresca solo lo que cambió, sin sondear la base.
+- Si el coordinador se cierra, los clientes intentan tomar el candado y
+  uno de ellos pasa a ser el coordinador.
+
+Uso:
+    coord = iniciar_coordinacion(db_local, despachar=executor.llamar_en_ui)
+    coord.suscribir('anotaciones', lambda tabla, pid: tab.refrescar())
+"""
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+    import msvcrt
+
+
+INTERVALO_RECONEXION_S = 1.0
+TIMEOUT_RESPUESTA_S = 60.0
+
+
+class CoordinacionNoDisponible(Exception):
+    """No hay coordinador al que mandar la escritura (se escribe directo)."""
+
+
+class EscrituraSinRespuesta(Exception):
+    """La escritura se mandó al coordinador pero no respondió: no se sabe si se hizo."""
+
+
+def _tomar_candado(archivo) -> bool:
+    """Candado exclusivo sin espera sobre el archivo abierto; False si otro proceso lo tiene."""
+    try:
+        if HAS_FCNTL:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            archivo.seek(0)
+            msvcrt.locking(archivo.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class CoordinacionProcesos:
+    """Rol de coordinador (escritor único) o cliente sobre una base compartida."""
+
+    COORDINADOR = 'coordinador'
+    CLIENTE = 'cliente'
+    SIN_CANAL = 'sin canal'
+
+    def __init__(self, ruta_base: str, ejecutar: Callable, despachar: Callable = None):
+        """
+        Args:
+            ruta_base: ruta de la base (de ahí salen los archivos .lock y .json)
+            ejecutar: ejecutar(operacion, args, kwargs) -> resultado, en este proceso
+            despachar: despacha avisos al hilo de UI (executor.llamar_en_ui)
+        """
+        raiz = os.path.splitext(ruta_base)[0]
+        self.ruta_candado = raiz + '_coordinador.lock'
+        self.ruta_direccion = raiz + '_coordinador.json'
+        self.pid = os.getpid()
+        self.rol = self.SIN_CANAL
+        self._ejecutar = ejecutar
+        self._despachar = despachar or (lambda fn, *args: fn(*args))
+        self._suscriptores: Dict[str, List[Callable]] = {}
+
+        self._lock = threading.Lock()             # estado del rol y del canal
+        self._lock_escritura = threading.Lock()   # el coordinador ejecuta de a una
+        self._archivo_candado = None
+        self._listener = None
+        self._clientes: List[Any] = []            # conexiones abiertas (coordinador)
+        self._conexion = None                     # conexión al coordinador (cliente)
+        self._lock_envio = threading.Lock()
+        self._ids = itertools.count(1)
+        self._esperando: Dict[int, list] = {}     # id -> [evento, ok, valor]
+        self._detenida = False
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def iniciar(self) -> 'CoordinacionProcesos':
+        if not self._intentar_ser_coordinador():
+            self._conectar()
+            threading.Thread(target=self._vigilar_coordinador, daemon=True,
+                             name='coordinacion-cliente').start()
+        return self
+
+    def suscribir(self, tabla: str, callback: Callable) -> None:
+        """callback(tabla, pid) en el hilo de UI cuando OTRO proceso escribe en `tabla`."""
+        self._suscriptores.setdefault(tabla, []).append(callback)
+
+    def escribir(self, operacion: str, args: tuple, kwargs: dict, tabla: str) -> Any:
+        """Ejecuta la escritura en el proceso coordinador y avisa el cambio."""
+        if self.rol == self.CLIENTE:
+            try:
+                return self._pedir(operacion, args, kwargs, tabla)
+            except CoordinacionNoDisponible:
+                pass  # No llegó a mandarse (sin coordinador): escribir directo
+        with self._lock_escritura:
+            resultado = self._ejecutar(operacion, args, kwargs)
+        self._avisar(tabla, self.pid)
+        return resultado
+
+    def detener(self) -> None:
+        self._detenida = True
+        with self._lock:
+            if self._listener is not None:
+                try:
+                    os.remove(self.ruta_direccion)
+                except OSError:
+                    pass
+                self._listener.close()
+            for conexion in self._clientes + ([self._conexion] if self._conexion else []):
+                try:
+                    conexion.close()
+                except OSError:
+                    pass
+            if self._archivo_candado is not None:
+                self._archivo_candado.close()
+
+    # ------------------------------------------------------------------
+    # Coordinador
+    # ------------------------------------------------------------------
+    def _intentar_ser_coordinador(self) -> bool:
+        archivo = open(self.ruta_candado, 'a+')
+        if not _tomar_candado(archivo):
+            archivo.close()
+            return False
+        clave = secrets.token_bytes(16)
+        listener = Listener(('127.0.0.1', 0), authkey=clave)
+        host, puerto = listener.address
+        temporal = self.ruta_direccion + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'puerto': puerto, 'clave': clave.hex(), 'pid': self.pid}, f)
+        os.replace(temporal, self.ruta_direccion)
+        with self._lock:
+            self._archivo_candado = archivo
+            self._listener = listener
+            self.rol = self.COORDINADOR
+        threading.Thread(target=self._aceptar, daemon=True, name='coordinacion-servidor').start()
+        print(f"✅ Coordinador de escrituras en 127.0.0.1:{puerto}")
+        return True
+
+    def _aceptar(self) -> None:
+        while not self._detenida:
+            try:
+                conexion = self._listener.accept()
+            except Exception:
+                if self._detenida:
+                    return
+                continue  # Cliente con clave equivocada o que se cayó al conectar
+            with self._lock:
+                self._clientes.append(conexion)
+            threading.Thread(target=self._atender, args=(conexion,), daemon=True,
+                             name='coordinacion-conexion').start()
+
+    def _atender(self, conexion) -> None:
+        """Ejecuta las escrituras que manda un cliente y le responde."""
+        try:
+            while True:
+                _tipo, id_pedido, operacion, args, kwargs, tabla, pid = conexion.recv()
+                try:
+                    with self._lock_escritura:
+                        respuesta = ('resultado', id_pedido, True, self._ejecutar(operacion, args, kwargs))
+                except Exception as e:
+                    respuesta = ('resultado', id_pedido, False, f"{type(e).__name__}: {e}")
+                self._enviar(conexion, respuesta)
+                self._avisar(tabla, pid)
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                if conexion in self._clientes:
+                    self._clientes.remove(conexion)
+            try:
+                conexion.close()
+            except OSError:
+                pass
+
+    def _avisar(self, tabla: str, pid: int) -> None:
+        """Avisa el cambio a los demás procesos (si coordina) y a los suscriptores locales."""
+        if self.rol == self.COORDINADOR:
+            with self._lock:
+                clientes = list(self._clientes)
+            for conexion in clientes:
+                self._enviar(conexion, ('cambio', tabla, pid))
+        self._notificar_local(tabla, pid)
+
+    def _notificar_local(self, tabla: str, pid: int) -> None:
+        if pid == self.pid:
+            return
+        for callback in self._suscriptores.get(tabla, []):
+            self._despachar(callback, tabla, pid)
+
+    def _enviar(self, conexion, mensaje) -> None:
+        try:
+            with self._lock_envio:
+                conexion.send(mensaje)
+        except (OSError, ValueError):
+            pass  # Se cerró; _atender o _escuchar la quitan
+
+    # ------------------------------------------------------------------
+    # Cliente
+    # ------------------------------------------------------------------
+    def _conectar(self) -> bool:
+        try:
+            with open(self.ruta_direccion, encoding='utf-8') as f:
+                direccion = json.load(f)
+            conexion = Client(('127.0.0.1', direccion['puerto']), authkey=bytes.fromhex(direccion['clave']))
+        except (OSError, ValueError, KeyError, EOFError):
+            return False
+        except Exception:
+            return False  # AuthenticationError: dirección vieja de otro coordinador
+        with self._lock:
+            self._conexion = conexion
+            self.rol = self.CLIENTE
+        threading.Thread(target=self._escuchar, args=(conexion,), daemon=True,
+                         name='coordinacion-avisos').start()
+        return True
+
+    def _escuchar(self, conexion) -> None:
+        """Recibe respuestas a pedidos propios y avisos de cambios."""
+        try:
+            while True:
+                mensaje = conexion.recv()
+                if mensaje[0] == 'resultado':
+                    _tipo, id_pedido, ok, valor = mensaje
+                    espera = self._esperando.get(id_pedido)
+                    if espera is not None:
+                        espera[1:] = [ok, valor]
+                        espera[0].set()
+                elif mensaje[0] == 'cambio':
+                    try:
+                        self._notificar_local(mensaje[1], mensaje[2])
+                    except Exception:
+                        traceback.print_exc()
+        except (EOFError, OSError):
+            pass
+        with self._lock:
+            if self._conexion is conexion:
+                self._conexion = None
+                self.rol = self.SIN_CANAL
+        # Despertar a quien esperaba respuesta (recibe EscrituraSinRespuesta)
+        for espera in list(self._esperando.values()):
+            espera[0].set()
+
+    def _pedir(self, operacion: str, args: tuple, kwargs: dict, tabla: str) -> Any:
+        conexion = self._conexion
+        if conexion is None:
+            raise CoordinacionNoDisponible()
+        id_pedido = next(self._ids)
+        espera = [threading.Event(), None, None]
+        self._esperando[id_pedido] = espera
+        try:
+            try:
+                with self._lock_envio:
+                    conexion.send(('escribir', id_pedido, operacion, args, kwargs, tabla, self.pid))
+            except (OSError, ValueError):
+                raise CoordinacionNoDisponible()
+            # Ya se mandó: sin respuesta no se repite (podría hacerse dos veces)
+            if not espera[0].wait(TIMEOUT_RESPUESTA_S) or espera[1] is None:
+                raise EscrituraSinRespuesta(f"El coordinador no respondió a {operacion}")
+            if not espera[1]:
+                raise RuntimeError(f"El coordinador no pudo ejecutar {operacion}: {espera[2]}")
+            return espera[2]
+        finally:
+            self._esperando.pop(id_pedido, None)
+
+    def _vigilar_coordinador(self) -> None:
+        """Sin canal: tomar el candado (coordinador caído) o reconectar."""
+        while not self._detenida:
+            time.sleep(INTERVALO_RECONEXION_S)
+            if self.rol != self.SIN_CANAL:
+                continue
+            if self._intentar_ser_coordinador() or self._conectar():
+                if self.rol == self.COORDINADOR:
+                    return
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# INSTANCIA COMPARTIDA
+# ══════════════════════════════════════════════════════════════════════════════
+
+_coordinacion: Optional[CoordinacionProcesos] = None
+
+
+def get_coordinacion() -> Optional[CoordinacionProcesos]:
+    """Coordinación del proceso (None si no se inició)."""
+    return _coordinacion
+
+
+def iniciar_coordinacion(db, despachar: Callable = None) -> CoordinacionProcesos:
+    """
+    Inicia la coordinación sobre database_local y le registra el enrutador
+    de escrituras coordinadas. Llamadas repetidas retornan la misma.
+    """
+    global _coordinacion
+    if _coordinacion is None:
+        _coordinacion = CoordinacionProcesos(db.DB_PATH, db.ejecutar_coordinada, despachar).iniciar()
+        db.registrar_enrutador(_coordinacion.escribir)
+    return _coordinacion
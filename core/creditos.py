@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Créditos de Eleventa (VENTATICKETS con TOTAL_CREDITO > 0)
+========================================================
+
+Consulta, parseo y guardado en SQLite de todos los créditos del sistema,
+sin interfaz. Lo usa la pestaña de créditos de la aplicación y los
+benchmarks.
+"""
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+from .day_state import ErrorCargaDia
+
+EjecutarSQL = Callable[[str], Tuple[bool, str, str]]
+
+
+def sql_creditos_eleventa() -> str:
+    # Consulta SQL para obtener TODOS los créditos (sin filtro de fecha)
+    return (
+        "SET HEADING ON;\n"
+        "SELECT V.ID, V.FOLIO, V.NOMBRE, V.SUBTOTAL, V.TOTAL_CREDITO, "
+        "CAST(V.CREADO_EN AS DATE) AS FECHA_CREACION\n"
+        "FROM VENTATICKETS V\n"
+        "WHERE V.TOTAL_CREDITO > 0\n"
+        "ORDER BY V.CREADO_EN DESC, V.FOLIO;\n"
+    )
+
+
+def parsear_creditos_eleventa(stdout: str) -> List[Dict[str, Any]]:
+    creditos = []
+    header_visto = False
+
+    for linea in stdout.split('\n'):
+        linea = linea.strip()
+        if not linea or linea.startswith('='):
+            continue
+        # Detectar header
+        if 'ID' in linea and 'FOLIO' in linea:
+            header_visto = True
+            continue
+        if not header_visto:
+            continue
+
+        partes = linea.split()
+        if len(partes) < 5:
+            continue
+
+        try:
+            id_v = int(partes[0])
+            folio_s = partes[1]
+            if folio_s == '<null>':
+                continue
+            folio = int(folio_s)
+
+            # Fecha está al final
+            fecha = partes[-1] if partes[-1] != '<null>' else ''
+            # Total crédito está antes de la fecha
+            total_credito = float(partes[-2]) if partes[-2] != '<null>' else 0.0
+            # Subtotal está antes del total crédito
+            subtotal = float(partes[-3]) if partes[-3] != '<null>' else 0.0
+            # Nombre está entre FOLIO y SUBTOTAL
+            nombre = ' '.join(partes[2:-3]).replace('<null>', '').strip()
+            if not nombre:
+                nombre = 'MOSTRADOR'
+
+            if folio <= 0 or total_credito <= 0:
+                continue
+
+            creditos.append({
+                'fecha': fecha,
+                'folio': folio,
+                'id': id_v,
+                'nombre': nombre,
+                'subtotal': subtotal,
+                'total_credito': total_credito,
+                'repartidor': ''
+            })
+        except (ValueError, IndexError):
+            continue
+    return creditos
+
+
+def consultar_creditos_eleventa(ejecutar_sql: EjecutarSQL, db) -> Tuple[int, int]:
+    """Consulta y guarda los créditos por fecha. Retorna (guardados, num_fechas).
+
+    Lanza ErrorCargaDia si la consulta no devuelve datos.
+    """
+    ok, stdout, stderr = ejecutar_sql(sql_creditos_eleventa())
+    if not ok or not stdout:
+        raise ErrorCargaDia(stderr or "No se recibieron datos de la BD")
+
+    creditos = parsear_creditos_eleventa(stdout)
+    if not creditos:
+        return 0, 0
+
+    # Guardar en SQLite por fecha
+    creditos_por_fecha: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for c in creditos:
+        creditos_por_fecha[c['fecha']].append(c)
+
+    total_guardados = 0
+    for fecha, lista in creditos_por_fecha.items():
+        total_guardados += db.guardar_creditos_eleventa_bulk(fecha, lista)
+
+    return total_guardados, len(creditos_por_fecha)
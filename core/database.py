@@ -8,6 +8,8 @@ import shutil
 import sys
 from typing import Tuple, Optional, List, Dict, Any
 
+from .productos_dia import productos_factura
+
 
 class DatabaseManager:
     """Gestiona las conexiones y consultas a la base de datos Firebird."""
@@ -237,44 +239,20 @@ WHERE CAST(CREADO_EN AS DATE) = '{fecha}';
         return entradas, salidas, None
     
     def consultar_productos_factura(self, folio: int) -> Tuple[List[Dict], Optional[str]]:
-        """Consulta los productos de una factura específica."""
-        sql = f"""
-SET HEADING ON;
-SELECT p.DESCRIPCION, vtp.CANTIDAD, vtp.PRECIO
-FROM VENTATICKETS_PRODUCTOS vtp
-JOIN PRODUCTOS p ON vtp.PRODUCTO_ID = p.ID
-WHERE vtp.VENTATICKET_ID = (
-    SELECT ID FROM VENTATICKETS WHERE FOLIO = {folio}
-);
-"""
-        resultado, error = self.ejecutar_sql(sql)
+        """Consulta los productos de una factura específica (usa la caché de productos del día)."""
+        def ejecutar(sql: str) -> Tuple[bool, str, str]:
+            resultado, error = self.ejecutar_sql(sql)
+            return error is None, resultado, error or ''
         
+        lineas, error = productos_factura(ejecutar, folio)
         if error:
             return [], error
         
-        productos = []
-        lines = [l.strip() for l in resultado.split('\n') if l.strip() and not l.startswith('Database:')]
-        
-        header_found = False
-        for line in lines:
-            if 'DESCRIPCION' in line.upper():
-                header_found = True
-                continue
-            if '===' in line:
-                continue
-            if header_found and line:
-                # Formato: DESCRIPCION    CANTIDAD    PRECIO
-                parts = line.rsplit(None, 2)  # Dividir desde la derecha
-                if len(parts) >= 3:
-                    try:
-                        productos.append({
-                            'descripcion': parts[0],
-                            'cantidad': int(float(parts[1])),
-                            'precio': float(parts[2].replace(',', ''))
-                        })
-                    except (ValueError, IndexError):
-                        continue
-        
+        productos = [{
+            'descripcion': linea['nombre'],
+            'cantidad': int(linea['cantidad']),
+            'precio': linea['precio'],
+        } for linea in lineas]
         return productos, None
     
     def _parsear_ventas(self, resultado: str) -> List[Dict]:
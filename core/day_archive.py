@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo de días cerrados (y copia local para modo offline)
+==========================================================
+
+Cuando todos los repartidores de una fecha ya tienen su liquidación
+guardada, el día se congela en un snapshot comprimido (JSON + zlib) con
+lo necesario para volver a mostrarlo sin consultar Firebird: ventas,
+asignaciones, corte y totales. Lo capturado en SQLite (descuentos, gastos,
+conteos) se sigue leyendo de SQLite. Cambiar una asignación del día
+desactiva el snapshot (trigger en database_local) y el día se vuelve a
+archivar al liquidarlo otra vez.
+
+El snapshot lleva un número de formato para poder leer archivos viejos
+si la estructura cambia. Guardarlo y leerlo de SQLite es responsabilidad
+de database_local (tabla archivos_dia).
+
+La misma serialización guarda la última carga buena de cada fecha
+(tabla cache_estado_dia) para servirla cuando Firebird no está disponible.
+"""
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .day_state import EstadoDia
+
+
+FORMATO_ARCHIVO = 1
+NIVEL_COMPRESION = 6
+
+
+class ErrorArchivoDia(Exception):
+    """El snapshot no se pudo leer (formato desconocido o datos dañados)."""
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SERIALIZACIÓN
+# ══════════════════════════════════════════════════════════════════════════════
+
+def comprimir_snapshot(snapshot: Dict[str, Any]) -> bytes:
+    datos = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'), default=str)
+    return zlib.compress(datos.encode('utf-8'), NIVEL_COMPRESION)
+
+
+def descomprimir_snapshot(blob: bytes) -> Dict[str, Any]:
+    try:
+        snapshot = json.loads(zlib.decompress(blob).decode('utf-8'))
+    except (zlib.error, ValueError) as e:
+        raise ErrorArchivoDia(f"Archivo dañado: {e}") from e
+    formato = snapshot.get('formato')
+    if formato != FORMATO_ARCHIVO:
+        raise ErrorArchivoDia(f"Formato de archivo no soportado: {formato}")
+    return snapshot
+
+
+def corte_a_dict(corte) -> Optional[Dict[str, Any]]:
+    """(CorteCajero, turno_id, num_turnos) -> dict serializable."""
+    if not corte:
+        return None
+    obj, turno_id, num_turnos = corte
+    ventas = obj.ventas
+    return {
+        'turno_id': turno_id,
+        'num_turnos': num_turnos,
+        'fecha_inicio': obj.fecha_inicio.isoformat() if obj.fecha_inicio else None,
+        'fecha_fin': obj.fecha_fin.isoformat() if obj.fecha_fin else None,
+        'dinero_en_caja': {k: v for k, v in obj.dinero_en_caja.to_dict().items() if k != 'total'},
+        'ventas': {
+            'ventas_efectivo': ventas.ventas_efectivo,
+            'ventas_tarjeta': ventas.ventas_tarjeta,
+            'ventas_credito': ventas.ventas_credito,
+            'ventas_vales': ventas.ventas_vales,
+            'devoluciones_ventas': ventas.devoluciones_ventas,
+            'devoluciones_por_forma_pago': dict(ventas.devoluciones_por_forma_pago or {}),
+        },
+        'ganancia': obj.ganancia,
+    }
+
+
+def corte_desde_dict(datos: Optional[Dict[str, Any]]):
+    """Inverso de corte_a_dict: reconstruye (CorteCajero, turno_id, num_turnos)."""
+    if not datos:
+        return None
+    from corte_cajero import CorteCajero, DineroEnCaja, Ventas
+
+    def _fecha(valor):
+        return datetime.fromisoformat(valor) if valor else None
+
+    obj = CorteCajero(
+        turno_id=datos['turno_id'],
+        fecha_inicio=_fecha(datos.get('fecha_inicio')),
+        fecha_fin=_fecha(datos.get('fecha_fin')),
+        dinero_en_caja=DineroEnCaja(**datos['dinero_en_caja']),
+        ventas=Ventas(**datos['ventas']),
+        ganancia=datos.get('ganancia', 0.0),
+    )
+    return obj, datos['turno_id'], datos.get('num_turnos', 1)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SNAPSHOT <-> ESTADO
+# ══════════════════════════════════════════════════════════════════════════════
+
+def construir_snapshot(estado: EstadoDia, ventas: List[Dict[str, Any]],
+                       totales: Dict[str, Any]) -> Dict[str, Any]:
+    """Arma el snapshot de un día cerrado.
+
+    Args:
+        estado: estado de Firebird del día (tal como se consultó)
+        ventas: ventas ya combinadas con sus repartidores
+        totales: totales calculados del día y por repartidor
+    """
+    return {
+        'formato': FORMATO_ARCHIVO,
+        'fecha': estado.fecha,
+        'archivado_en': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'estado': _estado_a_dict(estado),
+        # JSON solo admite claves str; se convierten de vuelta al leer
+        'asignaciones': {str(v['folio']): v.get('repartidor', '') for v in ventas},
+        'corte': corte_a_dict(estado.corte),
+        'totales': totales,
+    }
+
+
+def _estado_a_dict(estado: EstadoDia) -> Dict[str, Any]:
+    return {
+        'ventas': estado.ventas,
+        'canceladas_otro_dia': estado.canceladas_otro_dia,
+        'devoluciones': estado.devoluciones,
+        'dev_parciales': estado.dev_parciales,
+        'movimientos_entrada': estado.movimientos_entrada,
+        'movimientos_salida': estado.movimientos_salida,
+    }
+
+
+def serializar_estado(estado: EstadoDia) -> bytes:
+    """Copia local de una carga buena de Firebird (para modo offline)."""
+    return comprimir_snapshot({
+        'formato': FORMATO_ARCHIVO,
+        'fecha': estado.fecha,
+        'cargado_en': estado.cargado_en,
+        'estado': _estado_a_dict(estado),
+        'corte': corte_a_dict(estado.corte),
+    })
+
+
+def deserializar_estado(blob: bytes) -> EstadoDia:
+    """EstadoDia marcado como obsoleto a partir de su copia local."""
+    snapshot = descomprimir_snapshot(blob)
+    datos = snapshot['estado']
+    return EstadoDia(
+        fecha=snapshot['fecha'],
+        ventas=datos.get('ventas', []),
+        canceladas_otro_dia=datos.get('canceladas_otro_dia', []),
+        devoluciones=datos.get('devoluciones', []),
+        dev_parciales=datos.get('dev_parciales'),
+        movimientos_entrada=datos.get('movimientos_entrada', []),
+        movimientos_salida=datos.get('movimientos_salida', []),
+        corte=corte_desde_dict(snapshot.get('corte')),
+        cargado_en=snapshot.get('cargado_en', 0.0),
+        obsoleto=True,
+    )
+
+
+def estado_desde_snapshot(snapshot: Dict[str, Any]) -> EstadoDia:
+    """EstadoDia marcado como archivado a partir de un snapshot."""
+    datos = snapshot['estado']
+    return EstadoDia(
+        fecha=snapshot['fecha'],
+        ventas=datos.get('ventas', []),
+        canceladas_otro_dia=datos.get('canceladas_otro_dia', []),
+        devoluciones=datos.get('devoluciones', []),
+        dev_parciales=datos.get('dev_parciales'),
+        movimientos_entrada=datos.get('movimientos_entrada', []),
+        movimientos_salida=datos.get('movimientos_salida', []),
+        corte=corte_desde_dict(snapshot.get('corte')),
+        archivado=True,
+        asignaciones={int(folio): rep for folio, rep in snapshot.get('asignaciones', {}).items()},
+    )
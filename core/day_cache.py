@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+DayStateCache - Caché LRU de días cargados
+==========================================
+
+Guarda el EstadoDia completo (ventas, devoluciones, movimientos,
+dev. parciales, canceladas de otro día y corte) de los últimos N días
+consultados, con un tope de memoria aproximado. Permite que la navegación
+entre fechas (◀ / ▶) sea instantánea y que los días vecinos se precarguen
+en segundo plano.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .day_state import EstadoDia
+
+
+MAX_DIAS_DEFAULT = 14
+MAX_BYTES_DEFAULT = 64 * 1024 * 1024
+
+# Segundos durante los que un día se considera fresco sin revalidar.
+# El día de hoy cambia constantemente; los pasados casi nunca.
+TTL_HOY = 60
+TTL_PASADO = 15 * 60
+
+
+def estimar_tamano(obj: Any, _vistos: set = None) -> int:
+    """Tamaño aproximado en bytes de un objeto y todo lo que contiene."""
+    if _vistos is None:
+        _vistos = set()
+    oid = id(obj)
+    if oid in _vistos:
+        return 0
+    _vistos.add(oid)
+    tamano = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            tamano += estimar_tamano(k, _vistos) + estimar_tamano(v, _vistos)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            tamano += estimar_tamano(item, _vistos)
+    elif hasattr(obj, '__dict__'):
+        tamano += estimar_tamano(vars(obj), _vistos)
+    return tamano
+
+
+def huella_estado(estado: EstadoDia) -> tuple:
+    """Resumen barato para saber si una recarga trajo cambios."""
+    return (
+        len(estado.ventas),
+        max((v['id'] for v in estado.ventas), default=0),
+        round(sum(v.get('total_original', 0) for v in estado.ventas), 2),
+        sum(1 for v in estado.ventas if v.get('cancelada')),
+        len(estado.canceladas_otro_dia),
+        len(estado.devoluciones),
+        len(estado.dev_parciales or []),
+        len(estado.movimientos_entrada),
+        len(estado.movimientos_salida),
+    )
+
+
+class DayStateCache:
+    """LRU de EstadoDia por fecha con contabilidad de memoria. Es thread-safe."""
+
+    def __init__(self, max_dias: int = MAX_DIAS_DEFAULT, max_bytes: int = MAX_BYTES_DEFAULT):
+        self.max_dias = max_dias
+        self.max_bytes = max_bytes
+        self._dias: "OrderedDict[str, EstadoDia]" = OrderedDict()
+        self._tamanos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    # --- lectura ---
+    def get(self, fecha: str, tocar: bool = True) -> Optional[EstadoDia]:
+        """Retorna el estado en caché (y lo marca como usado recientemente)."""
+        with self._lock:
+            estado = self._dias.get(fecha)
+            if tocar:
+                if estado is None:
+                    self.fallos += 1
+                else:
+                    self.aciertos += 1
+                    self._dias.move_to_end(fecha)
+            return estado
+
+    def __contains__(self, fecha: str) -> bool:
+        with self._lock:
+            return fecha in self._dias
+
+    def fechas(self) -> List[str]:
+        """Fechas en caché, de la menos a la más recientemente usada."""
+        with self._lock:
+            return list(self._dias.keys())
+
+    @staticmethod
+    def es_fresco(estado: EstadoDia, ahora: float = None) -> bool:
+        if estado.archivado:
+            return True  # Un día archivado no cambia hasta que se reabre
+        if estado.obsoleto:
+            return False  # Copia offline: revalidar en cuanto haya conexión
+        ahora = ahora or time.time()
+        es_hoy = estado.fecha == datetime.now().strftime('%Y-%m-%d')
+        ttl = TTL_HOY if es_hoy else TTL_PASADO
+        return (ahora - estado.cargado_en) < ttl
+
+    # --- escritura ---
+    def put(self, estado: EstadoDia) -> None:
+        """Guarda (o reemplaza) el estado de su fecha, conservando el corte si el nuevo no lo trae."""
+        with self._lock:
+            anterior = self._dias.get(estado.fecha)
+            if anterior is not None and estado.corte is None and anterior.corte is not None:
+                estado.corte = anterior.corte
+            self._dias[estado.fecha] = estado
+            self._dias.move_to_end(estado.fecha)
+            self._tamanos[estado.fecha] = estimar_tamano(estado)
+            self._expulsar()
+
+    def set_corte(self, fecha: str, corte: Any) -> None:
+        """Asocia el resultado del corte cajero al día (si el día está en caché)."""
+        with self._lock:
+            estado = self._dias.get(fecha)
+            if estado is None:
+                return
+            estado.corte = corte
+            self._tamanos[fecha] = estimar_tamano(estado)
+            self._expulsar()
+
+    def invalidar(self, fecha: str) -> None:
+        with self._lock:
+            self._dias.pop(fecha, None)
+            self._tamanos.pop(fecha, None)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._dias.clear()
+            self._tamanos.clear()
+
+    def _expulsar(self) -> None:
+        """Saca los días menos usados hasta cumplir los límites (lock tomado)."""
+        while self._dias and (len(self._dias) > self.max_dias or
+                              sum(self._tamanos.values()) > self.max_bytes):
+            if len(self._dias) == 1:
+                break  # Siempre conservar el día actual
+            fecha, _ = self._dias.popitem(last=False)
+            self._tamanos.pop(fecha, None)
+
+    # --- estadísticas ---
+    @property
+    def memoria_usada(self) -> int:
+        with self._lock:
+            return sum(self._tamanos.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'dias': len(self._dias),
+                'bytes': sum(self._tamanos.values()),
+                'max_dias': self.max_dias,
+                'max_bytes': self.max_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+Carga del día desde Firebird (sin dependencias de Tk)
+=====================================================
+
+Consultas y parsers de la salida de isql para todo lo que se carga al
+cambiar de fecha: facturas, canceladas de otro día, devoluciones,
+devoluciones parciales y movimientos. Todo es código puro para poder
+ejecutarse en el executor de fondo y aplicarse luego en el hilo de Tk.
+
+La función `ejecutar_sql` que reciben es la misma firma que
+`LiquidadorRepartidores._ejecutar_sql`: sql -> (ok, stdout, stderr).
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .executor import CancelToken
+from .lote_sql import ejecutar_lote
+
+
+EjecutarSQL = Callable[[str], Tuple[bool, str, str]]
+
+
+class ErrorCargaDia(Exception):
+    """No se pudo consultar la información principal del día."""
+
+
+@dataclass
+class EstadoDia:
+    """Datos de Firebird de una fecha, tal como se consultaron (sin repartidores)."""
+    fecha: str
+    ventas: List[Dict[str, Any]] = field(default_factory=list)
+    canceladas_otro_dia: List[Dict[str, Any]] = field(default_factory=list)
+    devoluciones: List[Dict[str, Any]] = field(default_factory=list)
+    dev_parciales: Optional[List[Dict[str, Any]]] = None   # None = no se pudo consultar
+    movimientos_entrada: List[Dict[str, Any]] = field(default_factory=list)
+    movimientos_salida: List[Dict[str, Any]] = field(default_factory=list)
+    # (CorteCajero, turno_id, num_turnos) cuando ya se consultó el corte del día
+    corte: Optional[Tuple[Any, int, int]] = None
+    cargado_en: float = field(default_factory=time.time)
+    # Días cerrados: vienen del archivo local y traen sus propias asignaciones
+    archivado: bool = False
+    asignaciones: Optional[Dict[int, str]] = None
+    # Servido desde la copia local porque Firebird no respondió (modo offline)
+    obsoleto: bool = False
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CONSULTAS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def sql_facturas(fecha: str) -> str:
+    # Consulta principal usando VENTATICKETS con campo TOTAL para coincidir con corte de caja
+    # Incluye TURNO_ID para identificar el turno de cada venta
+    return (
+        "SET HEADING ON;\n"
+        "SELECT V.ID, V.FOLIO, V.NOMBRE, V.SUBTOTAL, V.TOTAL, V.ESTA_CANCELADO, V.TOTAL_CREDITO, "
+        "CAST(V.CREADO_EN AS DATE) AS FECHA_CREACION, "
+        "CAST(D.DEVUELTO_EN AS DATE) AS FECHA_CANCELACION, "
+        "V.TURNO_ID\n"
+        "FROM VENTATICKETS V\n"
+        "LEFT JOIN DEVOLUCIONES D ON D.TICKET_ID = V.ID AND D.TIPO_DEVOLUCION = 'C'\n"
+        f"WHERE CAST(V.CREADO_EN AS DATE) = '{fecha}'\n"
+        "ORDER BY V.FOLIO;\n"
+    )
+
+
+def sql_facturas_delta(fecha: str, id_desde: int, ids_refrescar: List[int] = ()) -> str:
+    """Facturas nuevas (ID > id_desde) y las ya conocidas que se deben refrescar."""
+    filtro = f"V.ID > {int(id_desde)}"
+    if ids_refrescar:
+        filtro = f"({filtro} OR V.ID IN ({', '.join(str(int(i)) for i in ids_refrescar)}))"
+    return sql_facturas(fecha).replace(
+        f"WHERE CAST(V.CREADO_EN AS DATE) = '{fecha}'\n",
+        f"WHERE CAST(V.CREADO_EN AS DATE) = '{fecha}' AND {filtro}\n"
+    )
+
+
+def sql_canceladas_otro_dia(fecha: str) -> str:
+    # Facturas creadas ANTES de la fecha pero CANCELADAS ese día
+    return (
+        "SET HEADING ON;\n"
+        "SELECT V.ID, V.FOLIO, V.NOMBRE, V.SUBTOTAL, V.TOTAL, V.ESTA_CANCELADO, V.TOTAL_CREDITO, "
+        "CAST(V.CREADO_EN AS DATE) AS FECHA_CREACION, "
+        "CAST(D.DEVUELTO_EN AS DATE) AS FECHA_CANCELACION\n"
+        "FROM VENTATICKETS V\n"
+        "INNER JOIN DEVOLUCIONES D ON D.TICKET_ID = V.ID AND D.TIPO_DEVOLUCION = 'C'\n"
+        f"WHERE V.ESTA_CANCELADO = 't'\n"
+        f"AND CAST(V.CREADO_EN AS DATE) < '{fecha}'\n"
+        f"AND CAST(D.DEVUELTO_EN AS DATE) = '{fecha}'\n"
+        "ORDER BY V.FOLIO;\n"
+    )
+
+
+def sql_devoluciones(fecha: str) -> str:
+    return (
+        "SET HEADING ON;\n"
+        "SELECT ID, TICKET_ID, TOTAL_DEVUELTO, CAJERO, TIPO_DEVOLUCION\n"
+        "FROM DEVOLUCIONES\n"
+        f"WHERE CAST(DEVUELTO_EN AS DATE) = '{fecha}'\n"
+        "ORDER BY ID;\n"
+    )
+
+
+def sql_devoluciones_delta(fecha: str, id_desde: int) -> str:
+    # Los ID de DEVOLUCIONES salen de un generador: ID > último visto = devueltas después de la última carga
+    return sql_devoluciones(fecha).replace("ORDER BY ID;", f"AND ID > {int(id_desde)}\nORDER BY ID;")
+
+
+def sql_devoluciones_parciales(fecha: str) -> str:
+    # Devoluciones parciales (TIPO_DEVOLUCION = 'P') asociadas a la FECHA DE LA VENTA
+    return f"""
+SELECT
+    DA.DEVOLUCION_ID,
+    V.FOLIO,
+    DA.CODIGO_PRODUCTO,
+    DA.DESCRIPCION_PRODUCTO,
+    DA.CANTIDAD_DEVUELTA,
+    DA.DINERO_DEVUELTO,
+    D.DEVUELTO_EN
+FROM DEVOLUCIONES_ARTICULOS DA
+INNER JOIN DEVOLUCIONES D ON DA.DEVOLUCION_ID = D.ID
+INNER JOIN VENTATICKETS V ON DA.TICKET_ID = V.ID
+WHERE CAST(V.VENDIDO_EN AS DATE) = '{fecha}'
+AND D.TIPO_DEVOLUCION = 'P'
+ORDER BY V.FOLIO, DA.ID;
+"""
+
+
+def sql_movimientos(fecha: str) -> str:
+    return (
+        "SET HEADING ON;\n"
+        "SELECT ID, TIPO, MONTO, COMENTARIOS\n"
+        "FROM MOVIMIENTOS\n"
+        f"WHERE CAST(CUANDO_FUE AS DATE) = '{fecha}'\n"
+        "ORDER BY ID;\n"
+    )
+
+
+def sql_movimientos_delta(fecha: str, id_desde: int) -> str:
+    return sql_movimientos(fecha).replace("ORDER BY ID;", f"AND ID > {int(id_desde)}\nORDER BY ID;")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PARSERS DE SALIDA ISQL
+# ══════════════════════════════════════════════════════════════════════════════
+
+def parsear_facturas(stdout: str, fecha: str) -> List[Dict[str, Any]]:
+    """Parsea la consulta principal de VENTATICKETS (sin repartidor asignado)."""
+    ventas = []
+    header_visto = False
+    for linea in stdout.split('\n'):
+        linea = linea.strip()
+        if not linea or linea.startswith('='):
+            continue
+        # Detectar header de VENTATICKETS
+        if 'ID' in linea and 'FOLIO' in linea:
+            header_visto = True
+            continue
+        if not header_visto:
+            continue
+        partes = linea.split()
+        if len(partes) < 9:  # Campos con TURNO_ID
+            continue
+        try:
+            # Formato: ID, FOLIO, NOMBRE..., SUBTOTAL, TOTAL, ESTA_CANCELADO, TOTAL_CREDITO, FECHA_CREACION, FECHA_CANCELACION, TURNO_ID
+            id_v = int(partes[0])
+            folio_s = partes[1]
+            if folio_s == '<null>':
+                continue
+            folio = int(folio_s)
+
+            # Obtener campos desde el final (más confiable)
+            turno_id_venta = partes[-1] if partes[-1] != '<null>' else ''
+            fecha_cancelacion = partes[-2] if partes[-2] != '<null>' else ''
+            fecha_creacion = partes[-3] if partes[-3] != '<null>' else fecha
+            total_credito = float(partes[-4]) if partes[-4] != '<null>' else 0.0
+            # ESTA_CANCELADO puede ser 't'/'f' o 1/0
+            cancelado_val = partes[-5].lower()
+            esta_cancelado = cancelado_val == 't' or cancelado_val == '1'
+            total_original = float(partes[-6]) if partes[-6] != '<null>' else 0.0
+            subtotal = float(partes[-7]) if partes[-7] != '<null>' else 0.0
+            # El nombre está entre FOLIO (índice 1) y SUBTOTAL (índice -7)
+            nombre = ' '.join(partes[2:-7]).replace('<null>', '').strip()
+            if not nombre:
+                nombre = 'MOSTRADOR'
+
+            if folio <= 0:
+                continue
+
+            # Para facturas canceladas del MISMO DÍA: subtotal = total
+            subtotal_final = total_original if esta_cancelado else subtotal
+
+            ventas.append({
+                'id': id_v,
+                'folio': folio,
+                'nombre': nombre,
+                'subtotal': subtotal_final,
+                'total_original': total_original,
+                'repartidor': '',
+                'cancelada': esta_cancelado,
+                'cancelada_otro_dia': False,
+                'total_credito': total_credito,
+                'es_credito': total_credito > 0,
+                'fecha_creacion': fecha_creacion,
+                'fecha_cancelacion': fecha_cancelacion,
+                'turno_id': turno_id_venta,
+                # Usar turno_id como identificador de usuario (Turno X)
+                'usuario': f"Turno {turno_id_venta}" if turno_id_venta else ''
+            })
+        except (ValueError, IndexError):
+            continue
+    return ventas
+
+
+def parsear_canceladas_otro_dia(stdout: str, fecha: str) -> List[Dict[str, Any]]:
+    """Parsea las canceladas de otro día (informativas, no suman al total)."""
+    canceladas = []
+    header_visto = False
+    for linea in stdout.split('\n'):
+        linea = linea.strip()
+        if not linea or linea.startswith('='):
+            continue
+        if 'ID' in linea and 'FOLIO' in linea:
+            header_visto = True
+            continue
+        if not header_visto:
+            continue
+        partes = linea.split()
+        if len(partes) < 8:
+            continue
+        try:
+            id_v = int(partes[0])
+            folio_s = partes[1]
+            if folio_s == '<null>':
+                continue
+            folio = int(folio_s)
+
+            # Parsear campos (de derecha a izquierda)
+            fecha_cancelacion = partes[-1] if partes[-1] != '<null>' else fecha
+            fecha_creacion = partes[-2] if partes[-2] != '<null>' else ''
+            total_credito = float(partes[-3]) if partes[-3] != '<null>' else 0.0
+            total_original = float(partes[-5]) if partes[-5] != '<null>' else 0.0
+            nombre = ' '.join(partes[2:-6]).replace('<null>', '').strip()
+            if not nombre:
+                nombre = 'MOSTRADOR'
+
+            if folio <= 0:
+                continue
+
+            canceladas.append({
+                'id': id_v,
+                'folio': folio,
+                'nombre': f"⚠️ {nombre}",
+                'subtotal': 0,  # NO suma al total (informativa)
+                'total_original': total_original,
+                'repartidor': '',
+                'cancelada': True,
+                'cancelada_otro_dia': True,
+                'total_credito': total_credito,
+                'es_credito': total_credito > 0,
+                'fecha_creacion': fecha_creacion,
+                'fecha_cancelacion': fecha_cancelacion
+            })
+        except (ValueError, IndexError):
+            continue
+    return canceladas
+
+
+def parsear_devoluciones(stdout: str) -> List[Dict[str, Any]]:
+    devoluciones = []
+    header_visto = False
+    for linea in stdout.split('\n'):
+        linea = linea.strip()
+        if not linea or linea.startswith('='):
+            continue
+        if 'ID' in linea and 'TICKET_ID' in linea:
+            header_visto = True
+            continue
+        if not header_visto:
+            continue
+        partes = linea.split()
+        if len(partes) >= 5:
+            try:
+                devoluciones.append({
+                    'id': int(partes[0]),
+                    'ticket_id': int(partes[1]) if partes[1] != '<null>' else 0,
+                    'monto': float(partes[2]) if partes[2] != '<null>' else 0.0,
+                    'cajero': partes[3] if partes[3] != '<null>' else '',
+                    'tipo': partes[4] if partes[4] != '<null>' else ''
+                })
+            except (ValueError, IndexError):
+                continue
+    return devoluciones
+
+
+def parsear_devoluciones_parciales(stdout: str) -> List[Dict[str, Any]]:
+    """Parsea DEVOLUCIONES_ARTICULOS. El precio de venta = DINERO / CANTIDAD."""
+    resultado = []
+    datos_inicio = False
+    for linea in stdout.strip().split('\n'):
+        linea = linea.strip()
+        if not linea or linea.startswith('=') or linea.startswith('-'):
+            continue
+        # Detectar inicio de datos (después de la línea de encabezados)
+        if 'DEVOLUCION_ID' in linea or 'FOLIO' in linea:
+            datos_inicio = True
+            continue
+        if not datos_inicio:
+            continue
+
+        # Formato: DEVOLUCION_ID FOLIO CODIGO DESCRIPCION... CANTIDAD DINERO FECHA
+        partes = linea.split()
+        if len(partes) < 6:
+            continue
+        try:
+            devolucion_id = int(partes[0])
+            folio = int(partes[1])
+            codigo = partes[2] if partes[2] else ""
+
+            # Buscar la fecha al final (formato YYYY-MM-DD HH:MM:SS o similar)
+            fecha_dev = None
+            idx_fecha = -1
+            for i in range(len(partes) - 1, 2, -1):
+                if '-' in partes[i] and len(partes[i]) >= 10:
+                    fecha_dev = partes[i][:10]
+                    idx_fecha = i
+                    break
+            if idx_fecha == -1:
+                continue
+
+            dinero = float(partes[idx_fecha - 1].replace(',', ''))
+            cantidad = float(partes[idx_fecha - 2].replace(',', ''))
+            descripcion = ' '.join(partes[3:idx_fecha - 2])
+
+            resultado.append({
+                'folio': folio,
+                'devolucion_id': devolucion_id,
+                'codigo': codigo,
+                'descripcion': descripcion.strip(),
+                'cantidad': cantidad,
+                'valor_unitario': dinero / cantidad if cantidad > 0 else 0,
+                'dinero': dinero,
+                'fecha_devolucion': fecha_dev
+            })
+        except (ValueError, IndexError) as e:
+            print(f"⚠️ Error parseando línea: {linea} - {e}")
+            continue
+    return resultado
+
+
+def parsear_movimientos(stdout: str) -> Tuple[List[Dict], List[Dict]]:
+    entradas = []
+    salidas = []
+    header_visto = False
+    for linea in stdout.split('\n'):
+        linea = linea.strip()
+        if not linea or linea.startswith('='):
+            continue
+        if 'ID' in linea and 'TIPO' in linea:
+            header_visto = True
+            continue
+        if not header_visto:
+            continue
+        partes = linea.split()
+        if len(partes) >= 3:
+            try:
+                tipo = partes[1].upper()
+                mov = {
+                    'id': int(partes[0]),
+                    'tipo': tipo,
+                    'monto': float(partes[2]) if partes[2] != '<null>' else 0.0,
+                    'comentario': ' '.join(partes[3:]).replace('<null>', '').strip() if len(partes) > 3 else ''
+                }
+                if tipo == 'E':  # Entrada/Ingreso
+                    entradas.append(mov)
+                elif tipo == 'S':  # Salida
+                    salidas.append(mov)
+            except (ValueError, IndexError):
+                continue
+    return entradas, salidas
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CARGA COMPLETA
+# ══════════════════════════════════════════════════════════════════════════════
+
+def consultar_estado_dia(ejecutar_sql: EjecutarSQL, fecha: str,
+                         token: CancelToken = None) -> EstadoDia:
+    """Ejecuta todas las consultas del día y retorna un EstadoDia.
+
+    Lanza ErrorCargaDia si falla la consulta principal de facturas; el resto
+    de consultas son best-effort igual que en la carga original. Las cinco
+    consultas van en un solo lote (un proceso de isql y un attach).
+    """
+    estado = EstadoDia(fecha=fecha)
+
+    if token:
+        token.verificar()
+    resultados = ejecutar_lote(ejecutar_sql, {
+        'facturas': sql_facturas(fecha),
+        'canceladas_otro_dia': sql_canceladas_otro_dia(fecha),
+        'devoluciones': sql_devoluciones(fecha),
+        'dev_parciales': sql_devoluciones_parciales(fecha),
+        'movimientos': sql_movimientos(fecha),
+    })
+    if token:
+        token.verificar()
+
+    ok, stdout, stderr = resultados['facturas']
+    if not ok or not stdout:
+        raise ErrorCargaDia(stderr or "No se recibieron datos de la BD")
+    estado.ventas = parsear_facturas(stdout, fecha)
+
+    ok, stdout, _ = resultados['canceladas_otro_dia']
+    if ok and stdout:
+        estado.canceladas_otro_dia = parsear_canceladas_otro_dia(stdout, fecha)
+
+    ok, stdout, _ = resultados['devoluciones']
+    if ok and stdout:
+        estado.devoluciones = parsear_devoluciones(stdout)
+
+    ok, stdout, stderr = resultados['dev_parciales']
+    if ok and stdout:
+        estado.dev_parciales = parsear_devoluciones_parciales(stdout)
+    else:
+        print(f"⚠️ No se pudieron cargar devoluciones parciales: {stderr}")
+
+    ok, stdout, _ = resultados['movimientos']
+    if ok and stdout:
+        estado.movimientos_entrada, estado.movimientos_salida = parsear_movimientos(stdout)
+
+    estado.cargado_en = time.time()
+    return estado
+
+
+def armar_ventas(estado: EstadoDia, asignaciones_dia: Dict[int, str],
+                 obtener_asignacion: Callable[[int, str], Optional[str]]) -> Tuple[List[Dict], List[int]]:
+    """Combina el estado de Firebird con las asignaciones guardadas.
+
+    Args:
+        asignaciones_dia: {folio: repartidor} de la fecha del estado
+        obtener_asignacion: (folio, fecha) -> repartidor, para canceladas de otro día
+
+    Returns:
+        (ventas, folios_cajero_nuevos): folios "Ticket X"/"MOSTRADOR" sin
+        asignación que se asignan automáticamente a CAJERO y deben persistirse.
+    """
+    ventas = []
+    nuevos_cajero = []
+    for base in estado.ventas:
+        v = dict(base)
+        rep = asignaciones_dia.get(v['folio']) or ''
+        # Si el nombre es "Ticket X", "MOSTRADOR" o similar, asignar a CAJERO
+        nombre_lower = v['nombre'].lower()
+        if not rep and (nombre_lower.startswith('ticket ') or nombre_lower == 'ticket' or nombre_lower == 'mostrador'):
+            rep = 'CAJERO'
+            nuevos_cajero.append(v['folio'])
+        v['repartidor'] = rep
+        ventas.append(v)
+
+    for base in estado.canceladas_otro_dia:
+        v = dict(base)
+        # Para canceladas de otro día, buscar si tiene repartidor asignado
+        v['repartidor'] = obtener_asignacion(v['folio'], v.get('fecha_creacion', '')) or ''
+        ventas.append(v)
+
+    return ventas, nuevos_cajero
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# RECARGA INCREMENTAL (DELTA)
+# ══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class DeltaDia:
+    """Cambios en Firebird desde la última carga de un día."""
+    fecha: str
+    ventas_nuevas: List[Dict[str, Any]] = field(default_factory=list)
+    ventas_actualizadas: List[Dict[str, Any]] = field(default_factory=list)
+    devoluciones_nuevas: List[Dict[str, Any]] = field(default_factory=list)
+    # Se reemplazan completas solo cuando hubo devoluciones nuevas que las afectan
+    canceladas_otro_dia: Optional[List[Dict[str, Any]]] = None
+    dev_parciales: Optional[List[Dict[str, Any]]] = None
+    entradas_nuevas: List[Dict[str, Any]] = field(default_factory=list)
+    salidas_nuevas: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def vacio(self) -> bool:
+        return not (self.ventas_nuevas or self.ventas_actualizadas or self.devoluciones_nuevas
+                    or self.canceladas_otro_dia is not None or self.dev_parciales is not None
+                    or self.entradas_nuevas or self.salidas_nuevas)
+
+
+def _max_id(filas: List[Dict[str, Any]]) -> int:
+    return max((f['id'] for f in filas), default=0)
+
+
+def consultar_delta_dia(ejecutar_sql: EjecutarSQL, base: EstadoDia,
+                        token: CancelToken = None) -> DeltaDia:
+    """Consulta solo lo que cambió desde `base`: tickets con ID mayor al último visto,
+    devoluciones nuevas (y los tickets que afectan) y movimientos nuevos.
+
+    Lanza ErrorCargaDia si falla la consulta de devoluciones o de facturas.
+    """
+    fecha = base.fecha
+    delta = DeltaDia(fecha=fecha)
+
+    ok, stdout, stderr = ejecutar_sql(sql_devoluciones_delta(fecha, _max_id(base.devoluciones)))
+    if not ok:
+        raise ErrorCargaDia(stderr or "No se pudieron consultar devoluciones")
+    delta.devoluciones_nuevas = parsear_devoluciones(stdout) if stdout else []
+
+    # Tickets ya cargados que cambiaron (cancelados/devueltos desde la última carga)
+    ids_conocidos = {v['id'] for v in base.ventas}
+    ids_refrescar = sorted({d['ticket_id'] for d in delta.devoluciones_nuevas} & ids_conocidos)
+
+    if token:
+        token.verificar()
+    ok, stdout, stderr = ejecutar_sql(sql_facturas_delta(fecha, _max_id(base.ventas), ids_refrescar))
+    if not ok:
+        raise ErrorCargaDia(stderr or "No se recibieron datos de la BD")
+    for v in (parsear_facturas(stdout, fecha) if stdout else []):
+        (delta.ventas_actualizadas if v['id'] in ids_conocidos else delta.ventas_nuevas).append(v)
+
+    # Consultas de seguimiento en un solo lote
+    tipos = {d['tipo'] for d in delta.devoluciones_nuevas}
+    id_mov = max(_max_id(base.movimientos_entrada), _max_id(base.movimientos_salida))
+    consultas = {}
+    if 'C' in tipos:
+        # Una cancelación nueva puede ser de un ticket de otro día
+        consultas['canceladas_otro_dia'] = sql_canceladas_otro_dia(fecha)
+    if 'P' in tipos:
+        consultas['dev_parciales'] = sql_devoluciones_parciales(fecha)
+    consultas['movimientos'] = sql_movimientos_delta(fecha, id_mov)
+
+    if token:
+        token.verificar()
+    resultados = ejecutar_lote(ejecutar_sql, consultas)
+
+    if 'canceladas_otro_dia' in resultados:
+        ok, stdout, _ = resultados['canceladas_otro_dia']
+        if ok:
+            delta.canceladas_otro_dia = parsear_canceladas_otro_dia(stdout, fecha) if stdout else []
+    if 'dev_parciales' in resultados:
+        ok, stdout, _ = resultados['dev_parciales']
+        if ok and stdout:
+            delta.dev_parciales = parsear_devoluciones_parciales(stdout)
+
+    ok, stdout, _ = resultados['movimientos']
+    if ok and stdout:
+        delta.entradas_nuevas, delta.salidas_nuevas = parsear_movimientos(stdout)
+
+    return delta
+
+
+def aplicar_delta(base: EstadoDia, delta: DeltaDia) -> EstadoDia:
+    """Nuevo EstadoDia = base + delta (base no se modifica; puede estar en caché)."""
+    actualizadas = {v['id']: v for v in delta.ventas_actualizadas}
+    ventas = [actualizadas.get(v['id'], v) for v in base.ventas] + delta.ventas_nuevas
+    return EstadoDia(
+        fecha=base.fecha,
+        ventas=ventas,
+        canceladas_otro_dia=(delta.canceladas_otro_dia if delta.canceladas_otro_dia is not None
+                             else base.canceladas_otro_dia),
+        devoluciones=base.devoluciones + delta.devoluciones_nuevas,
+        dev_parciales=delta.dev_parciales if delta.dev_parciales is not None else base.dev_parciales,
+        movimientos_entrada=base.movimientos_entrada + delta.entradas_nuevas,
+        movimientos_salida=base.movimientos_salida + delta.salidas_nuevas,
+        corte=base.corte,
+    )
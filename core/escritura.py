@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+ColaEscritura - Persistencia diferida (write-behind) de las mutaciones
+======================================================================
+
+Las mutaciones del DataStore ya cambiaron la memoria cuando llegan aquí;
+la escritura en SQLite se encola y un hilo escritor la aplica en lotes
+(una transacción por lote), así el hilo de Tk no espera al disco ni a
+que otro proceso (run_anotaciones.py) suelte la base.
+
+- Diario: cada operación se agrega como una línea JSON a un archivo antes
+  de volver al llamador. El escritor lo sincroniza a disco (fsync) antes
+  de aplicar cada lote y lo vacía cuando la cola queda al día. Al abrir la
+  aplicación se re-aplican las líneas cuya secuencia es mayor que la
+  última confirmada en la base (la confirma el mismo lote, así que cada
+  operación se aplica una sola vez).
+- Orden: las operaciones se aplican en el orden en que se encolaron.
+- Fallos: si una operación falla, se deshace solo esa operación y se
+  avisa con su on_error (o con `al_fallar`). Si la base está ocupada, el
+  lote completo se reintenta con espera creciente.
+- Leer después de escribir: `esperar(tabla)` bloquea hasta que lo
+  encolado para esa tabla esté confirmado; database_local la llama la
+  primera vez que una conexión lee cada tabla (registrar_barrera_lectura),
+  así las lecturas de tablas sin escrituras pendientes no esperan. En el
+  hilo de UI nunca espera: ahí la memoria del DataStore va por delante de
+  la base, y sus avisos de cambio llegan cuando la escritura ya se confirmó.
+
+Uso:
+    cola = ColaEscritura(db.RUTA_COLA_ESCRITURA,
+                         {n: getattr(db, n) for n in db.OPERACIONES_DIFERIDAS},
+                         db.lote_escritura, db.obtener_secuencia_aplicada(),
+                         tablas={n: db.tablas_escritas(n) for n in db.OPERACIONES_DIFERIDAS})
+    cola.encolar('guardar_asignacion', fecha, folio, repartidor, on_error=avisar)
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+MAX_LOTE = 200                  # operaciones por transacción
+ESPERA_REINTENTO_S = 0.05       # primera espera si la base está ocupada (se duplica)
+ESPERA_REINTENTO_MAX_S = 2.0
+ESPERA_LECTURA_S = 10.0         # lo más que una lectura espera a la cola
+# En el diario, los dict con claves que no son texto (el conteo de dinero:
+# denominación int -> cantidad) se guardan como pares para no volver como str
+_CLAVE_PARES = '__pares__'
+
+
+class OperacionFallida(Exception):
+    """La operación diferida no se pudo aplicar (retornó error o lanzó)."""
+
+
+def _a_diario(valor: Any) -> Any:
+    """Argumento -> valor JSON que se lee de vuelta igual (ver _CLAVE_PARES)."""
+    if isinstance(valor, dict):
+        if all(isinstance(clave, str) for clave in valor):
+            return {clave: _a_diario(v) for clave, v in valor.items()}
+        return {_CLAVE_PARES: [[clave, _a_diario(v)] for clave, v in valor.items()]}
+    if isinstance(valor, (list, tuple)):
+        return [_a_diario(v) for v in valor]
+    return valor
+
+
+def _de_diario(objeto: dict) -> Any:
+    """object_hook de json.loads: deshace los pares de _a_diario."""
+    if len(objeto) == 1 and _CLAVE_PARES in objeto:
+        return {clave: v for clave, v in objeto[_CLAVE_PARES]}
+    return objeto
+
+
+class _Entrada:
+    __slots__ = ('secuencia', 'operacion', 'args', 'on_ok', 'on_error')
+
+    def __init__(self, secuencia: int, operacion: str, args: tuple,
+                 on_ok: Callable = None, on_error: Callable = None):
+        self.secuencia = secuencia
+        self.operacion = operacion
+        self.args = args
+        self.on_ok = on_ok
+        self.on_error = on_error
+
+
+class ColaEscritura:
+    """Cola ordenada y con diario de operaciones de escritura, aplicada en lotes."""
+
+    def __init__(self, ruta_diario: str, operaciones: Dict[str, Callable],
+                 abrir_lote: Callable, secuencia_aplicada: int = 0,
+                 despachar: Callable = None, al_fallar: Callable = None,
+                 tablas: Dict[str, Iterable[str]] = None):
+        """
+        Args:
+            ruta_diario: archivo JSONL del diario
+            operaciones: nombre -> función que se ejecuta dentro del lote
+            abrir_lote: context manager que abre la transacción y entrega un
+                objeto con ejecutar(fn, args) -> (ok, resultado) y confirmar(secuencia)
+            secuencia_aplicada: última secuencia ya confirmada en la base
+            despachar: despacha callbacks al hilo de UI (executor.llamar_en_ui);
+                sin él se llaman desde el hilo escritor
+            al_fallar: callback(descripcion, error) para fallos sin on_error
+            tablas: nombre -> tablas que escribe la operación (para esperar
+                por tabla); sin él, esperar(tabla) espera toda la cola
+        """
+        self.ruta_diario = ruta_diario
+        self._operaciones = dict(operaciones)
+        self._abrir_lote = abrir_lote
+        self._despachar = despachar or (lambda fn, *args: fn(*args))
+        self._al_fallar = al_fallar
+        self._tablas = {nombre: tuple(t) for nombre, t in (tablas or {}).items()}
+        # Hilo que no debe esperar nunca a la cola (el que la crea: el de Tk)
+        self._hilo_ui = threading.current_thread()
+
+        self._cond = threading.Condition()
+        self._pendientes: deque = deque()
+        self._aplicada = secuencia_aplicada
+        self._encolada = secuencia_aplicada
+        self._ultima_por_tabla: Dict[str, int] = {}
+        self._detenida = False
+        self._diario = None
+
+        self._recuperar_diario()
+        self._diario = open(self.ruta_diario, 'a', encoding='utf-8')
+        self._hilo = threading.Thread(target=self._escribir, daemon=True, name='cola-escritura')
+        self._hilo.start()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def encolar(self, operacion: str, *args, on_ok: Callable = None,
+                on_error: Callable = None) -> int:
+        """
+        Agrega la operación al diario y a la cola; retorna su secuencia.
+
+        Args:
+            on_ok: callback(resultado) cuando quede confirmada
+            on_error: callback(excepcion) si falla
+        """
+        if operacion not in self._operaciones:
+            raise ValueError(f"Operación diferida desconocida: {operacion}")
+        with self._cond:
+            if self._detenida:
+                raise RuntimeError("La cola de escritura está detenida")
+            self._encolada += 1
+            entrada = _Entrada(self._encolada, operacion, args, on_ok, on_error)
+            self._diario.write(json.dumps({'s': entrada.secuencia, 'op': operacion, 'args': _a_diario(args)},
+                                          ensure_ascii=False, default=str) + '\n')
+            self._diario.flush()
+            self._pendientes.append(entrada)
+            self._marcar_tablas(entrada)
+            self._cond.notify_all()
+            return entrada.secuencia
+
+    def esperar(self, tabla: str = None, timeout: float = ESPERA_LECTURA_S) -> bool:
+        """
+        Espera a que lo encolado hasta ahora para `tabla` (None: todo) esté
+        confirmado. En el hilo de UI no espera. False si no está al día.
+        """
+        actual = threading.current_thread()
+        if actual is self._hilo:
+            return True
+        with self._cond:
+            objetivo = self._objetivo(tabla)
+            if self._aplicada >= objetivo:
+                return True
+            if actual is self._hilo_ui:
+                return False
+            listo = self._cond.wait_for(lambda: self._aplicada >= objetivo, timeout)
+        if not listo:
+            print(f"⚠️ La cola de escritura sigue con {self.pendientes()} operaciones; se lee sin esperarlas")
+        return listo
+
+    def pendiente(self, tabla: str) -> bool:
+        """True si hay escrituras de `tabla` encoladas sin confirmar."""
+        with self._cond:
+            return self._aplicada < self._objetivo(tabla)
+
+    def pendientes(self) -> int:
+        with self._cond:
+            return self._encolada - self._aplicada
+
+    def detener(self, timeout: float = 10.0) -> None:
+        """Aplica lo pendiente y detiene el hilo escritor."""
+        with self._cond:
+            self._detenida = True
+            self._cond.notify_all()
+        self._hilo.join(timeout)
+
+    def _objetivo(self, tabla: Optional[str]) -> int:
+        """Secuencia que hay que tener aplicada para leer `tabla` al día."""
+        if tabla is None or not self._tablas:
+            return self._encolada
+        return self._ultima_por_tabla.get(tabla, 0)
+
+    def _marcar_tablas(self, entrada: _Entrada) -> None:
+        for tabla in self._tablas.get(entrada.operacion, ()):
+            self._ultima_por_tabla[tabla] = entrada.secuencia
+
+    # ------------------------------------------------------------------
+    # Diario
+    # ------------------------------------------------------------------
+    def _recuperar_diario(self) -> None:
+        """Re-encola las operaciones del diario que no llegaron a confirmarse."""
+        if not os.path.exists(self.ruta_diario):
+            return
+        recuperadas = 0
+        with open(self.ruta_diario, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea, object_hook=_de_diario)
+                except ValueError:
+                    continue  # Última línea a medio escribir
+                secuencia = int(registro['s'])
+                self._encolada = max(self._encolada, secuencia)
+                if secuencia <= self._aplicada or registro['op'] not in self._operaciones:
+                    continue
+                entrada = _Entrada(secuencia, registro['op'], tuple(registro['args']))
+                self._pendientes.append(entrada)
+                self._marcar_tablas(entrada)
+                recuperadas += 1
+        if recuperadas:
+            print(f"✅ Cola de escritura: {recuperadas} operaciones recuperadas del diario")
+        else:
+            open(self.ruta_diario, 'w').close()
+
+    def _sincronizar_diario(self) -> None:
+        with self._cond:
+            self._diario.flush()
+            os.fsync(self._diario.fileno())
+
+    def _vaciar_diario_si_al_dia(self) -> None:
+        with self._cond:
+            if not self._pendientes and self._aplicada >= self._encolada:
+                self._diario.truncate(0)
+                self._diario.seek(0)
+
+    # ------------------------------------------------------------------
+    # Hilo escritor
+    # ------------------------------------------------------------------
+    def _escribir(self) -> None:
+        espera = ESPERA_REINTENTO_S
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pendientes or self._detenida)
+                if not self._pendientes:
+                    self._diario.close()
+                    return
+                lote = list(self._pendientes)[:MAX_LOTE]
+
+            try:
+                self._sincronizar_diario()
+                resultados = self._aplicar(lote)
+            except Exception as e:
+                # Base ocupada o no disponible: el lote completo se reintenta
+                if espera == ESPERA_REINTENTO_S:
+                    print(f"⚠️ No se pudo guardar ({len(lote)} operaciones en cola), reintentando: {e}")
+                time.sleep(espera)
+                espera = min(espera * 2, ESPERA_REINTENTO_MAX_S)
+                continue
+            espera = ESPERA_REINTENTO_S
+
+            with self._cond:
+                for _ in lote:
+                    self._pendientes.popleft()
+                self._aplicada = lote[-1].secuencia
+                self._cond.notify_all()
+            self._vaciar_diario_si_al_dia()
+            for entrada, (ok, resultado) in zip(lote, resultados):
+                self._avisar(entrada, ok, resultado)
+
+    def _aplicar(self, lote) -> list:
+        """Ejecuta el lote en una transacción y la confirma."""
+        resultados = []
+        with self._abrir_lote() as transaccion:
+            for entrada in lote:
+                resultados.append(transaccion.ejecutar(self._operaciones[entrada.operacion], entrada.args))
+            transaccion.confirmar(lote[-1].secuencia)
+        return resultados
+
+    def _avisar(self, entrada: _Entrada, ok: bool, resultado: Any) -> None:
+        try:
+            if ok:
+                if entrada.on_ok is not None:
+                    self._despachar(entrada.on_ok, resultado)
+                return
+            error = resultado if isinstance(resultado, Exception) else OperacionFallida(
+                resultado.get('error') if isinstance(resultado, dict) else f"{entrada.operacion} retornó {resultado!r}")
+            if entrada.on_error is not None:
+                self._despachar(entrada.on_error, error)
+            elif self._al_fallar is not None:
+                self._despachar(self._al_fallar, entrada.operacion, error)
+            else:
+                print(f"⚠️ Error en escritura diferida {entrada.operacion}: {error}")
+        except Exception:
+            traceback.print_exc()
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# INSTANCIA COMPARTIDA
+# ══════════════════════════════════════════════════════════════════════════════
+
+_cola: Optional[ColaEscritura] = None
+
+
+def get_cola_escritura() -> Optional[ColaEscritura]:
+    """Cola de escritura de la aplicación (None si no se inició)."""
+    return _cola
+
+
+def iniciar_cola_escritura(db, despachar: Callable = None, al_fallar: Callable = None) -> ColaEscritura:
+    """
+    Crea la cola compartida sobre database_local y registra su barrera de
+    lectura. Llamadas repetidas retornan la misma cola.
+    """
+    global _cola
+    if _cola is None:
+        _cola = ColaEscritura(db.RUTA_COLA_ESCRITURA,
+                              {nombre: getattr(db, nombre) for nombre in db.OPERACIONES_DIFERIDAS},
+                              db.lote_escritura, db.obtener_secuencia_aplicada(),
+                              despachar=despachar, al_fallar=al_fallar,
+                              tablas={nombre: db.tablas_escritas(nombre) for nombre in db.OPERACIONES_DIFERIDAS})
+        db.registrar_barrera_lectura(_cola.esperar)
+    return _cola
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+TaskExecutor - Servicio compartido de tareas en segundo plano
+=============================================================
+
+Pool de hilos acotado con:
+- Colas con nombre ('firebird', 'sqlite', ...) con límite de concurrencia propio
+- Prioridades (lo visible en pantalla se ejecuta antes que el prefetch)
+- Tokens de cancelación
+- Deduplicación de peticiones idénticas en vuelo (misma `clave`)
+- Una única cola de callbacks de UI drenada con `after` desde el hilo de Tk
+  (cerrada la ventana, los callbacks se descartan: nunca corren en otro hilo)
+- Las tareas canceladas avisan a su on_error con TareaCancelada
+
+Uso:
+    ex = get_executor()
+    ex.conectar_tk(ventana)          # una sola vez, desde el hilo de Tk
+    ex.submit(cargar, fecha, cola='firebird', clave=('dia', fecha),
+              on_ok=aplicar, on_error=mostrar_error)
+"""
+import heapq
+import itertools
+import queue
+import threading
+import traceback
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+# Prioridades (menor número = se ejecuta antes)
+PRIORIDAD_UI = 0
+PRIORIDAD_NORMAL = 5
+PRIORIDAD_PREFETCH = 10
+
+# Límite de tareas simultáneas por cola con nombre.
+# Firebird via isql no gana nada con muchas sesiones a la vez.
+LIMITES_COLA_DEFAULT = {
+    'firebird': 2,
+    'sqlite': 2,
+    'respaldo': 1,
+    'miniaturas': 1,
+}
+
+
+class TareaCancelada(Exception):
+    """Se lanza desde una tarea cuando su token fue cancelado."""
+
+
+class CancelToken:
+    """Token de cancelación compartido entre quien envía la tarea y la tarea."""
+
+    def __init__(self):
+        self._evento = threading.Event()
+
+    def cancelar(self) -> None:
+        self._evento.set()
+
+    @property
+    def cancelado(self) -> bool:
+        return self._evento.is_set()
+
+    def verificar(self) -> None:
+        """Lanza TareaCancelada si el token fue cancelado (para tareas largas)."""
+        if self._evento.is_set():
+            raise TareaCancelada()
+
+
+class Tarea:
+    """Handle de una tarea enviada al executor."""
+
+    PENDIENTE = 'pendiente'
+    EJECUTANDO = 'ejecutando'
+    TERMINADA = 'terminada'
+    CANCELADA = 'cancelada'
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, cola: str,
+                 prioridad: int, clave: Optional[Hashable], token: CancelToken):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cola = cola
+        self.prioridad = prioridad
+        self.clave = clave
+        self.token = token
+        self.estado = Tarea.PENDIENTE
+        self.resultado: Any = None
+        self.error: Optional[BaseException] = None
+        self._callbacks: List[tuple] = []
+        self._hecho = threading.Event()
+
+    def cancelar(self) -> None:
+        self.token.cancelar()
+
+    @property
+    def cancelada(self) -> bool:
+        return self.estado == Tarea.CANCELADA or self.token.cancelado
+
+    def hecha(self) -> bool:
+        return self._hecho.is_set()
+
+    def esperar(self, timeout: float = None) -> Any:
+        """Bloquea hasta que termine y retorna el resultado (o relanza el error)."""
+        if not self._hecho.wait(timeout):
+            raise TimeoutError("La tarea no terminó a tiempo")
+        if self.estado == Tarea.CANCELADA:
+            raise TareaCancelada()
+        if self.error is not None:
+            raise self.error
+        return self.resultado
+
+
+class TaskExecutor:
+    """Pool de hilos con prioridades, colas con nombre y despacho seguro a Tk."""
+
+    def __init__(self, max_workers: int = 4, limites_cola: Dict[str, int] = None):
+        self.max_workers = max(1, max_workers)
+        self._limites = dict(LIMITES_COLA_DEFAULT)
+        if limites_cola:
+            self._limites.update(limites_cola)
+
+        self._cond = threading.Condition()
+        self._heap: list = []               # (prioridad, secuencia, tarea)
+        self._secuencia = itertools.count()
+        self._activas_por_cola: Dict[str, int] = {}
+        self._en_vuelo: Dict[Hashable, Tarea] = {}
+        self._hilos: List[threading.Thread] = []
+        self._detenido = False
+
+        # Callbacks pendientes para el hilo de Tk
+        self._cola_ui: "queue.Queue[tuple]" = queue.Queue()
+        self._widget_tk = None
+        self._intervalo_ui = 30
+        self._ui_cerrada = False            # la ventana conectada ya no existe
+
+    # ------------------------------------------------------------------
+    # Integración con Tk
+    # ------------------------------------------------------------------
+    def conectar_tk(self, widget, intervalo_ms: int = 30) -> None:
+        """Comienza a drenar callbacks de UI con `widget.after`.
+
+        Debe llamarse desde el hilo de Tk. Llamadas repetidas no hacen nada
+        mientras el widget conectado siga vivo.
+        """
+        if self._widget_tk is not None:
+            try:
+                if self._widget_tk.winfo_exists():
+                    return
+            except Exception:
+                pass
+        self._widget_tk = widget
+        self._intervalo_ui = intervalo_ms
+        self._ui_cerrada = False
+        widget.after(intervalo_ms, self._drenar_ui)
+
+    def _drenar_ui(self) -> None:
+        widget = self._widget_tk
+        if widget is None:
+            return
+        # Limitar por tick para no congelar la UI si llegan muchos callbacks
+        for _ in range(50):
+            try:
+                fn, args = self._cola_ui.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+        try:
+            widget.after(self._intervalo_ui, self._drenar_ui)
+        except Exception:
+            # La ventana fue destruida: lo que quede ya no tiene dónde pintarse
+            self._ui_cerrada = True
+            self._widget_tk = None
+            self._vaciar_cola_ui()
+
+    def _vaciar_cola_ui(self) -> None:
+        while True:
+            try:
+                self._cola_ui.get_nowait()
+            except queue.Empty:
+                return
+
+    def llamar_en_ui(self, fn: Callable, *args) -> None:
+        """Encola `fn(*args)` para ejecutarse en el hilo de Tk.
+
+        Sin ventana conectada (modo headless) se ejecuta directamente; un
+        error del callback se registra y no afecta al hilo que lo llama.
+        Si la ventana conectada ya se cerró, el callback se descarta.
+        """
+        if self._ui_cerrada:
+            return
+        if self._widget_tk is None:
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+        else:
+            self._cola_ui.put((fn, args))
+
+    # ------------------------------------------------------------------
+    # Envío de tareas
+    # ------------------------------------------------------------------
+    def submit(self, fn: Callable, *args, cola: str = 'general',
+               prioridad: int = PRIORIDAD_NORMAL, clave: Hashable = None,
+               on_ok: Callable = None, on_error: Callable = None,
+               token: CancelToken = None, **kwargs) -> Tarea:
+        """Envía `fn(*args, **kwargs)` al pool.
+
+        Args:
+            cola: Nombre de la cola (limita concurrencia por tipo de recurso)
+            prioridad: PRIORIDAD_UI / PRIORIDAD_NORMAL / PRIORIDAD_PREFETCH
+            clave: Si ya hay una tarea en vuelo con la misma clave, se reutiliza
+                   (se suman los callbacks y se sube la prioridad si hace falta)
+            on_ok: callback(resultado), ejecutado en el hilo de Tk
+            on_error: callback(excepcion), ejecutado en el hilo de Tk
+            token: CancelToken a compartir con la tarea (se crea uno si falta)
+        """
+        with self._cond:
+            if self._detenido:
+                raise RuntimeError("El executor está detenido")
+
+            if clave is not None:
+                existente = self._en_vuelo.get(clave)
+                if existente is not None and not existente.cancelada:
+                    self._agregar_callbacks(existente, on_ok, on_error)
+                    if prioridad < existente.prioridad and existente.estado == Tarea.PENDIENTE:
+                        # Re-encolar con mayor prioridad; la entrada vieja se ignora
+                        existente.prioridad = prioridad
+                        heapq.heappush(self._heap, (prioridad, next(self._secuencia), existente))
+                        self._cond.notify()
+                    return existente
+
+            tarea = Tarea(fn, args, kwargs, cola, prioridad, clave, token or CancelToken())
+            self._agregar_callbacks(tarea, on_ok, on_error)
+            if clave is not None:
+                self._en_vuelo[clave] = tarea
+            heapq.heappush(self._heap, (prioridad, next(self._secuencia), tarea))
+            self._asegurar_hilos()
+            self._cond.notify()
+            return tarea
+
+    def _agregar_callbacks(self, tarea: Tarea, on_ok, on_error) -> None:
+        if on_ok is None and on_error is None:
+            return
+        if tarea.hecha():
+            self._despachar(tarea, [(on_ok, on_error)])
+        else:
+            tarea._callbacks.append((on_ok, on_error))
+
+    def cancelar(self, clave: Hashable) -> bool:
+        """
+        Cancela la tarea en vuelo con esa clave. Sus on_error reciben
+        TareaCancelada: ya si no había empezado, al terminar si estaba corriendo.
+        """
+        with self._cond:
+            tarea = self._en_vuelo.get(clave)
+            if tarea is None:
+                return False
+            tarea.cancelar()
+            callbacks = self._finalizar_cancelada(tarea) if tarea.estado == Tarea.PENDIENTE else []
+        self._despachar(tarea, callbacks)
+        return True
+
+    def cancelar_cola(self, cola: str, prioridad_minima: int = None) -> int:
+        """
+        Cancela las tareas PENDIENTES de una cola (opcionalmente solo
+        prefetch); sus on_error reciben TareaCancelada.
+        """
+        canceladas = []
+        with self._cond:
+            for _, _, tarea in self._heap:
+                if tarea.cola != cola or tarea.estado != Tarea.PENDIENTE:
+                    continue
+                if prioridad_minima is not None and tarea.prioridad < prioridad_minima:
+                    continue
+                tarea.cancelar()
+                canceladas.append((tarea, self._finalizar_cancelada(tarea)))
+        for tarea, callbacks in canceladas:
+            self._despachar(tarea, callbacks)
+        return len(canceladas)
+
+    def pendientes(self) -> int:
+        with self._cond:
+            return sum(1 for _, _, t in self._heap if t.estado == Tarea.PENDIENTE)
+
+    def detener(self, esperar: bool = False) -> None:
+        """Detiene los hilos; las tareas pendientes se cancelan."""
+        canceladas = []
+        with self._cond:
+            self._detenido = True
+            for _, _, tarea in self._heap:
+                tarea.cancelar()
+                if tarea.estado == Tarea.PENDIENTE:
+                    canceladas.append((tarea, self._finalizar_cancelada(tarea)))
+            self._cond.notify_all()
+        for tarea, callbacks in canceladas:
+            self._despachar(tarea, callbacks)
+        if esperar:
+            for hilo in self._hilos:
+                hilo.join(timeout=5)
+
+    # ------------------------------------------------------------------
+    # Hilos de trabajo
+    # ------------------------------------------------------------------
+    def _asegurar_hilos(self) -> None:
+        """Crea hilos bajo demanda hasta max_workers (llamar con el lock tomado)."""
+        self._hilos = [h for h in self._hilos if h.is_alive()]
+        if len(self._hilos) < self.max_workers:
+            hilo = threading.Thread(target=self._trabajar, daemon=True,
+                                    name=f"executor-{len(self._hilos)}")
+            self._hilos.append(hilo)
+            hilo.start()
+
+    def _siguiente(self, canceladas: List[tuple]) -> Optional[Tarea]:
+        """
+        Toma la tarea de mayor prioridad cuya cola tenga capacidad libre. Las
+        canceladas por su token que encuentra van a `canceladas` (tarea, callbacks).
+        """
+        saltadas = []
+        elegida = None
+        while self._heap:
+            entrada = heapq.heappop(self._heap)
+            _, _, tarea = entrada
+            if tarea.estado != Tarea.PENDIENTE or entrada[0] != tarea.prioridad:
+                # Entrada obsoleta (re-encolada con otra prioridad o ya tomada)
+                continue
+            if tarea.token.cancelado:
+                canceladas.append((tarea, self._finalizar_cancelada(tarea)))
+                continue
+            limite = self._limites.get(tarea.cola)
+            if limite is not None and self._activas_por_cola.get(tarea.cola, 0) >= limite:
+                saltadas.append(entrada)
+                continue
+            elegida = tarea
+            break
+        for entrada in saltadas:
+            heapq.heappush(self._heap, entrada)
+        return elegida
+
+    def _trabajar(self) -> None:
+        while True:
+            canceladas = []
+            with self._cond:
+                tarea = None
+                while not self._detenido:
+                    tarea = self._siguiente(canceladas)
+                    if tarea is not None or canceladas:
+                        break
+                    self._cond.wait()
+                if tarea is not None:
+                    tarea.estado = Tarea.EJECUTANDO
+                    self._activas_por_cola[tarea.cola] = self._activas_por_cola.get(tarea.cola, 0) + 1
+            for cancelada, callbacks in canceladas:
+                self._despachar(cancelada, callbacks)
+            if tarea is None:
+                if self._detenido:
+                    return
+                continue
+
+            try:
+                tarea.resultado = tarea.fn(*tarea.args, **tarea.kwargs)
+            except TareaCancelada:
+                tarea.token.cancelar()
+            except BaseException as e:
+                tarea.error = e
+            finally:
+                with self._cond:
+                    self._activas_por_cola[tarea.cola] -= 1
+                    if self._en_vuelo.get(tarea.clave) is tarea:
+                        del self._en_vuelo[tarea.clave]
+                    if tarea.token.cancelado:
+                        tarea.estado = Tarea.CANCELADA
+                    else:
+                        tarea.estado = Tarea.TERMINADA
+                    callbacks = list(tarea._callbacks)
+                    tarea._callbacks.clear()
+                    tarea._hecho.set()
+                    # Una cola liberó capacidad: despertar a los demás hilos
+                    self._cond.notify_all()
+
+            self._despachar(tarea, callbacks)
+
+    def _finalizar_cancelada(self, tarea: Tarea) -> List[tuple]:
+        """
+        Marca como cancelada una tarea que nunca llegó a ejecutarse (lock
+        tomado). Retorna sus callbacks para despacharlos fuera del lock.
+        """
+        tarea.estado = Tarea.CANCELADA
+        callbacks = list(tarea._callbacks)
+        tarea._callbacks.clear()
+        if self._en_vuelo.get(tarea.clave) is tarea:
+            del self._en_vuelo[tarea.clave]
+        tarea._hecho.set()
+        return callbacks
+
+    def _despachar(self, tarea: Tarea, callbacks: List[tuple]) -> None:
+        for on_ok, on_error in callbacks:
+            if tarea.estado == Tarea.CANCELADA:
+                if on_error is not None:
+                    self.llamar_en_ui(on_error, TareaCancelada())
+            elif tarea.error is not None:
+                if on_error is not None:
+                    self.llamar_en_ui(on_error, tarea.error)
+                else:
+                    print(f"⚠️ Error en tarea {tarea.clave or tarea.fn.__name__}: {tarea.error}")
+            elif on_ok is not None:
+                self.llamar_en_ui(on_ok, tarea.resultado)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# INSTANCIA COMPARTIDA
+# ══════════════════════════════════════════════════════════════════════════════
+
+_executor: Optional[TaskExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> TaskExecutor:
+    """Retorna el executor compartido de la aplicación (lo crea si no existe)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = TaskExecutor()
+        return _executor
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Ejecución de SQL en Firebird (PDVDATA.FDB de Eleventa) vía isql
+===============================================================
+
+Funciones sin interfaz para ejecutar consultas con isql y resolver las
+rutas por defecto del FDB y de isql. Las usan la aplicación de escritorio
+y el modo de línea de comandos (liquiventas).
+
+El transporte es intercambiable: ``usar_backend`` instala otro ejecutor
+(p. ej. la réplica SQLite de benchmarks/) y ``ejecutar_sql`` lo usa en
+lugar de isql. Un backend expone ``nombre``, ``ejecutar(ruta_fdb,
+isql_path, sql) -> (exito, stdout, stderr)`` con la salida en el formato
+de isql y, opcionalmente, ``conectar()`` con una conexión DB-API para el
+código que usa el driver ``fdb``. Sin backend, las consultas van a una
+sesión de isql que queda abierta (core.isql_sesion).
+"""
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+from typing import Any, Optional, Set, Tuple
+
+
+# Copias temporales del FDB (una por proceso) que se borran al salir
+_copias_tmp: Set[str] = set()
+
+
+def _borrar_copias_tmp() -> None:
+    for ruta in _copias_tmp:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+atexit.register(_borrar_copias_tmp)
+
+
+ERROR_SIN_ISQL = (
+    "No se encontró isql de Firebird.\n\n"
+    "Firebird no parece estar instalado correctamente.\n"
+    "Verifica la instalación en:\n"
+    "https://www.firebirdsql.org/download/\n\n"
+    "O agrega Firebird\\bin al PATH de tu sistema."
+)
+
+
+# Backend activo de las consultas (None = isql contra el FDB)
+_backend: Optional[Any] = None
+
+
+def usar_backend(backend: Optional[Any]) -> Optional[Any]:
+    """Instala un backend de consultas (None restaura isql). Retorna el anterior."""
+    global _backend
+    anterior, _backend = _backend, backend
+    return anterior
+
+
+def backend_activo() -> Optional[Any]:
+    """El backend instalado con usar_backend, o None si se usa isql."""
+    return _backend
+
+
+def ejecutar_sql(ruta_fdb: str, isql_path: str, sql: str) -> Tuple[bool, str, str]:
+    """Ejecuta un script SQL con el backend activo (por defecto la sesión persistente de isql)."""
+    backend = _backend
+    if backend is not None:
+        return backend.ejecutar(ruta_fdb, isql_path, sql)
+    from .isql_sesion import ejecutar_en_sesion, sesion_habilitada
+    if sesion_habilitada():
+        return ejecutar_en_sesion(ruta_fdb, isql_path, sql)
+    return ejecutar_isql(ruta_fdb, isql_path, sql)
+
+
+def rutas_por_defecto() -> Tuple[str, str]:
+    """(ruta_fdb, isql_path) según el sistema operativo y la configuración guardada."""
+    from .config import Config
+    if sys.platform == 'win32':
+        return Config.get_fdb_path(), Config.get_isql_path()
+    return os.path.join(Config.get_base_path(), 'PDVDATA.FDB'), Config.get_isql_path()
+
+
+def buscar_isql_windows() -> Optional[str]:
+    """isql.exe en las rutas comunes de instalación de Firebird, o 'isql' si está en el PATH."""
+    posibles_isql = [
+        r"C:\Program Files\Firebird\Firebird_5_0\isql.exe",  # Firebird 5.0
+        r"C:\Program Files\Firebird\Firebird_4_0\isql.exe",
+        r"C:\Program Files (x86)\Firebird\Firebird_4_0\bin\isql.exe",
+        r"C:\Program Files\Firebird\Firebird_3_0\isql.exe",
+        r"C:\Program Files (x86)\Firebird\Firebird_3_0\bin\isql.exe",
+        r"C:\Program Files\Firebird\Firebird_2_5\bin\isql.exe",
+        r"C:\Program Files (x86)\Firebird\Firebird_2_5\bin\isql.exe",
+        r"C:\Program Files\Firebird\bin\isql.exe",
+        r"C:\Program Files (x86)\Firebird\bin\isql.exe",
+    ]
+    
+    # Buscar isql en rutas estándar
+    for ruta in posibles_isql:
+        if os.path.exists(ruta):
+            return ruta
+    
+    # Si no encuentra, intentar ejecutar 'isql' directamente (puede estar en PATH)
+    try:
+        resultado_test = subprocess.run(
+            ['isql', '-version'],
+            capture_output=True,
+            timeout=2,
+            encoding='utf-8',
+            creationflags=subprocess.CREATE_NO_WINDOW
+        )
+        if resultado_test.returncode == 0:
+            return 'isql'
+    except:
+        pass
+    return None
+
+
+def copiar_fdb_tmp(ruta_fdb: str) -> str:
+    """
+    Copia el FDB a /tmp para conectarse por TCP/IP (Linux) y retorna la ruta.
+    
+    Firebird necesita acceso al archivo, así que se usa un nombre único en
+    /tmp para evitar conflictos de permisos (y uno por proceso para que el
+    modo por lotes pueda correr en paralelo). Lanza la excepción de la copia.
+    """
+    tmp_fdb = f'/tmp/PDVDATA_{os.getuid()}_{os.getpid()}.FDB'
+    _copias_tmp.add(tmp_fdb)
+    
+    # Si el archivo temporal existe y podemos escribir, lo eliminamos primero
+    if os.path.exists(tmp_fdb):
+        try:
+            os.remove(tmp_fdb)
+        except:
+            pass
+    
+    if os.path.exists(ruta_fdb):
+        shutil.copy2(ruta_fdb, tmp_fdb)
+        # Dar permisos completos al archivo
+        os.chmod(tmp_fdb, 0o666)
+    return tmp_fdb
+
+
+def salida_con_datos(stdout: str) -> bool:
+    """True si la salida de isql trae resultados (aunque stderr tenga avisos)."""
+    # Buscar líneas de separación (===) o datos numéricos típicos de resultados
+    if '===' in stdout or any(
+        keyword in stdout.upper() for keyword in ['COUNT', 'FOLIO', 'NOMBRE', 'TOTAL', 'SUBTOTAL']
+    ):
+        return True
+    
+    # También verificar si hay líneas con datos numéricos (típico de resultados)
+    for linea in stdout.split('\n'):
+        linea = linea.strip()
+        # Si hay una línea con números que parece ser un resultado de consulta
+        if linea and any(c.isdigit() for c in linea) and not linea.startswith('Use '):
+            return True
+    return False
+
+
+def ejecutar_isql(ruta_fdb: str, isql_path: str, sql: str) -> Tuple[bool, str, str]:
+    """Ejecuta un script SQL con isql. Retorna (exito, stdout, stderr)."""
+    try:
+        if not os.path.exists(ruta_fdb):
+            return False, "", f"Archivo no encontrado: {ruta_fdb}"
+        
+        # Detectar sistema operativo
+        es_windows = sys.platform.startswith('win')
+        
+        if es_windows:
+            # En Windows, buscar isql.exe en rutas comunes de instalación
+            isql_path = buscar_isql_windows()
+            
+            if not isql_path:
+                return False, "", ERROR_SIN_ISQL
+            
+            # En Windows: NO usar sudo, ejecutar directamente
+            cmd = [isql_path, '-u', 'SYSDBA', '-p', 'masterkey', ruta_fdb]
+        else:
+            # En Linux/Unix: conectar via TCP/IP al servidor Firebird
+            # Firebird necesita acceso al archivo, así que copiamos a /tmp
+            try:
+                tmp_fdb = copiar_fdb_tmp(ruta_fdb)
+            except Exception as e:
+                return False, "", f"Error copiando archivo a /tmp: {str(e)}"
+            
+            # Usar siempre /tmp para la conexión TCP/IP
+            fdb_path = tmp_fdb
+            
+            # El comando de isql para conexión TCP/IP
+            cmd = [isql_path]
+            # El SQL debe incluir el CONNECT con localhost
+            sql = f"CONNECT 'localhost:{fdb_path}' USER 'SYSDBA' PASSWORD 'masterkey';\n" + sql
+        
+        # Agregar QUIT al final del SQL para que isql termine correctamente
+        sql_completo = sql.strip()
+        if not sql_completo.endswith(';'):
+            sql_completo += ';'
+        sql_completo += '\nQUIT;'
+        
+        # En Windows usar cp1252 (Windows-1252) en lugar de utf-8
+        # porque Firebird a menudo devuelve datos en esa codificación
+        encoding_usar = 'cp1252' if es_windows else 'utf-8'
+        
+        # Configurar kwargs para subprocess
+        run_kwargs = {
+            'input': sql_completo,
+            'capture_output': True,
+            'text': True,
+            'timeout': 30,
+            'encoding': encoding_usar,
+            'errors': 'ignore'
+        }
+        # En Windows, ocultar ventana de CMD
+        if es_windows:
+            run_kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        
+        resultado = subprocess.run(cmd, **run_kwargs)
+        
+        # En Linux con conexión TCP/IP, isql siempre muestra "Use CONNECT..." en stderr
+        # pero eso no es un error si hay datos válidos en stdout
+        stdout = resultado.stdout or ""
+        stderr = resultado.stderr or ""
+        
+        # Verificar si hay datos válidos en la salida
+        tiene_datos = salida_con_datos(stdout)
+        
+        # Es exitoso si: returncode es 0, O si hay datos válidos en stdout
+        exito = resultado.returncode == 0 or tiene_datos
+        
+        # Si hay datos válidos, limpiar el stderr del mensaje "Use CONNECT..."
+        # ya que ese mensaje no es un error real cuando hay datos
+        if tiene_datos and 'Use CONNECT' in stderr:
+            stderr = ""
+        
+        return exito, stdout, stderr
+        
+    except subprocess.TimeoutExpired:
+        return False, "", "Timeout: La consulta SQL tardó demasiado (>30s)"
+    except FileNotFoundError:
+        return False, "", "No se pudo ejecutar isql. Verifica que Firebird esté instalado."
+    except Exception as e:
+        return False, "", str(e)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Grabación y reproducción de respuestas de Firebird
+==================================================
+
+``BackendGrabador`` envuelve al backend activo (isql por defecto) y guarda
+cada consulta con su respuesta: (SQL, éxito, stdout, stderr, duración).
+Se graba en un archivo gzip de líneas JSON; cada registro es un miembro
+gzip independiente escrito con una sola llamada en modo append, así que
+varios procesos pueden grabar en el mismo archivo y un corte a mitad de
+la sesión no invalida lo ya grabado.
+
+``BackendReproductor`` sirve esas respuestas de forma determinista: por
+cada SQL (normalizado por espacios) devuelve las respuestas en el orden
+en que se grabaron y vuelve a empezar al terminarse.
+
+Para grabar una sesión real basta con definir LIQUIVENTAS_GRABAR:
+
+    LIQUIVENTAS_GRABAR=sesion.jsonl.gz python liquidador_repartidores.py
+"""
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .firebird import backend_activo, ejecutar_isql, usar_backend
+
+VAR_ENTORNO = 'LIQUIVENTAS_GRABAR'
+FORMATO = 1
+
+_RE_FECHA = re.compile(r"'(\d{4}-\d{2}-\d{2})'")
+
+
+def clave_sql(sql: str) -> str:
+    """SQL con los espacios normalizados (la indentación no cambia la consulta)."""
+    return ' '.join(sql.split())
+
+
+def leer_grabacion(ruta: str) -> Iterator[Dict[str, Any]]:
+    """Registros de una grabación. Ignora un último registro incompleto."""
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        try:
+            for linea in f:
+                linea = linea.strip()
+                if linea:
+                    yield json.loads(linea)
+        except (EOFError, OSError, ValueError):
+            return
+
+
+class BackendGrabador:
+    """
+    Graba cada consulta del backend envuelto (None = isql) en `ruta`.
+
+    Los atributos que no define (p. ej. ``conectar``) se delegan al backend
+    envuelto, sin grabar.
+    """
+
+    nombre = 'grabador'
+
+    def __init__(self, ruta: str, backend: Optional[Any] = None):
+        self.ruta = ruta
+        self.backend = backend
+
+    def __getattr__(self, nombre: str):
+        backend = self.__dict__.get('backend')
+        if backend is None:
+            raise AttributeError(nombre)
+        return getattr(backend, nombre)
+
+    def ejecutar(self, ruta_fdb: str, isql_path: str, sql: str) -> Tuple[bool, str, str]:
+        inicio = time.perf_counter()
+        if self.backend is not None:
+            ok, stdout, stderr = self.backend.ejecutar(ruta_fdb, isql_path, sql)
+        else:
+            ok, stdout, stderr = ejecutar_isql(ruta_fdb, isql_path, sql)
+        duracion = time.perf_counter() - inicio
+        self._grabar({'v': FORMATO, 'sql': sql, 'ok': ok, 'stdout': stdout, 'stderr': stderr,
+                      'duracion': round(duracion, 4), 'en': round(time.time(), 3)})
+        return ok, stdout, stderr
+
+    def _grabar(self, registro: Dict[str, Any]) -> None:
+        datos = gzip.compress((json.dumps(registro, ensure_ascii=False) + '\n').encode('utf-8'))
+        try:
+            fd = os.open(self.ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, datos)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            # Grabar nunca debe romper la consulta real
+            print(f"⚠️ No se pudo grabar la consulta en {self.ruta}: {e}")
+
+
+class BackendReproductor:
+    """
+    Sirve respuestas grabadas sin Firebird.
+
+    Args:
+        ruta: archivo de BackendGrabador
+        respetar_duracion: esperar lo que tardó la consulta original
+    """
+
+    nombre = 'reproductor'
+
+    def __init__(self, ruta: str, respetar_duracion: bool = False):
+        self.ruta = ruta
+        self.respetar_duracion = respetar_duracion
+        self.consultas = 0
+        self.faltantes: List[str] = []
+        self._respuestas: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._posicion: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        for registro in leer_grabacion(ruta):
+            self._respuestas[clave_sql(registro['sql'])].append(registro)
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._respuestas.values())
+
+    def ejecutar(self, ruta_fdb: str, isql_path: str, sql: str) -> Tuple[bool, str, str]:
+        clave = clave_sql(sql)
+        with self._lock:
+            self.consultas += 1
+            respuestas = self._respuestas.get(clave)
+            if not respuestas:
+                self.faltantes.append(sql)
+                return False, "", f"Consulta no grabada: {clave[:200]}"
+            registro = respuestas[self._posicion[clave] % len(respuestas)]
+            self._posicion[clave] += 1
+        if self.respetar_duracion:
+            time.sleep(registro.get('duracion', 0))
+        return registro['ok'], registro['stdout'], registro['stderr']
+
+    def fechas(self) -> List[str]:
+        """Fechas que aparecen en las consultas grabadas."""
+        fechas = set()
+        for clave in self._respuestas:
+            fechas.update(_RE_FECHA.findall(clave))
+        return sorted(fechas)
+
+    def reiniciar(self) -> None:
+        """Vuelve a servir cada consulta desde su primera respuesta."""
+        with self._lock:
+            self._posicion.clear()
+
+    def reiniciar_contador(self) -> int:
+        with self._lock:
+            n, self.consultas = self.consultas, 0
+        return n
+
+
+def activar_grabacion(ruta: str) -> BackendGrabador:
+    """Empieza a grabar sobre el backend activo."""
+    grabador = BackendGrabador(ruta, backend_activo())
+    usar_backend(grabador)
+    return grabador
+
+
+def activar_desde_entorno() -> Optional[BackendGrabador]:
+    """Activa la grabación si LIQUIVENTAS_GRABAR tiene una ruta (y aún no se graba)."""
+    ruta = os.environ.get(VAR_ENTORNO)
+    if not ruta or isinstance(backend_activo(), BackendGrabador):
+        return None
+    print(f"⏺ Grabando consultas de Firebird en {ruta}")
+    return activar_grabacion(ruta)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Sesión persistente de isql
+==========================
+
+Cuando el driver ``fdb`` no se puede instalar, cada consulta arrancaba un
+isql nuevo: proceso, attach y (en Linux) copia del FDB, unos 150 ms antes
+de la primera fila. ``SesionIsql`` mantiene un isql interactivo abierto por
+FDB y le manda las consultas por stdin; el fin de cada respuesta se detecta
+con un SELECT centinela (el mismo de core.lote_sql).
+
+- Después de cada consulta se hace COMMIT, así la siguiente ve los datos
+  nuevos (la transacción de isql es SNAPSHOT).
+- Un lock serializa el acceso: una consulta a la vez por sesión.
+- Si isql se cae o una consulta excede el timeout, se mata el proceso y la
+  siguiente consulta arranca uno nuevo.
+- En Linux la sesión trabaja sobre la copia en /tmp; si el FDB original
+  cambia se vuelve a copiar y se reinicia la sesión.
+
+Se desactiva con LIQUIVENTAS_ISQL_SESION=0 (vuelve a un isql por consulta).
+"""
+import atexit
+import os
+import queue
+import re
+import secrets
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .firebird import ERROR_SIN_ISQL, buscar_isql_windows, copiar_fdb_tmp, salida_con_datos
+from .lote_sql import quitar_encabezado_centinela, sql_centinela
+
+VAR_ENTORNO = 'LIQUIVENTAS_ISQL_SESION'
+TIMEOUT_DEFAULT = 30.0
+
+# QUIT/EXIT terminarían la sesión; CONNECT lo maneja la sesión
+_RE_FIN_SCRIPT = re.compile(r'^\s*(QUIT|EXIT)\s*;\s*$', re.IGNORECASE | re.MULTILINE)
+_RE_CONNECT = re.compile(r"^\s*CONNECT\s+'[^']*'[^;]*;\s*$", re.IGNORECASE | re.MULTILINE)
+# Líneas que solo traen los prompts de isql (SQL> / CON>)
+_RE_SOLO_PROMPTS = re.compile(r'^\s*((SQL|CON)>\s*)+$')
+
+
+def sesion_habilitada() -> bool:
+    return os.environ.get(VAR_ENTORNO, '1').strip().lower() not in ('0', 'no', 'false')
+
+
+def _limpiar_script(sql: str) -> str:
+    sql = _RE_CONNECT.sub('', _RE_FIN_SCRIPT.sub('', sql)).strip()
+    if sql and not sql.endswith(';'):
+        sql += ';'
+    return sql
+
+
+def _errores_reales(lineas: List[str]) -> str:
+    # isql sin base en la línea de comandos siempre avisa "Use CONNECT..." (no es error)
+    texto = ''.join(lineas)
+    return '\n'.join(l for l in texto.split('\n') if l.strip() and 'Use CONNECT' not in l)
+
+
+class SesionIsql:
+    """
+    Un proceso isql interactivo.
+
+    Args:
+        cmd: línea de comandos de isql
+        encoding: codificación de la salida de isql
+        inicio: SQL que se envía al arrancar (p. ej. el CONNECT)
+        origen: archivo cuyo cambio obliga a reiniciar la sesión
+        preparar: se llama antes de cada arranque (p. ej. copiar el FDB)
+        timeout: segundos máximos por consulta
+    """
+
+    def __init__(self, cmd: List[str], encoding: str = 'utf-8', inicio: str = '',
+                 origen: Optional[str] = None, preparar: Optional[Callable[[], None]] = None,
+                 timeout: float = TIMEOUT_DEFAULT):
+        self.cmd = cmd
+        self.encoding = encoding
+        self.inicio = inicio
+        self.origen = origen
+        self.preparar = preparar
+        self.timeout = timeout
+        self.reinicios = 0
+        self._iniciada = False
+        self._proc: Optional[subprocess.Popen] = None
+        self._lineas: Optional[queue.Queue] = None
+        self._errores: List[str] = []
+        self._lock_errores = threading.Lock()
+        self._lock = threading.Lock()
+        self._firma_origen = None
+        self._ficha = secrets.token_hex(4)
+        self._contador = 0
+
+    # ── proceso ──────────────────────────────────────────────────────────────
+
+    def _firma(self):
+        if not self.origen:
+            return None
+        try:
+            st = os.stat(self.origen)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _vivo(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _leer_stdout(self, flujo, lineas: queue.Queue) -> None:
+        try:
+            for linea in iter(flujo.readline, ''):
+                lineas.put(linea)
+        except (OSError, ValueError):
+            pass
+        finally:
+            lineas.put(None)   # EOF: isql terminó
+            flujo.close()
+
+    def _leer_stderr(self, flujo) -> None:
+        try:
+            for linea in iter(flujo.readline, ''):
+                with self._lock_errores:
+                    self._errores.append(linea)
+        except (OSError, ValueError):
+            pass
+        finally:
+            flujo.close()
+
+    def _iniciar(self) -> None:
+        if self.preparar:
+            self.preparar()
+        cmd = list(self.cmd)
+        # isql con stdout en un pipe usa buffer completo; stdbuf lo deja por línea
+        if sys.platform != 'win32' and shutil.which('stdbuf'):
+            cmd = ['stdbuf', '-oL', '-eL'] + cmd
+        kwargs = {
+            'stdin': subprocess.PIPE,
+            'stdout': subprocess.PIPE,
+            'stderr': subprocess.PIPE,
+            'text': True,
+            'encoding': self.encoding,
+            'errors': 'ignore',
+            'bufsize': 1,
+        }
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        proc = subprocess.Popen(cmd, **kwargs)
+        lineas: queue.Queue = queue.Queue()
+        threading.Thread(target=self._leer_stdout, args=(proc.stdout, lineas),
+                         name='isql-stdout', daemon=True).start()
+        threading.Thread(target=self._leer_stderr, args=(proc.stderr,),
+                         name='isql-stderr', daemon=True).start()
+        self._proc, self._lineas = proc, lineas
+        self._firma_origen = self._firma()
+        if self.inicio:
+            ok, _, stderr = self._enviar(self.inicio, al_iniciar=True)
+            if not ok:
+                self._cerrar(forzar=True)
+                raise OSError(stderr or "isql no respondió al conectar")
+
+    def _cerrar(self, forzar: bool = False) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if not forzar and proc.poll() is None:
+                proc.stdin.write('QUIT;\n')
+                proc.stdin.flush()
+                proc.wait(timeout=2)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            pass
+        if proc.poll() is None:
+            proc.kill()
+            try:
+                proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                pass
+        # stdout/stderr los cierran sus hilos lectores al llegar al EOF
+        try:
+            proc.stdin.close()
+        except (OSError, ValueError):
+            pass
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._cerrar()
+
+    # ── consultas ────────────────────────────────────────────────────────────
+
+    def _enviar(self, sql: str, al_iniciar: bool = False) -> Tuple[bool, str, str]:
+        self._contador += 1
+        marca = f"@@{self._ficha}:{self._contador}@@"
+        # El COMMIT cierra la transacción: la siguiente consulta ve datos nuevos
+        script = f"{sql}\nCOMMIT;\n{sql_centinela(marca)}\n"
+        with self._lock_errores:
+            self._errores.clear()
+        try:
+            self._proc.stdin.write(script)
+            self._proc.stdin.flush()
+        except (OSError, ValueError):
+            self._cerrar(forzar=True)
+            return False, "", "isql terminó inesperadamente"
+
+        lineas: List[str] = []
+        limite = time.monotonic() + self.timeout
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                self._cerrar(forzar=True)
+                return False, "", f"Timeout: La consulta SQL tardó demasiado (>{self.timeout:g}s)"
+            try:
+                linea = self._lineas.get(timeout=min(restante, 0.2))
+            except queue.Empty:
+                if al_iniciar:
+                    # Sin conexión el centinela también falla: no esperar el timeout
+                    with self._lock_errores:
+                        errores = _errores_reales(self._errores)
+                    if errores:
+                        return False, "", errores
+                continue
+            if linea is None:
+                with self._lock_errores:
+                    errores = _errores_reales(self._errores)
+                self._cerrar(forzar=True)
+                return False, '\n'.join(lineas), errores or "isql terminó inesperadamente"
+            if marca in linea:
+                break
+            if not _RE_SOLO_PROMPTS.match(linea):
+                lineas.append(linea.rstrip('\n'))
+
+        stdout = '\n'.join(quitar_encabezado_centinela(lineas))
+        if stdout:
+            stdout += '\n'
+        with self._lock_errores:
+            stderr = _errores_reales(self._errores)
+            self._errores.clear()
+        # Igual que ejecutar_isql: con datos en stdout la consulta cuenta como exitosa
+        return (not stderr or salida_con_datos(stdout)), stdout, stderr
+
+    def ejecutar(self, sql: str) -> Tuple[bool, str, str]:
+        """Ejecuta un script en la sesión. Retorna (exito, stdout, stderr)."""
+        sql = _limpiar_script(sql)
+        with self._lock:
+            try:
+                if self._vivo() and self._firma() != self._firma_origen:
+                    self._cerrar()   # el FDB original cambió: copia nueva
+                if not self._vivo():
+                    if self._iniciada:
+                        self.reinicios += 1
+                    self._cerrar(forzar=True)
+                    self._iniciar()
+                    self._iniciada = True
+            except FileNotFoundError:
+                return False, "", "No se pudo ejecutar isql. Verifica que Firebird esté instalado."
+            except (OSError, subprocess.SubprocessError) as e:
+                return False, "", f"No se pudo iniciar isql: {e}"
+            if not sql:
+                return True, "", ""
+            return self._enviar(sql)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SESIONES POR FDB
+# ══════════════════════════════════════════════════════════════════════════════
+
+_sesiones: Dict[Tuple[str, str, Optional[str]], SesionIsql] = {}
+_lock_sesiones = threading.Lock()
+
+
+def _crear_sesion(ruta_fdb: str, isql_path: str, charset: Optional[str]) -> Optional[SesionIsql]:
+    usuario = ['-u', 'SYSDBA', '-p', 'masterkey']
+    if charset:
+        # Como CorteCajeroManager: conexión directa con el charset indicado
+        return SesionIsql([isql_path] + usuario + ['-ch', charset, ruta_fdb], encoding='cp1252',
+                          timeout=60.0)
+    if sys.platform.startswith('win'):
+        # Como ejecutar_isql: isql de la instalación de Firebird (None si no hay)
+        isql_path = buscar_isql_windows()
+        if not isql_path:
+            return None
+        return SesionIsql([isql_path] + usuario + [ruta_fdb], encoding='cp1252')
+    # Linux: igual que ejecutar_isql, TCP/IP contra una copia en /tmp
+    tmp_fdb = f'/tmp/PDVDATA_{os.getuid()}_{os.getpid()}.FDB'
+    return SesionIsql(
+        [isql_path],
+        inicio=f"CONNECT 'localhost:{tmp_fdb}' USER 'SYSDBA' PASSWORD 'masterkey';",
+        origen=ruta_fdb,
+        preparar=lambda: copiar_fdb_tmp(ruta_fdb),
+    )
+
+
+def obtener_sesion(ruta_fdb: str, isql_path: str, charset: Optional[str] = None) -> Optional[SesionIsql]:
+    """La sesión de ese FDB (se crea la primera vez). None si no se encontró isql."""
+    clave = (ruta_fdb, isql_path, charset)
+    with _lock_sesiones:
+        sesion = _sesiones.get(clave)
+        if sesion is None:
+            sesion = _crear_sesion(ruta_fdb, isql_path, charset)
+            if sesion is not None:
+                _sesiones[clave] = sesion
+        return sesion
+
+
+def ejecutar_en_sesion(ruta_fdb: str, isql_path: str, sql: str,
+                       charset: Optional[str] = None) -> Tuple[bool, str, str]:
+    """Como ejecutar_isql, pero sobre la sesión persistente del FDB."""
+    if not os.path.exists(ruta_fdb):
+        return False, "", f"Archivo no encontrado: {ruta_fdb}"
+    sesion = obtener_sesion(ruta_fdb, isql_path, charset)
+    if sesion is None:
+        return False, "", ERROR_SIN_ISQL
+    return sesion.ejecutar(sql)
+
+
+def cerrar_sesiones() -> None:
+    with _lock_sesiones:
+        sesiones = list(_sesiones.values())
+        _sesiones.clear()
+    for sesion in sesiones:
+        sesion.cerrar()
+
+
+atexit.register(cerrar_sesiones)
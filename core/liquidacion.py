@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+LiquidacionEngine - Cálculo de la liquidación sin interfaz
+==========================================================
+
+Calcula la liquidación de una fecha (general o de un repartidor) a partir
+de las ventas del día y de lo capturado en SQLite (descuentos, gastos,
+pagos, préstamos, conteos, punteados, no entregados). No depende de Tk:
+la pestaña de liquidación solo pinta el ResultadoLiquidacion y el mismo
+cálculo sirve para guardar liquidaciones, reportes y procesos por lotes.
+
+Las entradas de cada fecha se leen una sola vez (EntradasDia) y se
+filtran en Python para cada repartidor, así calcular todos los
+repartidores de un día o un rango de fechas cuesta una lectura por día.
+"""
+import threading
+from datetime import datetime, timedelta
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .agregados import FrameDia
+from .day_archive import (ErrorArchivoDia, descomprimir_snapshot, deserializar_estado,
+                          estado_desde_snapshot, serializar_estado)
+from .day_state import EjecutarSQL, ErrorCargaDia, EstadoDia, armar_ventas, consultar_estado_dia
+
+
+# Nombres con los que se capturan los gastos del cajero
+NOMBRES_CAJERO = ('cajero', 'caja', 'cajera')
+
+# Cómo se muestra la liquidación general (repartidor '') en reportes y resúmenes
+ETIQUETA_GENERAL = '(General)'
+
+
+@dataclass
+class VentasDia:
+    """Ventas de un día ya combinadas con sus repartidores, más movimientos de caja."""
+    ventas: List[Dict[str, Any]]
+    movimientos_entrada: List[Dict[str, Any]] = field(default_factory=list)
+    movimientos_salida: List[Dict[str, Any]] = field(default_factory=list)
+
+
+ObtenerVentas = Callable[[str], VentasDia]
+
+
+@dataclass
+class EntradasDia:
+    """Todo lo que necesita la liquidación de una fecha (se lee una vez por día)."""
+    fecha: str
+    frame: FrameDia
+    folios_por_repartidor: Dict[str, set]
+    total_dev_parciales: float
+    descuentos: List[Dict[str, Any]]
+    gastos: List[Dict[str, Any]]
+    pagos_proveedores: List[Dict[str, Any]]
+    prestamos: List[Dict[str, Any]]
+    pagos_nomina: List[Dict[str, Any]]
+    pagos_socios: List[Dict[str, Any]]
+    transferencias: List[Dict[str, Any]]
+    conteos: Dict[str, float]
+    creditos_punteados: List[tuple]       # [(folio, subtotal)]
+    no_entregados: List[tuple]            # [(folio, subtotal)]
+    total_ingresos: float
+    total_salidas: float
+
+
+@dataclass
+class ResultadoLiquidacion:
+    """Liquidación de una fecha; repartidor '' es la liquidación general."""
+    fecha: str
+    repartidor: str = ''
+    num_facturas: int = 0
+    # Ventas
+    total_facturas: float = 0.0
+    total_canceladas: float = 0.0
+    total_canceladas_otro_dia: float = 0.0
+    total_dev_parciales: float = 0.0
+    total_vendido: float = 0.0
+    total_credito: float = 0.0
+    total_efectivo: float = 0.0
+    monto_facturas: float = 0.0            # Subtotal en efectivo de las facturas válidas
+    total_creditos_punteados: float = 0.0
+    total_no_entregados: float = 0.0
+    # Descuentos
+    total_ajustes: float = 0.0
+    total_gastos: float = 0.0
+    total_gastos_cajero: float = 0.0
+    gastos_por_concepto: Dict[str, float] = field(default_factory=dict)
+    total_pago_proveedores: float = 0.0
+    total_prestamos: float = 0.0
+    total_pago_nomina: float = 0.0
+    total_pago_socios: float = 0.0
+    total_transferencias: float = 0.0
+    total_descuentos: float = 0.0
+    # Movimientos de caja (generales del día)
+    total_ingresos: float = 0.0
+    total_salidas: float = 0.0
+    # Cuadre
+    neto: float = 0.0                      # Dinero a entregar
+    dinero_contado: float = 0.0
+    diferencia: float = 0.0                # Contado - neto
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def datos_historial(self) -> Dict[str, Any]:
+        """Datos para historial_liquidaciones: claves históricas más el detalle completo."""
+        datos = self.to_dict()
+        datos.update({
+            'total_ventas': self.total_vendido,
+            'total_creditos': self.total_credito,
+            'total_devoluciones': self.total_dev_parciales,
+            'total_gastos': self.total_gastos + self.total_gastos_cajero,
+            'total_canceladas': self.total_canceladas + self.total_canceladas_otro_dia,
+            'total_dinero': self.dinero_contado,
+            'fecha_guardado': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        return datos
+
+
+def rango_fechas(desde: str, hasta: str) -> List[str]:
+    """Fechas de desde a hasta (inclusive) en formato AAAA-MM-DD."""
+    inicio = datetime.strptime(desde, '%Y-%m-%d').date()
+    fin = datetime.strptime(hasta, '%Y-%m-%d').date()
+    return [(inicio + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((fin - inicio).days + 1)]
+
+
+def _sumar(filas: Iterable[Dict[str, Any]], campo: str = 'monto') -> float:
+    return sum(f.get(campo) or 0 for f in filas)
+
+
+def cargar_estado_dia(fecha: str, ejecutar_sql: Optional[EjecutarSQL], db) -> EstadoDia:
+    """EstadoDia de una fecha sin interfaz: archivo del día cerrado, Firebird o copia local.
+
+    Con ejecutar_sql=None no se consulta Firebird (solo archivo o copia local).
+    Lanza ErrorCargaDia si no hay ninguna fuente disponible.
+    """
+    archivo = db.obtener_archivo_dia(fecha)
+    if archivo:
+        try:
+            return estado_desde_snapshot(descomprimir_snapshot(archivo['datos']))
+        except ErrorArchivoDia as e:
+            print(f"⚠️ Archivo de {fecha} ilegible, se consulta de nuevo: {e}")
+
+    error = ErrorCargaDia("Firebird no disponible")
+    if ejecutar_sql is not None:
+        try:
+            estado = consultar_estado_dia(ejecutar_sql, fecha)
+            db.guardar_cache_estado_dia(fecha, serializar_estado(estado))
+            return estado
+        except ErrorCargaDia as e:
+            error = e
+
+    copia = db.obtener_cache_estado_dia(fecha)
+    if copia:
+        try:
+            return deserializar_estado(copia)
+        except ErrorArchivoDia:
+            pass
+    raise error
+
+
+def ventas_desde_estado(estado: EstadoDia, db) -> VentasDia:
+    """VentasDia de un EstadoDia con las asignaciones guardadas en SQLite (solo lectura)."""
+    if estado.asignaciones is not None:
+        asignaciones = estado.asignaciones
+        ventas, _ = armar_ventas(estado, asignaciones, lambda folio, _fecha: asignaciones.get(folio))
+    else:
+        ventas, _ = armar_ventas(estado, db.obtener_asignaciones_fecha(estado.fecha),
+                                 lambda folio, fecha: db.obtener_asignacion(fecha, int(folio)) or '')
+    return VentasDia(ventas, estado.movimientos_entrada, estado.movimientos_salida)
+
+
+class LiquidacionEngine:
+    """
+    Motor de liquidación con entradas memorizadas por fecha. Es thread-safe.
+
+    Args:
+        obtener_ventas: fecha -> VentasDia (Firebird, caché de días o archivo)
+        db: módulo database_local (o equivalente); por defecto se importa
+    """
+
+    def __init__(self, obtener_ventas: ObtenerVentas, db=None):
+        if db is None:
+            import database_local as db
+        self.db = db
+        self.obtener_ventas = obtener_ventas
+        self._entradas: Dict[str, EntradasDia] = {}
+        self._lock = threading.Lock()
+
+    # --- entradas ---
+    def invalidar(self, fecha: Optional[str] = None) -> None:
+        """Olvida las entradas de una fecha (o de todas) tras un cambio."""
+        with self._lock:
+            if fecha is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(fecha, None)
+
+    def entradas(self, fecha: str) -> EntradasDia:
+        with self._lock:
+            entradas = self._entradas.get(fecha)
+        if entradas is None:
+            entradas = self._leer_entradas(fecha)
+            with self._lock:
+                self._entradas[fecha] = entradas
+        return entradas
+
+    def _leer_entradas(self, fecha: str) -> EntradasDia:
+        db = self.db
+        dia = self.obtener_ventas(fecha)
+        punteados = [(c['folio'], c.get('subtotal') or 0) for c in db.obtener_creditos_punteados_fecha(fecha)]
+        no_entregados = [(n['folio'], n.get('subtotal') or 0) for n in db.obtener_no_entregados_fecha(fecha)]
+        descuentos = db.obtener_descuentos_fecha(fecha)
+
+        ajustes_por_folio: Dict[int, float] = {}
+        for d in descuentos:
+            if (d.get('tipo') or '').lower() == 'ajuste':
+                ajustes_por_folio[d['folio']] = ajustes_por_folio.get(d['folio'], 0) + (d.get('monto') or 0)
+
+        folios_por_repartidor: Dict[str, set] = {}
+        for v in dia.ventas:
+            folios_por_repartidor.setdefault(v.get('repartidor') or '', set()).add(v['folio'])
+
+        frame = FrameDia(dia.ventas,
+                         dev_parciales=db.obtener_devoluciones_parciales_por_folio_fecha(fecha),
+                         ajustes=ajustes_por_folio,
+                         punteados=[folio for folio, _ in punteados],
+                         no_entregados=[folio for folio, _ in no_entregados])
+        return EntradasDia(
+            fecha=fecha,
+            frame=frame,
+            folios_por_repartidor=folios_por_repartidor,
+            total_dev_parciales=db.obtener_total_devoluciones_parciales_fecha(fecha),
+            descuentos=descuentos,
+            gastos=db.obtener_gastos_fecha(fecha),
+            pagos_proveedores=db.obtener_pagos_proveedores_fecha(fecha),
+            prestamos=db.obtener_prestamos_fecha(fecha),
+            pagos_nomina=db.obtener_pagos_nomina_fecha(fecha),
+            pagos_socios=db.obtener_pagos_socios_fecha(fecha),
+            transferencias=db.obtener_transferencias_fecha(fecha),
+            conteos={c['repartidor']: c['total'] for c in db.obtener_resumen_conteos_multiples_fecha(fecha)},
+            creditos_punteados=punteados,
+            no_entregados=no_entregados,
+            total_ingresos=_sumar(dia.movimientos_entrada),
+            total_salidas=_sumar(dia.movimientos_salida),
+        )
+
+    # --- cálculo ---
+    def calcular(self, fecha: str, repartidor: str = '') -> ResultadoLiquidacion:
+        """Liquidación de un repartidor, o general si repartidor es ''."""
+        e = self.entradas(fecha)
+        rep = repartidor or ''
+
+        if rep:
+            t = e.frame.totales(repartidor=rep)
+            folios = e.folios_por_repartidor.get(rep, set())
+            total_dev_parciales = t['dev_parciales']
+            punteados = sum(m for folio, m in e.creditos_punteados if folio in folios)
+            no_entregados = sum(m for folio, m in e.no_entregados if folio in folios)
+            conteo = e.conteos.get(rep, 0)
+        else:
+            t = e.frame.totales()
+            total_dev_parciales = e.total_dev_parciales
+            punteados = sum(m for _, m in e.creditos_punteados)
+            no_entregados = sum(m for _, m in e.no_entregados)
+            conteo = sum(e.conteos.values())
+
+        # Cada tabla filtra por su propia columna (igual que database_local)
+        def de(filas, campo):
+            return filas if not rep else [f for f in filas if f.get(campo) == rep]
+
+        ajustes = _sumar(d for d in de(e.descuentos, 'repartidor')
+                         if (d.get('tipo') or '').lower() == 'ajuste')
+        gastos = de(e.gastos, 'repartidor')
+        gastos_cajero = [g for g in gastos if (g.get('repartidor') or '').lower() in NOMBRES_CAJERO]
+        gastos_rep = [g for g in gastos if (g.get('repartidor') or '').lower() not in NOMBRES_CAJERO]
+        por_concepto: Dict[str, float] = {}
+        for g in gastos:
+            concepto = (g.get('concepto') or '').upper()
+            por_concepto[concepto] = por_concepto.get(concepto, 0) + (g.get('monto') or 0)
+        # Los pagos a proveedores sin repartidor cuentan para todos
+        proveedores = e.pagos_proveedores if not rep else [
+            p for p in e.pagos_proveedores if p.get('repartidor') in (rep, None, '')]
+
+        r = ResultadoLiquidacion(
+            fecha=fecha,
+            repartidor=rep,
+            num_facturas=t['num_facturas'],
+            total_facturas=t['total_todas_facturas'],
+            total_canceladas=t['total_canceladas'],
+            total_canceladas_otro_dia=t['total_canceladas_otro_dia'],
+            total_dev_parciales=total_dev_parciales,
+            total_credito=t['total_credito_vigente'],
+            monto_facturas=t['subtotal_efectivo'],
+            total_creditos_punteados=punteados,
+            total_no_entregados=no_entregados,
+            total_ajustes=ajustes,
+            total_gastos=_sumar(gastos_rep),
+            total_gastos_cajero=_sumar(gastos_cajero),
+            gastos_por_concepto=por_concepto,
+            total_pago_proveedores=_sumar(proveedores),
+            total_prestamos=_sumar(de(e.prestamos, 'repartidor')),
+            total_pago_nomina=_sumar(de(e.pagos_nomina, 'empleado')),
+            total_pago_socios=_sumar(de(e.pagos_socios, 'socio')),
+            total_transferencias=_sumar(de(e.transferencias, 'destinatario')),
+            total_ingresos=e.total_ingresos,
+            total_salidas=e.total_salidas,
+            dinero_contado=conteo,
+        )
+        r.total_vendido = (r.total_facturas - r.total_canceladas - r.total_canceladas_otro_dia
+                           - r.total_dev_parciales)
+        r.total_efectivo = r.total_vendido - r.total_credito
+        r.total_descuentos = (r.total_ajustes + r.total_gastos + r.total_gastos_cajero +
+                              r.total_pago_proveedores + r.total_prestamos + r.total_pago_nomina +
+                              r.total_pago_socios + r.total_transferencias)
+        r.neto = r.monto_facturas - r.total_descuentos - r.total_creditos_punteados - r.total_no_entregados
+        r.diferencia = r.dinero_contado - r.neto
+        return r
+
+    def repartidores(self, fecha: str) -> List[str]:
+        """Repartidores con facturas asignadas en la fecha."""
+        return sorted(r for r in self.entradas(fecha).folios_por_repartidor if r)
+
+    def calcular_todos(self, fecha: str) -> Dict[str, ResultadoLiquidacion]:
+        """{repartidor: resultado} de todos los repartidores de la fecha ('' = general)."""
+        resultados = {'': self.calcular(fecha)}
+        for rep in self.repartidores(fecha):
+            resultados[rep] = self.calcular(fecha, rep)
+        return resultados
+
+    def resumen_dia(self, fecha: str) -> Dict[str, Dict[str, Any]]:
+        """{repartidor: to_dict()} de todos los repartidores de la fecha; la general
+        va bajo ETIQUETA_GENERAL (formato de los reportes por rango y del modo por lotes)."""
+        return {rep or ETIQUETA_GENERAL: r.to_dict() for rep, r in self.calcular_todos(fecha).items()}
+
+    def calcular_rango(self, fechas: Iterable[str],
+                       repartidor: str = '') -> Dict[str, ResultadoLiquidacion]:
+        """{fecha: resultado} de un repartidor (o general) en varias fechas."""
+        return {fecha: self.calcular(fecha, repartidor) for fecha in fechas}
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Lotes de consultas en un solo script de isql
+============================================
+
+Cada llamada a isql arranca un proceso, hace el attach (y en Linux copia
+el FDB a /tmp), así que cargar un día con cinco consultas separadas paga
+ese costo cinco veces. ``ejecutar_lote`` une varias consultas con nombre
+en un solo script, intercalando un SELECT centinela antes de cada una, y
+separa la salida de isql de vuelta en un resultado por consulta.
+
+isql escribe los errores en stderr, sin marcar a qué sentencia
+pertenecen. Si el lote reporta errores, las consultas que quedaron sin
+salida se vuelven a ejecutar solas para obtener su propio resultado.
+"""
+import hashlib
+from typing import Callable, Dict, List, Tuple
+
+Resultado = Tuple[bool, str, str]
+EjecutarSQL = Callable[[str], Resultado]
+
+COLUMNA_MARCA = 'LOTE_MARCA'
+
+
+def _sentencias(sql: str) -> str:
+    """El SQL de una consulta sin espacios sobrantes y terminado en ';'."""
+    sql = sql.strip()
+    return sql if sql.endswith(';') else sql + ';'
+
+
+def _ficha(consultas: Dict[str, str]) -> str:
+    # Determinista para que el mismo lote genere el mismo script (grabaciones)
+    h = hashlib.sha1()
+    for nombre, sql in consultas.items():
+        h.update(nombre.encode('utf-8') + b'\0' + sql.encode('utf-8') + b'\0')
+    return h.hexdigest()[:12]
+
+
+def _marca(ficha: str, nombre: str) -> str:
+    return f"@@{ficha}:{nombre}@@"
+
+
+def sql_centinela(marca: str) -> str:
+    return f"SELECT '{marca}' AS {COLUMNA_MARCA} FROM RDB$DATABASE;"
+
+
+def construir_script(consultas: Dict[str, str]) -> Tuple[str, List[str]]:
+    """Script con un centinela antes de cada consulta y uno final.
+
+    Returns:
+        (script, marcas): marcas[i] precede a la consulta i; la última cierra el lote.
+    """
+    ficha = _ficha(consultas)
+    partes, marcas = [], []
+    for nombre, sql in consultas.items():
+        marca = _marca(ficha, nombre)
+        marcas.append(marca)
+        partes.append(sql_centinela(marca))
+        partes.append(_sentencias(sql))
+    fin = _marca(ficha, '__fin__')
+    marcas.append(fin)
+    partes.append(sql_centinela(fin))
+    return '\n'.join(partes) + '\n', marcas
+
+
+def quitar_encabezado_centinela(lineas: List[str]) -> List[str]:
+    """Quita del final el encabezado (LOTE_MARCA y ====) que isql imprime antes de la marca."""
+    fin = len(lineas)
+    while fin and not lineas[fin - 1].strip():
+        fin -= 1
+    if fin and lineas[fin - 1].strip().startswith('='):
+        fin -= 1
+    if fin and lineas[fin - 1].strip().endswith(COLUMNA_MARCA):
+        fin -= 1
+    return lineas[:fin]
+
+
+def separar_salida(stdout: str, marcas: List[str]) -> Dict[str, str]:
+    """stdout de cada tramo entre marcas, por marca. Faltan las marcas que no aparecieron."""
+    tramos: Dict[str, str] = {}
+    actual, lineas = None, []
+    for linea in stdout.split('\n'):
+        # isql puede anteponer sus prompts (SQL>, CON>) a la línea de la marca
+        marca = next((m for m in marcas if m in linea), None) if '@@' in linea else None
+        if marca:
+            if actual is not None:
+                tramos[actual] = '\n'.join(quitar_encabezado_centinela(lineas)).strip('\n')
+            actual, lineas = marca, []
+            continue
+        lineas.append(linea)
+    return tramos
+
+
+def ejecutar_lote(ejecutar_sql: EjecutarSQL, consultas: Dict[str, str]) -> Dict[str, Resultado]:
+    """
+    Ejecuta varias consultas con un solo llamado a `ejecutar_sql`.
+
+    Args:
+        ejecutar_sql: sql -> (ok, stdout, stderr), como LiquidadorRepartidores._ejecutar_sql
+        consultas: {nombre: sql}; cada sql puede traer sus propios SET
+
+    Returns:
+        {nombre: (ok, stdout, stderr)} con la salida de cada consulta por separado.
+    """
+    if not consultas:
+        return {}
+    if len(consultas) == 1:
+        nombre, sql = next(iter(consultas.items()))
+        return {nombre: ejecutar_sql(sql)}
+
+    script, marcas = construir_script(consultas)
+    ok, stdout, stderr = ejecutar_sql(script)
+    tramos = separar_salida(stdout or '', marcas)
+    if not tramos:
+        # Falló el lote completo (FDB no encontrado, timeout...): mismo error para todas
+        return {nombre: (False, '', stderr or "No se recibieron datos de la BD") for nombre in consultas}
+
+    resultados: Dict[str, Resultado] = {}
+    for nombre, marca in zip(consultas, marcas):
+        salida = tramos.get(marca)
+        if salida or (salida is not None and not stderr):
+            resultados[nombre] = (True, salida, '')
+        else:
+            # Sin salida y con errores en el lote (o el lote se cortó): a solas
+            resultados[nombre] = ejecutar_sql(consultas[nombre])
+    return resultados
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Modo offline
+============
+
+Cuando PDVDATA.FDB está bloqueado (respaldo de Eleventa, cierre de mes) o
+el servicio de Firebird no responde, la aplicación sigue funcionando con
+la última carga buena de cada fecha. Este módulo lleva el estado de la
+conexión y la cola de recargas pendientes que se repiten al reconectar.
+
+Solo se usa desde el hilo de Tk; no necesita locks.
+"""
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional
+
+
+# Cada cuánto se prueba la conexión mientras se está offline
+INTERVALO_SONDEO_MS = 30 * 1000
+
+SQL_SONDEO = "SELECT 1 FROM RDB$DATABASE;"
+
+
+class EstadoConexion:
+    """Estado en línea / offline de Firebird y recargas pendientes."""
+
+    def __init__(self):
+        self.en_linea = True
+        self.caida_desde: Optional[float] = None
+        self.ultimo_error = ''
+        self._pendientes: "OrderedDict[Hashable, Callable[[], None]]" = OrderedDict()
+
+    def marcar_caida(self, error: str = '') -> bool:
+        """Pasa a modo offline. Retorna True si antes estaba en línea."""
+        self.ultimo_error = str(error)[:300]
+        if not self.en_linea:
+            return False
+        self.en_linea = False
+        self.caida_desde = time.time()
+        return True
+
+    def marcar_en_linea(self) -> List[Callable[[], None]]:
+        """Vuelve a modo en línea y entrega las recargas pendientes (en orden)."""
+        self.en_linea = True
+        self.caida_desde = None
+        self.ultimo_error = ''
+        acciones = list(self._pendientes.values())
+        self._pendientes.clear()
+        return acciones
+
+    def encolar(self, clave: Hashable, accion: Callable[[], None]) -> None:
+        """Agrega una recarga pendiente; la misma clave solo se repite una vez."""
+        self._pendientes.pop(clave, None)
+        self._pendientes[clave] = accion
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._pendientes)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Productos por factura precargados por día
+=========================================
+
+En la pestaña de descuentos el operador recorre decenas de facturas
+seguidas; consultar VENTATICKETS_ARTICULOS folio por folio paga un viaje
+a Firebird en cada clic. Después de cargar un día se traen en segundo
+plano todas las líneas de artículos de los tickets de esa fecha con una
+sola consulta y se guardan indexadas por folio en ``CacheProductos``, un
+LRU por fecha compartido por la app y por DatabaseManager.
+
+Los folios que no están en ningún día precargado (tickets creados después
+de la precarga, canceladas de otro día) se consultan solos y también
+quedan en caché.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .day_state import ErrorCargaDia
+
+MAX_DIAS_DEFAULT = 7
+MAX_SUELTOS_DEFAULT = 256
+
+Linea = Dict[str, object]          # {'nombre', 'cantidad', 'precio'}
+EjecutarSQL = Callable[[str], Tuple[bool, str, str]]
+
+
+def sql_productos_dia(fecha: str) -> str:
+    """Líneas de artículos de todos los tickets creados en `fecha`."""
+    return (
+        "SET HEADING ON;\n"
+        "SELECT V.FOLIO, VA.PRODUCTO_NOMBRE, VA.CANTIDAD, VA.PRECIO_FINAL\n"
+        "FROM VENTATICKETS_ARTICULOS VA\n"
+        "INNER JOIN VENTATICKETS V ON VA.TICKET_ID = V.ID\n"
+        f"WHERE CAST(V.CREADO_EN AS DATE) = '{fecha}'\n"
+        "ORDER BY V.FOLIO, VA.PRODUCTO_NOMBRE;\n"
+    )
+
+
+def sql_productos_folio(folio: int) -> str:
+    """Líneas de artículos de un solo ticket."""
+    return (
+        "SET HEADING ON;\n"
+        "SELECT VA.PRODUCTO_NOMBRE, VA.CANTIDAD, VA.PRECIO_FINAL\n"
+        "FROM VENTATICKETS_ARTICULOS VA\n"
+        "INNER JOIN VENTATICKETS V ON VA.TICKET_ID = V.ID\n"
+        f"WHERE V.FOLIO = {int(folio)}\n"
+        "ORDER BY VA.PRODUCTO_NOMBRE;\n"
+    )
+
+
+def _filas(stdout: str):
+    """Filas de datos (ya divididas) de la salida de isql, después del encabezado."""
+    header_visto = False
+    for linea in stdout.split('\n'):
+        linea = linea.strip()
+        if not linea or linea.startswith('='):
+            continue
+        if 'PRODUCTO_NOMBRE' in linea and 'CANTIDAD' in linea:
+            header_visto = True
+            continue
+        if header_visto:
+            yield linea.split()
+
+
+def _linea(partes: List[str]) -> Optional[Linea]:
+    """NOMBRE CANTIDAD PRECIO_FINAL leídos desde la derecha (el nombre tiene espacios)."""
+    if len(partes) < 3:
+        return None
+    try:
+        # Precio en pesos colombianos (NO dividir por 100)
+        precio = float(partes[-1])
+        cantidad = float(partes[-2])
+    except ValueError:
+        return None
+    nombre = ' '.join(partes[:-2]).replace('<null>', '').strip()
+    if not nombre:
+        return None
+    return {'nombre': nombre, 'cantidad': cantidad, 'precio': precio}
+
+
+def parsear_productos_folio(stdout: str) -> List[Linea]:
+    """Salida de sql_productos_folio -> lista de líneas."""
+    return [linea for linea in map(_linea, _filas(stdout)) if linea]
+
+
+def parsear_productos_dia(stdout: str) -> Dict[int, List[Linea]]:
+    """Salida de sql_productos_dia -> {folio: [líneas]}."""
+    por_folio: Dict[int, List[Linea]] = {}
+    for partes in _filas(stdout):
+        try:
+            folio = int(partes[0])
+        except (ValueError, IndexError):
+            continue
+        linea = _linea(partes[1:])
+        if linea:
+            por_folio.setdefault(folio, []).append(linea)
+    return por_folio
+
+
+class CacheProductos:
+    """LRU de líneas de artículos por fecha, con índice por folio. Es thread-safe."""
+
+    def __init__(self, max_dias: int = MAX_DIAS_DEFAULT, max_sueltos: int = MAX_SUELTOS_DEFAULT):
+        self.max_dias = max_dias
+        self.max_sueltos = max_sueltos
+        self._dias: "OrderedDict[str, Dict[int, List[Linea]]]" = OrderedDict()
+        self._indice: Dict[int, str] = {}          # folio -> fecha en _dias
+        self._sueltos: "OrderedDict[int, List[Linea]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    # --- lectura ---
+    def productos(self, folio: int) -> Optional[List[Linea]]:
+        """Líneas del folio (copia) o None si no está en caché."""
+        with self._lock:
+            fecha = self._indice.get(folio)
+            if fecha is not None:
+                self._dias.move_to_end(fecha)
+                lineas = self._dias[fecha].get(folio, [])
+            elif folio in self._sueltos:
+                self._sueltos.move_to_end(folio)
+                lineas = self._sueltos[folio]
+            else:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            return [dict(linea) for linea in lineas]
+
+    def tiene_dia(self, fecha: str) -> bool:
+        with self._lock:
+            return fecha in self._dias
+
+    def fechas(self) -> List[str]:
+        """Fechas precargadas, de la menos a la más recientemente usada."""
+        with self._lock:
+            return list(self._dias.keys())
+
+    # --- escritura ---
+    def guardar_dia(self, fecha: str, por_folio: Dict[int, List[Linea]]) -> None:
+        """Guarda (o reemplaza) las líneas de todos los tickets de una fecha."""
+        with self._lock:
+            self._quitar_dia(fecha)
+            self._dias[fecha] = por_folio
+            for folio in por_folio:
+                self._indice[folio] = fecha
+                self._sueltos.pop(folio, None)
+            while len(self._dias) > self.max_dias:
+                self._quitar_dia(next(iter(self._dias)))
+
+    def guardar_folio(self, folio: int, lineas: List[Linea]) -> None:
+        """Guarda las líneas de un folio consultado solo."""
+        with self._lock:
+            if folio in self._indice:
+                return
+            self._sueltos[folio] = lineas
+            self._sueltos.move_to_end(folio)
+            while len(self._sueltos) > self.max_sueltos:
+                self._sueltos.popitem(last=False)
+
+    def invalidar(self, fecha: str) -> None:
+        with self._lock:
+            self._quitar_dia(fecha)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._dias.clear()
+            self._indice.clear()
+            self._sueltos.clear()
+
+    def _quitar_dia(self, fecha: str) -> None:
+        """Saca un día y sus folios del índice (lock tomado)."""
+        por_folio = self._dias.pop(fecha, None)
+        for folio in por_folio or ():
+            if self._indice.get(folio) == fecha:
+                del self._indice[folio]
+
+    # --- estadísticas ---
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'dias': len(self._dias),
+                'folios': len(self._indice),
+                'sueltos': len(self._sueltos),
+                'max_dias': self.max_dias,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
+
+
+# Caché compartida por la app y DatabaseManager
+cache_productos = CacheProductos()
+
+
+def precargar_productos_dia(ejecutar_sql: EjecutarSQL, fecha: str,
+                            cache: CacheProductos = None) -> int:
+    """
+    Consulta las líneas de artículos del día y las deja en caché.
+
+    Returns:
+        Número de folios precargados.
+    """
+    cache = cache or cache_productos
+    ok, stdout, stderr = ejecutar_sql(sql_productos_dia(fecha))
+    if not ok:
+        raise ErrorCargaDia(stderr or "No se pudieron consultar los productos del día")
+    por_folio = parsear_productos_dia(stdout)
+    cache.guardar_dia(fecha, por_folio)
+    return len(por_folio)
+
+
+def productos_factura(ejecutar_sql: EjecutarSQL, folio: int,
+                      cache: CacheProductos = None) -> Tuple[List[Linea], Optional[str]]:
+    """
+    Líneas de un folio: de la caché si está, si no con una consulta propia.
+
+    Returns:
+        (líneas, error)
+    """
+    cache = cache or cache_productos
+    lineas = cache.productos(folio)
+    if lineas is not None:
+        return lineas, None
+    ok, stdout, stderr = ejecutar_sql(sql_productos_folio(folio))
+    if not ok:
+        return [], stderr or "No se recibieron datos de la BD"
+    lineas = parsear_productos_folio(stdout)
+    cache.guardar_folio(folio, lineas)
+    return [dict(linea) for linea in lineas], None
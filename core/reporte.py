@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+"""
+Reporte de liquidación por repartidor (texto y Excel)
+=====================================================
+
+Arma los datos del reporte de un día a partir de las ventas ya asignadas
+y de lo capturado en SQLite, y los convierte en el texto del preview o en
+un libro de Excel. No depende de Tk; openpyxl se importa solo al armar
+el libro para que el modo de línea de comandos arranque rápido.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# Denominaciones del conteo de dinero, de mayor a menor
+VALORES_ORDEN = [100000, 50000, 20000, 10000, 5000, 2000,
+                 1000, 500, 200, 100, 50]
+
+TIPOS_DESCUENTO = {"credito": "Crédito", "devolucion": "Devolución", "ajuste": "Ajuste"}
+
+
+def datos_reporte(fecha: str, ventas: List[Dict[str, Any]], db,
+                  repartidores: Optional[Iterable[str]] = None,
+                  totales_por_rep: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, Dict[str, Any]]:
+    """{repartidor: {ventas, descuentos, gastos, dinero, totales...}} de una fecha.
+
+    Args:
+        ventas: ventas del día con su repartidor
+        db: módulo database_local
+        repartidores: repartidores a incluir (por defecto, los que tienen ventas)
+        totales_por_rep: resultado de FrameDia.por_repartidor() si ya se calculó
+    """
+    ventas_por_rep: Dict[str, List[Dict[str, Any]]] = {}
+    for v in ventas:
+        ventas_por_rep.setdefault(v.get('repartidor') or '', []).append(v)
+    if repartidores is None:
+        repartidores = sorted(r for r in ventas_por_rep if r)
+    if totales_por_rep is None:
+        from .agregados import FrameDia
+        totales_por_rep = FrameDia(ventas).por_repartidor()
+
+    descuentos_fecha = db.obtener_descuentos_fecha(fecha)
+    conteos = {c['repartidor']: c['total'] for c in db.obtener_resumen_conteos_multiples_fecha(fecha)}
+
+    datos_por_rep = {}
+    for rep in repartidores:
+        desc_rep = [{
+            'folio': str(d['folio']),
+            'tipo': TIPOS_DESCUENTO.get(d['tipo'], d['tipo']),
+            'monto': d.get('monto', 0),
+            'observacion': d.get('observacion') or '',
+        } for d in descuentos_fecha if d.get('repartidor') == rep]
+        gastos_rep = db.obtener_gastos_repartidor(fecha, rep)
+
+        total_sub = totales_por_rep.get(rep, {}).get('subtotal', 0)
+        total_desc = sum(d['monto'] for d in desc_rep)
+        total_gasto = sum(g['monto'] for g in gastos_rep)
+        total_din = conteos.get(rep, 0)
+        neto = total_sub - total_desc - total_gasto
+
+        datos_por_rep[rep] = {
+            'ventas':      ventas_por_rep.get(rep, []),
+            'descuentos':  desc_rep,
+            'gastos':      gastos_rep,
+            'dinero':      db.obtener_conteo_dinero(fecha, rep) or {},
+            'total_sub':   total_sub,
+            'total_desc':  total_desc,
+            'total_gasto': total_gasto,
+            'total_din':   total_din,
+            'neto':        neto,
+            'diferencia':  total_din - neto,
+        }
+    return datos_por_rep
+
+
+def texto_reporte(datos_por_rep: Dict[str, Dict[str, Any]], fecha: str) -> str:
+    """Texto del preview con la liquidación de todos los repartidores."""
+    # ── texto preview (todos los reps concatenados) ─────────────────
+    sep  = "═" * 64
+    thin = "─" * 64
+    texto_total = ""
+
+    for rep, d in datos_por_rep.items():
+        texto_total += (
+            f"\n{sep}\n"
+            f"  LIQUIDACIÓN DE REPARTIDOR\n"
+            f"  Repartidor : {rep}\n"
+            f"  Fecha      : {fecha}\n"
+            f"{sep}\n\n"
+            f"VENTAS DEL DÍA\n"
+        )
+        for v in d['ventas']:
+            cancelada_txt = " [CANCELADA]" if v.get('cancelada', False) else ""
+            texto_total += f"  Folio {v['folio']:>6}  {v['nombre']:<40} ${v['subtotal']:>12,.2f}{cancelada_txt}\n"
+        texto_total += f"  {thin}\n  Total Subtotal          ${d['total_sub']:>18,.2f}\n\n"
+
+        texto_total += "DESCUENTOS\n"
+        if d['descuentos']:
+            for desc in d['descuentos']:
+                texto_total += (f"  Folio {desc['folio']:>6}: {desc['tipo']:<12} "
+                                f"${desc['monto']:>12,.2f}   {desc['observacion']}\n")
+        else:
+            texto_total += "  Ninguno\n"
+        texto_total += f"  {thin}\n  Total Descuentos        ${d['total_desc']:>18,.2f}\n\n"
+
+        texto_total += "GASTOS ADICIONALES\n"
+        if d['gastos']:
+            for g in d['gastos']:
+                texto_total += f"  {g['concepto']:<40} ${g['monto']:>12,.2f}\n"
+        else:
+            texto_total += "  Ninguno\n"
+        texto_total += f"  {thin}\n  Total Gastos            ${d['total_gasto']:>18,.2f}\n"
+        texto_total += f"  {thin}\n  Total a Descontar       ${d['total_desc']+d['total_gasto']:>18,.2f}\n\n"
+
+        texto_total += (
+            f"{sep}\n"
+            f"  TOTAL NETO A PAGAR      ${d['neto']:>18,.2f}\n"
+            f"{sep}\n\n"
+            f"CONTEO DE DINERO\n"
+        )
+        for valor in VALORES_ORDEN:
+            cant = d['dinero'].get(valor, 0)
+            if cant > 0:
+                texto_total += f"  ${valor:>7,} × {cant:>4} = ${cant*valor:>13,}\n"
+        texto_total += f"  {thin}\n  TOTAL DINERO            ${d['total_din']:>18,.2f}\n\n"
+        texto_total += f"  DIFERENCIA              ${d['diferencia']:>18,.2f}\n"
+        if abs(d['diferencia']) < 0.01:
+            texto_total += "\n  ✓  LIQUIDACIÓN CUADRADA\n"
+        texto_total += "\n"
+    return texto_total
+
+
+def construir_libro(datos_por_rep: Dict[str, Dict[str, Any]], fecha: str):
+    """Libro de Excel con una hoja por repartidor."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+    # ─ estilos reutilizables ─
+    font_title   = Font(name='Arial', size=14, bold=True, color='FFFFFF')
+    font_header  = Font(name='Arial', size=10, bold=True, color='FFFFFF')
+    font_seccion = Font(name='Arial', size=11, bold=True)
+    font_normal  = Font(name='Arial', size=10)
+    font_neto    = Font(name='Arial', size=12, bold=True, color='2E7D32')
+    font_dif_ok  = Font(name='Arial', size=11, bold=True, color='2E7D32')
+    font_dif_no  = Font(name='Arial', size=11, bold=True, color='C62828')
+
+    fill_title   = PatternFill('solid', fgColor='1565C0')
+    fill_header  = PatternFill('solid', fgColor='1976D2')
+    fill_seccion = PatternFill('solid', fgColor='E3F2FD')
+    fill_resumen = PatternFill('solid', fgColor='FFF3E0')
+    fill_neto    = PatternFill('solid', fgColor='E8F5E9')
+    fill_dinero  = PatternFill('solid', fgColor='F3E5F5')
+    fill_par     = PatternFill('solid', fgColor='FFFFFF')
+    fill_impar   = PatternFill('solid', fgColor='F5F5F5')
+
+    align_c = Alignment(horizontal='center', vertical='center')
+    align_l = Alignment(horizontal='left',   vertical='center')
+    align_r = Alignment(horizontal='right',  vertical='center')
+
+    borde_fino = Border(
+        left=Side(style='thin', color='BDBDBD'),
+        right=Side(style='thin', color='BDBDBD'),
+        top=Side(style='thin', color='BDBDBD'),
+        bottom=Side(style='thin', color='BDBDBD')
+    )
+
+    fmt_moneda = '#,##0.00'
+
+    wb = Workbook()
+    wb.remove(wb.active)   # eliminar hoja vacía por defecto
+
+    for rep, d in datos_por_rep.items():
+        # nombre de hoja: máximo 31 chars, sin caracteres ilegales
+        nombre_hoja = rep[:31].replace('/', '-').replace('\\', '-').replace('[', '').replace(']', '')
+        ws = wb.create_sheet(title=nombre_hoja)
+
+        ws.column_dimensions['A'].width = 12   # Folio
+        ws.column_dimensions['B'].width = 35   # Cliente
+        ws.column_dimensions['C'].width = 16   # Subtotal
+        ws.column_dimensions['D'].width = 12   # Cancelada
+        ws.column_dimensions['E'].width = 22   # Observación (descuentos)
+        ws.column_dimensions['F'].width = 18   # Extra
+
+        r = 1   # cursor de fila
+
+        # ══ TÍTULO ═══════════════════════════════════════════════════
+        ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=5)
+        ws.cell(r, 1, value=f"LIQUIDACIÓN DE REPARTIDOR — {rep}")
+        ws.cell(r, 1).font = font_title
+        ws.cell(r, 1).fill = fill_title
+        ws.cell(r, 1).alignment = align_c
+        for c in range(1, 6):
+            ws.cell(r, c).fill = fill_title
+        r += 1
+
+        ws.cell(r, 1, value="Fecha:")
+        ws.cell(r, 1).font = font_seccion
+        ws.cell(r, 2, value=fecha)
+        ws.cell(r, 2).font = font_normal
+        r += 2
+
+        # ══ VENTAS DEL DÍA ═══════════════════════════════════════════
+        ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=4)
+        ws.cell(r, 1, value="VENTAS DEL DÍA")
+        ws.cell(r, 1).font = font_seccion
+        ws.cell(r, 1).fill = fill_seccion
+        for c in range(1, 5):
+            ws.cell(r, c).fill = fill_seccion
+            ws.cell(r, c).border = borde_fino
+        r += 1
+
+        # headers ventas
+        hdrs_ventas = ["Folio", "Cliente", "Subtotal", "Cancelada"]
+        for i, h in enumerate(hdrs_ventas, 1):
+            cell = ws.cell(r, i, value=h)
+            cell.font = font_header
+            cell.fill = fill_header
+            cell.alignment = align_c
+            cell.border = borde_fino
+        r += 1
+
+        fila_inicio_ventas = r
+        for idx, v in enumerate(d['ventas']):
+            fill_f = fill_par if idx % 2 == 0 else fill_impar
+            cancelada = v.get('cancelada', False)
+            ws.cell(r, 1, value=v['folio']);      ws.cell(r, 1).alignment = align_c
+            ws.cell(r, 2, value=v['nombre']);     ws.cell(r, 2).alignment = align_l
+            ws.cell(r, 3, value=v['subtotal']);   ws.cell(r, 3).number_format = fmt_moneda
+            ws.cell(r, 3).alignment = align_r
+            ws.cell(r, 4, value="SÍ" if cancelada else "NO"); ws.cell(r, 4).alignment = align_c
+            for c in range(1, 5):
+                ws.cell(r, c).font  = font_normal
+                ws.cell(r, c).fill  = fill_f
+                ws.cell(r, c).border = borde_fino
+            r += 1
+        fila_fin_ventas = r - 1
+
+        # fila Total Subtotal con fórmula SUM
+        ws.cell(r, 2, value="Total Subtotal:")
+        ws.cell(r, 2).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 2).alignment = align_r
+        if fila_inicio_ventas <= fila_fin_ventas:
+            ws.cell(r, 3, value=f"=SUM(C{fila_inicio_ventas}:C{fila_fin_ventas})")
+        else:
+            ws.cell(r, 3, value=0)
+        ws.cell(r, 3).number_format = fmt_moneda
+        ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 3).alignment = align_r
+        for c in range(1, 5):
+            ws.cell(r, c).fill  = fill_resumen
+            ws.cell(r, c).border = borde_fino
+        r += 2
+
+        # ══ DESCUENTOS ════════════════════════════════════════════════
+        ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=4)
+        ws.cell(r, 1, value="DESCUENTOS")
+        ws.cell(r, 1).font = font_seccion
+        ws.cell(r, 1).fill = fill_seccion
+        for c in range(1, 5):
+            ws.cell(r, c).fill = fill_seccion
+            ws.cell(r, c).border = borde_fino
+        r += 1
+
+        hdrs_desc = ["Folio", "Tipo", "Monto", "Observación"]
+        for i, h in enumerate(hdrs_desc, 1):
+            cell = ws.cell(r, i, value=h)
+            cell.font = font_header
+            cell.fill = fill_header
+            cell.alignment = align_c
+            cell.border = borde_fino
+        r += 1
+
+        fila_inicio_desc = r
+        for idx, desc in enumerate(d['descuentos']):
+            fill_f = fill_par if idx % 2 == 0 else fill_impar
+            ws.cell(r, 1, value=desc['folio']);       ws.cell(r, 1).alignment = align_c
+            ws.cell(r, 2, value=desc['tipo']);        ws.cell(r, 2).alignment = align_c
+            ws.cell(r, 3, value=desc['monto']);       ws.cell(r, 3).number_format = fmt_moneda
+            ws.cell(r, 3).alignment = align_r
+            ws.cell(r, 4, value=desc['observacion']); ws.cell(r, 4).alignment = align_l
+            for c in range(1, 5):
+                ws.cell(r, c).font  = font_normal
+                ws.cell(r, c).fill  = fill_f
+                ws.cell(r, c).border = borde_fino
+            r += 1
+        fila_fin_desc = r - 1
+
+        ws.cell(r, 3, value="Total Descuentos:")
+        ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 3).alignment = align_r
+        if fila_inicio_desc <= fila_fin_desc:
+            ws.cell(r, 4, value=f"=SUM(C{fila_inicio_desc}:C{fila_fin_desc})")
+        else:
+            ws.cell(r, 4, value=0)
+        ws.cell(r, 4).number_format = fmt_moneda
+        ws.cell(r, 4).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 4).alignment = align_r
+        for c in range(1, 5):
+            ws.cell(r, c).fill  = fill_resumen
+            ws.cell(r, c).border = borde_fino
+        r += 2
+
+        # ══ GASTOS ADICIONALES ════════════════════════════════════════
+        ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=3)
+        ws.cell(r, 1, value="GASTOS ADICIONALES")
+        ws.cell(r, 1).font = font_seccion
+        ws.cell(r, 1).fill = fill_seccion
+        for c in range(1, 4):
+            ws.cell(r, c).fill = fill_seccion
+            ws.cell(r, c).border = borde_fino
+        r += 1
+
+        hdrs_gasto = ["#", "Concepto", "Monto"]
+        for i, h in enumerate(hdrs_gasto, 1):
+            cell = ws.cell(r, i, value=h)
+            cell.font = font_header
+            cell.fill = fill_header
+            cell.alignment = align_c
+            cell.border = borde_fino
+        r += 1
+
+        fila_inicio_gasto = r
+        for idx, g in enumerate(d['gastos']):
+            fill_f = fill_par if idx % 2 == 0 else fill_impar
+            ws.cell(r, 1, value=idx + 1);           ws.cell(r, 1).alignment = align_c
+            ws.cell(r, 2, value=g['concepto']);      ws.cell(r, 2).alignment = align_l
+            ws.cell(r, 3, value=g['monto']);         ws.cell(r, 3).number_format = fmt_moneda
+            ws.cell(r, 3).alignment = align_r
+            for c in range(1, 4):
+                ws.cell(r, c).font  = font_normal
+                ws.cell(r, c).fill  = fill_f
+                ws.cell(r, c).border = borde_fino
+            r += 1
+        fila_fin_gasto = r - 1
+
+        ws.cell(r, 2, value="Total Gastos:")
+        ws.cell(r, 2).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 2).alignment = align_r
+        if fila_inicio_gasto <= fila_fin_gasto:
+            ws.cell(r, 3, value=f"=SUM(C{fila_inicio_gasto}:C{fila_fin_gasto})")
+        else:
+            ws.cell(r, 3, value=0)
+        ws.cell(r, 3).number_format = fmt_moneda
+        ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 3).alignment = align_r
+        for c in range(1, 4):
+            ws.cell(r, c).fill  = fill_resumen
+            ws.cell(r, c).border = borde_fino
+        r += 2
+
+        # ══ RESUMEN FINANCIERO ════════════════════════════════════════
+        ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=3)
+        ws.cell(r, 1, value="RESUMEN FINANCIERO")
+        ws.cell(r, 1).font = font_seccion
+        ws.cell(r, 1).fill = fill_seccion
+        for c in range(1, 4):
+            ws.cell(r, c).fill = fill_seccion
+            ws.cell(r, c).border = borde_fino
+        r += 1
+
+        resumen_items = [
+            ("Total Subtotal",     d['total_sub']),
+            ("Total Descuentos",   d['total_desc']),
+            ("Total Gastos",       d['total_gasto']),
+            ("Total a Descontar",  d['total_desc'] + d['total_gasto']),
+        ]
+        for label, valor in resumen_items:
+            ws.cell(r, 1, value=label)
+            ws.cell(r, 1).font = font_normal
+            ws.cell(r, 1).alignment = align_l
+            ws.cell(r, 2, value=valor)
+            ws.cell(r, 2).number_format = fmt_moneda
+            ws.cell(r, 2).font = font_normal
+            ws.cell(r, 2).alignment = align_r
+            for c in range(1, 3):
+                ws.cell(r, c).fill  = fill_resumen
+                ws.cell(r, c).border = borde_fino
+            r += 1
+
+        # NETO
+        ws.cell(r, 1, value="TOTAL NETO A PAGAR")
+        ws.cell(r, 1).font = font_neto
+        ws.cell(r, 1).fill = fill_neto
+        ws.cell(r, 1).alignment = align_l
+        ws.cell(r, 1).border = borde_fino
+        ws.cell(r, 2, value=d['neto'])
+        ws.cell(r, 2).number_format = fmt_moneda
+        ws.cell(r, 2).font = font_neto
+        ws.cell(r, 2).fill = fill_neto
+        ws.cell(r, 2).alignment = align_r
+        ws.cell(r, 2).border = borde_fino
+        r += 2
+
+        # ══ CONTEO DE DINERO ══════════════════════════════════════════
+        ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=3)
+        ws.cell(r, 1, value="CONTEO DE DINERO")
+        ws.cell(r, 1).font = font_seccion
+        ws.cell(r, 1).fill = fill_dinero
+        for c in range(1, 4):
+            ws.cell(r, c).fill = fill_dinero
+            ws.cell(r, c).border = borde_fino
+        r += 1
+
+        hdrs_din = ["Denominación", "Cantidad", "Subtotal"]
+        for i, h in enumerate(hdrs_din, 1):
+            cell = ws.cell(r, i, value=h)
+            cell.font = font_header
+            cell.fill = fill_header
+            cell.alignment = align_c
+            cell.border = borde_fino
+        r += 1
+
+        fila_inicio_din = r
+        for idx, valor in enumerate(VALORES_ORDEN):
+            cant = d['dinero'].get(valor, 0)
+            fill_f = fill_par if idx % 2 == 0 else fill_impar
+            ws.cell(r, 1, value=f"${valor:,}");   ws.cell(r, 1).alignment = align_l
+            ws.cell(r, 2, value=cant);             ws.cell(r, 2).alignment = align_c
+            ws.cell(r, 3, value=cant * valor);     ws.cell(r, 3).number_format = fmt_moneda
+            ws.cell(r, 3).alignment = align_r
+            for c in range(1, 4):
+                ws.cell(r, c).font  = font_normal
+                ws.cell(r, c).fill  = fill_f
+                ws.cell(r, c).border = borde_fino
+            r += 1
+        fila_fin_din = r - 1
+
+        ws.cell(r, 2, value="TOTAL DINERO:")
+        ws.cell(r, 2).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 2).alignment = align_r
+        ws.cell(r, 3, value=f"=SUM(C{fila_inicio_din}:C{fila_fin_din})")
+        ws.cell(r, 3).number_format = fmt_moneda
+        ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
+        ws.cell(r, 3).alignment = align_r
+        for c in range(1, 4):
+            ws.cell(r, c).fill  = fill_dinero
+            ws.cell(r, c).border = borde_fino
+        r += 2
+
+        # ══ DIFERENCIA ════════════════════════════════════════════════
+        ws.cell(r, 1, value="DIFERENCIA")
+        ws.cell(r, 1).font = Font(name='Arial', size=11, bold=True)
+        ws.cell(r, 1).alignment = align_l
+        ws.cell(r, 1).border = borde_fino
+        ws.cell(r, 2, value=d['diferencia'])
+        ws.cell(r, 2).number_format = fmt_moneda
+        ws.cell(r, 2).font = font_dif_ok if abs(d['diferencia']) < 0.01 else font_dif_no
+        ws.cell(r, 2).alignment = align_r
+        ws.cell(r, 2).border = borde_fino
+        if abs(d['diferencia']) < 0.01:
+            ws.cell(r, 3, value="✓ CUADRADA")
+            ws.cell(r, 3).font = font_dif_ok
+        r += 1
+
+    return wb
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# REPORTE POR RANGO DE FECHAS
+# ══════════════════════════════════════════════════════════════════════════════
+
+# (hoja, campo de ResultadoLiquidacion.to_dict()) de las matrices día × repartidor
+MATRICES_RANGO = (
+    ("Ventas por día", 'total_vendido'),
+    ("Neto por día", 'neto'),
+    ("Contado por día", 'dinero_contado'),
+    ("Diferencia por día", 'diferencia'),
+)
+
+# (encabezado, campo) de la hoja Resumen
+COLUMNAS_RESUMEN = (
+    ("Facturas", 'num_facturas'),
+    ("Total Vendido", 'total_vendido'),
+    ("Monto Efectivo", 'monto_facturas'),
+    ("Crédito", 'total_credito'),
+    ("Descuentos", 'total_descuentos'),
+    ("Punteados", 'total_creditos_punteados'),
+    ("No Entregados", 'total_no_entregados'),
+    ("Neto", 'neto'),
+    ("Contado", 'dinero_contado'),
+    ("Diferencia", 'diferencia'),
+)
+
+
+def totales_rango(dias: Dict[str, Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, float]]:
+    """{repartidor: {campo: suma del rango, 'dias': n}} de los resultados por día."""
+    totales: Dict[str, Dict[str, float]] = {}
+    for por_rep in dias.values():
+        for rep, r in por_rep.items():
+            acum = totales.setdefault(rep, {'dias': 0})
+            acum['dias'] += 1
+            for _, campo in COLUMNAS_RESUMEN:
+                acum[campo] = acum.get(campo, 0) + (r.get(campo) or 0)
+    return totales
+
+
+def construir_libro_rango(dias: Dict[str, Dict[str, Dict[str, Any]]], general: str,
+                          errores: Optional[Dict[str, str]] = None, titulo: str = ''):
+    """Libro de Excel de un rango de fechas.
+
+    Args:
+        dias: {fecha: {repartidor: ResultadoLiquidacion.to_dict()}}
+        general: clave de la liquidación general dentro de cada día
+        errores: {fecha: motivo} de los días que no se pudieron calcular
+        titulo: título de la hoja Resumen
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    font_title  = Font(name='Arial', size=14, bold=True, color='FFFFFF')
+    font_header = Font(name='Arial', size=10, bold=True, color='FFFFFF')
+    font_total  = Font(name='Arial', size=10, bold=True)
+    fill_title  = PatternFill('solid', fgColor='1565C0')
+    fill_header = PatternFill('solid', fgColor='1976D2')
+    fill_total  = PatternFill('solid', fgColor='FFF3E0')
+    align_c = Alignment(horizontal='center', vertical='center')
+    fmt_moneda = '#,##0.00'
+
+    fechas = sorted(dias)
+    repartidores = sorted({rep for por_rep in dias.values() for rep in por_rep if rep != general})
+    columnas = repartidores + [general]
+    totales = totales_rango(dias)
+
+    def encabezados(ws, fila, textos):
+        for i, texto in enumerate(textos, 1):
+            celda = ws.cell(fila, i, value=texto)
+            celda.font = font_header
+            celda.fill = fill_header
+            celda.alignment = align_c
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Resumen"
+
+    # ══ RESUMEN DEL RANGO (una fila por repartidor) ═══════════════════════
+    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(COLUMNAS_RESUMEN) + 2)
+    ws.cell(1, 1, value=titulo or f"LIQUIDACIÓN {fechas[0] if fechas else ''} — {fechas[-1] if fechas else ''}")
+    ws.cell(1, 1).font = font_title
+    ws.cell(1, 1).fill = fill_title
+    ws.cell(1, 1).alignment = align_c
+    encabezados(ws, 3, ["Repartidor", "Días"] + [h for h, _ in COLUMNAS_RESUMEN])
+    ws.column_dimensions['A'].width = 24
+    for i in range(2, len(COLUMNAS_RESUMEN) + 3):
+        ws.column_dimensions[get_column_letter(i)].width = 15
+
+    fila = 4
+    for rep in columnas:
+        t = totales.get(rep, {'dias': 0})
+        ws.cell(fila, 1, value=rep)
+        ws.cell(fila, 2, value=t['dias'])
+        for i, (_, campo) in enumerate(COLUMNAS_RESUMEN, 3):
+            celda = ws.cell(fila, i, value=t.get(campo, 0))
+            if campo != 'num_facturas':
+                celda.number_format = fmt_moneda
+        if rep == general:
+            for i in range(1, len(COLUMNAS_RESUMEN) + 3):
+                ws.cell(fila, i).font = font_total
+                ws.cell(fila, i).fill = fill_total
+        fila += 1
+
+    # ══ MATRICES DÍA × REPARTIDOR ══════════════════════════════════════════
+    for nombre_hoja, campo in MATRICES_RANGO:
+        wm = wb.create_sheet(title=nombre_hoja)
+        encabezados(wm, 1, ["Fecha"] + columnas)
+        wm.column_dimensions['A'].width = 12
+        for i in range(2, len(columnas) + 2):
+            wm.column_dimensions[get_column_letter(i)].width = 15
+        for f, fecha in enumerate(fechas, 2):
+            wm.cell(f, 1, value=fecha)
+            for c, rep in enumerate(columnas, 2):
+                r = dias[fecha].get(rep)
+                if r is not None:
+                    wm.cell(f, c, value=r.get(campo) or 0).number_format = fmt_moneda
+        fila_total = len(fechas) + 2
+        wm.cell(fila_total, 1, value="TOTAL")
+        for c in range(1, len(columnas) + 2):
+            wm.cell(fila_total, c).font = font_total
+            wm.cell(fila_total, c).fill = fill_total
+            if c > 1:
+                letra = get_column_letter(c)
+                wm.cell(fila_total, c, value=f"=SUM({letra}2:{letra}{fila_total - 1})" if fechas else 0)
+                wm.cell(fila_total, c).number_format = fmt_moneda
+        wm.freeze_panes = 'B2'
+
+    # ══ DÍAS CON ERROR ═════════════════════════════════════════════════════
+    if errores:
+        we = wb.create_sheet(title="Errores")
+        encabezados(we, 1, ["Fecha", "Motivo"])
+        we.column_dimensions['A'].width = 12
+        we.column_dimensions['B'].width = 80
+        for f, fecha in enumerate(sorted(errores), 2):
+            we.cell(f, 1, value=fecha)
+            we.cell(f, 2, value=errores[fecha])
+
+    return wb
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+Respaldo en línea de liquidador_data.db
+=======================================
+
+Copia la base mientras la aplicación sigue escribiendo, sin trabar la UI:
+
+- La copia usa la API de respaldo en línea de SQLite (Connection.backup)
+  de a PAGINAS_POR_PASO páginas, con una pausa entre pasos para que los
+  demás hilos y procesos sigan escribiendo. Si la base cambia tanto que
+  la copia se reinicia más de MAX_REINICIOS veces, se termina en un solo
+  paso (en WAL eso no bloquea a los escritores).
+- Cada copia se verifica con ``PRAGMA integrity_check`` y se guarda
+  comprimida (gzip) como una instantánea con su manifiesto JSON.
+- Los archivos históricos anuales y la carpeta de adjuntos se guardan por
+  contenido (sha256) en ``objetos/``: un archivo que no cambió no se
+  vuelve a copiar, y si su tamaño y fecha de modificación son los mismos
+  que en la instantánea anterior ni siquiera se vuelve a leer.
+- Rotación abuelo-padre-hijo: se conserva la última instantánea de cada
+  una de las últimas RETENCION['hora'] horas, RETENCION['dia'] días y
+  RETENCION['mes'] meses; los objetos que ya nadie usa se borran.
+
+Estructura de la carpeta de respaldos:
+    instantaneas/<AAAAMMDD_HHMMSS>.json     manifiesto (la instantánea existe si existe él)
+    instantaneas/<AAAAMMDD_HHMMSS>.db.gz    base comprimida
+    objetos/<ab>/<sha256>.gz                archivos históricos y adjuntos
+
+Uso:
+    respaldo = iniciar_respaldo(db_local)
+    executor.submit(respaldo.respaldar_si_corresponde, cola='respaldo', clave=('respaldo',))
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from .coordinacion import _tomar_candado
+
+
+FORMATO_MANIFIESTO = 1
+PAGINAS_POR_PASO = 256
+PAUSA_ENTRE_PASOS_S = 0.005
+MAX_REINICIOS = 3
+NIVEL_COMPRESION = 6
+BLOQUE_LECTURA = 1024 * 1024
+INTERVALO_RESPALDO_S = 60 * 60
+INTERVALO_RESPALDO_MS = INTERVALO_RESPALDO_S * 1000
+
+# Cuántas instantáneas conservar por periodo (la última de cada uno)
+RETENCION = {'hora': 24, 'dia': 30, 'mes': 12}
+_FORMATOS_PERIODO = {'hora': '%Y%m%d%H', 'dia': '%Y%m%d', 'mes': '%Y%m'}
+_FORMATO_NOMBRE = '%Y%m%d_%H%M%S'
+
+
+class ErrorRespaldo(Exception):
+    """La copia no se pudo hacer o no pasó la verificación de integridad."""
+
+
+class RespaldoCancelado(ErrorRespaldo):
+    """Se detuvo el respaldo (cierre de la aplicación) antes de terminar."""
+
+
+class _CopiaInestable(Exception):
+    """La copia por pasos se reinició demasiadas veces."""
+
+
+def sha256_archivo(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(BLOQUE_LECTURA), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _comprimir(origen: str, destino: str) -> None:
+    """Comprime `origen` en `destino` (escribe a un .tmp y lo renombra)."""
+    temporal = destino + '.tmp'
+    with open(origen, 'rb') as entrada, gzip.open(temporal, 'wb', compresslevel=NIVEL_COMPRESION) as salida:
+        shutil.copyfileobj(entrada, salida, BLOQUE_LECTURA)
+    os.replace(temporal, destino)
+
+
+def _descomprimir(origen: str, destino: str) -> None:
+    with gzip.open(origen, 'rb') as entrada, open(destino, 'wb') as salida:
+        shutil.copyfileobj(entrada, salida, BLOQUE_LECTURA)
+
+
+class RespaldoBase:
+    """Instantáneas comprimidas y verificadas de la base, sus archivos históricos y los adjuntos."""
+
+    def __init__(self, ruta_base: str, carpeta: str, carpeta_adjuntos: str = None,
+                 archivos_extra: Callable[[], List[str]] = None, retencion: Dict[str, int] = None):
+        """
+        Args:
+            ruta_base: base SQLite a respaldar
+            carpeta: carpeta de respaldos
+            carpeta_adjuntos: carpeta cuyos archivos se respaldan por contenido
+            archivos_extra: retorna otras bases SQLite a respaldar por
+                contenido (los archivos históricos anuales)
+            retencion: {'hora': n, 'dia': n, 'mes': n}
+        """
+        self.ruta_base = ruta_base
+        self.carpeta = carpeta
+        self.carpeta_adjuntos = carpeta_adjuntos
+        self._archivos_extra = archivos_extra or (lambda: [])
+        self.retencion = dict(retencion or RETENCION)
+        self.carpeta_instantaneas = os.path.join(carpeta, 'instantaneas')
+        self.carpeta_objetos = os.path.join(carpeta, 'objetos')
+        self.ruta_candado = os.path.join(carpeta, '.respaldo.lock')
+        self._detenido = threading.Event()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def respaldar_si_corresponde(self) -> Optional[Dict]:
+        """Respalda y rota si la última instantánea tiene más de INTERVALO_RESPALDO_S. None si no tocaba."""
+        instantaneas = self.listar()
+        if instantaneas and time.time() - instantaneas[-1]['marca'] < INTERVALO_RESPALDO_S:
+            return None
+        manifiesto = self.respaldar()
+        if manifiesto is not None:
+            self.rotar()
+        return manifiesto
+
+    def respaldar(self) -> Optional[Dict]:
+        """
+        Toma una instantánea. Retorna su manifiesto, o None si otro proceso
+        está respaldando la misma carpeta en este momento.
+
+        Raises:
+            ErrorRespaldo: la copia falló o no pasó integrity_check
+        """
+        os.makedirs(self.carpeta_instantaneas, exist_ok=True)
+        os.makedirs(self.carpeta_objetos, exist_ok=True)
+        with open(self.ruta_candado, 'a+') as candado:
+            if not _tomar_candado(candado):
+                return None
+            return self._respaldar()
+
+    def rotar(self) -> List[str]:
+        """Borra las instantáneas fuera de la retención y los objetos sin uso. Retorna las borradas."""
+        instantaneas = self.listar()
+        conservar = {instantaneas[-1]['nombre']} if instantaneas else set()
+        for periodo, cantidad in self.retencion.items():
+            vistos = set()
+            for inst in reversed(instantaneas):
+                clave = datetime.fromtimestamp(inst['marca']).strftime(_FORMATOS_PERIODO[periodo])
+                if clave in vistos:
+                    continue
+                if len(vistos) >= cantidad:
+                    break
+                vistos.add(clave)
+                conservar.add(inst['nombre'])
+
+        borradas = []
+        for inst in instantaneas:
+            if inst['nombre'] in conservar:
+                continue
+            for ruta in (inst['ruta_manifiesto'], os.path.join(self.carpeta_instantaneas, inst['base']['archivo'])):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+            borradas.append(inst['nombre'])
+        self._limpiar_huerfanos({inst['nombre'] for inst in instantaneas} - set(borradas))
+        return borradas
+
+    def listar(self) -> List[Dict]:
+        """Manifiestos de las instantáneas, de la más vieja a la más nueva."""
+        if not os.path.isdir(self.carpeta_instantaneas):
+            return []
+        instantaneas = []
+        for nombre in sorted(os.listdir(self.carpeta_instantaneas)):
+            if not nombre.endswith('.json'):
+                continue
+            ruta = os.path.join(self.carpeta_instantaneas, nombre)
+            try:
+                with open(ruta, encoding='utf-8') as f:
+                    manifiesto = json.load(f)
+            except (OSError, ValueError):
+                continue
+            manifiesto['ruta_manifiesto'] = ruta
+            instantaneas.append(manifiesto)
+        return instantaneas
+
+    def restaurar(self, nombre: str, carpeta_destino: str) -> str:
+        """
+        Reconstruye la instantánea `nombre` en `carpeta_destino` (base,
+        archivos históricos y adjuntos). No toca la base en uso.
+        Retorna la ruta de la base restaurada.
+        """
+        manifiesto = next((m for m in self.listar() if m['nombre'] == nombre), None)
+        if manifiesto is None:
+            raise ErrorRespaldo(f"No existe la instantánea {nombre}")
+        os.makedirs(carpeta_destino, exist_ok=True)
+        ruta_base = os.path.join(carpeta_destino, os.path.basename(self.ruta_base))
+        _descomprimir(os.path.join(self.carpeta_instantaneas, manifiesto['base']['archivo']), ruta_base)
+        if sha256_archivo(ruta_base) != manifiesto['base']['sha256']:
+            raise ErrorRespaldo(f"La base de la instantánea {nombre} está dañada")
+        for nombre_archivo, entrada in manifiesto['archivos'].items():
+            _descomprimir(self._ruta_objeto(entrada['sha256']), os.path.join(carpeta_destino, nombre_archivo))
+        for relativa, entrada in manifiesto['adjuntos'].items():
+            destino = os.path.join(carpeta_destino, 'attachments', relativa)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            _descomprimir(self._ruta_objeto(entrada['sha256']), destino)
+        return ruta_base
+
+    def detener(self) -> None:
+        """Corta el respaldo en curso (se descarta la copia a medias)."""
+        self._detenido.set()
+
+    # ------------------------------------------------------------------
+    # Instantánea
+    # ------------------------------------------------------------------
+    def _respaldar(self) -> Dict:
+        inicio = time.time()
+        nombre = datetime.fromtimestamp(inicio).strftime(_FORMATO_NOMBRE)
+        anterior = (self.listar()[-1:] or [{}])[0]
+        copia = os.path.join(self.carpeta_instantaneas, nombre + '.db.tmp')
+        try:
+            paginas = self._copiar_sqlite(self.ruta_base, copia)
+            base = {'archivo': nombre + '.db.gz', 'sha256': sha256_archivo(copia),
+                    'tam': os.path.getsize(copia), 'paginas': paginas}
+            _comprimir(copia, os.path.join(self.carpeta_instantaneas, base['archivo']))
+        finally:
+            self._quitar(copia)
+
+        manifiesto = {
+            'formato': FORMATO_MANIFIESTO,
+            'nombre': nombre,
+            'marca': inicio,
+            'fecha': datetime.fromtimestamp(inicio).isoformat(timespec='seconds'),
+            'base': base,
+            'archivos': self._respaldar_archivos(anterior.get('archivos', {})),
+            'adjuntos': self._respaldar_adjuntos(anterior.get('adjuntos', {})),
+        }
+        manifiesto['duracion_s'] = round(time.time() - inicio, 3)
+        ruta = os.path.join(self.carpeta_instantaneas, nombre + '.json')
+        with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+        os.replace(ruta + '.tmp', ruta)
+        print(f"💾 Respaldo {nombre}: base {base['tam'] / 1024:,.0f} KB, "
+              f"{len(manifiesto['adjuntos'])} adjuntos, {manifiesto['duracion_s']:.1f}s")
+        return manifiesto
+
+    def _copiar_sqlite(self, origen: str, destino: str) -> int:
+        """Copia en línea `origen` a `destino` y la verifica. Retorna el número de páginas."""
+        self._quitar(destino)
+        fuente = sqlite3.connect(origen, timeout=30)
+        copia = sqlite3.connect(destino)
+        estado = {'restante': None, 'reinicios': 0, 'total': 0}
+
+        def progreso(_status, restante, total):
+            if self._detenido.is_set():
+                raise RespaldoCancelado("Respaldo detenido")
+            if estado['restante'] is not None and restante > estado['restante']:
+                estado['reinicios'] += 1  # Otro proceso escribió: SQLite reinicia la copia
+                if estado['reinicios'] > MAX_REINICIOS:
+                    raise _CopiaInestable()
+            estado['restante'], estado['total'] = restante, total
+            time.sleep(PAUSA_ENTRE_PASOS_S)
+
+        try:
+            try:
+                fuente.backup(copia, pages=PAGINAS_POR_PASO, progress=progreso)
+            except _CopiaInestable:
+                fuente.backup(copia, pages=-1)
+            copia.execute('PRAGMA journal_mode = DELETE')  # La copia queda en un solo archivo
+            resultado = [fila[0] for fila in copia.execute('PRAGMA integrity_check').fetchall()]
+            if resultado != ['ok']:
+                raise ErrorRespaldo(f"La copia de {os.path.basename(origen)} no pasó integrity_check: "
+                                    + '; '.join(resultado[:5]))
+            return copia.execute('PRAGMA page_count').fetchone()[0]
+        except sqlite3.Error as e:
+            raise ErrorRespaldo(f"No se pudo copiar {os.path.basename(origen)}: {e}") from e
+        finally:
+            copia.close()
+            fuente.close()
+
+    def _respaldar_archivos(self, anteriores: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Bases extra (archivos históricos): se copian en línea solo si cambiaron."""
+        entradas = {}
+        for ruta in self._archivos_extra():
+            if not os.path.exists(ruta):
+                continue
+            nombre = os.path.basename(ruta)
+            entrada = self._entrada_sin_cambios(ruta, anteriores.get(nombre))
+            if entrada is None:
+                copia = os.path.join(self.carpeta_instantaneas, nombre + '.tmp')
+                try:
+                    estado = os.stat(ruta)
+                    self._copiar_sqlite(ruta, copia)
+                    entrada = self._guardar_objeto(copia, estado)
+                finally:
+                    self._quitar(copia)
+            entradas[nombre] = entrada
+        return entradas
+
+    def _respaldar_adjuntos(self, anteriores: Dict[str, Dict]) -> Dict[str, Dict]:
+        if not self.carpeta_adjuntos or not os.path.isdir(self.carpeta_adjuntos):
+            return {}
+        entradas = {}
+        for raiz, _carpetas, archivos in os.walk(self.carpeta_adjuntos):
+            for archivo in archivos:
+                if self._detenido.is_set():
+                    raise RespaldoCancelado("Respaldo detenido")
+                ruta = os.path.join(raiz, archivo)
+                relativa = os.path.relpath(ruta, self.carpeta_adjuntos).replace(os.sep, '/')
+                try:
+                    entradas[relativa] = (self._entrada_sin_cambios(ruta, anteriores.get(relativa))
+                                          or self._guardar_objeto(ruta, os.stat(ruta)))
+                except OSError as e:
+                    print(f"⚠️ Adjunto no respaldado {relativa}: {e}")
+        return entradas
+
+    # ------------------------------------------------------------------
+    # Objetos por contenido
+    # ------------------------------------------------------------------
+    def _ruta_objeto(self, sha256: str) -> str:
+        return os.path.join(self.carpeta_objetos, sha256[:2], sha256 + '.gz')
+
+    def _entrada_sin_cambios(self, ruta: str, anterior: Optional[Dict]) -> Optional[Dict]:
+        """La entrada anterior si el archivo tiene el mismo tamaño y fecha y su objeto sigue ahí."""
+        if not anterior:
+            return None
+        estado = os.stat(ruta)
+        if (estado.st_size == anterior.get('tam') and estado.st_mtime_ns == anterior.get('mtime_ns')
+                and os.path.exists(self._ruta_objeto(anterior['sha256']))):
+            return anterior
+        return None
+
+    def _guardar_objeto(self, ruta: str, estado: os.stat_result) -> Dict:
+        """Guarda el contenido de `ruta` en objetos/ si todavía no está."""
+        sha256 = sha256_archivo(ruta)
+        destino = self._ruta_objeto(sha256)
+        if not os.path.exists(destino):
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            _comprimir(ruta, destino)
+        return {'sha256': sha256, 'tam': estado.st_size, 'mtime_ns': estado.st_mtime_ns}
+
+    def _limpiar_huerfanos(self, vigentes: set) -> None:
+        """Borra objetos que ninguna instantánea usa y restos de copias interrumpidas."""
+        usados, bases = set(), set()
+        for inst in self.listar():
+            if inst['nombre'] not in vigentes:
+                continue
+            bases.add(inst['base']['archivo'])
+            usados.update(e['sha256'] for e in inst['archivos'].values())
+            usados.update(e['sha256'] for e in inst['adjuntos'].values())
+        for nombre in os.listdir(self.carpeta_instantaneas):
+            if nombre.endswith('.db.gz') and nombre not in bases:
+                self._quitar(os.path.join(self.carpeta_instantaneas, nombre))
+        if not os.path.isdir(self.carpeta_objetos):
+            return
+        for raiz, _carpetas, archivos in os.walk(self.carpeta_objetos):
+            for archivo in archivos:
+                if archivo[:-len('.gz')] not in usados:
+                    self._quitar(os.path.join(raiz, archivo))
+
+    @staticmethod
+    def _quitar(ruta: str) -> None:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# INSTANCIA COMPARTIDA
+# ══════════════════════════════════════════════════════════════════════════════
+
+_respaldo: Optional[RespaldoBase] = None
+
+
+def get_respaldo() -> Optional[RespaldoBase]:
+    """Respaldo de la aplicación (None si no se inició)."""
+    return _respaldo
+
+
+def iniciar_respaldo(db) -> RespaldoBase:
+    """
+    Crea el respaldo compartido de database_local: su base, sus archivos
+    históricos y la carpeta de adjuntos. Llamadas repetidas retornan el mismo.
+    """
+    global _respaldo
+    if _respaldo is None:
+        _respaldo = RespaldoBase(
+            db.DB_PATH, db.RUTA_RESPALDOS, carpeta_adjuntos=db.RUTA_ADJUNTOS,
+            archivos_extra=lambda: [p['ruta'] for p in db.obtener_periodos_archivados()])
+    return _respaldo
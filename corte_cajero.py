@@ -1,26 +1,11 @@
 # ══════════════════════════════════════════════════════════════════════════════
 # CANCELACIONES POR USUARIO (DEVOLUCIONES + CREDITOS CANCELADOS)
 # ══════════════════════════════════════════════════════════════════════════════
-def obtener_cancelaciones_por_usuario(fecha: str, db_path: str = None, isql_path: str = None) -> dict:
-    """
-    Devuelve un resumen de cancelaciones por usuario/cajero para una fecha.
-    Suma TODAS las cancelaciones del día incluyendo:
-    - Devoluciones en efectivo
-    - Créditos cancelados
-    - Devoluciones de tarjeta
-    - Devoluciones de vales
-    
-    Retorna: { 'admin': {'total': 123.45, 'num': 2, 'detalle': {...}}, ... }
-    """
-    import subprocess
-    from collections import defaultdict
-    db_path = db_path or DB_PATH_DEFAULT
-    isql_path = isql_path or ISQL_PATH_DEFAULT
-    
+def sql_cancelaciones_por_usuario(fecha: str) -> str:
     # Consulta que agrupa TODAS las devoluciones por cajero con detalle por forma de pago
     # Clasifica como CRÉDITO si: V.CREDITO=1, V.TOTAL_CREDITO>0, o V.CONDICION='CREDITO'
     # Todo lo demás es EFECTIVO (ventas de contado/mostrador)
-    sql = f"""
+    return f"""
     SET NAMES WIN1252;
     SELECT 
         D.CAJERO,
@@ -41,20 +26,10 @@ def obtener_cancelaciones_por_usuario(fecha: str, db_path: str = None, isql_path
     WHERE CAST(D.DEVUELTO_EN AS DATE) = '{fecha}'
     GROUP BY D.CAJERO;
     """
-    cmd = [isql_path, '-u', 'SYSDBA', '-p', 'masterkey', '-ch', 'WIN1252', db_path]
-    run_kwargs = {
-        'input': sql,
-        'capture_output': True,
-        'text': True,
-        'timeout': 60,
-        'encoding': 'cp1252',
-        'errors': 'replace'
-    }
-    if sys.platform == 'win32':
-        run_kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
-    proc = subprocess.run(cmd, **run_kwargs)
-    stdout = proc.stdout or ""
-    
+
+
+def parsear_cancelaciones_por_usuario(stdout: str) -> dict:
+    """Parsea la salida de sql_cancelaciones_por_usuario (ver obtener_cancelaciones_por_usuario)."""
     resumen = {}
     header_visto = False
     
@@ -120,6 +95,45 @@ def obtener_cancelaciones_por_usuario(fecha: str, db_path: str = None, isql_path
                 continue
     
     return resumen
+
+
+def obtener_cancelaciones_por_usuario(fecha: str, db_path: str = None, isql_path: str = None) -> dict:
+    """
+    Devuelve un resumen de cancelaciones por usuario/cajero para una fecha.
+    Suma TODAS las cancelaciones del día incluyendo:
+    - Devoluciones en efectivo
+    - Créditos cancelados
+    - Devoluciones de tarjeta
+    - Devoluciones de vales
+    
+    Retorna: { 'admin': {'total': 123.45, 'num': 2, 'detalle': {...}}, ... }
+    """
+    import subprocess
+    db_path = db_path or DB_PATH_DEFAULT
+    isql_path = isql_path or ISQL_PATH_DEFAULT
+    
+    sql = sql_cancelaciones_por_usuario(fecha)
+    backend = backend_activo()
+    if backend is not None:
+        _, stdout, _ = backend.ejecutar(db_path, isql_path, sql)
+    elif sesion_habilitada():
+        _, stdout, _ = ejecutar_en_sesion(db_path, isql_path, sql, charset='WIN1252')
+    else:
+        cmd = [isql_path, '-u', 'SYSDBA', '-p', 'masterkey', '-ch', 'WIN1252', db_path]
+        run_kwargs = {
+            'input': sql,
+            'capture_output': True,
+            'text': True,
+            'timeout': 60,
+            'encoding': 'cp1252',
+            'errors': 'replace'
+        }
+        if sys.platform == 'win32':
+            run_kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        proc = subprocess.run(cmd, **run_kwargs)
+        stdout = proc.stdout or ""
+    
+    return parsear_cancelaciones_por_usuario(stdout)
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
@@ -161,9 +175,13 @@ import subprocess
 import sys
 import os
 from datetime import datetime, date
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Callable, Dict, Any, Optional, Tuple, List
 from dataclasses import dataclass
 
+from core.firebird import backend_activo
+from core.isql_sesion import ejecutar_en_sesion, sesion_habilitada
+from core.lote_sql import ejecutar_lote
+
 
 # ══════════════════════════════════════════════════════════════════════════════
 # CONFIGURACIÓN
@@ -299,6 +317,24 @@ class CorteCajero:
         }
 
 
+@dataclass
+class CorteDia:
+    """Todo lo que muestra el panel de corte para una fecha (ver obtener_corte_dia)."""
+    fecha: str
+    turnos: List[int]
+    corte: Optional[CorteCajero]
+    cancelaciones_por_usuario: Dict[str, Dict[str, Any]]
+    
+    @property
+    def turno_id(self) -> int:
+        """Último turno del día (0 = corte por fecha de ventas)."""
+        return self.turnos[-1] if self.turnos else 0
+    
+    @property
+    def num_turnos(self) -> int:
+        return len(self.turnos)
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # CLASE PRINCIPAL
 # ══════════════════════════════════════════════════════════════════════════════
@@ -331,11 +367,12 @@ class CorteCajeroManager:
         self.db_path = db_path or DB_PATH_DEFAULT
         self.isql_path = isql_path or ISQL_PATH_DEFAULT
         
-        # Validar rutas
-        if not os.path.exists(self.db_path):
-            raise FileNotFoundError(f"No se encontró la base de datos: {self.db_path}")
-        if not os.path.exists(self.isql_path):
-            raise FileNotFoundError(f"No se encontró isql: {self.isql_path}")
+        # Validar rutas (un backend instalado no usa ni el FDB ni isql)
+        if backend_activo() is None:
+            if not os.path.exists(self.db_path):
+                raise FileNotFoundError(f"No se encontró la base de datos: {self.db_path}")
+            if not os.path.exists(self.isql_path):
+                raise FileNotFoundError(f"No se encontró isql: {self.isql_path}")
     
     def _ejecutar_sql(self, sql: str) -> Tuple[str, Optional[str]]:
         """
@@ -347,6 +384,15 @@ class CorteCajeroManager:
         Returns:
             Tupla (resultado, error)
         """
+        backend = backend_activo()
+        if backend is not None:
+            ok, stdout, stderr = backend.ejecutar(self.db_path, self.isql_path, sql)
+            return stdout, stderr or (None if ok else "Error ejecutando la consulta")
+        if sesion_habilitada():
+            # Sesión de isql abierta: sin arranque ni attach por consulta
+            _, stdout, stderr = ejecutar_en_sesion(self.db_path, self.isql_path, sql, charset='WIN1252')
+            return stdout, stderr if stderr else None
+        
         cmd = [
             self.isql_path,
             '-u', 'SYSDBA',
@@ -719,7 +765,14 @@ class CorteCajeroManager:
         Returns:
             Total de ventas a crédito de la fecha
         """
-        sql = f"""
+        resultado, error = self._ejecutar_sql(self._sql_credito_fecha(fecha))
+        if error:
+            return 0.0
+        return self._parsear_valor(resultado, 'TOTAL_CREDITO')
+    
+    @staticmethod
+    def _sql_credito_fecha(fecha: str) -> str:
+        return f"""
         SET NAMES WIN1252;
         SELECT COALESCE(SUM(TOTAL), 0) AS TOTAL_CREDITO
         FROM VENTATICKETS
@@ -727,10 +780,6 @@ class CorteCajeroManager:
         AND (COALESCE(CREDITO, 0) = 1 
              OR COALESCE(TOTAL_CREDITO, 0) > 0);
         """
-        resultado, error = self._ejecutar_sql(sql)
-        if error:
-            return 0.0
-        return self._parsear_valor(resultado, 'TOTAL_CREDITO')
 
     def obtener_ganancia(self, turno_id: int) -> float:
         """
@@ -894,19 +943,26 @@ class CorteCajeroManager:
         Returns:
             Lista de IDs de turnos (puede estar vacía)
         """
-        sql = f"""
-        SELECT ID
-        FROM TURNOS
-        WHERE CAST(INICIO_EN AS DATE) = '{fecha}'
-        ORDER BY ID;
-        """
+        sql = self._sql_turnos_fecha(fecha)
         print(f"[CorteCajeroManager] SQL turnos: {sql}")
         resultado, error = self._ejecutar_sql(sql)
         print(f"[CorteCajeroManager] Resultado: {resultado[:200] if resultado else 'vacío'}")
         print(f"[CorteCajeroManager] Error: {error}")
         if error:
             return []
-        
+        return self._parsear_turnos(resultado)
+    
+    @staticmethod
+    def _sql_turnos_fecha(fecha: str) -> str:
+        return f"""
+        SELECT ID
+        FROM TURNOS
+        WHERE CAST(INICIO_EN AS DATE) = '{fecha}'
+        ORDER BY ID;
+        """
+    
+    @staticmethod
+    def _parsear_turnos(resultado: str) -> List[int]:
         turnos = []
         try:
             lines = resultado.split('\n')
@@ -1230,7 +1286,20 @@ class CorteCajeroManager:
             Objeto CorteCajero con totales combinados o None si no hay turnos
         """
         # CONSULTA ÚNICA: Sumar TODOS los turnos del día en una sola consulta
-        sql = f"""
+        resultado, error = self._ejecutar_sql(self._sql_totales_turnos_fecha(fecha))
+        
+        if error or not resultado:
+            return None
+        
+        return self._armar_corte_turnos(
+            fecha, resultado,
+            consultar_movimientos=lambda: self._ejecutar_sql(self._sql_movimientos_turnos_fecha(fecha)),
+            consultar_credito=lambda: self.obtener_ventas_credito_por_fecha(fecha),
+        )
+    
+    @staticmethod
+    def _sql_totales_turnos_fecha(fecha: str) -> str:
+        return f"""
         SELECT 
             COUNT(T.ID) AS NUM_TURNOS,
             MIN(T.ID) AS PRIMER_TURNO,
@@ -1251,11 +1320,29 @@ class CorteCajeroManager:
         FROM TURNOS T
         WHERE CAST(T.INICIO_EN AS DATE) = '{fecha}';
         """
-        resultado, error = self._ejecutar_sql(sql)
-        
-        if error or not resultado:
-            return None
+    
+    @staticmethod
+    def _sql_movimientos_turnos_fecha(fecha: str) -> str:
+        return f"""
+        SELECT 
+            COALESCE(SUM(CASE WHEN M.TIPO = 'Entrada' THEN M.MONTO ELSE 0 END), 0) AS ENTRADAS,
+            COALESCE(SUM(CASE WHEN M.TIPO = 'Salida' THEN M.MONTO ELSE 0 END), 0) AS SALIDAS
+        FROM CORTE_MOVIMIENTOS M
+        INNER JOIN TURNOS T ON M.ID_TURNO = T.ID
+        WHERE CAST(T.INICIO_EN AS DATE) = '{fecha}';
+        """
+    
+    def _armar_corte_turnos(self, fecha: str, resultado: str,
+                            consultar_movimientos: Callable[[], Tuple[str, Optional[str]]],
+                            consultar_credito: Callable[[], float]) -> Optional[CorteCajero]:
+        """
+        Arma el corte combinado desde la fila de totales de TURNOS.
         
+        Args:
+            resultado: Salida de _sql_totales_turnos_fecha
+            consultar_movimientos: () -> (resultado, error) de _sql_movimientos_turnos_fecha
+            consultar_credito: () -> ventas a crédito desde VENTATICKETS (si TURNOS trae 0)
+        """
         # Parsear resultado
         try:
             lines = resultado.split('\n')
@@ -1317,15 +1404,7 @@ class CorteCajeroManager:
                 return None
             
             # Obtener entradas y salidas combinadas
-            sql_mov = f"""
-            SELECT 
-                COALESCE(SUM(CASE WHEN M.TIPO = 'Entrada' THEN M.MONTO ELSE 0 END), 0) AS ENTRADAS,
-                COALESCE(SUM(CASE WHEN M.TIPO = 'Salida' THEN M.MONTO ELSE 0 END), 0) AS SALIDAS
-            FROM CORTE_MOVIMIENTOS M
-            INNER JOIN TURNOS T ON M.ID_TURNO = T.ID
-            WHERE CAST(T.INICIO_EN AS DATE) = '{fecha}';
-            """
-            res_mov, err_mov = self._ejecutar_sql(sql_mov)
+            res_mov, err_mov = consultar_movimientos()
             
             entradas = 0.0
             salidas = 0.0
@@ -1351,7 +1430,7 @@ class CorteCajeroManager:
             
             # Si ventas_credito es 0, calcular desde VENTATICKETS
             if ventas_credito == 0.0:
-                ventas_credito = self.obtener_ventas_credito_por_fecha(fecha)
+                ventas_credito = consultar_credito()
             
             # Crear objetos
             dinero_en_caja = DineroEnCaja(
@@ -1487,9 +1566,15 @@ class CorteCajeroManager:
         """
         print(f"[Corte por Fecha Ventas] Consultando ventas para fecha: {fecha}")
         
+        resultado, error = self._ejecutar_sql(self._sql_ventas_fecha(fecha))
+        res_devs, err_devs = self._ejecutar_sql(self._sql_devoluciones_fecha(fecha))
+        return self._armar_corte_por_fecha_ventas(fecha, resultado, error, res_devs, err_devs)
+    
+    @staticmethod
+    def _sql_ventas_fecha(fecha: str) -> str:
         # Consulta principal: Obtener totales de ventas por fecha de venta
         # ESTA_CANCELADO es char('t'/'f') en Firebird, no numérico
-        sql = f"""
+        return f"""
         SELECT 
             COALESCE(SUM(CASE WHEN COALESCE(V.ESTA_CANCELADO, 'f') <> 't' THEN V.SUBTOTAL ELSE 0 END), 0) AS TOTAL_VENTAS,
             COALESCE(SUM(CASE WHEN COALESCE(V.ESTA_CANCELADO, 'f') <> 't' THEN COALESCE(V.TOTAL_CREDITO, 0) ELSE 0 END), 0) AS VENTAS_CREDITO,
@@ -1499,8 +1584,29 @@ class CorteCajeroManager:
         FROM VENTATICKETS V
         WHERE CAST(V.CREADO_EN AS DATE) = '{fecha}';
         """
-        
-        resultado, error = self._ejecutar_sql(sql)
+    
+    @staticmethod
+    def _sql_devoluciones_fecha(fecha: str) -> str:
+        # Consulta de devoluciones por fecha
+        return f"""
+        SELECT 
+            COALESCE(SUM(D.TOTAL_DEVUELTO), 0) AS TOTAL_DEVOLUCIONES,
+            COALESCE(SUM(CASE 
+                WHEN COALESCE(V.TOTAL_CREDITO, 0) = 0 THEN D.TOTAL_DEVUELTO 
+                ELSE 0 
+            END), 0) AS DEV_EFECTIVO,
+            COALESCE(SUM(CASE 
+                WHEN COALESCE(V.TOTAL_CREDITO, 0) > 0 THEN D.TOTAL_DEVUELTO 
+                ELSE 0 
+            END), 0) AS DEV_CREDITO
+        FROM DEVOLUCIONES D
+        LEFT JOIN VENTATICKETS V ON D.TICKET_ID = V.ID
+        WHERE CAST(D.DEVUELTO_EN AS DATE) = '{fecha}';
+        """
+    
+    def _armar_corte_por_fecha_ventas(self, fecha: str, resultado: str, error: Optional[str],
+                                      res_devs: str, err_devs: Optional[str]) -> Optional[CorteCajero]:
+        """Arma el corte por fecha de ventas desde _sql_ventas_fecha y _sql_devoluciones_fecha."""
         print(f"[Corte por Fecha Ventas] Resultado SQL: {resultado[:300] if resultado else 'vacío'}")
         
         if error:
@@ -1548,24 +1654,6 @@ class CorteCajeroManager:
         except Exception as e:
             print(f"[Corte por Fecha Ventas] Error parseando: {e}")
         
-        # Consulta de devoluciones por fecha
-        sql_devs = f"""
-        SELECT 
-            COALESCE(SUM(D.TOTAL_DEVUELTO), 0) AS TOTAL_DEVOLUCIONES,
-            COALESCE(SUM(CASE 
-                WHEN COALESCE(V.TOTAL_CREDITO, 0) = 0 THEN D.TOTAL_DEVUELTO 
-                ELSE 0 
-            END), 0) AS DEV_EFECTIVO,
-            COALESCE(SUM(CASE 
-                WHEN COALESCE(V.TOTAL_CREDITO, 0) > 0 THEN D.TOTAL_DEVUELTO 
-                ELSE 0 
-            END), 0) AS DEV_CREDITO
-        FROM DEVOLUCIONES D
-        LEFT JOIN VENTATICKETS V ON D.TICKET_ID = V.ID
-        WHERE CAST(D.DEVUELTO_EN AS DATE) = '{fecha}';
-        """
-        
-        res_devs, err_devs = self._ejecutar_sql(sql_devs)
         
         total_devoluciones = 0.0
         dev_efectivo = 0.0
@@ -1632,6 +1720,70 @@ class CorteCajeroManager:
         )
 
 
+    # ══════════════════════════════════════════════════════════════════════════
+    # CORTE DEL DÍA EN UN SOLO VIAJE
+    # ══════════════════════════════════════════════════════════════════════════
+    
+    def obtener_corte_dia(self, fecha: str) -> CorteDia:
+        """
+        Turnos, corte combinado y cancelaciones por usuario de una fecha en UN
+        solo lote de isql (una sesión de Firebird en lugar de cinco o más).
+        
+        Incluye las consultas de respaldo (corte por fecha de ventas y crédito
+        desde VENTATICKETS) para no volver a Firebird si se necesitan.
+        
+        Args:
+            fecha: Fecha en formato 'YYYY-MM-DD'
+            
+        Returns:
+            CorteDia; corte es None si no hay datos para la fecha
+        """
+        def ejecutar(sql: str) -> Tuple[bool, str, str]:
+            resultado, error = self._ejecutar_sql(sql)
+            return error is None, resultado or "", error or ""
+        
+        resultados = ejecutar_lote(ejecutar, {
+            'turnos': self._sql_turnos_fecha(fecha),
+            'totales': self._sql_totales_turnos_fecha(fecha),
+            'movimientos': self._sql_movimientos_turnos_fecha(fecha),
+            'credito': self._sql_credito_fecha(fecha),
+            'ventas_fecha': self._sql_ventas_fecha(fecha),
+            'devoluciones_fecha': self._sql_devoluciones_fecha(fecha),
+            'cancelaciones': sql_cancelaciones_por_usuario(fecha),
+        })
+        
+        def salida(nombre: str) -> Tuple[str, Optional[str]]:
+            ok, stdout, stderr = resultados[nombre]
+            return stdout, None if ok else (stderr or "Error ejecutando la consulta")
+        
+        resultado, error = salida('turnos')
+        turnos = [] if error else self._parsear_turnos(resultado)
+        
+        if turnos:
+            resultado, error = salida('totales')
+            corte = None
+            if not error and resultado:
+                def credito() -> float:
+                    res_cred, err_cred = salida('credito')
+                    return 0.0 if err_cred else self._parsear_valor(res_cred, 'TOTAL_CREDITO')
+                corte = self._armar_corte_turnos(
+                    fecha, resultado,
+                    consultar_movimientos=lambda: salida('movimientos'),
+                    consultar_credito=credito,
+                )
+        else:
+            # Sin turnos del día (turno abierto desde un día anterior): por fecha de ventas
+            corte = self._armar_corte_por_fecha_ventas(
+                fecha, *salida('ventas_fecha'), *salida('devoluciones_fecha'))
+        
+        return CorteDia(
+            fecha=fecha,
+            turnos=turnos,
+            corte=corte,
+            cancelaciones_por_usuario=parsear_cancelaciones_por_usuario(resultados['cancelaciones'][1]),
+        )
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # FUNCIONES DE CONVENIENCIA (para uso directo sin instanciar la clase)
 # ══════════════════════════════════════════════════════════════════════════════
@@ -109,6 +109,10 @@ import sqlite3
 import os
 import sys
 import json
+import re
+import functools
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, List, Dict, Any, Tuple
 
@@ -122,17 +126,395 @@ else:
     # Ejecutando como script Python normal
     BASE_DIR = os.path.dirname(__file__)
 
-DB_PATH = os.path.join(BASE_DIR, "liquidador_data.db")
+# LIQUIDADOR_DB permite apuntar a otra base (p. ej. la de los benchmarks)
+DB_PATH = os.environ.get('LIQUIDADOR_DB') or os.path.join(BASE_DIR, "liquidador_data.db")
+
+
+# Diario de la cola de escritura diferida (core/escritura.py), junto a la base
+RUTA_COLA_ESCRITURA = os.path.splitext(DB_PATH)[0] + '_cola_escritura.jsonl'
+
+# Adjuntos de anotaciones (core/adjuntos.py) y respaldos (core/respaldo.py)
+RUTA_ADJUNTOS = os.path.join(BASE_DIR, 'attachments')
+RUTA_MINIATURAS = os.path.join(BASE_DIR, 'attachments_miniaturas')
+RUTA_RESPALDOS = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'respaldos')
+
+# Funciones que la aplicación puede mandar a la cola de escritura diferida -> tablas que escriben
+OPERACIONES_DIFERIDAS: Dict[str, tuple] = {
+    **dict.fromkeys(('guardar_asignacion', 'eliminar_asignacion', 'limpiar_asignaciones_fecha'),
+                    ('asignaciones',)),
+    **dict.fromkeys(('agregar_gasto', 'actualizar_gasto', 'eliminar_gasto'), ('gastos',)),
+    'guardar_conteo_dinero': ('conteo_dinero',),
+    **dict.fromkeys(('agregar_pago_proveedor', 'actualizar_pago_proveedor', 'eliminar_pago_proveedor'),
+                    ('pago_proveedores',)),
+    **dict.fromkeys(('agregar_prestamo', 'actualizar_prestamo', 'eliminar_prestamo'), ('prestamos',)),
+    **dict.fromkeys(('agregar_pago_nomina', 'actualizar_pago_nomina', 'eliminar_pago_nomina'),
+                    ('pago_nomina',)),
+    **dict.fromkeys(('agregar_pago_socios', 'actualizar_pago_socios', 'eliminar_pago_socios'),
+                    ('pago_socios',)),
+    **dict.fromkeys(('agregar_transferencia', 'actualizar_transferencia', 'eliminar_transferencia'),
+                    ('transferencias',)),
+    'actualizar_abono_credito_eleventa': ('creditos_eleventa', 'historial_abonos'),
+    'actualizar_abono_credito_punteado': ('creditos_punteados', 'historial_abonos'),
+    'actualizar_abono_no_entregado': ('no_entregados',),
+    'actualizar_abono_prestamo': ('prestamos',),
+}
+
+
+def tablas_escritas(operacion: str) -> set:
+    """
+    Tablas que cambia una operación diferida, incluidas las derivadas que
+    mantienen los triggers (cartera_saldos, busqueda_global, sugerencias).
+    """
+    tablas = set(OPERACIONES_DIFERIDAS[operacion])
+    if tablas & {fuente[0] for fuente in CARTERA_FUENTES.values()}:
+        tablas.add('cartera_saldos')
+    if tablas & {fuente[1] for fuente in BUSQUEDA_FUENTES.values()}:
+        tablas.add('busqueda_global')
+    if 'asignaciones' in tablas:
+        tablas.update(('ventas_busqueda', 'busqueda_global', 'sugerencias_repartidor', 'archivos_dia'))
+    return tablas
+
+
+# Varios procesos abren la base (liquidador, run_anotaciones.py): en WAL los
+# lectores no bloquean al escritor, y con TIMEOUT_OCUPADA_S el busy handler
+# de SQLite espera (con pausas crecientes) en vez de fallar con "database is
+# locked". Las transacciones implícitas empiezan con BEGIN IMMEDIATE: toman el
+# candado de escritura al empezar y no fallan al pasar de lectura a escritura.
+TIMEOUT_OCUPADA_S = 30.0
+
+_hilo = threading.local()          # .lote: conexión del lote en curso en este hilo
+                                   # .coordinada: ejecutando una escritura coordinada
+                                   # .rango_archivo: (desde, hasta) archivados que se leen
+_barrera_lectura = None            # callable(tabla) que espera las escrituras encoladas de la tabla
+_enrutador = None                  # callable que manda escrituras al proceso coordinador
+_borrar_adjunto = None             # callable(hash, extension) que borra un contenido del almacén
 
 
 def get_connection():
     """Obtiene una conexión a la base de datos SQLite."""
-    conn = sqlite3.connect(DB_PATH)
+    lote = getattr(_hilo, 'lote', None)
+    if lote is not None:
+        return lote
+    conn = sqlite3.connect(DB_PATH, timeout=TIMEOUT_OCUPADA_S, isolation_level='IMMEDIATE')
     conn.row_factory = sqlite3.Row  # Para acceder a columnas por nombre
+    if _barrera_lectura is not None:
+        conn.set_authorizer(_autorizador_barrera(conn, _barrera_lectura))
+    rango = getattr(_hilo, 'rango_archivo', None)
+    if rango:
+        # Lectura que llega a periodos archivados (ver ARCHIVO HISTÓRICO)
+        _adjuntar_archivo(conn, *rango)
     return conn
 
 
+def activar_wal() -> bool:
+    """Pone la base en modo WAL (queda guardado en el archivo). False si no se pudo."""
+    conn = sqlite3.connect(DB_PATH, timeout=TIMEOUT_OCUPADA_S)
+    try:
+        return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0].lower() == 'wal'
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ No se pudo activar WAL: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+# Escrituras que pasan por el proceso coordinador (core/coordinacion.py): nombre -> tabla.
+# Son las de las tablas que escriben los dos programas (anotaciones y sus
+# adjuntos); las demás las escribe solo el liquidador (y liquiventas el
+# historial de liquidaciones) y van directo, con WAL y TIMEOUT_OCUPADA_S.
+OPERACIONES_COORDINADAS: Dict[str, str] = {}
+
+
+def _escritura_coordinada(tabla: str):
+    """
+    Marca una función de escritura para que, con la coordinación iniciada,
+    se ejecute en el proceso coordinador y se avise el cambio de `tabla` a
+    los demás procesos.
+    """
+    def decorar(fn):
+        OPERACIONES_COORDINADAS[fn.__name__] = tabla
+
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            if _enrutador is None or getattr(_hilo, 'coordinada', False):
+                return fn(*args, **kwargs)
+            return _enrutador(fn.__name__, args, kwargs, tabla)
+        envoltura.directa = fn
+        return envoltura
+    return decorar
+
+
+def registrar_enrutador(enrutador) -> None:
+    """enrutador(operacion, args, kwargs, tabla) recibe las escrituras coordinadas (None lo quita)."""
+    global _enrutador
+    _enrutador = enrutador
+
+
+def ejecutar_coordinada(operacion: str, args: tuple, kwargs: dict) -> Any:
+    """Ejecuta en este proceso una escritura coordinada (lado del coordinador)."""
+    if operacion not in OPERACIONES_COORDINADAS:
+        raise ValueError(f"Operación no coordinada: {operacion}")
+    _hilo.coordinada = True
+    try:
+        return globals()[operacion].directa(*args, **kwargs)
+    finally:
+        _hilo.coordinada = False
+
+
+def _autorizador_barrera(conn, barrera):
+    """
+    Leer después de escribir: la primera vez que una sentencia de la conexión
+    lee una tabla se llama `barrera(tabla)`, que espera solo si la cola
+    diferida tiene escrituras pendientes de esa tabla. Dentro de una
+    transacción no se espera (el escritor necesitaría el candado que ya tiene).
+    """
+    vistas = set()
+
+    def autorizar(accion, tabla, _columna, _base, _disparador):
+        if accion == sqlite3.SQLITE_READ and tabla and tabla not in vistas and not conn.in_transaction:
+            vistas.add(tabla)
+            barrera(tabla)
+        return sqlite3.SQLITE_OK
+    return autorizar
+
+
+def registrar_barrera_lectura(barrera) -> None:
+    """
+    Hace que las conexiones de get_connection llamen `barrera(tabla)` antes
+    de leer cada tabla por primera vez (None la quita).
+    """
+    global _barrera_lectura
+    _barrera_lectura = barrera
+
+
+@contextmanager
+def leer_archivo(desde: str = None, hasta: str = None, activo: bool = True):
+    """
+    Mientras dura, get_connection en este hilo también ve las filas de los
+    años archivados que cruza [desde, hasta] (None: sin límite). Con
+    activo=False las lecturas se quedan en la base caliente aunque estén
+    marcadas con _lectura_archivada. Un leer_archivo exterior tiene
+    prioridad sobre los de adentro. Solo para lecturas.
+    """
+    anterior = getattr(_hilo, 'rango_archivo', None)
+    if anterior is None:
+        _hilo.rango_archivo = (desde, hasta) if activo else False
+    try:
+        yield
+    finally:
+        _hilo.rango_archivo = anterior
+
+
+def _lectura_archivada(rango):
+    """
+    Marca una lectura que puede necesitar periodos archivados.
+    rango(*args, **kwargs) retorna (desde, hasta) o None si basta la base
+    caliente.
+    """
+    def decorar(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            limites = rango(*args, **kwargs)
+            if limites is None:
+                return fn(*args, **kwargs)
+            with leer_archivo(*limites):
+                return fn(*args, **kwargs)
+        return envoltura
+    return decorar
+
+
+def _rango_fecha(fecha: str = None, *_args, **_kwargs):
+    """El día consultado (o todo el historial si no hay fecha)."""
+    return fecha, fecha
+
+
+def _rango_todo(*_args, **_kwargs):
+    return None, None
+
+
+def _rango_estado(estado: str = None, *_args, **_kwargs):
+    """Los archivos solo tienen créditos cerrados: los pendientes están en la base caliente."""
+    return None if estado == 'PENDIENTE' else (None, None)
+
+
+def _rango_incluir(incluir_archivados: bool = True, *_args, **_kwargs):
+    return (None, None) if incluir_archivados else None
+
+
+class _ConexionLote:
+    """
+    Conexión compartida por las operaciones de un lote de escritura.
+    Las funciones de este módulo la reciben de get_connection: su commit y
+    su close no hacen nada (confirma el lote completo) y su rollback
+    deshace solo la operación en curso (vuelve a su SAVEPOINT).
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._fallo = False
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rollback(self):
+        self._conn.execute('ROLLBACK TO operacion')
+        self._fallo = True
+
+    def ejecutar(self, fn, args) -> Tuple[bool, Any]:
+        """
+        Ejecuta una función de este módulo dentro del lote. Si lanza, hace
+        rollback o retorna un valor de error (False, -1, {'success': False})
+        sus cambios se deshacen y se retorna (False, resultado o excepción).
+        """
+        self._fallo = False
+        self._conn.execute('SAVEPOINT operacion')
+        try:
+            resultado = fn(*args)
+        except Exception as e:
+            resultado, self._fallo = e, True
+        if not self._fallo and (resultado is False or resultado == -1 or
+                                (isinstance(resultado, dict) and resultado.get('success') is False)):
+            self._fallo = True
+        if self._fallo:
+            self._conn.execute('ROLLBACK TO operacion')
+        self._conn.execute('RELEASE operacion')
+        return not self._fallo, resultado
+
+    def confirmar(self, secuencia: int) -> None:
+        """Guarda hasta qué secuencia del diario está aplicado y confirma el lote."""
+        self._conn.execute('''
+            INSERT INTO configuracion (clave, valor, fecha_modificacion)
+            VALUES ('cola_escritura_aplicada', ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(clave) DO UPDATE SET
+                valor = excluded.valor,
+                fecha_modificacion = CURRENT_TIMESTAMP
+        ''', (str(secuencia),))
+        self._conn.execute('COMMIT')
+
+
+@contextmanager
+def lote_escritura():
+    """
+    Abre una transacción (BEGIN IMMEDIATE) para un lote de operaciones
+    diferidas. Mientras dura, get_connection en este hilo retorna la
+    conexión del lote. Si no se llama confirmar, todo se deshace.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=TIMEOUT_OCUPADA_S, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    lote = _ConexionLote(conn)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        _hilo.lote = lote
+        yield lote
+    finally:
+        _hilo.lote = None
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        conn.close()
+
+
+def obtener_secuencia_aplicada() -> int:
+    """Última secuencia del diario de escritura diferida que ya está en la base."""
+    return int(obtener_config('cola_escritura_aplicada', '0') or 0)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# ÍNDICES COMPUESTOS
+# Cubren los filtros de las consultas más frecuentes (fecha + repartidor,
+# estado + fecha...). benchmarks/planes.py verifica con EXPLAIN QUERY PLAN
+# que ninguna consulta de este módulo recorra una tabla completa.
+# ══════════════════════════════════════════════════════════════════════════════
+INDICES_COMPUESTOS = [
+    ('idx_descuentos_folio', 'descuentos', 'folio'),
+    ('idx_descuentos_fecha_repartidor', 'descuentos', 'fecha, repartidor'),
+    ('idx_gastos_fecha_repartidor', 'gastos', 'fecha, repartidor'),
+    ('idx_pago_proveedores_fecha_repartidor', 'pago_proveedores', 'fecha, repartidor'),
+    ('idx_prestamos_fecha_beneficiario', 'prestamos', 'fecha, beneficiario'),
+    ('idx_pago_nomina_fecha_empleado', 'pago_nomina', 'fecha, empleado'),
+    ('idx_pago_socios_fecha_socio', 'pago_socios', 'fecha, socio'),
+    ('idx_transferencias_fecha_destinatario', 'transferencias', 'fecha, destinatario'),
+    ('idx_conteos_sesion_fecha_repartidor', 'conteos_sesion', 'fecha, repartidor'),
+    ('idx_historial_liquidaciones_fecha_repartidor', 'historial_liquidaciones', 'fecha, repartidor'),
+    ('idx_historial_liquidaciones_repartidor', 'historial_liquidaciones', 'repartidor, fecha_generacion'),
+    ('idx_devoluciones_parciales_fecha_devolucion', 'devoluciones_parciales', 'fecha_devolucion, fecha'),
+    ('idx_devoluciones_parciales_devolucion', 'devoluciones_parciales', 'devolucion_id'),
+    ('idx_historial_abonos_fecha_monto', 'historial_abonos', 'fecha_abono, monto_abonado'),
+    ('idx_creditos_punteados_estado_fecha', 'creditos_punteados', 'estado, fecha'),
+    ('idx_creditos_eleventa_estado_fecha', 'creditos_eleventa', 'estado, fecha'),
+    ('idx_anotaciones_fecha_estado', 'anotaciones', 'fecha, archivada, eliminada, prioridad, fecha_creacion'),
+    ('idx_anotaciones_estado_prioridad', 'anotaciones', 'archivada, eliminada, prioridad, fecha_creacion'),
+    ('idx_anotaciones_eliminada_prioridad', 'anotaciones', 'eliminada, prioridad, fecha_creacion'),
+    ('idx_cancelaciones_detalle_fecha_cancel', 'cancelaciones_detalle', 'fecha_cancel, fecha'),
+]
+
+# Índices parciales: solo guardan las filas que cumplen la condición, que
+# son pocas (créditos pendientes, notas con adjuntos de la versión anterior).
+# La consulta debe repetir la condición tal cual para que SQLite los use.
+INDICES_PARCIALES = [
+    ('idx_creditos_eleventa_pendientes', 'creditos_eleventa', 'fecha, folio',
+     "COALESCE(NULLIF(estado, ''), 'PENDIENTE') = 'PENDIENTE'"),
+    ('idx_creditos_punteados_pendientes', 'creditos_punteados', 'fecha, folio',
+     "COALESCE(NULLIF(estado, ''), 'PENDIENTE') = 'PENDIENTE'"),
+    ('idx_anotaciones_legado', 'anotaciones', 'id, attachments',
+     "attachments IS NOT NULL AND attachments NOT IN ('', '[]')"),
+]
+
+# ANALYZE completo como mucho una vez por semana; PRAGMA optimize en cada pasada
+ANALYZE_CADA_DIAS = 7
+INTERVALO_OPTIMIZAR_MS = 6 * 60 * 60 * 1000
+
+
+def crear_indices(cursor):
+    """Crea los índices compuestos y parciales que falten (idempotente)."""
+    indices = [(nombre, tabla, columnas, '') for nombre, tabla, columnas in INDICES_COMPUESTOS]
+    indices += [(nombre, tabla, columnas, f' WHERE {condicion}')
+                for nombre, tabla, columnas, condicion in INDICES_PARCIALES]
+    for nombre, tabla, columnas, condicion in indices:
+        try:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla}({columnas}){condicion}')
+        except sqlite3.OperationalError:
+            pass  # Tabla que esta base todavía no tiene (la crea init_database)
+
+
+def optimizar_base(forzar_analyze: bool = False) -> bool:
+    """
+    Actualiza las estadísticas del planificador de SQLite.
+
+    Corre ``PRAGMA optimize`` siempre y un ``ANALYZE`` completo si nunca se
+    hizo, si pasaron ANALYZE_CADA_DIAS desde el último o si se fuerza.
+    Retorna True si corrió ANALYZE.
+    """
+    ultimo = obtener_config('ultimo_analyze')
+    analizar = forzar_analyze or not ultimo
+    if not analizar:
+        try:
+            analizar = (datetime.now() - datetime.fromisoformat(ultimo)).days >= ANALYZE_CADA_DIAS
+        except (TypeError, ValueError):
+            analizar = True
+    conn = get_connection()
+    try:
+        if analizar:
+            conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        conn.commit()
+    finally:
+        conn.close()
+    if analizar:
+        guardar_config('ultimo_analyze', datetime.now().isoformat(timespec='seconds'))
+    return analizar
+
+
 def init_database():
+    activar_wal()
     conn = get_connection()
     cursor = conn.cursor()
     # ══════════════════════════════════════════════════════════════════
@@ -824,6 +1206,15 @@ def init_database():
         cursor.execute('ALTER TABLE gastos ADD COLUMN observaciones TEXT')
     except: pass
     
+    crear_indices(cursor)
+    crear_cartera(cursor)
+    crear_busqueda(cursor)
+    crear_sugerencias(cursor)
+    crear_archivo(cursor)
+    crear_adjuntos(cursor)
+    crear_archivos_dia(cursor)
+    crear_reapertura_dias(cursor)
+    
     conn.commit()
     conn.close()
     
@@ -840,13 +1231,13 @@ def guardar_cancelacion_detalle(fecha: str, folio: int, ticket_id: int, cajero_c
         conn = get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO cancelaciones_detalle (fecha, folio, ticket_id, cajero_cancelo, monto, fecha_cancelacion)
+            INSERT INTO cancelaciones_detalle (fecha, folio, ticket_id, cajero_cancelo, cancelacion, fecha_cancel)
             VALUES (?, ?, ?, ?, ?, ?)
             ON CONFLICT(fecha, folio) DO UPDATE SET
                 ticket_id = excluded.ticket_id,
                 cajero_cancelo = excluded.cajero_cancelo,
-                monto = excluded.monto,
-                fecha_cancelacion = excluded.fecha_cancelacion
+                cancelacion = excluded.cancelacion,
+                fecha_cancel = excluded.fecha_cancel
         ''', (fecha, folio, ticket_id, cajero_cancelo.upper(), monto, fecha_cancelacion))
         conn.commit()
         conn.close()
@@ -868,13 +1259,13 @@ def guardar_cancelaciones_detalle_lote(fecha: str, cancelaciones: list) -> bool:
         cursor = conn.cursor()
         for canc in cancelaciones:
             cursor.execute('''
-                INSERT INTO cancelaciones_detalle (fecha, folio, ticket_id, cajero_cancelo, monto, fecha_cancelacion)
+                INSERT INTO cancelaciones_detalle (fecha, folio, ticket_id, cajero_cancelo, cancelacion, fecha_cancel)
                 VALUES (?, ?, ?, ?, ?, ?)
                 ON CONFLICT(fecha, folio) DO UPDATE SET
                     ticket_id = excluded.ticket_id,
                     cajero_cancelo = excluded.cajero_cancelo,
-                    monto = excluded.monto,
-                    fecha_cancelacion = excluded.fecha_cancelacion
+                    cancelacion = excluded.cancelacion,
+                    fecha_cancel = excluded.fecha_cancel
             ''', (
                 fecha,
                 canc.get('folio', 0),
@@ -891,6 +1282,7 @@ def guardar_cancelaciones_detalle_lote(fecha: str, cancelaciones: list) -> bool:
         return False
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_cajero_cancelo(fecha: str, folio: int) -> Optional[str]:
     """Obtiene el cajero que canceló una factura específica."""
     conn = get_connection()
@@ -904,12 +1296,13 @@ def obtener_cajero_cancelo(fecha: str, folio: int) -> Optional[str]:
     return row['cajero_cancelo'] if row else None
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_cancelaciones_detalle_fecha(fecha: str) -> Dict[int, dict]:
     """Obtiene todas las cancelaciones de una fecha como dict {folio: {cajero_cancelo, monto, ...}}."""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT folio, ticket_id, cajero_cancelo, monto, fecha_cancelacion
+        SELECT folio, ticket_id, cajero_cancelo, cancelacion AS monto, fecha_cancel AS fecha_cancelacion
         FROM cancelaciones_detalle
         WHERE fecha = ?
     ''', (fecha,))
@@ -926,6 +1319,7 @@ def obtener_cancelaciones_detalle_fecha(fecha: str) -> Dict[int, dict]:
     }
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_cajeros_cancelaron_fecha(fecha: str) -> Dict[int, str]:
     """Obtiene un mapa de folio -> cajero que canceló para una fecha."""
     conn = get_connection()
@@ -1039,6 +1433,7 @@ def guardar_asignacion(fecha: str, folio: int, repartidor: str) -> bool:
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'asignaciones', fecha, [folio])
         cursor.execute('''
             INSERT INTO asignaciones (fecha, folio, repartidor, fecha_modificacion)
             VALUES (?, ?, ?, CURRENT_TIMESTAMP)
@@ -1054,6 +1449,7 @@ def guardar_asignacion(fecha: str, folio: int, repartidor: str) -> bool:
         return False
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_asignacion(fecha: str, folio: int) -> Optional[str]:
     """Obtiene el repartidor asignado a una factura."""
     conn = get_connection()
@@ -1067,6 +1463,7 @@ def obtener_asignacion(fecha: str, folio: int) -> Optional[str]:
     return row['repartidor'] if row else None
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_asignaciones_fecha(fecha: str) -> Dict[int, str]:
     """Obtiene todas las asignaciones de una fecha como dict {folio: repartidor}."""
     conn = get_connection()
@@ -1085,6 +1482,7 @@ def eliminar_asignacion(fecha: str, folio: int) -> bool:
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'asignaciones', fecha, [folio], mover=True)
         cursor.execute('DELETE FROM asignaciones WHERE fecha = ? AND folio = ?', (fecha, folio))
         conn.commit()
         conn.close()
@@ -1099,6 +1497,7 @@ def limpiar_asignaciones_fecha(fecha: str) -> bool:
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'asignaciones', fecha, mover=True)
         cursor.execute('DELETE FROM asignaciones WHERE fecha = ?', (fecha,))
         conn.commit()
         conn.close()
@@ -1497,6 +1896,7 @@ def eliminar_conteo_sesion(sesion_id: int) -> bool:
         return False
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_conteos_sesion_repartidor(fecha: str, repartidor: str) -> List[Dict]:
     """
     Obtiene todas las sesiones de conteo de un repartidor en una fecha.
@@ -1530,9 +1930,14 @@ def obtener_detalle_conteo_sesion(sesion_id: int) -> Dict[int, int]:
     ''', (sesion_id,))
     rows = cursor.fetchall()
     conn.close()
+    if not rows and getattr(_hilo, 'rango_archivo', None) is None:
+        # Sesión de un día ya archivado: buscarla en los archivos
+        with leer_archivo():
+            return obtener_detalle_conteo_sesion(sesion_id)
     return {row['denominacion']: row['cantidad'] for row in rows}
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_total_conteos_repartidor(fecha: str, repartidor: str) -> float:
     """
     Calcula el total de TODOS los conteos de un repartidor en una fecha.
@@ -1550,6 +1955,7 @@ def obtener_total_conteos_repartidor(fecha: str, repartidor: str) -> float:
     return row['total'] if row else 0
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_resumen_conteos_multiples_fecha(fecha: str) -> List[Dict]:
     """
     Obtiene un resumen de todos los conteos (sesiones) por repartidor para una fecha.
@@ -1570,6 +1976,7 @@ def obtener_resumen_conteos_multiples_fecha(fecha: str) -> List[Dict]:
              'total': row['total'] or 0} for row in rows]
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_total_general_conteos_fecha(fecha: str) -> float:
     """
     Calcula el total general de TODOS los conteos de TODOS los repartidores en una fecha.
@@ -1743,6 +2150,7 @@ def guardar_devolucion_parcial(fecha: str, folio: int, devolucion_id: int,
         return -1
 
 
+@_lectura_archivada(_rango_todo)
 def obtener_devoluciones_parciales_folio(folio: int) -> List[Dict]:
     """Obtiene las devoluciones parciales de un folio específico."""
     conn = get_connection()
@@ -1757,6 +2165,7 @@ def obtener_devoluciones_parciales_folio(folio: int) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_devoluciones_parciales_fecha(fecha: str) -> List[Dict]:
     """Obtiene todas las devoluciones parciales de una fecha."""
     conn = get_connection()
@@ -1771,6 +2180,7 @@ def obtener_devoluciones_parciales_fecha(fecha: str) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
+@_lectura_archivada(_rango_todo)
 def obtener_total_devoluciones_parciales_folio(folio: int) -> float:
     """Obtiene el total de dinero devuelto para un folio."""
     conn = get_connection()
@@ -1785,6 +2195,7 @@ def obtener_total_devoluciones_parciales_folio(folio: int) -> float:
     return row['total'] if row else 0
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_total_devoluciones_parciales_fecha(fecha: str) -> float:
     """Obtiene el total de devoluciones parciales de una fecha."""
     conn = get_connection()
@@ -1799,6 +2210,7 @@ def obtener_total_devoluciones_parciales_fecha(fecha: str) -> float:
     return row['total'] if row else 0
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_dev_parciales_otro_dia(fecha_devolucion: str) -> Tuple[float, List[Dict]]:
     """
     Obtiene devoluciones parciales procesadas en fecha_devolucion pero de facturas de otros días.
@@ -1835,6 +2247,7 @@ def obtener_dev_parciales_otro_dia(fecha_devolucion: str) -> Tuple[float, List[D
     return total, facturas
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_dev_parciales_no_registradas(fecha_venta: str) -> Tuple[float, List[Dict]]:
     """
     Obtiene devoluciones parciales de facturas vendidas en fecha_venta pero procesadas en otro día.
@@ -1873,6 +2286,7 @@ def obtener_dev_parciales_no_registradas(fecha_venta: str) -> Tuple[float, List[
     return total, facturas
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_canceladas_otro_dia(fecha_cancelacion: str) -> Tuple[float, List[Dict]]:
     """
     Obtiene cancelaciones de facturas de otros días que se procesaron en fecha_cancelacion.
@@ -1889,9 +2303,9 @@ def obtener_canceladas_otro_dia(fecha_cancelacion: str) -> Tuple[float, List[Dic
     cursor = conn.cursor()
     # Obtener folios de facturas de otros días canceladas en esta fecha
     cursor.execute('''
-        SELECT folio, fecha as fecha_factura, monto
+        SELECT folio, fecha as fecha_factura, cancelacion as monto
         FROM cancelaciones_detalle 
-        WHERE fecha_cancelacion = ? AND fecha != ?
+        WHERE fecha_cancel = ? AND fecha != ?
         ORDER BY folio
     ''', (fecha_cancelacion, fecha_cancelacion))
     rows = cursor.fetchall()
@@ -1909,6 +2323,7 @@ def obtener_canceladas_otro_dia(fecha_cancelacion: str) -> Tuple[float, List[Dic
     return total, facturas
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_devoluciones_parciales_por_folio_fecha(fecha: str) -> Dict[int, float]:
     """Obtiene un diccionario con el total de devoluciones parciales por folio para una fecha."""
     conn = get_connection()
@@ -1924,6 +2339,7 @@ def obtener_devoluciones_parciales_por_folio_fecha(fecha: str) -> Dict[int, floa
     return {row['folio']: row['total'] for row in rows}
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_detalle_devoluciones_por_fecha(fecha: str) -> Dict[int, List[Dict]]:
     """Obtiene el detalle de artículos devueltos agrupados por folio para una fecha.
     Retorna: {folio: [{codigo, articulo, cantidad, valor_unitario, dinero}, ...]}"""
@@ -1968,6 +2384,7 @@ def limpiar_devoluciones_parciales_fecha(fecha: str) -> bool:
         return False
 
 
+@_lectura_archivada(_rango_todo)
 def obtener_todas_dev_parciales() -> List[Dict]:
     """Obtiene todas las devoluciones parciales de la base de datos."""
     conn = get_connection()
@@ -2212,7 +2629,7 @@ def actualizar_estado_prestamo(prestamo_id: int, estado: str) -> bool:
         cursor = conn.cursor()
         cursor.execute('''
             UPDATE prestamos 
-            SET estado = ?, fecha_modificacion = CURRENT_TIMESTAMP
+            SET estado = ?
             WHERE id = ?
         ''', (estado, prestamo_id))
         conn.commit()
@@ -2257,6 +2674,7 @@ def guardar_liquidacion(fecha: str, repartidor: str, datos: Dict) -> int:
         return -1
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_historial_liquidaciones(fecha: str = None, repartidor: str = None) -> List[Dict]:
     """Obtiene el historial de liquidaciones con filtros opcionales."""
     conn = get_connection()
@@ -2280,6 +2698,186 @@ def obtener_historial_liquidaciones(fecha: str = None, repartidor: str = None) -
     return [dict(row) for row in rows]
 
 
+@_lectura_archivada(_rango_fecha)
+def obtener_repartidores_liquidados(fecha: str) -> List[str]:
+    """Repartidores que ya tienen al menos una liquidación guardada en la fecha."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT repartidor FROM historial_liquidaciones WHERE fecha = ?', (fecha,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [row['repartidor'] for row in rows]
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# FUNCIONES PARA ARCHIVO DE DÍAS CERRADOS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def crear_archivos_dia(cursor):
+    """Crea archivos_dia y cache_estado_dia (idempotente)."""
+    # ══════════════════════════════════════════════════════════════════
+    # TABLA: ARCHIVOS_DIA
+    # Snapshot comprimido de un día cerrado (todos los repartidores liquidados).
+    # Mientras activo = 1 el día se carga desde aquí y no desde Firebird.
+    # ══════════════════════════════════════════════════════════════════
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archivos_dia (
+            fecha DATE PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1,
+            formato INTEGER NOT NULL,
+            datos BLOB NOT NULL,
+            totales_json TEXT,
+            tamano INTEGER DEFAULT 0,
+            activo INTEGER DEFAULT 1,
+            fecha_archivado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_reapertura TIMESTAMP
+        )
+    ''')
+    
+    # ══════════════════════════════════════════════════════════════════
+    # TABLA: CACHE_ESTADO_DIA
+    # Última carga buena de Firebird por fecha (comprimida), para el
+    # modo offline cuando el FDB está bloqueado o el servidor no responde.
+    # ══════════════════════════════════════════════════════════════════
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_estado_dia (
+            fecha DATE PRIMARY KEY,
+            datos BLOB NOT NULL,
+            fecha_carga TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def crear_reapertura_dias(cursor):
+    """
+    Triggers que desactivan el snapshot de un día archivado cuando cambia
+    una de sus asignaciones: el snapshot manda sobre SQLite al cargar el
+    día, así que si siguiera activo el cambio se perdería. El día se vuelve
+    a archivar al liquidarlo de nuevo.
+    """
+    # El trigger escribe en archivos_dia: que exista antes de instalarlo
+    crear_archivos_dia(cursor)
+    for evento, fila in (('INSERT', 'NEW'), ('UPDATE OF repartidor', 'NEW'), ('DELETE', 'OLD')):
+        nombre = 'trg_reabrir_dia_asignaciones_' + evento.split()[0].lower()
+        try:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON asignaciones
+                BEGIN
+                    UPDATE archivos_dia SET activo = 0, fecha_reapertura = CURRENT_TIMESTAMP
+                    WHERE fecha = {fila}.fecha AND activo = 1;
+                END
+            ''')
+        except sqlite3.OperationalError:
+            pass  # Tabla que esta base todavía no tiene (la crea init_database)
+
+
+def guardar_archivo_dia(fecha: str, datos: bytes, formato: int, totales: Dict) -> int:
+    """
+    Guarda (o reemplaza) el snapshot comprimido de un día cerrado.
+    Cada vez que se vuelve a archivar la misma fecha aumenta la versión.
+    
+    Returns:
+        La versión guardada, o -1 si hubo error
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO archivos_dia (fecha, version, formato, datos, totales_json, tamano, activo)
+            VALUES (?, 1, ?, ?, ?, ?, 1)
+            ON CONFLICT(fecha) DO UPDATE SET
+                version = archivos_dia.version + 1,
+                formato = excluded.formato,
+                datos = excluded.datos,
+                totales_json = excluded.totales_json,
+                tamano = excluded.tamano,
+                activo = 1,
+                fecha_archivado = CURRENT_TIMESTAMP,
+                fecha_reapertura = NULL
+        ''', (fecha, formato, sqlite3.Binary(datos), json.dumps(totales), len(datos)))
+        cursor.execute('SELECT version FROM archivos_dia WHERE fecha = ?', (fecha,))
+        version = cursor.fetchone()['version']
+        conn.commit()
+        conn.close()
+        return version
+    except Exception as e:
+        print(f"Error archivando día {fecha}: {e}")
+        return -1
+
+
+def obtener_archivo_dia(fecha: str) -> Optional[Dict]:
+    """Obtiene el archivo activo de una fecha (datos comprimidos incluidos) o None."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM archivos_dia WHERE fecha = ? AND activo = 1', (fecha,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return None
+    archivo = dict(row)
+    archivo['totales'] = json.loads(archivo.pop('totales_json') or '{}')
+    return archivo
+
+
+def es_dia_archivado(fecha: str) -> bool:
+    """Verifica si una fecha tiene un archivo activo."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM archivos_dia WHERE fecha = ? AND activo = 1', (fecha,))
+    existe = cursor.fetchone() is not None
+    conn.close()
+    return existe
+
+
+def reabrir_dia(fecha: str) -> bool:
+    """Invalida el archivo de una fecha; se conserva el blob para la siguiente versión."""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE archivos_dia SET activo = 0, fecha_reapertura = CURRENT_TIMESTAMP
+            WHERE fecha = ? AND activo = 1
+        ''', (fecha,))
+        conn.commit()
+        reabierto = cursor.rowcount > 0
+        conn.close()
+        return reabierto
+    except Exception as e:
+        print(f"Error reabriendo día {fecha}: {e}")
+        return False
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# FUNCIONES PARA COPIA LOCAL DEL DÍA (MODO OFFLINE)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def guardar_cache_estado_dia(fecha: str, datos: bytes) -> bool:
+    """Guarda (reemplaza) la última carga buena de Firebird de una fecha."""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO cache_estado_dia (fecha, datos, fecha_carga)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', (fecha, sqlite3.Binary(datos)))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"Error guardando copia local de {fecha}: {e}")
+        return False
+
+
+def obtener_cache_estado_dia(fecha: str) -> Optional[bytes]:
+    """Obtiene la copia local comprimida de una fecha, o None."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT datos FROM cache_estado_dia WHERE fecha = ?', (fecha,))
+    row = cursor.fetchone()
+    conn.close()
+    return bytes(row['datos']) if row else None
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # FUNCIONES DE MIGRACIÓN (JSON a SQLite)
 # ══════════════════════════════════════════════════════════════════════════════
@@ -2399,6 +2997,7 @@ def agregar_credito_punteado(fecha: str, folio: int, cliente: str, subtotal: flo
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_punteados', fecha, [folio])
         cursor.execute('''
             INSERT INTO creditos_punteados (fecha, folio, cliente, subtotal, repartidor, observaciones)
             VALUES (?, ?, ?, ?, ?, ?)
@@ -2422,6 +3021,7 @@ def eliminar_credito_punteado(fecha: str, folio: int) -> bool:
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_punteados', fecha, [folio], mover=True)
         cursor.execute('DELETE FROM creditos_punteados WHERE fecha = ? AND folio = ?', (fecha, folio))
         conn.commit()
         afectados = cursor.rowcount
@@ -2432,6 +3032,7 @@ def eliminar_credito_punteado(fecha: str, folio: int) -> bool:
         return False
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_creditos_punteados_fecha(fecha: str) -> List[Dict]:
     """Obtiene todos los créditos punteados de una fecha."""
     conn = get_connection()
@@ -2445,8 +3046,9 @@ def obtener_creditos_punteados_fecha(fecha: str) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
-def obtener_todos_creditos_punteados() -> List[Dict]:
-    """Obtiene TODOS los créditos punteados de todas las fechas."""
+@_lectura_archivada(_rango_incluir)
+def obtener_todos_creditos_punteados(incluir_archivados: bool = True) -> List[Dict]:
+    """Obtiene TODOS los créditos punteados de todas las fechas (sin los archivados si incluir_archivados=False)."""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -2458,6 +3060,7 @@ def obtener_todos_creditos_punteados() -> List[Dict]:
     return [dict(row) for row in rows]
 
 
+@_lectura_archivada(_rango_todo)
 def obtener_fechas_creditos_punteados() -> List[str]:
     """Obtiene lista de fechas únicas con créditos punteados."""
     conn = get_connection()
@@ -2468,6 +3071,7 @@ def obtener_fechas_creditos_punteados() -> List[str]:
     return [row['fecha'] for row in rows]
 
 
+@_lectura_archivada(_rango_fecha)
 def es_credito_punteado(fecha: str, folio: int) -> bool:
     """Verifica si una factura está marcada como crédito punteado."""
     conn = get_connection()
@@ -2478,6 +3082,7 @@ def es_credito_punteado(fecha: str, folio: int) -> bool:
     return count > 0
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_total_creditos_punteados(fecha: str) -> float:
     """Obtiene el total de créditos punteados de una fecha."""
     conn = get_connection()
@@ -2488,6 +3093,7 @@ def obtener_total_creditos_punteados(fecha: str) -> float:
     return total or 0.0
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_total_creditos_punteados_por_folios(fecha: str, folios: list) -> float:
     """Obtiene el total de créditos punteados de una fecha filtrado por lista de folios."""
     if not folios:
@@ -2798,17 +3404,8 @@ def obtener_todos_prestamos() -> List[Dict]:
 
 
 def obtener_total_prestamos_pendientes() -> float:
-    """Obtiene el total de préstamos pendientes (sin pagar)."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT COALESCE(SUM(monto - COALESCE(abono, 0)), 0) 
-        FROM prestamos 
-        WHERE estado = 'PENDIENTE'
-    ''')
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total or 0.0
+    """Obtiene el total de préstamos pendientes (sin pagar), desde la cartera."""
+    return obtener_antiguedad_cartera(['PRESTAMO'])['total']
 
 
 def actualizar_abono_prestamo(id_prestamo: int, nuevo_abono: float) -> dict:
@@ -2970,7 +3567,9 @@ def obtener_prestamo(id_prestamo: int) -> dict:
 
 def guardar_credito_eleventa(fecha: str, folio: int, ticket_id: int, cliente: str,
                               subtotal: float, total_credito: float, repartidor: str = '') -> bool:
-    """Guarda o actualiza un crédito de Eleventa en cache."""
+    """Guarda o actualiza un crédito de Eleventa en cache (los ya archivados no se tocan)."""
+    if folio in _folios_eleventa_archivados(fecha):
+        return True
     try:
         conn = get_connection()
         cursor = conn.cursor()
@@ -3005,8 +3604,12 @@ def guardar_creditos_eleventa_bulk(fecha: str, creditos: List[Dict]) -> int:
         
         # Insertar o actualizar (preservando abono, estado, repartidor y observaciones)
         # SOLO se actualizan los datos que vienen de Eleventa: ticket_id, cliente, subtotal, total_credito
+        # Los créditos ya archivados (pagados) no vuelven a la base caliente como pendientes
+        archivados = _folios_eleventa_archivados(fecha)
         count = 0
         for c in creditos:
+            if c.get('folio', 0) in archivados:
+                continue
             cursor.execute('''
                 INSERT INTO creditos_eleventa (fecha, folio, ticket_id, cliente, subtotal, total_credito)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -3034,6 +3637,7 @@ def guardar_creditos_eleventa_bulk(fecha: str, creditos: List[Dict]) -> int:
         return 0
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_creditos_eleventa_fecha(fecha: str) -> List[Dict]:
     """Obtiene todos los créditos Eleventa de una fecha."""
     conn = get_connection()
@@ -3050,8 +3654,9 @@ def obtener_creditos_eleventa_fecha(fecha: str) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
-def obtener_todos_creditos_eleventa() -> List[Dict]:
-    """Obtiene TODOS los créditos Eleventa de todas las fechas."""
+@_lectura_archivada(_rango_incluir)
+def obtener_todos_creditos_eleventa(incluir_archivados: bool = True) -> List[Dict]:
+    """Obtiene TODOS los créditos Eleventa de todas las fechas (sin los archivados si incluir_archivados=False)."""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -3065,6 +3670,7 @@ def obtener_todos_creditos_eleventa() -> List[Dict]:
     return [dict(row) for row in rows]
 
 
+@_lectura_archivada(_rango_todo)
 def obtener_fechas_creditos_eleventa() -> List[str]:
     """Obtiene lista de fechas únicas con créditos Eleventa."""
     conn = get_connection()
@@ -3075,6 +3681,7 @@ def obtener_fechas_creditos_eleventa() -> List[str]:
     return [row['fecha'] for row in rows]
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_total_creditos_eleventa(fecha: str) -> float:
     """Obtiene el total de créditos Eleventa de una fecha."""
     conn = get_connection()
@@ -3099,6 +3706,7 @@ def eliminar_creditos_eleventa_fecha(fecha: str) -> bool:
         return False
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_total_creditos_cobrados_fecha(fecha: str) -> dict:
     """
     Obtiene el total de créditos cobrados (abonos y pagos completos) en una fecha específica.
@@ -3205,6 +3813,7 @@ def registrar_historial_abono(fecha_abono: str, folio: int, origen: str, cliente
         return False
 
 
+@_lectura_archivada(_rango_todo)
 def obtener_historial_abonos(folio: int = None, origen: str = None) -> list:
     """Obtiene el historial de abonos, opcionalmente filtrado por folio u origen."""
     try:
@@ -3239,6 +3848,7 @@ def actualizar_abono_credito_punteado(fecha: str, folio: int, nuevo_abono: float
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_punteados', fecha, [folio])
         
         # Obtener datos actuales del crédito (incluyendo observaciones)
         cursor.execute('''
@@ -3345,6 +3955,7 @@ def actualizar_estado_credito_punteado(fecha: str, folio: int, estado: str) -> b
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_punteados', fecha, [folio])
         cursor.execute('''
             UPDATE creditos_punteados 
             SET estado = ?
@@ -3363,6 +3974,7 @@ def actualizar_abono_credito_eleventa(fecha: str, folio: int, nuevo_abono: float
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_eleventa', fecha, [folio])
         
         print(f"[DEBUG] Buscando crédito Eleventa: fecha={fecha}, folio={folio}")
         
@@ -3484,6 +4096,7 @@ def actualizar_estado_credito_eleventa(fecha: str, folio: int, estado: str) -> b
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_eleventa', fecha, [folio])
         cursor.execute('''
             UPDATE creditos_eleventa 
             SET estado = ?, fecha_modificacion = CURRENT_TIMESTAMP
@@ -3502,9 +4115,10 @@ def actualizar_repartidor_credito_punteado(fecha: str, folio: int, repartidor: s
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_punteados', fecha, [folio])
         cursor.execute('''
             UPDATE creditos_punteados 
-            SET repartidor = ?, fecha_modificacion = CURRENT_TIMESTAMP
+            SET repartidor = ?
             WHERE fecha = ? AND folio = ?
         ''', (repartidor, fecha, folio))
         conn.commit()
@@ -3520,6 +4134,7 @@ def actualizar_repartidor_credito_eleventa(fecha: str, folio: int, repartidor: s
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_eleventa', fecha, [folio])
         cursor.execute('''
             UPDATE creditos_eleventa 
             SET repartidor = ?, fecha_modificacion = CURRENT_TIMESTAMP
@@ -3538,9 +4153,10 @@ def actualizar_observaciones_credito_punteado(fecha: str, folio: int, observacio
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_punteados', fecha, [folio])
         cursor.execute('''
             UPDATE creditos_punteados 
-            SET observaciones = ?, fecha_modificacion = CURRENT_TIMESTAMP
+            SET observaciones = ?
             WHERE fecha = ? AND folio = ?
         ''', (observaciones, fecha, folio))
         conn.commit()
@@ -3556,6 +4172,7 @@ def actualizar_observaciones_credito_eleventa(fecha: str, folio: int, observacio
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        _traer_de_archivo(conn, 'creditos_eleventa', fecha, [folio])
         cursor.execute('''
             UPDATE creditos_eleventa 
             SET observaciones = ?, fecha_modificacion = CURRENT_TIMESTAMP
@@ -3569,6 +4186,7 @@ def actualizar_observaciones_credito_eleventa(fecha: str, folio: int, observacio
         return False
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_credito_punteado(fecha: str, folio: int) -> Dict:
     """Obtiene un crédito punteado específico por fecha y folio."""
     try:
@@ -3583,6 +4201,7 @@ def obtener_credito_punteado(fecha: str, folio: int) -> Dict:
         return {}
 
 
+@_lectura_archivada(_rango_fecha)
 def obtener_credito_eleventa(fecha: str, folio: int) -> Dict:
     """Obtiene un crédito Eleventa específico por fecha y folio."""
     try:
@@ -3597,6 +4216,7 @@ def obtener_credito_eleventa(fecha: str, folio: int) -> Dict:
         return {}
 
 
+@_lectura_archivada(_rango_estado)
 def obtener_creditos_punteados_por_estado(estado: str = None) -> List[Dict]:
     """Obtiene créditos punteados filtrados por estado. Si estado=None, trae todos."""
     conn = get_connection()
@@ -3610,6 +4230,7 @@ def obtener_creditos_punteados_por_estado(estado: str = None) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
+@_lectura_archivada(_rango_estado)
 def obtener_creditos_eleventa_por_estado(estado: str = None) -> List[Dict]:
     """Obtiene créditos Eleventa filtrados por estado. Si estado=None, trae todos."""
     conn = get_connection()
@@ -3623,157 +4244,1327 @@ def obtener_creditos_eleventa_por_estado(estado: str = None) -> List[Dict]:
     return [dict(row) for row in rows]
 
 
-def saldar_creditos_anteriores_a_fecha(fecha_limite: str = '2026-01-01') -> dict:
+# ══════════════════════════════════════════════════════════════════════════════
+# OPERACIONES MASIVAS DE CRÉDITOS
+# Cada operación es un UPDATE ... WHERE (y un INSERT INTO historial_abonos
+# SELECT ...) por tabla, todo en una transacción. Los créditos se eligen con
+# un filtro (fecha límite) o con la selección del tab de créditos, que se
+# carga en una tabla temporal de la conexión.
+# ══════════════════════════════════════════════════════════════════════════════
+
+# origen -> (tabla, expresión del valor del crédito, tiene fecha_modificacion)
+TABLAS_CREDITO = {
+    'ELEVENTA': ('creditos_eleventa', 'COALESCE(NULLIF(total_credito, 0), NULLIF(subtotal, 0), 0)', True),
+    'PUNTEADO': ('creditos_punteados', 'COALESCE(NULLIF(valor_credito, 0), NULLIF(subtotal, 0), 0)', False),
+}
+
+
+def _cargar_seleccion_creditos(cursor, creditos) -> None:
+    """Carga [(origen, fecha, folio)] en temp.seleccion_creditos."""
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS seleccion_creditos (
+            origen TEXT, fecha TEXT, folio INTEGER,
+            PRIMARY KEY (origen, fecha, folio)
+        )
+    ''')
+    cursor.execute('DELETE FROM temp.seleccion_creditos')
+    cursor.executemany('INSERT OR IGNORE INTO temp.seleccion_creditos VALUES (?, ?, ?)',
+                       [(origen, fecha, int(folio)) for origen, fecha, folio in creditos])
+
+
+def _filtro_creditos(origen: str, condiciones: List[str], params: List[Any],
+                     creditos=None, fecha_limite: str = None) -> Tuple[str, List[Any]]:
+    """WHERE (y sus parámetros) de una operación masiva sobre la tabla de `origen`."""
+    condiciones, params = list(condiciones), list(params)
+    if fecha_limite:
+        condiciones.append('fecha < ?')
+        params.append(fecha_limite)
+    if creditos is not None:
+        condiciones.append('(fecha, folio) IN (SELECT fecha, folio FROM temp.seleccion_creditos WHERE origen = ?)')
+        params.append(origen)
+    return ' AND '.join(condiciones), params
+
+
+def _origenes(creditos) -> List[str]:
+    """Orígenes a tocar: todos, o solo los que aparecen en la selección."""
+    if creditos is None:
+        return list(TABLAS_CREDITO)
+    presentes = {c[0] for c in creditos}
+    return [origen for origen in TABLAS_CREDITO if origen in presentes]
+
+
+def _resultado_masivo(por_origen: Dict[str, Dict], errores: List[str]) -> Dict:
+    return {
+        'count': sum(r['count'] for r in por_origen.values()),
+        'total': sum(r['total'] for r in por_origen.values()),
+        'por_origen': por_origen,
+        'errores': errores,
+    }
+
+
+def saldar_creditos(creditos=None, fecha_limite: str = None, observacion: str = None) -> Dict:
     """
-    Salda automáticamente todos los créditos con fecha anterior a fecha_limite.
-    Pone abono = valor_credito y estado = PAGADO.
-    Registra cada cambio en el historial.
-    
+    Salda créditos no pagados: abono = valor del crédito y estado = PAGADO,
+    registrando cada uno en historial_abonos.
+
     Args:
-        fecha_limite: Fecha límite en formato 'YYYY-MM-DD'. Por defecto '2026-01-01'
-    
+        creditos: [(origen, fecha, folio)] seleccionados; None = todos los que cumplan el filtro
+        fecha_limite: solo créditos con fecha anterior (YYYY-MM-DD)
+        observacion: texto para el historial
+
     Returns:
-        dict con: eleventa_count, punteados_count, total_saldado
+        dict con count, total (valor saldado), por_origen {origen: {count, total, abonado}} y errores
     """
     from datetime import date
-    
-    resultado = {
-        'eleventa_count': 0,
-        'punteados_count': 0,
-        'total_saldado_eleventa': 0,
-        'total_saldado_punteados': 0,
-        'errores': []
-    }
-    
+    hoy = date.today().isoformat()
+    observacion = observacion or 'Saldado masivo'
+    por_origen, errores = {}, []
+    conn = get_connection()
     try:
-        conn = get_connection()
         cursor = conn.cursor()
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SALDAR CRÉDITOS ELEVENTA ANTERIORES A LA FECHA LÍMITE
-        # ═══════════════════════════════════════════════════════════════
-        cursor.execute('''
-            SELECT fecha, folio, cliente, subtotal, total_credito, abono, estado
-            FROM creditos_eleventa
-            WHERE fecha < ? AND (estado IS NULL OR estado != 'PAGADO')
-        ''', (fecha_limite,))
-        creditos_elev = cursor.fetchall()
-        
-        for c in creditos_elev:
-            fecha, folio, cliente, subtotal, total_credito, abono_ant, estado_ant = c
-            valor_credito = total_credito or subtotal or 0
-            abono_anterior = abono_ant or 0
-            estado_anterior = estado_ant or 'PENDIENTE'
-            
-            if valor_credito <= 0:
-                continue
-            
-            # Actualizar: abono = valor_credito, estado = PAGADO
-            cursor.execute('''
-                UPDATE creditos_eleventa
-                SET abono = ?, estado = 'PAGADO', fecha_modificacion = CURRENT_TIMESTAMP
-                WHERE fecha = ? AND folio = ?
-            ''', (valor_credito, fecha, folio))
-            
-            # Registrar en historial
-            monto_abonado = valor_credito - abono_anterior
-            cursor.execute('''
-                INSERT INTO historial_abonos 
-                (fecha_abono, folio, origen, cliente, valor_credito, abono_anterior, nuevo_abono,
-                 monto_abonado, saldo_anterior, saldo_nuevo, estado_anterior, estado_nuevo, observacion)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                date.today().isoformat(),
-                folio,
-                'ELEVENTA',
-                cliente or '',
-                valor_credito,
-                abono_anterior,
-                valor_credito,  # nuevo_abono = valor_credito (saldado)
-                monto_abonado,
-                valor_credito - abono_anterior,  # saldo_anterior
-                0,  # saldo_nuevo = 0 (saldado)
-                estado_anterior,
-                'PAGADO',
-                f'Saldado automáticamente - Crédito anterior a {fecha_limite}'
-            ))
-            
-            resultado['eleventa_count'] += 1
-            resultado['total_saldado_eleventa'] += valor_credito
-        
-        # ═══════════════════════════════════════════════════════════════
-        # SALDAR CRÉDITOS PUNTEADOS ANTERIORES A LA FECHA LÍMITE
-        # ═══════════════════════════════════════════════════════════════
-        cursor.execute('''
-            SELECT fecha, folio, cliente, subtotal, valor_credito, abono, estado
-            FROM creditos_punteados
-            WHERE fecha < ? AND (estado IS NULL OR estado != 'PAGADO')
-        ''', (fecha_limite,))
-        creditos_punt = cursor.fetchall()
-        
-        for c in creditos_punt:
-            fecha, folio, cliente, subtotal, valor_credito_db, abono_ant, estado_ant = c
-            valor_credito = valor_credito_db or subtotal or 0
-            abono_anterior = abono_ant or 0
-            estado_anterior = estado_ant or 'PENDIENTE'
-            
-            if valor_credito <= 0:
+        if creditos is not None:
+            _traer_seleccion_de_archivo(conn, creditos)
+            _cargar_seleccion_creditos(cursor, creditos)
+        for origen in _origenes(creditos):
+            tabla, valor, con_modificacion = TABLAS_CREDITO[origen]
+            where, params = _filtro_creditos(
+                origen, ["(estado IS NULL OR estado != 'PAGADO')", f'{valor} > 0'], [],
+                creditos, fecha_limite)
+            cursor.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM({valor}), 0), COALESCE(SUM({valor} - COALESCE(abono, 0)), 0)
+                FROM {tabla} WHERE {where}
+            ''', params)
+            n, total, abonado = cursor.fetchone()
+            por_origen[origen] = {'count': n, 'total': total, 'abonado': abonado}
+            if not n:
                 continue
-            
-            # Actualizar: abono = valor_credito, estado = PAGADO
-            cursor.execute('''
-                UPDATE creditos_punteados
-                SET abono = ?, estado = 'PAGADO'
-                WHERE fecha = ? AND folio = ?
-            ''', (valor_credito, fecha, folio))
-            
-            # Registrar en historial
-            monto_abonado = valor_credito - abono_anterior
-            cursor.execute('''
-                INSERT INTO historial_abonos 
+            # El historial va antes del UPDATE: lee el abono y el estado anteriores
+            cursor.execute(f'''
+                INSERT INTO historial_abonos
                 (fecha_abono, folio, origen, cliente, valor_credito, abono_anterior, nuevo_abono,
                  monto_abonado, saldo_anterior, saldo_nuevo, estado_anterior, estado_nuevo, observacion)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                date.today().isoformat(),
-                folio,
-                'PUNTEADO',
-                cliente or '',
-                valor_credito,
-                abono_anterior,
-                valor_credito,  # nuevo_abono = valor_credito (saldado)
-                monto_abonado,
-                valor_credito - abono_anterior,  # saldo_anterior
-                0,  # saldo_nuevo = 0 (saldado)
-                estado_anterior,
-                'PAGADO',
-                f'Saldado automáticamente - Crédito anterior a {fecha_limite}'
-            ))
-            
-            resultado['punteados_count'] += 1
-            resultado['total_saldado_punteados'] += valor_credito
-        
+                SELECT ?, folio, ?, COALESCE(cliente, ''), {valor}, COALESCE(abono, 0), {valor},
+                       {valor} - COALESCE(abono, 0), {valor} - COALESCE(abono, 0), 0,
+                       COALESCE(NULLIF(estado, ''), 'PENDIENTE'), 'PAGADO', ?
+                FROM {tabla} WHERE {where}
+            ''', [hoy, origen, observacion] + params)
+            modificacion = ', fecha_modificacion = CURRENT_TIMESTAMP' if con_modificacion else ''
+            cursor.execute(f'''
+                UPDATE {tabla}
+                SET abono = {valor}, estado = 'PAGADO',
+                    fecha_pagado = COALESCE(NULLIF(fecha_pagado, ''), ?){modificacion}
+                WHERE {where}
+            ''', [hoy] + params)
         conn.commit()
-        conn.close()
-        
-        total_creditos = resultado['eleventa_count'] + resultado['punteados_count']
-        total_monto = resultado['total_saldado_eleventa'] + resultado['total_saldado_punteados']
-        print(f"✅ Saldados {total_creditos} créditos anteriores a {fecha_limite}")
-        print(f"   - Eleventa: {resultado['eleventa_count']} créditos (${resultado['total_saldado_eleventa']:,.2f})")
-        print(f"   - Punteados: {resultado['punteados_count']} créditos (${resultado['total_saldado_punteados']:,.2f})")
-        print(f"   - Total: ${total_monto:,.2f}")
-        
-        return resultado
-        
     except Exception as e:
-        print(f"Error saldando créditos anteriores: {e}")
-        resultado['errores'].append(str(e))
-        return resultado
+        conn.rollback()
+        print(f"Error saldando créditos: {e}")
+        errores.append(str(e))
+        por_origen = {}
+    finally:
+        conn.close()
+    return _resultado_masivo(por_origen, errores)
 
 
-# ══════════════════════════════════════════════════════════════════════════════
-# FUNCIONES PARA PAGO DE NÓMINA
-# ══════════════════════════════════════════════════════════════════════════════
+def cambiar_estado_creditos(creditos, estado: str) -> Dict:
+    """
+    Cambia el estado (PENDIENTE, PAGADO, CANCELADA) de los créditos seleccionados.
+    Solo toca los que tienen otro estado; cada cambio queda en historial_abonos
+    sin monto abonado.
+
+    Returns:
+        dict con count, total (saldo de los créditos cambiados), por_origen y errores
+    """
+    from datetime import date
+    hoy = date.today().isoformat()
+    por_origen, errores = {}, []
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        _traer_seleccion_de_archivo(conn, creditos)
+        _cargar_seleccion_creditos(cursor, creditos)
+        for origen in _origenes(creditos):
+            tabla, valor, con_modificacion = TABLAS_CREDITO[origen]
+            where, params = _filtro_creditos(
+                origen, ["COALESCE(NULLIF(estado, ''), 'PENDIENTE') != ?"], [estado], creditos)
+            cursor.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM({valor} - COALESCE(abono, 0)), 0)
+                FROM {tabla} WHERE {where}
+            ''', params)
+            n, saldo = cursor.fetchone()
+            por_origen[origen] = {'count': n, 'total': saldo}
+            if not n:
+                continue
+            cursor.execute(f'''
+                INSERT INTO historial_abonos
+                (fecha_abono, folio, origen, cliente, valor_credito, abono_anterior, nuevo_abono,
+                 monto_abonado, saldo_anterior, saldo_nuevo, estado_anterior, estado_nuevo, observacion)
+                SELECT ?, folio, ?, COALESCE(cliente, ''), {valor}, COALESCE(abono, 0), COALESCE(abono, 0),
+                       0, {valor} - COALESCE(abono, 0), {valor} - COALESCE(abono, 0),
+                       COALESCE(NULLIF(estado, ''), 'PENDIENTE'), ?, 'Cambio de estado masivo'
+                FROM {tabla} WHERE {where}
+            ''', [hoy, origen, estado] + params)
+            modificacion = ', fecha_modificacion = CURRENT_TIMESTAMP' if con_modificacion else ''
+            cursor.execute(f'UPDATE {tabla} SET estado = ?{modificacion} WHERE {where}',
+                           [estado] + params)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error cambiando estado de créditos: {e}")
+        errores.append(str(e))
+        por_origen = {}
+    finally:
+        conn.close()
+    return _resultado_masivo(por_origen, errores)
+
+
+def asignar_repartidor_creditos(creditos, repartidor: str) -> Dict:
+    """
+    Asigna el repartidor a los créditos seleccionados.
+
+    Returns:
+        dict con count, total (saldo de los créditos reasignados), por_origen y errores
+    """
+    por_origen, errores = {}, []
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        _traer_seleccion_de_archivo(conn, creditos)
+        _cargar_seleccion_creditos(cursor, creditos)
+        for origen in _origenes(creditos):
+            tabla, valor, con_modificacion = TABLAS_CREDITO[origen]
+            where, params = _filtro_creditos(
+                origen, ["COALESCE(repartidor, '') != ?"], [repartidor], creditos)
+            cursor.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM({valor} - COALESCE(abono, 0)), 0)
+                FROM {tabla} WHERE {where}
+            ''', params)
+            n, saldo = cursor.fetchone()
+            por_origen[origen] = {'count': n, 'total': saldo}
+            if not n:
+                continue
+            modificacion = ', fecha_modificacion = CURRENT_TIMESTAMP' if con_modificacion else ''
+            cursor.execute(f'UPDATE {tabla} SET repartidor = ?{modificacion} WHERE {where}',
+                           [repartidor] + params)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error asignando repartidor a créditos: {e}")
+        errores.append(str(e))
+        por_origen = {}
+    finally:
+        conn.close()
+    return _resultado_masivo(por_origen, errores)
+
+
+def saldar_creditos_anteriores_a_fecha(fecha_limite: str = '2026-01-01') -> dict:
+    """
+    Salda automáticamente todos los créditos con fecha anterior a fecha_limite.
+    Pone abono = valor_credito y estado = PAGADO.
+    Registra cada cambio en el historial.
+
+    Args:
+        fecha_limite: Fecha límite en formato 'YYYY-MM-DD'. Por defecto '2026-01-01'
+
+    Returns:
+        dict con: eleventa_count, punteados_count, total_saldado
+    """
+    r = saldar_creditos(fecha_limite=fecha_limite,
+                        observacion=f'Saldado automáticamente - Crédito anterior a {fecha_limite}')
+    elev = r['por_origen'].get('ELEVENTA', {})
+    punt = r['por_origen'].get('PUNTEADO', {})
+    resultado = {
+        'eleventa_count': elev.get('count', 0),
+        'punteados_count': punt.get('count', 0),
+        'total_saldado_eleventa': elev.get('total', 0),
+        'total_saldado_punteados': punt.get('total', 0),
+        'errores': r['errores']
+    }
+    if not r['errores']:
+        print(f"✅ Saldados {r['count']} créditos anteriores a {fecha_limite}")
+        print(f"   - Eleventa: {resultado['eleventa_count']} créditos (${resultado['total_saldado_eleventa']:,.2f})")
+        print(f"   - Punteados: {resultado['punteados_count']} créditos (${resultado['total_saldado_punteados']:,.2f})")
+        print(f"   - Total: ${r['total']:,.2f}")
+    return resultado
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CARTERA: SALDOS PENDIENTES POR CLIENTE Y REPARTIDOR, CON ANTIGÜEDAD
+# cartera_saldos guarda, por origen, cliente o repartidor y tramo de
+# antigüedad, la suma de saldos pendientes y cuántos documentos la forman.
+# Triggers sobre las tablas de créditos, no entregados y préstamos aplican
+# cada cambio (abonos, estados, saldados masivos, altas y bajas) como un
+# delta, así que los tableros de cartera leen unas pocas filas en vez de
+# recorrer las tablas. Los tramos se calculan contra una fecha de corte;
+# cuando cambia el día se reconstruye la tabla una vez.
+# ══════════════════════════════════════════════════════════════════════════════
+
+TRAMOS_CARTERA = ('0-7', '8-30', '31-90', '>90')
+
+_PENDIENTE = "COALESCE(NULLIF({r}.estado, ''), 'PENDIENTE') = 'PENDIENTE'"
+
+# origen -> (tabla, saldo, condición de pendiente, columna cliente, columna repartidor, columnas que lo afectan)
+CARTERA_FUENTES = {
+    'ELEVENTA': ('creditos_eleventa',
+                 'COALESCE({r}.total_credito, 0) - COALESCE({r}.abono, 0)',
+                 # Igual que el tab de créditos: subtotal 0 con crédito es una factura cancelada
+                 _PENDIENTE + ' AND NOT (COALESCE({r}.subtotal, 0) = 0 AND COALESCE({r}.total_credito, 0) > 0)',
+                 'cliente', 'repartidor', 'fecha, cliente, repartidor, subtotal, total_credito, abono, estado'),
+    'PUNTEADO': ('creditos_punteados',
+                 'COALESCE(NULLIF({r}.valor_credito, 0), {r}.subtotal, 0) - COALESCE({r}.abono, 0)',
+                 _PENDIENTE,
+                 'cliente', 'repartidor', 'fecha, cliente, repartidor, subtotal, valor_credito, abono, estado'),
+    'NO_ENTREGADO': ('no_entregados',
+                     'COALESCE({r}.subtotal, 0) - COALESCE({r}.abono, 0)',
+                     _PENDIENTE,
+                     'cliente', 'repartidor', 'fecha, cliente, repartidor, subtotal, abono, estado'),
+    'PRESTAMO': ('prestamos',
+                 'COALESCE({r}.monto, 0) - COALESCE({r}.abono, 0)',
+                 _PENDIENTE,
+                 'beneficiario', 'responsable', 'fecha, beneficiario, responsable, monto, abono, estado'),
+}
+
+_DIAS_CARTERA = ("(julianday((SELECT valor FROM configuracion WHERE clave = 'cartera_fecha_corte'))"
+                 " - julianday({fecha}))")
+_TRAMO_CARTERA = ('CASE WHEN {d} <= 7 THEN 0 WHEN {d} <= 30 THEN 1 WHEN {d} <= 90 THEN 2 ELSE 3 END')
+
+
+def _sql_tramo(fecha: str) -> str:
+    return _TRAMO_CARTERA.format(d=_DIAS_CARTERA.format(fecha=fecha))
+
+
+def _sql_movimiento_cartera(origen: str, r: str, signo: str) -> str:
+    """Sentencias de trigger que suman (signo '') o restan ('-') la fila `r` (NEW/OLD)."""
+    _tabla, saldo, pendiente, col_cliente, col_repartidor, _cols = CARTERA_FUENTES[origen]
+    sentencias = []
+    for dimension, columna in (('CLIENTE', col_cliente), ('REPARTIDOR', col_repartidor)):
+        sentencias.append(f'''
+            INSERT INTO cartera_saldos (origen, dimension, clave, tramo, saldo, documentos)
+            SELECT '{origen}', '{dimension}', COALESCE({r}.{columna}, ''), {_sql_tramo(f'{r}.fecha')},
+                   {signo}({saldo.format(r=r)}), {signo}1
+            WHERE {pendiente.format(r=r)}
+            ON CONFLICT(origen, dimension, clave, tramo) DO UPDATE SET
+                saldo = saldo + excluded.saldo,
+                documentos = documentos + excluded.documentos;''')
+    return ''.join(sentencias)
+
+
+def crear_cartera(cursor):
+    """Crea cartera_saldos y los triggers que la mantienen (idempotente)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cartera_saldos (
+            origen TEXT NOT NULL,
+            dimension TEXT NOT NULL CHECK(dimension IN ('CLIENTE', 'REPARTIDOR')),
+            clave TEXT NOT NULL,
+            tramo INTEGER NOT NULL,
+            saldo REAL DEFAULT 0,
+            documentos INTEGER DEFAULT 0,
+            PRIMARY KEY (origen, dimension, clave, tramo)
+        )
+    ''')
+    for origen, (tabla, _saldo, _pend, _cli, _rep, columnas) in CARTERA_FUENTES.items():
+        prefijo = f'trg_cartera_{tabla}'
+        try:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {prefijo}_insert AFTER INSERT ON {tabla}
+                BEGIN {_sql_movimiento_cartera(origen, 'NEW', '')}
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {prefijo}_delete AFTER DELETE ON {tabla}
+                BEGIN {_sql_movimiento_cartera(origen, 'OLD', '-')}
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {prefijo}_update AFTER UPDATE OF {columnas} ON {tabla}
+                BEGIN {_sql_movimiento_cartera(origen, 'OLD', '-')}
+                      {_sql_movimiento_cartera(origen, 'NEW', '')}
+                END
+            ''')
+        except sqlite3.OperationalError:
+            pass  # Tabla que esta base todavía no tiene (la crea init_database)
+
+
+def reconstruir_cartera(fecha_corte: str = None) -> bool:
+    """
+    Recalcula cartera_saldos desde las tablas con los tramos contados a
+    `fecha_corte` (hoy por defecto). Es la única lectura completa de las
+    tablas; se hace una vez al día.
+    """
+    from datetime import date
+    fecha_corte = fecha_corte or date.today().isoformat()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO configuracion (clave, valor, fecha_modificacion)
+            VALUES ('cartera_fecha_corte', ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(clave) DO UPDATE SET
+                valor = excluded.valor,
+                fecha_modificacion = CURRENT_TIMESTAMP
+        ''', (fecha_corte,))
+        cursor.execute('DELETE FROM cartera_saldos')
+        for origen, (tabla, saldo, pendiente, col_cliente, col_repartidor, _cols) in CARTERA_FUENTES.items():
+            for dimension, columna in (('CLIENTE', col_cliente), ('REPARTIDOR', col_repartidor)):
+                cursor.execute(f'''
+                    INSERT INTO cartera_saldos (origen, dimension, clave, tramo, saldo, documentos)
+                    SELECT ?, ?, COALESCE(r.{columna}, ''), {_sql_tramo('r.fecha')},
+                           SUM({saldo.format(r='r')}), COUNT(*)
+                    FROM {tabla} AS r
+                    WHERE {pendiente.format(r='r')}
+                    GROUP BY 3, 4
+                ''', (origen, dimension))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Error reconstruyendo cartera: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def _asegurar_corte_cartera():
+    """Reconstruye la cartera si sus tramos se calcularon otro día."""
+    from datetime import date
+    if obtener_config('cartera_fecha_corte') != date.today().isoformat():
+        reconstruir_cartera()
+
+
+def obtener_cartera(dimension: str = 'CLIENTE', origen: str = None) -> List[Dict]:
+    """
+    Saldos pendientes por cliente o repartidor, con su antigüedad.
+
+    Args:
+        dimension: 'CLIENTE' o 'REPARTIDOR'
+        origen: ELEVENTA, PUNTEADO, NO_ENTREGADO o PRESTAMO; None = todos
+
+    Returns:
+        [{'clave', 'saldo', 'documentos', '0-7', '8-30', '31-90', '>90'}] de mayor a menor saldo
+    """
+    _asegurar_corte_cartera()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT clave,
+               SUM(saldo) AS saldo,
+               SUM(documentos) AS documentos,
+               SUM(CASE WHEN tramo = 0 THEN saldo ELSE 0 END) AS t0,
+               SUM(CASE WHEN tramo = 1 THEN saldo ELSE 0 END) AS t1,
+               SUM(CASE WHEN tramo = 2 THEN saldo ELSE 0 END) AS t2,
+               SUM(CASE WHEN tramo = 3 THEN saldo ELSE 0 END) AS t3
+        FROM cartera_saldos
+        WHERE dimension = ? AND origen = COALESCE(?, origen)
+        GROUP BY clave
+        HAVING SUM(documentos) > 0
+        ORDER BY saldo DESC
+    ''', (dimension, origen))
+    rows = cursor.fetchall()
+    conn.close()
+    return [{
+        'clave': row['clave'],
+        'saldo': round(row['saldo'], 2),
+        'documentos': row['documentos'],
+        **{tramo: round(row[f't{i}'], 2) for i, tramo in enumerate(TRAMOS_CARTERA)},
+    } for row in rows]
+
+
+def obtener_antiguedad_cartera(origenes: List[str] = None) -> Dict[str, float]:
+    """
+    Total pendiente por tramo de antigüedad.
+
+    Args:
+        origenes: lista de orígenes a sumar; None = todos
+
+    Returns:
+        {'0-7', '8-30', '31-90', '>90', 'total', 'documentos'}
+    """
+    _asegurar_corte_cartera()
+    resultado = {tramo: 0.0 for tramo in TRAMOS_CARTERA}
+    resultado.update(total=0.0, documentos=0)
+    conn = get_connection()
+    cursor = conn.cursor()
+    for origen in (origenes or [None]):
+        cursor.execute('''
+            SELECT tramo, SUM(saldo), SUM(documentos)
+            FROM cartera_saldos
+            WHERE dimension = 'CLIENTE' AND origen = COALESCE(?, origen)
+            GROUP BY tramo
+        ''', (origen,))
+        for tramo, saldo, documentos in cursor.fetchall():
+            resultado[TRAMOS_CARTERA[tramo]] += saldo or 0
+            resultado['total'] += saldo or 0
+            resultado['documentos'] += documentos or 0
+    conn.close()
+    for clave in TRAMOS_CARTERA + ('total',):
+        resultado[clave] = round(resultado[clave], 2)
+    return resultado
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BÚSQUEDA GLOBAL (FTS5)
+# busqueda_global indexa cliente, folio, repartidor y un texto libre
+# (observaciones, título y contenido de anotaciones) de ventas, créditos,
+# no entregados y anotaciones de todas las fechas. Igual que la cartera,
+# la mantienen triggers sobre las tablas de origen. Las ventas vienen de
+# Firebird, así que cada día cargado se guarda en ventas_busqueda.
+# Si el SQLite no trae FTS5, busqueda_global es una tabla normal y se
+# busca con LIKE.
+# ══════════════════════════════════════════════════════════════════════════════
+
+# origen -> (código de rowid, tabla, folio, cliente, repartidor, texto, condición, columnas que la afectan)
+BUSQUEDA_FUENTES = {
+    'VENTA': (5, 'ventas_busqueda', '{r}.folio', '{r}.cliente', '{r}.repartidor', "''", '1',
+              'fecha, folio, cliente, repartidor'),
+    'ELEVENTA': (1, 'creditos_eleventa', '{r}.folio', '{r}.cliente', '{r}.repartidor', '{r}.observaciones', '1',
+                 'fecha, folio, cliente, repartidor, observaciones'),
+    'PUNTEADO': (2, 'creditos_punteados', '{r}.folio', '{r}.cliente', '{r}.repartidor', '{r}.observaciones', '1',
+                 'fecha, folio, cliente, repartidor, observaciones'),
+    'NO_ENTREGADO': (3, 'no_entregados', '{r}.folio', '{r}.cliente', '{r}.repartidor', '{r}.observaciones', '1',
+                     'fecha, folio, cliente, repartidor, observaciones'),
+    'ANOTACION': (4, 'anotaciones', "''", "''", "''",
+                  "COALESCE({r}.titulo, '') || ' ' || COALESCE({r}.contenido, '')", '{r}.eliminada = 0',
+                  'fecha, titulo, contenido, eliminada'),
+}
+_ROWID_BUSQUEDA = '{r}.id * 8 + {codigo}'
+
+
+def fts5_disponible() -> bool:
+    """True si el SQLite de este Python trae FTS5."""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE prueba USING fts5(texto)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+HAS_FTS5 = fts5_disponible()
+
+
+def _sql_fila_busqueda(origen: str, r: str, desde: str = '') -> str:
+    """SELECT con las columnas de busqueda_global para la fila `r` (NEW, o alias de `desde`)."""
+    codigo, _tabla, folio, cliente, repartidor, texto, condicion, _cols = BUSQUEDA_FUENTES[origen]
+    return f'''
+        SELECT {_ROWID_BUSQUEDA.format(r=r, codigo=codigo)}, COALESCE({cliente.format(r=r)}, ''),
+               COALESCE({folio.format(r=r)}, ''), COALESCE({repartidor.format(r=r)}, ''),
+               COALESCE({texto.format(r=r)}, ''), '{origen}', {r}.fecha, {r}.id
+        {desde}
+        WHERE {condicion.format(r=r)}'''
+
+
+_COLUMNAS_BUSQUEDA = '(rowid, cliente, folio, repartidor, texto, origen, fecha, ref)'
+
+
+def crear_busqueda(cursor):
+    """Crea busqueda_global, ventas_busqueda y sus triggers (idempotente)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ventas_busqueda (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TEXT NOT NULL,
+            folio INTEGER NOT NULL,
+            cliente TEXT,
+            subtotal REAL DEFAULT 0,
+            repartidor TEXT DEFAULT '',
+            UNIQUE(fecha, folio)
+        )
+    ''')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'busqueda_global'")
+    nueva = cursor.fetchone() is None
+    if HAS_FTS5:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS busqueda_global USING fts5(
+                cliente, folio, repartidor, texto,
+                origen UNINDEXED, fecha UNINDEXED, ref UNINDEXED,
+                tokenize = "unicode61 remove_diacritics 2", prefix = '1 2 3'
+            )
+        ''')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS busqueda_global (
+                cliente TEXT, folio TEXT, repartidor TEXT, texto TEXT,
+                origen TEXT, fecha TEXT, ref INTEGER
+            )
+        ''')
+
+    for origen, (codigo, tabla, _f, _c, _r, _t, _cond, columnas) in BUSQUEDA_FUENTES.items():
+        prefijo = f'trg_busqueda_{tabla}'
+        borrar = f'DELETE FROM busqueda_global WHERE rowid = {_ROWID_BUSQUEDA.format(r="OLD", codigo=codigo)};'
+        insertar = f'INSERT INTO busqueda_global {_COLUMNAS_BUSQUEDA} {_sql_fila_busqueda(origen, "NEW")};'
+        try:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {prefijo}_insert AFTER INSERT ON {tabla}
+                BEGIN {insertar} END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {prefijo}_delete AFTER DELETE ON {tabla}
+                BEGIN {borrar} END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {prefijo}_update AFTER UPDATE OF {columnas} ON {tabla}
+                BEGIN {borrar} {insertar} END
+            ''')
+        except sqlite3.OperationalError:
+            pass  # Tabla que esta base todavía no tiene (la crea init_database)
+
+    # El repartidor de una venta es el de su asignación
+    for evento, fila, valor in (('INSERT', 'NEW', 'NEW.repartidor'), ('UPDATE OF repartidor', 'NEW', 'NEW.repartidor'),
+                                ('DELETE', 'OLD', "''")):
+        nombre = 'trg_busqueda_asignaciones_' + evento.split()[0].lower()
+        try:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON asignaciones
+                BEGIN
+                    UPDATE ventas_busqueda SET repartidor = {valor}
+                    WHERE fecha = {fila}.fecha AND folio = {fila}.folio;
+                END
+            ''')
+        except sqlite3.OperationalError:
+            pass
+
+    if nueva:
+        _llenar_busqueda(cursor)
+
+
+def _llenar_busqueda(cursor):
+    """Indexa todas las filas de las fuentes (busqueda_global vacía)."""
+    for origen, (_codigo, tabla, *_resto) in BUSQUEDA_FUENTES.items():
+        try:
+            cursor.execute(f'''
+                INSERT INTO busqueda_global {_COLUMNAS_BUSQUEDA}
+                {_sql_fila_busqueda(origen, 'r', f'FROM {tabla} AS r')}
+            ''')
+        except sqlite3.OperationalError:
+            pass
+
+
+def reconstruir_busqueda() -> bool:
+    """Vacía y vuelve a llenar busqueda_global desde las tablas de origen (incluye lo archivado)."""
+    with leer_archivo():
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM busqueda_global')
+        _llenar_busqueda(cursor)
+        if HAS_FTS5:
+            cursor.execute("INSERT INTO busqueda_global(busqueda_global) VALUES ('optimize')")
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Error reconstruyendo índice de búsqueda: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def indexar_ventas_dia(fecha: str, ventas: List[Dict]) -> int:
+    """
+    Guarda las ventas de un día cargado de Firebird para la búsqueda global.
+
+    Args:
+        ventas: dicts con folio, nombre, subtotal y repartidor (como DataStore.ventas)
+
+    Returns:
+        Número de ventas guardadas.
+    """
+    filas = [(fecha, int(v['folio']), v.get('nombre', '') or '', v.get('subtotal', 0) or 0,
+              v.get('repartidor', '') or '') for v in ventas]
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        # Solo cambia (y reindexa) lo que es distinto
+        cursor.executemany('''
+            INSERT INTO ventas_busqueda (fecha, folio, cliente, subtotal, repartidor)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(fecha, folio) DO UPDATE SET
+                cliente = excluded.cliente,
+                subtotal = excluded.subtotal,
+                repartidor = excluded.repartidor
+            WHERE cliente IS NOT excluded.cliente
+               OR subtotal IS NOT excluded.subtotal
+               OR repartidor IS NOT excluded.repartidor
+        ''', filas)
+        conn.commit()
+        conn.close()
+        return len(filas)
+    except Exception as e:
+        print(f"Error indexando ventas del {fecha}: {e}")
+        return 0
+
+
+def _consulta_fts(texto: str) -> str:
+    """Texto del buscador -> consulta FTS5: todas las palabras, como prefijo."""
+    palabras = re.findall(r'\w+', texto or '', re.UNICODE)
+    return ' '.join(f'"{p}"*' for p in palabras)
+
+
+def buscar_global(texto: str, limite: int = 100) -> List[Dict]:
+    """
+    Busca en ventas, créditos, no entregados y anotaciones de todas las fechas.
+
+    Returns:
+        [{'origen', 'fecha', 'folio', 'cliente', 'repartidor', 'detalle', 'ref'}],
+        de más a menos relevante.
+    """
+    if not HAS_FTS5:
+        return _buscar_global_like(texto, limite)
+    consulta = _consulta_fts(texto)
+    if not consulta:
+        return []
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT origen, fecha, folio, cliente, repartidor,
+                   snippet(busqueda_global, 3, '', '', '…', 8) AS detalle, ref
+            FROM busqueda_global
+            WHERE busqueda_global MATCH ?
+            ORDER BY bm25(busqueda_global, 4.0, 8.0, 2.0, 1.0), fecha DESC
+            LIMIT ?
+        ''', (consulta, limite))
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.OperationalError as e:
+        print(f"Error en búsqueda global: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def _buscar_global_like(texto: str, limite: int) -> List[Dict]:
+    """Búsqueda sin FTS5: subcadena sobre la tabla normal, más recientes primero."""
+    texto = (texto or '').strip()
+    if not texto:
+        return []
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT origen, fecha, folio, cliente, repartidor, substr(texto, 1, 60) AS detalle, ref
+        FROM busqueda_global
+        WHERE cliente || ' ' || folio || ' ' || repartidor || ' ' || texto LIKE ?
+        ORDER BY fecha DESC
+        LIMIT ?
+    ''', (f'%{texto}%', limite))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SUGERENCIAS DE REPARTIDOR POR CLIENTE
+# sugerencias_repartidor cuenta cuántas veces se asignó cada cliente a cada
+# repartidor, por día de la semana. El nombre del cliente sale de
+# ventas_busqueda (las ventas de los días cargados) y la asignación de
+# asignaciones; triggers en las dos tablas suman y restan cada cambio.
+# ══════════════════════════════════════════════════════════════════════════════
+
+# Auto-asignar solo si el repartidor sugerido tiene historial suficiente y claro
+SUGERENCIA_MIN_VECES = 2
+SUGERENCIA_MIN_PROPORCION = 0.6
+# Peso de las asignaciones del mismo día de la semana frente al total
+PESO_MISMO_DIA = 3
+
+_CLIENTE_SUGERENCIA = "UPPER(TRIM(COALESCE({c}, '')))"
+
+
+def _sql_conteo_sugerencia(cliente: str, fecha: str, repartidor: str, signo: str) -> str:
+    """Upsert que suma (signo '') o resta ('-') una asignación cliente -> repartidor."""
+    return f'''
+        INSERT INTO sugerencias_repartidor (cliente, dia_semana, repartidor, veces, ultima_fecha)
+        SELECT {_CLIENTE_SUGERENCIA.format(c=cliente)}, CAST(strftime('%w', {fecha}) AS INTEGER),
+               {repartidor}, {signo}1, {fecha}
+        WHERE {_CLIENTE_SUGERENCIA.format(c=cliente)} != '' AND COALESCE({repartidor}, '') != ''
+          AND strftime('%w', {fecha}) IS NOT NULL
+        ON CONFLICT(cliente, dia_semana, repartidor) DO UPDATE SET
+            veces = veces + excluded.veces,
+            ultima_fecha = MAX(ultima_fecha, excluded.ultima_fecha);'''
+
+
+def crear_sugerencias(cursor):
+    """Crea sugerencias_repartidor y los triggers que la mantienen (idempotente)."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sugerencias_repartidor'")
+    nueva = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sugerencias_repartidor (
+            cliente TEXT NOT NULL,
+            dia_semana INTEGER NOT NULL,
+            repartidor TEXT NOT NULL,
+            veces INTEGER DEFAULT 0,
+            ultima_fecha TEXT,
+            PRIMARY KEY (cliente, dia_semana, repartidor)
+        )
+    ''')
+    # Cliente de la venta asignada (NEW/OLD de asignaciones)
+    cliente_de = ("(SELECT cliente FROM ventas_busqueda WHERE fecha = {r}.fecha AND folio = {r}.folio)")
+    # Repartidor asignado a la venta (NEW/OLD de ventas_busqueda)
+    repartidor_de = ("(SELECT repartidor FROM asignaciones WHERE fecha = {r}.fecha AND folio = {r}.folio)")
+    triggers = {
+        'trg_sugerencias_asignaciones_insert': ('AFTER INSERT ON asignaciones',
+            _sql_conteo_sugerencia(cliente_de.format(r='NEW'), 'NEW.fecha', 'NEW.repartidor', '')),
+        'trg_sugerencias_asignaciones_delete': ('AFTER DELETE ON asignaciones',
+            _sql_conteo_sugerencia(cliente_de.format(r='OLD'), 'OLD.fecha', 'OLD.repartidor', '-')),
+        'trg_sugerencias_asignaciones_update': ('AFTER UPDATE OF fecha, folio, repartidor ON asignaciones',
+            _sql_conteo_sugerencia(cliente_de.format(r='OLD'), 'OLD.fecha', 'OLD.repartidor', '-')
+            + _sql_conteo_sugerencia(cliente_de.format(r='NEW'), 'NEW.fecha', 'NEW.repartidor', '')),
+        'trg_sugerencias_ventas_insert': ('AFTER INSERT ON ventas_busqueda',
+            _sql_conteo_sugerencia('NEW.cliente', 'NEW.fecha', repartidor_de.format(r='NEW'), '')),
+        'trg_sugerencias_ventas_delete': ('AFTER DELETE ON ventas_busqueda',
+            _sql_conteo_sugerencia('OLD.cliente', 'OLD.fecha', repartidor_de.format(r='OLD'), '-')),
+        'trg_sugerencias_ventas_update': ('AFTER UPDATE OF cliente ON ventas_busqueda',
+            _sql_conteo_sugerencia('OLD.cliente', 'OLD.fecha', repartidor_de.format(r='OLD'), '-')
+            + _sql_conteo_sugerencia('NEW.cliente', 'NEW.fecha', repartidor_de.format(r='NEW'), '')),
+    }
+    for nombre, (evento, cuerpo) in triggers.items():
+        try:
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {nombre} {evento} BEGIN {cuerpo} END')
+        except sqlite3.OperationalError:
+            pass  # Tabla que esta base todavía no tiene (la crea init_database)
+    if nueva:
+        _llenar_sugerencias(cursor)
+
+
+def _llenar_sugerencias(cursor):
+    """Cuenta todo el historial de asignaciones con nombre de cliente conocido."""
+    cliente = _CLIENTE_SUGERENCIA.format(c='v.cliente')
+    try:
+        cursor.execute(f'''
+            INSERT INTO sugerencias_repartidor (cliente, dia_semana, repartidor, veces, ultima_fecha)
+            SELECT {cliente}, CAST(strftime('%w', a.fecha) AS INTEGER), a.repartidor, COUNT(*), MAX(a.fecha)
+            FROM asignaciones a
+            JOIN ventas_busqueda v ON v.fecha = a.fecha AND v.folio = a.folio
+            WHERE {cliente} != '' AND a.repartidor != '' AND strftime('%w', a.fecha) IS NOT NULL
+            GROUP BY 1, 2, 3
+        ''')
+    except sqlite3.OperationalError:
+        pass
+
+
+def reconstruir_sugerencias() -> bool:
+    """Vuelve a contar sugerencias_repartidor desde el historial completo (incluye lo archivado)."""
+    with leer_archivo():
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM sugerencias_repartidor')
+        _llenar_sugerencias(cursor)
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Error reconstruyendo sugerencias de repartidor: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def _dia_semana(fecha: str) -> int:
+    """Día de la semana como strftime('%w') de SQLite (0 = domingo)."""
+    return int(datetime.strptime(fecha, '%Y-%m-%d').strftime('%w'))
+
+
+def _sugerencias_cliente(cursor, cliente: str, dia_semana: int, limite: int) -> List[Dict]:
+    cursor.execute('''
+        SELECT repartidor,
+               SUM(veces) AS veces,
+               SUM(CASE WHEN dia_semana = ? THEN veces ELSE 0 END) AS mismo_dia,
+               MAX(ultima_fecha) AS ultima_fecha
+        FROM sugerencias_repartidor
+        WHERE cliente = ?
+        GROUP BY repartidor
+        HAVING SUM(veces) > 0
+        ORDER BY SUM(CASE WHEN dia_semana = ? THEN veces ELSE 0 END) * ? + SUM(veces) DESC,
+                 MAX(ultima_fecha) DESC
+        LIMIT ?
+    ''', (dia_semana, cliente.strip().upper(), dia_semana, PESO_MISMO_DIA, limite))
+    filas = [dict(row) for row in cursor.fetchall()]
+    total = sum(f['mismo_dia'] * PESO_MISMO_DIA + f['veces'] for f in filas) or 1
+    for f in filas:
+        f['proporcion'] = round((f['mismo_dia'] * PESO_MISMO_DIA + f['veces']) / total, 3)
+    return filas
+
+
+def sugerir_repartidores(cliente: str, fecha: str, limite: int = 5) -> List[Dict]:
+    """
+    Repartidores a los que más se ha asignado el cliente, primero los del
+    mismo día de la semana que `fecha`.
+
+    Returns:
+        [{'repartidor', 'veces', 'mismo_dia', 'ultima_fecha', 'proporcion'}]
+    """
+    if not (cliente or '').strip():
+        return []
+    conn = get_connection()
+    try:
+        return _sugerencias_cliente(conn.cursor(), cliente, _dia_semana(fecha), limite)
+    finally:
+        conn.close()
+
+
+def sugerir_asignaciones(fecha: str, clientes: List[str]) -> Dict[str, str]:
+    """
+    Repartidor sugerido con confianza para cada cliente (para auto-asignar).
+    Solo incluye clientes con al menos SUGERENCIA_MIN_VECES asignaciones y un
+    repartidor con SUGERENCIA_MIN_PROPORCION del historial.
+
+    Returns:
+        {cliente: repartidor}
+    """
+    dia = _dia_semana(fecha)
+    sugeridos = {}
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        for cliente in {c for c in clientes if (c or '').strip()}:
+            filas = _sugerencias_cliente(cursor, cliente, dia, 3)
+            if not filas:
+                continue
+            mejor = filas[0]
+            if mejor['veces'] >= SUGERENCIA_MIN_VECES and mejor['proporcion'] >= SUGERENCIA_MIN_PROPORCION:
+                sugeridos[cliente] = mejor['repartidor']
+    finally:
+        conn.close()
+    return sugeridos
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# ARCHIVO HISTÓRICO (BASE CALIENTE Y ARCHIVOS POR AÑO)
+# Los días cerrados (más viejos que MESES_BASE_CALIENTE y sin créditos
+# pendientes) se mudan de las tablas de ARCHIVO_TABLAS a un archivo SQLite
+# por año junto a la base (<base>_archivo_<año>.db); archivo_periodos dice
+# qué fechas tiene cada uno. Las lecturas marcadas con _lectura_archivada
+# (o dentro de leer_archivo) adjuntan con ATTACH solo los años que cruza
+# su rango y ven cada tabla como una vista TEMP: base caliente UNION ALL
+# archivos. Si una fila se vuelve a escribir en la base caliente, esa
+# versión reemplaza a la archivada en la vista. Las tablas derivadas
+# (cartera, búsqueda, sugerencias) conservan lo archivado.
+# ══════════════════════════════════════════════════════════════════════════════
+
+MESES_BASE_CALIENTE = 12
+ARCHIVAR_CADA_DIAS = 30
+# SQLite adjunta como mucho 10 bases por conexión
+MAX_ARCHIVOS_ADJUNTOS = 10
+
+# tabla -> (fecha que decide el año, otras fechas que también deben ser viejas,
+#           columnas que identifican la fila, condición extra para archivarla)
+# El orden importa: el detalle de conteos sale antes que su sesión.
+ARCHIVO_TABLAS = {
+    'conteos_sesion_detalle': ('(SELECT s.fecha FROM main.conteos_sesion AS s WHERE s.id = {r}.sesion_id)',
+                               (), ('id',), ''),
+    'conteos_sesion': ('{r}.fecha', (), ('id',), ''),
+    'asignaciones': ('{r}.fecha', (), ('fecha', 'folio'), ''),
+    'creditos_eleventa': ('{r}.fecha', (), ('fecha', 'folio'), ''),
+    'creditos_punteados': ('{r}.fecha', (), ('fecha', 'folio'), ''),
+    'cancelaciones_detalle': ('{r}.fecha', ('{r}.fecha_cancel',), ('fecha', 'folio'), ''),
+    'devoluciones_parciales': ('{r}.fecha', ('{r}.fecha_devolucion',), ('id',), ''),
+    'historial_liquidaciones': ('{r}.fecha', (), ('id',), ''),
+    # Los abonos de un crédito que sigue pendiente se quedan con él
+    'historial_abonos': ('{r}.fecha_abono', (), ('id',),
+                         '{r}.folio NOT IN (SELECT folio FROM temp.archivo_folios_abiertos)'),
+}
+# Detalles que se archivan junto con su fila padre: tabla -> (columna del id, padre).
+# Se eligen por el id del padre: su fecha es una subconsulta por fila, sin índice.
+ARCHIVO_DETALLES = {
+    'conteos_sesion_detalle': ('sesion_id', 'conteos_sesion'),
+}
+
+
+def crear_archivo(cursor):
+    """Crea el catálogo de archivos anuales (idempotente)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archivo_periodos (
+            anio INTEGER PRIMARY KEY,
+            archivo TEXT NOT NULL,
+            desde TEXT NOT NULL,
+            hasta TEXT NOT NULL,
+            filas INTEGER DEFAULT 0,
+            fecha_archivado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _nombre_archivo(anio: int) -> str:
+    return f"{os.path.splitext(os.path.basename(DB_PATH))[0]}_archivo_{anio}.db"
+
+
+def _ruta_archivo(archivo: str) -> str:
+    """Los archivos se guardan por nombre: viajan junto con la base."""
+    return os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), archivo)
+
+
+def _columnas_tabla(conn, esquema: str, tabla: str) -> List[str]:
+    return [fila[1] for fila in conn.execute(f'PRAGMA {esquema}.table_info({tabla})').fetchall()]
+
+
+def _adjuntar_archivo(conn, desde: str = None, hasta: str = None) -> List[int]:
+    """
+    Adjunta a `conn` los archivos anuales con fechas en [desde, hasta] y
+    crea las vistas TEMP que los unen con la base caliente. Retorna los años.
+    """
+    try:
+        periodos = conn.execute('''
+            SELECT anio, archivo FROM archivo_periodos
+            WHERE (? IS NULL OR hasta >= ?) AND (? IS NULL OR desde <= ?)
+            ORDER BY anio DESC
+        ''', (desde, desde, hasta, hasta)).fetchall()
+    except sqlite3.OperationalError:
+        return []  # Base sin catálogo todavía
+    if len(periodos) > MAX_ARCHIVOS_ADJUNTOS:
+        print(f"⚠️ La consulta cruza {len(periodos)} años archivados; se leen los "
+              f"{MAX_ARCHIVOS_ADJUNTOS} más recientes")
+        periodos = periodos[:MAX_ARCHIVOS_ADJUNTOS]
+    anios = []
+    for anio, archivo in periodos:
+        ruta = _ruta_archivo(archivo)
+        if not os.path.exists(ruta):
+            print(f"⚠️ Falta el archivo histórico {archivo}")
+            continue
+        conn.execute(f'ATTACH DATABASE ? AS archivo_{anio}', (ruta,))
+        anios.append(anio)
+    if not anios:
+        return []
+
+    for tabla, (_fecha, _otras, clave, _extra) in ARCHIVO_TABLAS.items():
+        columnas = _columnas_tabla(conn, 'main', tabla)
+        if not columnas:
+            continue
+        partes = [f"SELECT {', '.join(columnas)} FROM main.{tabla}"]
+        for anio in anios:
+            propias = set(_columnas_tabla(conn, f'archivo_{anio}', tabla))
+            if not propias:
+                continue
+            # Columnas que la base caliente ganó después de archivar: NULL
+            select = ', '.join(f'a.{c}' if c in propias else f'NULL AS {c}' for c in columnas)
+            misma_fila = ' AND '.join(f'm.{c} = a.{c}' for c in clave)
+            partes.append(f'''SELECT {select} FROM archivo_{anio}.{tabla} AS a
+                WHERE NOT EXISTS (SELECT 1 FROM main.{tabla} AS m WHERE {misma_fila})''')
+        if len(partes) > 1:
+            conn.execute(f"CREATE TEMP VIEW {tabla} AS {' UNION ALL '.join(partes)}")
+    return anios
+
+
+def _fecha_corte_archivo(meses: int) -> str:
+    """Primer día del mes que quedó `meses` meses atrás."""
+    hoy = datetime.now()
+    mes = hoy.year * 12 + hoy.month - 1 - meses
+    return f"{mes // 12:04d}-{mes % 12 + 1:02d}-01"
+
+
+def _condicion_archivo(tabla: str) -> str:
+    """WHERE de las filas de `tabla` a archivar; parámetros: desde, hasta y corte por cada otra fecha."""
+    if tabla in ARCHIVO_DETALLES:
+        columna, padre = ARCHIVO_DETALLES[tabla]
+        return f'{tabla}.{columna} IN (SELECT {padre}.id FROM main.{padre} WHERE {_condicion_archivo(padre)})'
+    fecha, otras, _clave, extra = ARCHIVO_TABLAS[tabla]
+    fecha = fecha.format(r=tabla)
+    condiciones = [f'{fecha} >= ?', f'{fecha} < ?',
+                   f'{fecha} NOT IN (SELECT fecha FROM temp.archivo_dias_abiertos)']
+    condiciones += [f'COALESCE({otra.format(r=tabla)}, {fecha}) < ?' for otra in otras]
+    if extra:
+        condiciones.append(extra.format(r=tabla))
+    return ' AND '.join(condiciones)
+
+
+def _marcar_periodos_abiertos(conn, corte: str) -> None:
+    """Días y folios con créditos pendientes: no se archivan aunque sean viejos."""
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS archivo_dias_abiertos (fecha TEXT PRIMARY KEY)')
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS archivo_folios_abiertos (folio INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM temp.archivo_dias_abiertos')
+    conn.execute('DELETE FROM temp.archivo_folios_abiertos')
+    for tabla in ('creditos_eleventa', 'creditos_punteados'):
+        pendiente = _PENDIENTE.format(r=tabla)
+        conn.execute(f'''
+            INSERT OR IGNORE INTO temp.archivo_dias_abiertos
+            SELECT fecha FROM {tabla} WHERE fecha < ? AND {pendiente}
+        ''', (corte,))
+        conn.execute(f'''
+            INSERT OR IGNORE INTO temp.archivo_folios_abiertos
+            SELECT folio FROM {tabla} WHERE {pendiente}
+        ''')
+
+
+def _anios_por_archivar(conn, corte: str) -> List[int]:
+    primera = None
+    for tabla, (fecha, *_resto) in ARCHIVO_TABLAS.items():
+        fecha = fecha.format(r=tabla)
+        try:
+            valor = conn.execute(f'SELECT MIN({fecha}) FROM main.{tabla} WHERE {fecha} < ?', (corte,)).fetchone()[0]
+        except sqlite3.OperationalError:
+            continue  # Tabla que esta base no tiene
+        if valor and (primera is None or valor < primera):
+            primera = valor
+    if not primera:
+        return []
+    return list(range(int(primera[:4]), int(corte[:4]) + 1))
+
+
+def _preparar_tabla_archivo(origen, destino, tabla: str) -> None:
+    """Crea (o completa) en el archivo la tabla con el esquema y los índices de la base caliente."""
+    existe = destino.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                             (tabla,)).fetchone()
+    if not existe:
+        fila = origen.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (tabla,)).fetchone()
+        destino.execute(fila[0])
+    else:
+        tiene = set(_columnas_tabla(destino, 'main', tabla))
+        for _cid, nombre, tipo, _notnull, defecto, _pk in origen.execute(f'PRAGMA main.table_info({tabla})'):
+            if nombre not in tiene:
+                sufijo = f' DEFAULT {defecto}' if defecto is not None else ''
+                destino.execute(f'ALTER TABLE {tabla} ADD COLUMN {nombre} {tipo}{sufijo}')
+    for (sql,) in origen.execute("SELECT sql FROM sqlite_master WHERE type = 'index' "
+                                 "AND tbl_name = ? AND sql IS NOT NULL", (tabla,)).fetchall():
+        destino.execute(re.sub(r'^CREATE (UNIQUE )?INDEX ', r'CREATE \1INDEX IF NOT EXISTS ', sql))
+
+
+def _copiar_a_archivo(conn, anio: int, corte: str) -> Tuple[Dict[str, int], Optional[str], Optional[str]]:
+    """
+    Copia al archivo del año las filas a archivar y lo confirma (antes de
+    borrarlas de la base caliente). Retorna ({tabla: filas}, primera fecha, última fecha).
+    """
+    desde, hasta = f'{anio}-01-01', min(f'{anio + 1}-01-01', corte)
+    copiadas, primera, ultima = {}, None, None
+    destino = None
+    try:
+        for tabla, (fecha, otras, _clave, _extra) in ARCHIVO_TABLAS.items():
+            columnas = _columnas_tabla(conn, 'main', tabla)
+            if not columnas:
+                continue
+            fecha = fecha.format(r=tabla)
+            ultima_fecha = (f"MAX({fecha}, {', '.join(f'COALESCE({o.format(r=tabla)}, {fecha})' for o in otras)})"
+                            if otras else fecha)
+            filas = conn.execute(f'''
+                SELECT {fecha}, {ultima_fecha}, {', '.join(columnas)} FROM main.{tabla}
+                WHERE {_condicion_archivo(tabla)}
+            ''', (desde, hasta, *[corte] * len(otras))).fetchall()
+            if not filas:
+                continue
+            if destino is None:
+                destino = sqlite3.connect(_ruta_archivo(_nombre_archivo(anio)), timeout=TIMEOUT_OCUPADA_S)
+            _preparar_tabla_archivo(conn, destino, tabla)
+            # OR REPLACE: si un archivado anterior se cortó antes de borrar, se repite sin duplicar
+            destino.executemany(
+                f"INSERT OR REPLACE INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+                [tuple(fila)[2:] for fila in filas])
+            copiadas[tabla] = len(filas)
+            primera = min(f for f in [primera, *(fila[0] for fila in filas)] if f)
+            ultima = max(f for f in [ultima, *(fila[1] for fila in filas)] if f)
+        if destino is not None:
+            destino.commit()
+    finally:
+        if destino is not None:
+            destino.close()
+    return copiadas, primera, ultima
+
+
+def _quitar_triggers_archivo(conn) -> List[str]:
+    """Quita los triggers de las tablas archivadas (el archivado no debe tocar las derivadas)."""
+    marcadores = ', '.join('?' * len(ARCHIVO_TABLAS))
+    triggers = conn.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND tbl_name IN ({marcadores})
+    ''', tuple(ARCHIVO_TABLAS)).fetchall()
+    for nombre, _sql in triggers:
+        conn.execute(f'DROP TRIGGER {nombre}')
+    return [sql for _nombre, sql in triggers]
+
+
+def archivar_periodos(meses: int = MESES_BASE_CALIENTE) -> Dict:
+    """
+    Muda a los archivos anuales los días de hace más de `meses` meses que ya
+    no tienen créditos pendientes.
+
+    Cada año se copia y confirma primero en su archivo y después se borra
+    de la base caliente, todo con la base caliente tomada (BEGIN IMMEDIATE)
+    para que nadie la cambie en medio.
+
+    Returns:
+        {'success', 'corte', 'anios': {año: {tabla: filas}}, 'filas'} o {'success': False, 'error'}
+    """
+    corte = _fecha_corte_archivo(meses)
+    conn = sqlite3.connect(DB_PATH, timeout=TIMEOUT_OCUPADA_S, isolation_level=None)
+    anios = {}
+    try:
+        crear_archivo(conn.cursor())
+        conn.execute('BEGIN IMMEDIATE')
+        _marcar_periodos_abiertos(conn, corte)
+        triggers = None
+        for anio in _anios_por_archivar(conn, corte):
+            copiadas, primera, ultima = _copiar_a_archivo(conn, anio, corte)
+            if not copiadas:
+                continue
+            if triggers is None:
+                triggers = _quitar_triggers_archivo(conn)
+            desde, hasta = f'{anio}-01-01', min(f'{anio + 1}-01-01', corte)
+            for tabla in copiadas:
+                otras = ARCHIVO_TABLAS[tabla][1]
+                conn.execute(f'DELETE FROM main.{tabla} WHERE {_condicion_archivo(tabla)}',
+                             (desde, hasta, *[corte] * len(otras)))
+            conn.execute('''
+                INSERT INTO archivo_periodos (anio, archivo, desde, hasta, filas, fecha_archivado)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(anio) DO UPDATE SET
+                    desde = MIN(desde, excluded.desde),
+                    hasta = MAX(hasta, excluded.hasta),
+                    filas = filas + excluded.filas,
+                    fecha_archivado = CURRENT_TIMESTAMP
+            ''', (anio, _nombre_archivo(anio), primera, ultima, sum(copiadas.values())))
+            anios[anio] = copiadas
+        for sql in triggers or []:
+            conn.execute(sql)
+        conn.execute('''
+            INSERT INTO configuracion (clave, valor, fecha_modificacion)
+            VALUES ('ultimo_archivado', ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(clave) DO UPDATE SET
+                valor = excluded.valor,
+                fecha_modificacion = CURRENT_TIMESTAMP
+        ''', (datetime.now().isoformat(timespec='seconds'),))
+        conn.execute('COMMIT')
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        print(f"Error archivando periodos: {e}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        conn.close()
+
+    filas = sum(sum(copiadas.values()) for copiadas in anios.values())
+    if filas:
+        print(f"📦 Archivadas {filas} filas anteriores a {corte} en {len(anios)} archivo(s) anual(es)")
+    return {'success': True, 'corte': corte, 'anios': anios, 'filas': filas}
+
+
+def archivar_si_corresponde(compactar: bool = True) -> Dict:
+    """
+    Archiva los periodos cerrados si pasaron ARCHIVAR_CADA_DIAS desde la
+    última vez; si se movieron filas y `compactar`, hace VACUUM para que el
+    archivo de la base caliente también se achique.
+    """
+    ultimo = obtener_config('ultimo_archivado')
+    try:
+        if ultimo and (datetime.now() - datetime.fromisoformat(ultimo)).days < ARCHIVAR_CADA_DIAS:
+            return {'success': True, 'filas': 0}
+    except (TypeError, ValueError):
+        pass
+    resultado = archivar_periodos()
+    if compactar and resultado.get('filas'):
+        conn = sqlite3.connect(DB_PATH, timeout=TIMEOUT_OCUPADA_S, isolation_level=None)
+        try:
+            conn.execute('VACUUM')
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ No se pudo compactar la base: {e}")
+        finally:
+            conn.close()
+    return resultado
+
+
+def obtener_periodos_archivados() -> List[Dict]:
+    """Años archivados con su rango de fechas, cantidad de filas y ruta del archivo."""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM archivo_periodos ORDER BY anio')
+        return [dict(row, ruta=_ruta_archivo(row['archivo'])) for row in cursor.fetchall()]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+def _ruta_archivo_fecha(conn, fecha: str) -> Optional[str]:
+    """Ruta del archivo anual que guarda `fecha`, o None si la fecha no está archivada."""
+    try:
+        fila = conn.execute('SELECT archivo FROM archivo_periodos WHERE anio = ? AND desde <= ? AND hasta >= ?',
+                            (int(fecha[:4]), fecha, fecha)).fetchone()
+    except (sqlite3.OperationalError, ValueError):
+        return None
+    if fila is None or not os.path.exists(_ruta_archivo(fila[0])):
+        return None
+    return _ruta_archivo(fila[0])
+
+
+def _folios_eleventa_archivados(fecha: str) -> set:
+    """Folios de créditos Eleventa de `fecha` que ya están en un archivo anual."""
+    conn = get_connection()
+    try:
+        ruta = _ruta_archivo_fecha(conn, fecha)
+    finally:
+        conn.close()
+    if ruta is None:
+        return set()
+    archivo = sqlite3.connect(ruta, timeout=TIMEOUT_OCUPADA_S)
+    try:
+        return {folio for (folio,) in archivo.execute('SELECT folio FROM creditos_eleventa WHERE fecha = ?', (fecha,))}
+    except sqlite3.OperationalError:
+        return set()
+    finally:
+        archivo.close()
+
+
+def _traer_de_archivo(conn, tabla: str, fecha: str, folios: List[int] = None, mover: bool = False) -> int:
+    """
+    Devuelve a la base caliente las filas archivadas de `tabla` (claves
+    fecha y folio) de `fecha` (solo `folios` si se dan) antes de cambiarlas:
+    las lecturas las ven por las vistas del archivo, pero las escrituras
+    solo llegan a la base caliente. Se insertan sin triggers porque las
+    tablas derivadas (cartera, búsqueda, sugerencias) todavía las cuentan:
+    el archivado no las descontó. Así el cambio que sigue pasa por los
+    triggers de UPDATE/DELETE como con cualquier fila caliente.
+
+    La copia del archivo se queda (las vistas prefieren la fila caliente) y
+    vuelve a reemplazarse en el próximo archivado; con mover=True (para
+    borrar) se quita del archivo, si no la vista la seguiría mostrando.
+
+    Returns:
+        Cuántas filas volvieron
+    """
+    ruta = _ruta_archivo_fecha(conn, fecha)
+    if ruta is None:
+        return 0
+    calientes = set(_columnas_tabla(conn, 'main', tabla))
+    condicion, params = 'fecha = ?', [fecha]
+    if folios is not None:
+        condicion += f" AND folio IN ({', '.join('?' * len(folios))})"
+        params += [int(folio) for folio in folios]
+    archivo = sqlite3.connect(ruta, timeout=TIMEOUT_OCUPADA_S)
+    try:
+        columnas = [c for c in _columnas_tabla(archivo, 'main', tabla) if c in calientes]
+        if not columnas:
+            return 0
+        filas = [fila for fila in archivo.execute(f"SELECT {', '.join(columnas)} FROM {tabla} WHERE {condicion}",
+                                                  params).fetchall()
+                 if conn.execute(f'SELECT 1 FROM main.{tabla} WHERE fecha = ? AND folio = ?',
+                                 (fila[columnas.index('fecha')], fila[columnas.index('folio')])).fetchone() is None]
+        if not filas:
+            return 0
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        triggers = _quitar_triggers_archivo(conn)
+        conn.executemany(f"INSERT INTO main.{tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+                         filas)
+        for sql in triggers:
+            conn.execute(sql)
+        if mover:
+            archivo.execute(f'DELETE FROM {tabla} WHERE {condicion}', params)
+            archivo.commit()
+        return len(filas)
+    finally:
+        archivo.close()
+
+
+def _traer_seleccion_de_archivo(conn, creditos) -> None:
+    """_traer_de_archivo de los créditos [(origen, fecha, folio)] de una operación masiva."""
+    por_dia = {}
+    for origen, fecha, folio in creditos or ():
+        por_dia.setdefault((TABLAS_CREDITO[origen][0], fecha), []).append(folio)
+    for (tabla, fecha), folios in por_dia.items():
+        _traer_de_archivo(conn, tabla, fecha, folios)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# FUNCIONES PARA PAGO DE NÓMINA
+# ══════════════════════════════════════════════════════════════════════════════
 
 def agregar_pago_nomina(fecha: str, empleado: str, concepto: str, monto: float,
                         observaciones: str = '') -> int:
@@ -4216,6 +6007,7 @@ def obtener_ultimo_corte_cajero() -> Optional[Dict[str, Any]]:
 # FUNCIONES PARA ANOTACIONES (Sticky Notes)
 # ══════════════════════════════════════════════════════════════════════════════
 
+@_escritura_coordinada('anotaciones')
 def agregar_anotacion(fecha: str, titulo: str = '', contenido: str = '', color: str = '#FFEB3B',
                       es_checklist: bool = False, pos_x: int = 0, pos_y: int = 0,
                       ancho: int = 220, alto: int = 180, prioridad: int = 0,
@@ -4274,16 +6066,28 @@ def obtener_anotaciones(incluir_archivadas: bool = False, fecha: str = None,
     ''', params)
     
     rows = cursor.fetchall()
+    
+    # Adjuntos del almacén (una sola consulta para todas las notas). CROSS
+    # JOIN fija el orden: primero las notas del filtro, luego sus adjuntos
+    adjuntos = {}
+    cursor.execute(f'''
+        SELECT a.id, a.nota_id, a.hash, a.nombre, a.fecha_alta, o.extension, o.tam
+        FROM anotaciones
+        CROSS JOIN anotacion_adjuntos a ON a.nota_id = anotaciones.id
+        JOIN adjuntos_objetos o ON o.hash = a.hash
+        WHERE {where_clause}
+        ORDER BY a.nota_id, a.id
+    ''', params)
+    for adjunto in cursor.fetchall():
+        adjuntos.setdefault(adjunto['nota_id'], []).append(dict(adjunto))
     conn.close()
     
     result = []
     for row in rows:
         nota = dict(row)
-        # Parsear attachments de JSON a lista
-        try:
-            nota['attachments'] = json.loads(nota['attachments']) if nota['attachments'] else []
-        except (json.JSONDecodeError, TypeError):
-            nota['attachments'] = []
+        # Rutas de la versión anterior (columna JSON), las que no se migraron al almacén
+        nota['attachments'] = _lista_attachments(nota['attachments'])
+        nota['adjuntos'] = adjuntos.get(nota['id'], [])
         nota['es_checklist'] = bool(nota['es_checklist'])
         nota['archivada'] = bool(nota['archivada'])
         nota['eliminada'] = bool(nota['eliminada'])
@@ -4292,6 +6096,15 @@ def obtener_anotaciones(incluir_archivadas: bool = False, fecha: str = None,
     return result
 
 
+def _lista_attachments(valor) -> List[str]:
+    """Lista de rutas de la columna JSON attachments."""
+    try:
+        return json.loads(valor) if valor else []
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+@_escritura_coordinada('anotaciones')
 def actualizar_anotacion(nota_id: int, **kwargs) -> bool:
     """
     Actualiza una anotación existente.
@@ -4341,6 +6154,7 @@ def actualizar_anotacion(nota_id: int, **kwargs) -> bool:
         return False
 
 
+@_escritura_coordinada('anotaciones')
 def eliminar_anotacion(nota_id: int, permanente: bool = False) -> bool:
     """
     Elimina una anotación.
@@ -4380,6 +6194,177 @@ def restaurar_anotacion(nota_id: int) -> bool:
     return actualizar_anotacion(nota_id, eliminada=False)
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+# ADJUNTOS DE ANOTACIONES
+# Almacén por contenido (core/adjuntos.py): adjuntos_objetos tiene un
+# contenido por fila (sha256) con su cuenta de referencias, que mantienen
+# los triggers de anotacion_adjuntos (un adjunto por fila, índice por nota).
+# ══════════════════════════════════════════════════════════════════════════════
+
+def crear_adjuntos(cursor):
+    """Crea las tablas de adjuntos y los triggers de la cuenta de referencias (idempotente)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS adjuntos_objetos (
+            hash TEXT PRIMARY KEY,
+            extension TEXT NOT NULL DEFAULT '',
+            tam INTEGER DEFAULT 0,
+            refs INTEGER DEFAULT 0,
+            fecha_alta TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS anotacion_adjuntos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nota_id INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            nombre TEXT,
+            fecha_alta TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_anotacion_adjuntos_nota ON anotacion_adjuntos(nota_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_anotacion_adjuntos_hash ON anotacion_adjuntos(hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_adjuntos_objetos_refs ON adjuntos_objetos(refs)')
+    triggers = {
+        'trg_adjuntos_insert': ('AFTER INSERT ON anotacion_adjuntos',
+            'UPDATE adjuntos_objetos SET refs = refs + 1 WHERE hash = NEW.hash;'),
+        'trg_adjuntos_delete': ('AFTER DELETE ON anotacion_adjuntos',
+            'UPDATE adjuntos_objetos SET refs = refs - 1 WHERE hash = OLD.hash;'),
+        # Borrar una nota de verdad suelta sus adjuntos (la papelera los conserva)
+        'trg_anotaciones_adjuntos_delete': ('AFTER DELETE ON anotaciones',
+            'DELETE FROM anotacion_adjuntos WHERE nota_id = OLD.id;'),
+    }
+    for nombre, (evento, cuerpo) in triggers.items():
+        try:
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {nombre} {evento} BEGIN {cuerpo} END')
+        except sqlite3.OperationalError:
+            pass  # Tabla que esta base todavía no tiene (la crea init_database)
+
+
+@_escritura_coordinada('anotaciones')
+def registrar_adjunto(nota_id: int, hash_contenido: str, extension: str, tam: int,
+                      nombre: str, legado: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Liga a una nota un contenido ya guardado en el almacén (suma una referencia).
+
+    Args:
+        legado: ruta de la columna JSON attachments que este adjunto
+            reemplaza; se quita de la lista en la misma transacción. Si ya no
+            está (otro proceso la migró) no se liga nada.
+
+    Returns:
+        El adjunto (id, nota_id, hash, nombre, fecha_alta, extension, tam) o None
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        if legado is not None:
+            cursor.execute('SELECT attachments FROM anotaciones WHERE id = ?', (nota_id,))
+            fila = cursor.fetchone()
+            rutas = _lista_attachments(fila['attachments']) if fila else []
+            if legado not in rutas:
+                conn.rollback()
+                return None
+            rutas.remove(legado)
+            cursor.execute('UPDATE anotaciones SET attachments = ? WHERE id = ?', (json.dumps(rutas), nota_id))
+        cursor.execute('INSERT OR IGNORE INTO adjuntos_objetos (hash, extension, tam) VALUES (?, ?, ?)',
+                       (hash_contenido, extension, tam))
+        cursor.execute('INSERT INTO anotacion_adjuntos (nota_id, hash, nombre) VALUES (?, ?, ?)',
+                       (nota_id, hash_contenido, nombre))
+        adjunto_id = cursor.lastrowid
+        conn.commit()
+        cursor.execute('''
+            SELECT a.id, a.nota_id, a.hash, a.nombre, a.fecha_alta, o.extension, o.tam
+            FROM anotacion_adjuntos a JOIN adjuntos_objetos o ON o.hash = a.hash
+            WHERE a.id = ?
+        ''', (adjunto_id,))
+        return dict(cursor.fetchone())
+    except Exception as e:
+        print(f"Error registrando adjunto: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+@_escritura_coordinada('anotaciones')
+def quitar_adjunto(adjunto_id: int) -> bool:
+    """Desliga un adjunto de su nota (resta una referencia a su contenido)."""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM anotacion_adjuntos WHERE id = ?', (adjunto_id,))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+    except Exception as e:
+        print(f"Error quitando adjunto: {e}")
+        return False
+
+
+def obtener_adjuntos(nota_id: int) -> List[Dict[str, Any]]:
+    """Adjuntos de una nota, en el orden en que se agregaron."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT a.id, a.nota_id, a.hash, a.nombre, a.fecha_alta, o.extension, o.tam
+        FROM anotacion_adjuntos a JOIN adjuntos_objetos o ON o.hash = a.hash
+        WHERE a.nota_id = ?
+        ORDER BY a.id
+    ''', (nota_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def obtener_adjuntos_legado() -> List[Tuple[int, str]]:
+    """(nota_id, ruta) de las rutas que siguen en la columna JSON attachments."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, attachments FROM anotaciones WHERE attachments IS NOT NULL "
+                   "AND attachments NOT IN ('', '[]')")
+    rows = cursor.fetchall()
+    conn.close()
+    return [(row['id'], ruta) for row in rows for ruta in _lista_attachments(row['attachments'])]
+
+
+def registrar_borrado_adjuntos(borrar) -> None:
+    """
+    borrar(hash, extension) borra del almacén el archivo de un contenido
+    (core/adjuntos.py). Se registra en vez de pasarse a
+    purgar_adjuntos_sin_uso porque la purga puede ejecutarla otro proceso.
+    """
+    global _borrar_adjunto
+    _borrar_adjunto = borrar
+
+
+@_escritura_coordinada('anotaciones')
+def purgar_adjuntos_sin_uso() -> int:
+    """
+    Quita los contenidos que ninguna nota referencia. El archivo se borra
+    (con el borrado registrado) dentro de la misma transacción, así un
+    adjunto nuevo del mismo contenido (que espera la transacción) vuelve a
+    escribirlo. Sin borrado registrado no purga nada. Retorna cuántos se quitaron.
+    """
+    if _borrar_adjunto is None:
+        return 0
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT hash, extension FROM adjuntos_objetos WHERE refs <= 0')
+        sin_uso = cursor.fetchall()
+        for fila in sin_uso:
+            cursor.execute('DELETE FROM adjuntos_objetos WHERE hash = ?', (fila['hash'],))
+            _borrar_adjunto(fila['hash'], fila['extension'])
+        conn.commit()
+        return len(sin_uso)
+    except Exception as e:
+        print(f"Error purgando adjuntos: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # FUNCIONES PARA BUGS_ELEVENTA
 # ══════════════════════════════════════════════════════════════════════════════
@@ -4579,7 +6564,19 @@ else:
     
     if not required_tables.issubset(tables):
         init_database()
-
+    else:
+        # Bases existentes: agregar los índices y las tablas derivadas nuevas
+        conn = get_connection()
+        crear_indices(conn.cursor())
+        crear_cartera(conn.cursor())
+        crear_busqueda(conn.cursor())
+        crear_sugerencias(conn.cursor())
+        crear_archivo(conn.cursor())
+        crear_adjuntos(conn.cursor())
+        crear_archivos_dia(conn.cursor())
+        crear_reapertura_dias(conn.cursor())
+        conn.commit()
+        conn.close()
 
 if __name__ == '__main__':
     # Prueba de inicialización
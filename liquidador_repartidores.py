@@ -11,13 +11,38 @@ import tkinter as tk
 import database_local as db
 db.init_database()
 from tkinter import ttk, messagebox, filedialog, simpledialog
-import subprocess
 import os
 import sys
 import shutil
+import json
+import time
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, numbers
+from typing import Optional
+
+from core.executor import get_executor, TareaCancelada, PRIORIDAD_UI, PRIORIDAD_NORMAL, PRIORIDAD_PREFETCH
+from core.escritura import get_cola_escritura, iniciar_cola_escritura
+from core.coordinacion import get_coordinacion, iniciar_coordinacion
+from core.respaldo import INTERVALO_RESPALDO_MS, get_respaldo, iniciar_respaldo
+from core.day_state import (EstadoDia, ErrorCargaDia, consultar_estado_dia, armar_ventas,
+                            consultar_delta_dia, aplicar_delta)
+from core.day_cache import DayStateCache, huella_estado
+from core.day_archive import (ErrorArchivoDia, FORMATO_ARCHIVO, comprimir_snapshot,
+                              descomprimir_snapshot, construir_snapshot, estado_desde_snapshot,
+                              serializar_estado, deserializar_estado)
+from core.offline import EstadoConexion, INTERVALO_SONDEO_MS, SQL_SONDEO
+from core.agregados import FrameDia
+from core.firebird import ejecutar_sql
+from core.creditos import consultar_creditos_eleventa
+from core.auditoria import obtener_datos_auditoria
+from core.productos_dia import cache_productos, precargar_productos_dia, productos_factura
+from core.grabacion import activar_desde_entorno as activar_grabacion_desde_entorno
+from core.liquidacion import (LiquidacionEngine, VentasDia, ETIQUETA_GENERAL, cargar_estado_dia,
+                              rango_fechas, ventas_desde_estado)
+from core.reporte import (VALORES_ORDEN, datos_reporte, texto_reporte, construir_libro,
+                          construir_libro_rango)
+
+# Espera después de la última tecla antes de filtrar o buscar
+DEBOUNCE_BUSQUEDA_MS = 250
 
 # Intentar importar tkcalendar para selector de fecha
 try:
@@ -89,9 +114,10 @@ def obtener_descuentos_factura(folio):
     return []
 
 def cargar_asignaciones():
-    """Carga todas las asignaciones como dict {fecha_folio: repartidor}."""
+    """Carga todas las asignaciones (también las archivadas) como dict {fecha_folio: repartidor}."""
     if USE_SQLITE:
-        conn = db_local.get_connection()
+        with db_local.leer_archivo():
+            conn = db_local.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT fecha, folio, repartidor FROM asignaciones')
         rows = cursor.fetchall()
@@ -224,6 +250,8 @@ class DataStore:
         self.fecha: str = datetime.now().strftime('%Y-%m-%d')
         # Lista de dicts: {id, folio, nombre, subtotal, repartidor, cancelada, total_credito, es_credito}
         self.ventas: list = []
+        # False mientras se carga el día de `fecha`: no se editan sus ventas
+        self.dia_cargado: bool = False
         # Conjunto rápido de repartidores conocidos
         self._repartidores: set = set()
         # Callbacks registrados por las pestañas
@@ -232,6 +260,37 @@ class DataStore:
         self.devoluciones: list = []      # Lista de devoluciones del día
         self.movimientos_entrada: list = []  # Ingresos extras
         self.movimientos_salida: list = []   # Salidas
+        # Frame columnar de las ventas (se reconstruye cuando cambian)
+        self._version: int = 0
+        self._frame = None
+        self._frame_version: int = -1
+        # Cambios de asignaciones todavía en la cola de escritura:
+        # fecha -> [(folio, repartidor)] en orden (folio None: se limpió el día)
+        self._asignaciones_en_cola: dict = {}
+
+    # --- persistencia ---
+    def persistir(self, operacion: str, *args, on_ok=None, on_error=None, notificar: bool = False):
+        """
+        Escribe en SQLite con la función `operacion` de database_local.
+        Con la cola de escritura diferida iniciada, solo la encola (la
+        memoria ya tiene el cambio) y retorna None; si no, la ejecuta ya.
+
+        Con notificar=True avisa a las pestañas cuando la escritura quedó
+        confirmada (o falló): para los datos que se leen de SQLite y no de
+        la memoria, así el hilo de Tk nunca lee la tabla con la escritura
+        todavía en la cola.
+        """
+        if notificar:
+            on_ok = self._notificar_despues(on_ok)
+            on_error = self._notificar_despues(on_error)
+        cola = get_cola_escritura()
+        if cola is not None:
+            cola.encolar(operacion, *args, on_ok=on_ok, on_error=on_error)
+            return None
+        resultado = getattr(db_local, operacion)(*args)
+        if on_ok is not None:
+            on_ok(resultado)
+        return resultado
 
     # --- suscripción de eventos ---
     def suscribir(self, callback):
@@ -239,7 +298,15 @@ class DataStore:
         if callback not in self._listeners:
             self._listeners.append(callback)
 
+    def _notificar_despues(self, callback):
+        def envoltura(valor):
+            if callback is not None:
+                callback(valor)
+            self._notificar()
+        return envoltura
+
     def _notificar(self):
+        self._version += 1
         for cb in self._listeners:
             try:
                 cb()
@@ -247,47 +314,113 @@ class DataStore:
                 pass
 
     # --- ventas ---
+    def cambiar_fecha(self, fecha: str):
+        """
+        Pasa a otra fecha. Las ventas del día anterior se quitan (y se avisa)
+        para no mostrarlas ni editarlas con la fecha nueva; las ediciones de
+        ventas se ignoran hasta que llegue el día (set_estado_dia).
+        """
+        if fecha == self.fecha and self.dia_cargado:
+            return
+        self.fecha = fecha
+        self.dia_cargado = False
+        self.ventas = []
+        self._repartidores = set()
+        self.devoluciones = []
+        self.movimientos_entrada = []
+        self.movimientos_salida = []
+        self._version += 1
+        self._notificar()
+
     def set_ventas(self, ventas: list):
         self.ventas = ventas
+        self.dia_cargado = True
+        self._version += 1
         self._repartidores = {v['repartidor'] for v in ventas if v.get('repartidor')}
         self._notificar()
 
     def get_ventas(self):
         return self.ventas
 
+    def set_estado_dia(self, ventas: list, devoluciones: list, entradas: list, salidas: list,
+                       notificar: bool = True):
+        """Reemplaza de una vez los datos Firebird del día (una sola notificación)."""
+        self.ventas = ventas
+        self.dia_cargado = True
+        self._repartidores = {v['repartidor'] for v in ventas if v.get('repartidor')}
+        self.devoluciones = devoluciones
+        self.movimientos_entrada = entradas
+        self.movimientos_salida = salidas
+        self._version += 1
+        if notificar:
+            self._notificar()
+
+    def aplicar_cambios_ventas(self, nuevas: list, actualizadas: list,
+                               canceladas_otro_dia: list = None, devoluciones: list = (),
+                               entradas: list = (), salidas: list = (), notificar: bool = True):
+        """
+        Actualiza filas puntuales (recarga incremental) sin reemplazar la lista:
+        las actualizadas conservan su repartidor, las nuevas se agregan después
+        de las del día y, si se indica, se reemplaza el bloque de canceladas de otro día.
+        """
+        por_id = {v['id']: v for v in actualizadas}
+        for v in self.ventas:
+            cambio = por_id.get(v['id'])
+            if cambio is not None and not v.get('cancelada_otro_dia', False):
+                rep = v.get('repartidor', '')
+                v.update(cambio)
+                v['repartidor'] = rep or cambio.get('repartidor', '')
+        # Las canceladas de otro día van siempre al final, como en la carga completa
+        del_dia = [v for v in self.ventas if not v.get('cancelada_otro_dia', False)]
+        if canceladas_otro_dia is None:
+            canceladas_otro_dia_actuales = [v for v in self.ventas if v.get('cancelada_otro_dia', False)]
+        else:
+            canceladas_otro_dia_actuales = list(canceladas_otro_dia)
+        self.ventas[:] = del_dia + list(nuevas) + canceladas_otro_dia_actuales
+        for v in list(nuevas) + list(canceladas_otro_dia or []):
+            if v.get('repartidor'):
+                self._repartidores.add(v['repartidor'])
+        self.devoluciones.extend(devoluciones)
+        self.movimientos_entrada.extend(entradas)
+        self.movimientos_salida.extend(salidas)
+        self._version += 1
+        if notificar:
+            self._notificar()
+
+    def frame(self) -> FrameDia:
+        """
+        Frame columnar de las ventas (con dev. parciales por folio), construido
+        una vez por cada cambio de datos. Los get_total_* salen de aquí.
+        """
+        if self._frame is None or self._frame_version != self._version:
+            dev_parciales = {}
+            if USE_SQLITE and self.fecha:
+                dev_parciales = db_local.obtener_devoluciones_parciales_por_folio_fecha(self.fecha)
+            self._frame = FrameDia(self.ventas, dev_parciales=dev_parciales)
+            self._frame_version = self._version
+        return self._frame
+
     def get_total_subtotal(self) -> float:
         """Retorna el total de ventas usando TOTAL (no subtotal).
         Para facturas canceladas del mismo día: se excluyen del total vendido.
         Para facturas canceladas de otro día: NO se suman (solo informativas).
         NOTA: Se usa total_original para coincidir con el corte de caja de Firebird.
         """
-        total = 0
-        for v in self.ventas:
-            cancelada_otro_dia = v.get('cancelada_otro_dia', False)
-            cancelada = v.get('cancelada', False)
-            if cancelada_otro_dia or cancelada:
-                # Las canceladas no suman al total vendido
-                continue
-            # Usar total_original (TOTAL) para coincidir con Firebird
-            total += v.get('total_original', v['subtotal'])
-        return total
+        return self.frame().totales()['total_vendido']
 
     def get_total_canceladas(self) -> float:
         """Retorna el total de facturas canceladas del mismo día."""
-        return sum(v.get('total_original', 0) for v in self.ventas 
-                   if v.get('cancelada', False) and not v.get('cancelada_otro_dia', False))
+        return self.frame().totales()['total_canceladas']
 
     def get_total_canceladas_otro_dia(self) -> float:
         """Retorna el total de facturas canceladas que son de otro día."""
-        return sum(v.get('total_original', 0) for v in self.ventas 
-                   if v.get('cancelada', False) and v.get('cancelada_otro_dia', False))
+        return self.frame().totales()['total_canceladas_otro_dia']
 
     def get_total_todas_facturas(self) -> float:
         """Retorna el total de TODAS las facturas del día (incluyendo canceladas del mismo día).
         Las canceladas de otro día NO se suman (solo son informativas).
         """
-        return sum(v.get('total_original', v['subtotal']) for v in self.ventas 
-                   if not v.get('cancelada_otro_dia', False))
+        return self.frame().totales()['total_todas_facturas']
 
     def get_monto_facturas_efectivo(self) -> float:
         """Retorna el MONTO FACTURAS para cuadre de caja.
@@ -299,13 +432,7 @@ class DataStore:
         Para facturas con devolución parcial (estado P), el campo TOTAL de Eleventa
         ya contiene el monto después del descuento.
         """
-        return sum(
-            v.get('total_original', v['subtotal']) 
-            for v in self.ventas 
-            if not v.get('cancelada', False)  # No canceladas
-            and not v.get('cancelada_otro_dia', False)  # No canceladas de otro día
-            and not v.get('es_credito', False)  # No crédito
-        )
+        return self.frame().totales()['monto_efectivo']
 
     def get_ventas_canceladas_otro_dia(self) -> list:
         """Retorna lista de ventas canceladas de otro día."""
@@ -313,7 +440,7 @@ class DataStore:
 
     def get_total_credito(self) -> float:
         """Retorna el total de facturas a crédito."""
-        return sum(v.get('total_credito', 0) for v in self.ventas if v.get('es_credito', False))
+        return self.frame().totales()['total_credito']
 
     def get_ventas_credito(self) -> list:
         """Retorna lista de ventas a crédito."""
@@ -349,36 +476,73 @@ class DataStore:
 
     def set_repartidor_factura(self, folio: int, repartidor: str):
         """Actualiza el repartidor de una factura y persiste."""
+        if not self.dia_cargado:
+            return
         for v in self.ventas:
             if v['folio'] == folio:
                 v['repartidor'] = repartidor
                 break
         if repartidor:
             self._repartidores.add(repartidor)
-            asignar_repartidor(folio, self.fecha, repartidor)
+            if USE_SQLITE:
+                self._persistir_asignacion(int(folio), repartidor, 'guardar_asignacion',
+                                           self.fecha, int(folio), repartidor)
         self._notificar()
 
     def clear_repartidor_factura(self, folio: int):
+        if not self.dia_cargado:
+            return
         for v in self.ventas:
             if v['folio'] == folio:
                 v['repartidor'] = ''
                 break
         # Eliminar de persistencia
-        asignaciones = cargar_asignaciones()
-        key = f"{self.fecha}_{folio}"
-        if key in asignaciones:
-            del asignaciones[key]
-            guardar_asignaciones(asignaciones)
+        if USE_SQLITE:
+            self._persistir_asignacion(int(folio), '', 'eliminar_asignacion', self.fecha, int(folio))
         self._repartidores = {v['repartidor'] for v in self.ventas if v.get('repartidor')}
         self._notificar()
 
     def clear_all_asignaciones(self):
+        if not self.dia_cargado:
+            return
         for v in self.ventas:
             v['repartidor'] = ''
         self._repartidores.clear()
-        limpiar_asignaciones_dia(self.fecha)
+        if USE_SQLITE:
+            self._persistir_asignacion(None, '', 'limpiar_asignaciones_fecha', self.fecha)
         self._notificar()
 
+    def _persistir_asignacion(self, folio, repartidor: str, operacion: str, *args):
+        """persistir() de una asignación, recordándola hasta que quede confirmada."""
+        fecha = self.fecha
+        cambio = (folio, repartidor)
+        en_cola = self._asignaciones_en_cola.setdefault(fecha, [])
+        en_cola.append(cambio)
+
+        def quitar(_resultado):
+            en_cola.remove(cambio)
+            if not en_cola and self._asignaciones_en_cola.get(fecha) is en_cola:
+                del self._asignaciones_en_cola[fecha]
+        self.persistir(operacion, *args, on_ok=quitar, on_error=quitar)
+
+    def tiene_asignaciones_en_cola(self, fecha: str) -> bool:
+        return fecha in self._asignaciones_en_cola
+
+    def get_asignaciones_fecha(self, fecha: str) -> dict:
+        """
+        {folio: repartidor} guardados de la fecha, con los cambios que siguen
+        en la cola encima (el hilo de Tk no espera a la cola para leerlos).
+        """
+        asignaciones = db_local.obtener_asignaciones_fecha(fecha)
+        for folio, repartidor in self._asignaciones_en_cola.get(fecha, ()):
+            if folio is None:
+                asignaciones.clear()
+            elif repartidor:
+                asignaciones[folio] = repartidor
+            else:
+                asignaciones.pop(folio, None)
+        return asignaciones
+
     # --- gastos adicionales por repartidor ---
     # Estructura: list de dicts {repartidor, concepto, monto}
     # Se inicializa en __init__ junto con el resto.
@@ -396,22 +560,22 @@ class DataStore:
             'monto': monto,
             'observaciones': observaciones
         }
-        # Persistir en SQLite
+        # Persistir en SQLite (el id llega cuando la escritura se confirma)
         if USE_SQLITE:
-            gasto_id = db_local.agregar_gasto(self.fecha, repartidor, concepto, monto, observaciones)
-            gasto['id'] = gasto_id
+            self.persistir('agregar_gasto', self.fecha, repartidor, concepto, monto, observaciones,
+                            on_ok=lambda gasto_id: gasto.__setitem__('id', gasto_id), notificar=True)
         self.gastos.append(gasto)
-        self._notificar()
+        if not USE_SQLITE:
+            self._notificar()
 
     def eliminar_gasto(self, index_or_id):
         """Elimina un gasto por índice o ID de SQLite."""
         self._ensure_gastos()
         if USE_SQLITE and isinstance(index_or_id, int):
             # Eliminar directamente de la BD por ID
-            db_local.eliminar_gasto(index_or_id)
+            self.persistir('eliminar_gasto', index_or_id, notificar=True)
             # Sincronizar lista local
             self.gastos = [g for g in self.gastos if g.get('id') != index_or_id]
-            self._notificar()
         elif 0 <= index_or_id < len(self.gastos):
             del self.gastos[index_or_id]
             self._notificar()
@@ -462,13 +626,15 @@ class DataStore:
         self.dinero[repartidor] = dict(conteo)   # copia shallow
         # Persistir en SQLite
         if USE_SQLITE:
-            db_local.guardar_conteo_dinero(self.fecha, repartidor, conteo)
+            self.persistir('guardar_conteo_dinero', self.fecha, repartidor, dict(conteo))
 
     def get_dinero(self, repartidor: str) -> dict:
         """Retorna {valor_int: cantidad} para un repartidor."""
         self._ensure_dinero()
-        # Primero intentar cargar de SQLite
-        if USE_SQLITE:
+        # Primero intentar cargar de SQLite (si su escritura no sigue en la cola)
+        cola = get_cola_escritura()
+        if USE_SQLITE and not (cola is not None and cola.pendiente('conteo_dinero')
+                               and repartidor in self.dinero):
             conteo_db = db_local.obtener_conteo_dinero(self.fecha, repartidor)
             if conteo_db:
                 self.dinero[repartidor] = conteo_db
@@ -514,26 +680,26 @@ class DataStore:
         return total
 
     # --- pagos a proveedores ---
-    def agregar_pago_proveedor(self, proveedor: str, concepto: str, monto: float, repartidor: str = '', observaciones: str = ''):
-        """Agrega un pago a proveedor y lo persiste en SQLite."""
+    def agregar_pago_proveedor(self, proveedor: str, concepto: str, monto: float, repartidor: str = '', observaciones: str = '', on_ok=None):
+        """
+        Agrega un pago a proveedor y lo persiste en SQLite.
+        El id nuevo llega en on_ok(id) cuando la escritura se confirma; se
+        retorna solo si se escribió ya (sin la cola diferida).
+        """
         if USE_SQLITE:
-            pago_id = db_local.agregar_pago_proveedor(self.fecha, proveedor, concepto, monto, repartidor, observaciones)
-            self._notificar()
-            return pago_id
+            return self.persistir('agregar_pago_proveedor', self.fecha, proveedor, concepto, monto, repartidor, observaciones, on_ok=on_ok, notificar=True)
         return -1
 
     def eliminar_pago_proveedor(self, pago_id: int):
         """Elimina un pago a proveedor."""
         if USE_SQLITE:
-            db_local.eliminar_pago_proveedor(pago_id)
-            self._notificar()
+            self.persistir('eliminar_pago_proveedor', pago_id, notificar=True)
 
     def actualizar_pago_proveedor(self, pago_id: int, proveedor: str, concepto: str, 
                                    monto: float, repartidor: str = '', observaciones: str = ''):
         """Actualiza un pago a proveedor existente."""
         if USE_SQLITE:
-            db_local.actualizar_pago_proveedor(pago_id, proveedor, concepto, monto, repartidor, observaciones)
-            self._notificar()
+            self.persistir('actualizar_pago_proveedor', pago_id, proveedor, concepto, monto, repartidor, observaciones, notificar=True)
 
     def get_pagos_proveedores(self, repartidor: str = '') -> list:
         """Obtiene los pagos a proveedores de la fecha actual."""
@@ -553,29 +719,28 @@ class DataStore:
     def actualizar_gasto(self, gasto_id: int, repartidor: str, concepto: str, monto: float, observaciones: str = ''):
         """Actualiza un gasto existente."""
         if USE_SQLITE:
-            db_local.actualizar_gasto(gasto_id, repartidor, concepto, monto, observaciones)
-            self._notificar()
+            self.persistir('actualizar_gasto', gasto_id, repartidor, concepto, monto, observaciones, notificar=True)
 
     # --- préstamos ---
-    def agregar_prestamo(self, repartidor: str, concepto: str, monto: float, observaciones: str = ''):
-        """Agrega un préstamo y lo persiste en SQLite."""
+    def agregar_prestamo(self, repartidor: str, concepto: str, monto: float, observaciones: str = '', on_ok=None):
+        """
+        Agrega un préstamo y lo persiste en SQLite.
+        El id nuevo llega en on_ok(id) cuando la escritura se confirma; se
+        retorna solo si se escribió ya (sin la cola diferida).
+        """
         if USE_SQLITE:
-            prestamo_id = db_local.agregar_prestamo(self.fecha, repartidor, concepto, monto, observaciones)
-            self._notificar()
-            return prestamo_id
+            return self.persistir('agregar_prestamo', self.fecha, repartidor, concepto, monto, observaciones, on_ok=on_ok, notificar=True)
         return -1
 
     def eliminar_prestamo(self, prestamo_id: int):
         """Elimina un préstamo."""
         if USE_SQLITE:
-            db_local.eliminar_prestamo(prestamo_id)
-            self._notificar()
+            self.persistir('eliminar_prestamo', prestamo_id, notificar=True)
 
     def actualizar_prestamo(self, prestamo_id: int, repartidor: str, concepto: str, monto: float, observaciones: str = ''):
         """Actualiza un préstamo existente."""
         if USE_SQLITE:
-            db_local.actualizar_prestamo(prestamo_id, repartidor, concepto, monto, observaciones)
-            self._notificar()
+            self.persistir('actualizar_prestamo', prestamo_id, repartidor, concepto, monto, observaciones, notificar=True)
 
     def get_prestamos(self, repartidor: str = '') -> list:
         """Obtiene los préstamos de la fecha actual."""
@@ -592,25 +757,25 @@ class DataStore:
         return 0.0
 
     # --- pagos de nómina ---
-    def agregar_pago_nomina(self, empleado: str, concepto: str, monto: float, observaciones: str = ''):
-        """Agrega un pago de nómina y lo persiste en SQLite."""
+    def agregar_pago_nomina(self, empleado: str, concepto: str, monto: float, observaciones: str = '', on_ok=None):
+        """
+        Agrega un pago de nómina y lo persiste en SQLite.
+        El id nuevo llega en on_ok(id) cuando la escritura se confirma; se
+        retorna solo si se escribió ya (sin la cola diferida).
+        """
         if USE_SQLITE:
-            pago_id = db_local.agregar_pago_nomina(self.fecha, empleado, concepto, monto, observaciones)
-            self._notificar()
-            return pago_id
+            return self.persistir('agregar_pago_nomina', self.fecha, empleado, concepto, monto, observaciones, on_ok=on_ok, notificar=True)
         return -1
 
     def eliminar_pago_nomina(self, pago_id: int):
         """Elimina un pago de nómina."""
         if USE_SQLITE:
-            db_local.eliminar_pago_nomina(pago_id)
-            self._notificar()
+            self.persistir('eliminar_pago_nomina', pago_id, notificar=True)
 
     def actualizar_pago_nomina(self, pago_id: int, empleado: str, concepto: str, monto: float, observaciones: str = ''):
         """Actualiza un pago de nómina existente."""
         if USE_SQLITE:
-            db_local.actualizar_pago_nomina(pago_id, empleado, concepto, monto, observaciones)
-            self._notificar()
+            self.persistir('actualizar_pago_nomina', pago_id, empleado, concepto, monto, observaciones, notificar=True)
 
     def get_pagos_nomina(self, repartidor: str = '') -> list:
         """Obtiene los pagos de nómina de la fecha actual, opcionalmente filtrado por repartidor."""
@@ -627,25 +792,25 @@ class DataStore:
         return 0.0
 
     # --- pagos a socios ---
-    def agregar_pago_socios(self, socio: str, concepto: str, monto: float, observaciones: str = ''):
-        """Agrega un pago a socios y lo persiste en SQLite."""
+    def agregar_pago_socios(self, socio: str, concepto: str, monto: float, observaciones: str = '', on_ok=None):
+        """
+        Agrega un pago a socios y lo persiste en SQLite.
+        El id nuevo llega en on_ok(id) cuando la escritura se confirma; se
+        retorna solo si se escribió ya (sin la cola diferida).
+        """
         if USE_SQLITE:
-            pago_id = db_local.agregar_pago_socios(self.fecha, socio, concepto, monto, observaciones)
-            self._notificar()
-            return pago_id
+            return self.persistir('agregar_pago_socios', self.fecha, socio, concepto, monto, observaciones, on_ok=on_ok, notificar=True)
         return -1
 
     def eliminar_pago_socios(self, pago_id: int):
         """Elimina un pago a socios."""
         if USE_SQLITE:
-            db_local.eliminar_pago_socios(pago_id)
-            self._notificar()
+            self.persistir('eliminar_pago_socios', pago_id, notificar=True)
 
     def actualizar_pago_socios(self, pago_id: int, socio: str, concepto: str, monto: float, observaciones: str = ''):
         """Actualiza un pago a socios existente."""
         if USE_SQLITE:
-            db_local.actualizar_pago_socios(pago_id, socio, concepto, monto, observaciones)
-            self._notificar()
+            self.persistir('actualizar_pago_socios', pago_id, socio, concepto, monto, observaciones, notificar=True)
 
     def get_pagos_socios(self, repartidor: str = '') -> list:
         """Obtiene los pagos a socios de la fecha actual, opcionalmente filtrado por repartidor."""
@@ -662,25 +827,25 @@ class DataStore:
         return 0.0
 
     # --- transferencias ---
-    def agregar_transferencia(self, destinatario: str, concepto: str, monto: float, observaciones: str = ''):
-        """Agrega una transferencia y la persiste en SQLite."""
+    def agregar_transferencia(self, destinatario: str, concepto: str, monto: float, observaciones: str = '', on_ok=None):
+        """
+        Agrega una transferencia y la persiste en SQLite.
+        El id nuevo llega en on_ok(id) cuando la escritura se confirma; se
+        retorna solo si se escribió ya (sin la cola diferida).
+        """
         if USE_SQLITE:
-            transferencia_id = db_local.agregar_transferencia(self.fecha, destinatario, concepto, monto, observaciones)
-            self._notificar()
-            return transferencia_id
+            return self.persistir('agregar_transferencia', self.fecha, destinatario, concepto, monto, observaciones, on_ok=on_ok, notificar=True)
         return -1
 
     def eliminar_transferencia(self, transferencia_id: int):
         """Elimina una transferencia."""
         if USE_SQLITE:
-            db_local.eliminar_transferencia(transferencia_id)
-            self._notificar()
+            self.persistir('eliminar_transferencia', transferencia_id, notificar=True)
 
     def actualizar_transferencia(self, transferencia_id: int, destinatario: str, concepto: str, monto: float, observaciones: str = ''):
         """Actualiza una transferencia existente."""
         if USE_SQLITE:
-            db_local.actualizar_transferencia(transferencia_id, destinatario, concepto, monto, observaciones)
-            self._notificar()
+            self.persistir('actualizar_transferencia', transferencia_id, destinatario, concepto, monto, observaciones, notificar=True)
 
     def get_transferencias(self, repartidor: str = '') -> list:
         """Obtiene las transferencias de la fecha actual, opcionalmente filtrado por repartidor."""
@@ -731,9 +896,36 @@ class LiquidadorRepartidores:
         # Cargar ruta FDB desde configuración
         self._cargar_configuracion_rutas()
         
+        # Grabar las respuestas de Firebird si LIQUIVENTAS_GRABAR lo pide (benchmarks offline)
+        activar_grabacion_desde_entorno()
+        
         # DataStore único
         self.ds = DataStore()
 
+        # Executor compartido para consultas en segundo plano (Firebird/SQLite)
+        self.executor = get_executor()
+        self.executor.conectar_tk(self.ventana)
+        
+        # Escrituras de SQLite diferidas: el hilo de Tk no espera al disco
+        if USE_SQLITE:
+            iniciar_cola_escritura(db_local, despachar=self.executor.llamar_en_ui,
+                                   al_fallar=self._on_error_escritura)
+            # Escritor único entre procesos y avisos de cambios de run_anotaciones.py
+            coordinacion = iniciar_coordinacion(db_local, despachar=self.executor.llamar_en_ui)
+            coordinacion.suscribir('anotaciones', self._on_cambio_externo_anotaciones)
+            self.ventana.protocol("WM_DELETE_WINDOW", self._al_cerrar_ventana)
+        
+        # Caché LRU de días ya cargados (navegación ◀ ▶ instantánea)
+        self.cache_dias = DayStateCache()
+        
+        # Modo offline: estado de Firebird y recargas pendientes
+        self.conexion = EstadoConexion()
+        self._sondeo_after_id = None
+        self._after_debounce = {}             # nombre -> id de after pendiente (ver _programar)
+        
+        # Motor de liquidación sin interfaz (la pestaña solo pinta su resultado)
+        self.motor_liquidacion = LiquidacionEngine(self._ventas_para_liquidacion)
+
         # Variable compartida para repartidor filtro en Liquidación
         self.repartidor_filtro_var = tk.StringVar()
 
@@ -753,6 +945,12 @@ class LiquidadorRepartidores:
         
         # Cargar datos de la fecha actual al iniciar (con pequeño delay para que la GUI esté lista)
         self.ventana.after(500, self._cargar_datos_inicial)
+        
+        # Estadísticas del planificador de SQLite (ANALYZE / PRAGMA optimize) periódicas
+        self.ventana.after(60 * 1000, self._mantenimiento_sqlite)
+
+        # Respaldo en línea de la base local y los adjuntos (core/respaldo.py)
+        self.ventana.after(2 * 60 * 1000, self._respaldo_periodico)
     
     def _crear_tooltip(self, widget, texto):
         """Crea un tooltip (mensaje emergente) para un widget."""
@@ -893,7 +1091,7 @@ class LiquidadorRepartidores:
             else:
                 fecha = self.fecha_global_var.get().strip()
             
-            self.ds.fecha = fecha
+            self.ds.cambiar_fecha(fecha)
             if hasattr(self, 'fecha_asign_var'):
                 self.fecha_asign_var.set(fecha)
             
@@ -1289,7 +1487,7 @@ class LiquidadorRepartidores:
         ttk.Button(fila1, text="🔗 Verificar", command=self._verificar_conexion_bd, width=10).pack(side=tk.LEFT, padx=4)
         
         # Indicador de estado
-        self.lbl_estado_bd = ttk.Label(fila1, text="● Desconectado", foreground="red", width=15)
+        self.lbl_estado_bd = ttk.Label(fila1, text="● Desconectado", foreground="red", width=26)
         self.lbl_estado_bd.pack(side=tk.LEFT, padx=(12, 0))
         
         # Separador
@@ -1334,12 +1532,26 @@ class LiquidadorRepartidores:
             self.fecha_global_entry.bind("<Return>", self._on_fecha_global_cambio)
             self.fecha_global_entry.bind("<FocusOut>", self._on_fecha_global_cambio)
         
-        # Botón para cargar datos de la fecha seleccionada
+        # Botón para cargar datos de la fecha seleccionada (siempre consulta Firebird)
         btn_cargar = ttk.Button(fila2, text="📥", width=3,
-                   command=self._on_fecha_global_cambio)
-        btn_cargar.pack(side=tk.LEFT, padx=(0, 8))
+                   command=self._recargar_fecha_global)
+        btn_cargar.pack(side=tk.LEFT, padx=(0, 2))
         self._crear_tooltip(btn_cargar, "Cargar")
         
+        # Recarga incremental: solo tickets, devoluciones y movimientos nuevos
+        btn_delta = ttk.Button(fila2, text="🔄", width=3, command=self._recargar_delta)
+        btn_delta.pack(side=tk.LEFT, padx=(0, 2))
+        self._crear_tooltip(btn_delta, "Traer solo lo nuevo")
+        
+        # Auto-actualización periódica del día (recarga incremental)
+        self._auto_refresh_segundos = int(db_local.obtener_config('auto_refresh_segundos', 60)) if USE_SQLITE else 60
+        self._auto_refresh_after_id = None
+        self.auto_refresh_var = tk.BooleanVar(value=False)
+        chk_auto = ttk.Checkbutton(fila2, text="Auto", variable=self.auto_refresh_var,
+                                   command=self._on_auto_refresh_toggle)
+        chk_auto.pack(side=tk.LEFT, padx=(0, 8))
+        self._crear_tooltip(chk_auto, f"Traer lo nuevo cada {self._auto_refresh_segundos} s")
+        
         # Botones de navegación de fecha
         ttk.Button(fila2, text="◀", width=3,
                    command=lambda: self._cambiar_fecha_global(-1)).pack(side=tk.LEFT, padx=2)
@@ -1380,12 +1592,15 @@ class LiquidadorRepartidores:
         self.buscar_global_var = tk.StringVar()
         self.entry_buscar_global = ttk.Entry(fila2, textvariable=self.buscar_global_var, width=20)
         self.entry_buscar_global.pack(side=tk.LEFT, padx=(0, 5))
-        self.buscar_global_var.trace_add("write", lambda *a: self._on_buscar_global())
+        self.buscar_global_var.trace_add(
+            "write", lambda *a: self._programar("buscar_global", DEBOUNCE_BUSQUEDA_MS, self._on_buscar_global))
         # Enter en buscador -> saltar al listado
         self.entry_buscar_global.bind("<Return>", self._saltar_al_listado)
         self.entry_buscar_global.bind("<KP_Enter>", self._saltar_al_listado)
         ttk.Button(fila2, text="✕", width=2,
-                   command=self._limpiar_buscar_global).pack(side=tk.LEFT, padx=(0, 8))
+                   command=self._limpiar_buscar_global).pack(side=tk.LEFT, padx=(0, 2))
+        ttk.Button(fila2, text="🔎", width=3,
+                   command=self._dialogo_busqueda_global).pack(side=tk.LEFT, padx=(0, 8))
         
         # Separador antes de botones de acción
         ttk.Separator(fila2, orient=tk.VERTICAL).pack(side=tk.LEFT, fill=tk.Y, padx=12)
@@ -1395,6 +1610,10 @@ class LiquidadorRepartidores:
                    command=self._guardar_liquidacion, style="Success.TButton").pack(side=tk.LEFT, padx=5)
         ttk.Button(fila2, text="📄 Gen. Reporte",
                    command=self._generar_reporte).pack(side=tk.LEFT, padx=5)
+        ttk.Button(fila2, text="📅 Reporte Rango",
+                   command=self._dialogo_reporte_rango).pack(side=tk.LEFT, padx=5)
+        ttk.Button(fila2, text="🔓 Reabrir día",
+                   command=self._reabrir_dia).pack(side=tk.LEFT, padx=5)
         
         # ===== NOTEBOOK (PESTAÑAS) =====
         self.notebook = ttk.Notebook(self.ventana)
@@ -1646,6 +1865,8 @@ class LiquidadorRepartidores:
         self.tree_creditos.bind("<Button-1>", self._on_clic_credito)
         # Doble clic para ver/editar observaciones
         self.tree_creditos.bind("<Double-1>", self._on_doble_clic_credito)
+        # Clic derecho: operaciones masivas sobre la selección (Ctrl/Shift + clic)
+        self.tree_creditos.bind("<Button-3>", self._mostrar_menu_creditos)
         
         # Tags para estados - colores más suaves y profesionales
         self.tree_creditos.tag_configure("pagado", background="#1b5e20", foreground="#a5d6a7")    # Verde
@@ -1685,6 +1906,12 @@ class LiquidadorRepartidores:
         self.lbl_cant_pendiente_filtrado.pack(side=tk.LEFT)
         ttk.Label(frame_totales_bottom, text=" registros)", font=("Segoe UI", 9)).pack(side=tk.LEFT)
         
+        # Antigüedad de la cartera pendiente (de cartera_saldos, sin filtros)
+        ttk.Separator(frame_totales_bottom, orient=tk.VERTICAL).pack(side=tk.LEFT, fill=tk.Y, padx=10)
+        ttk.Label(frame_totales_bottom, text="Antigüedad:", font=("Segoe UI", 9)).pack(side=tk.LEFT, padx=5)
+        self.lbl_antiguedad_creditos = ttk.Label(frame_totales_bottom, text="", font=("Segoe UI", 9, "bold"))
+        self.lbl_antiguedad_creditos.pack(side=tk.LEFT, padx=5)
+        
         # Widget flotante para edición in-place
         self.credito_edit_widget = None
         
@@ -1768,6 +1995,10 @@ class LiquidadorRepartidores:
         # Cerrar widget de edición previo
         self._cerrar_edicion_credito()
         
+        # Ctrl/Shift + clic: dejar que el Treeview extienda la selección
+        if event.state & (0x0001 | 0x0004):
+            return
+        
         # Identificar fila y columna
         item_id = self.tree_creditos.identify_row(event.y)
         column = self.tree_creditos.identify_column(event.x)
@@ -1863,13 +2094,11 @@ class LiquidadorRepartidores:
                         f"El abono (${nuevo_abono:,.0f}) no puede ser mayor al valor del crédito (${valor_credito:,.0f})",
                         parent=self.ventana)
                     return
-                
-                # Guardar en SQLite (las funciones ahora retornan dict con info completa)
-                if tipo == 'punteado':
-                    resultado = db_local.actualizar_abono_credito_punteado(fecha, folio, nuevo_abono)
-                else:
-                    resultado = db_local.actualizar_abono_credito_eleventa(fecha, folio, nuevo_abono)
-                
+            except ValueError:
+                entry.config(background='#ffcccc')
+                return
+            
+            def al_guardar(resultado):
                 if isinstance(resultado, dict) and resultado.get('success'):
                     nuevo_saldo = resultado.get('nuevo_saldo', 0)
                     nuevo_estado = resultado.get('nuevo_estado', '')
@@ -1889,13 +2118,19 @@ class LiquidadorRepartidores:
                     print(msg)
                 elif isinstance(resultado, dict):
                     messagebox.showerror("Error", resultado.get('error', 'Error desconocido'), parent=self.ventana)
-                
-                self._cerrar_edicion_credito()
                 self._refrescar_creditos_tab()
                 # Actualizar también la liquidación para reflejar los créditos cobrados
                 self._actualizar_datos_liquidacion()
-            except ValueError:
-                entry.config(background='#ffcccc')
+            
+            def al_fallar(error):
+                messagebox.showerror("Error", str(error) or 'Error desconocido', parent=self.ventana)
+                self._refrescar_creditos_tab()
+            
+            # Guardar en SQLite (las funciones retornan dict con info completa)
+            operacion = ('actualizar_abono_credito_punteado' if tipo == 'punteado'
+                         else 'actualizar_abono_credito_eleventa')
+            self._cerrar_edicion_credito()
+            self.ds.persistir(operacion, fecha, folio, nuevo_abono, on_ok=al_guardar, on_error=al_fallar)
         
         def cancelar(event=None):
             self._cerrar_edicion_credito()
@@ -2143,106 +2378,132 @@ class LiquidadorRepartidores:
         except Exception as e:
             messagebox.showerror("Error", f"Error al saldar créditos: {e}", parent=self.ventana)
     
-    def _cargar_todos_creditos_eleventa(self):
-        """Consulta TODOS los créditos de Firebird y los guarda en SQLite."""
-        if not self.ruta_fdb or not os.path.exists(self.ruta_fdb):
-            messagebox.showerror("Error", "No se ha configurado la ruta de la base de datos Firebird.")
+    def _mostrar_menu_creditos(self, event):
+        """Menú contextual con operaciones masivas sobre los créditos seleccionados."""
+        self._cerrar_edicion_credito()
+        # Si se hace clic derecho fuera de la selección, seleccionar solo esa fila
+        item = self.tree_creditos.identify_row(event.y)
+        if item and item not in self.tree_creditos.selection():
+            self.tree_creditos.selection_set(item)
+        n = len(self.tree_creditos.selection())
+        if not n:
             return
         
-        # Consulta SQL para obtener TODOS los créditos (sin filtro de fecha)
-        sql = (
-            "SET HEADING ON;\n"
-            "SELECT V.ID, V.FOLIO, V.NOMBRE, V.SUBTOTAL, V.TOTAL_CREDITO, "
-            "CAST(V.CREADO_EN AS DATE) AS FECHA_CREACION\n"
-            "FROM VENTATICKETS V\n"
-            "WHERE V.TOTAL_CREDITO > 0\n"
-            "ORDER BY V.CREADO_EN DESC, V.FOLIO;\n"
-        )
-        
-        ok, stdout, stderr = self._ejecutar_sql(sql)
-        
-        if not ok or not stdout:
-            error_msg = stderr or "No se recibieron datos de la BD"
-            messagebox.showerror("Error BD", f"No se pudo consultar créditos:\n{error_msg}")
-            return
+        menu = tk.Menu(self.ventana, tearoff=0)
+        menu.add_command(label="📋 Copiar", command=lambda: self._copiar_seleccion_tree(self.tree_creditos))
+        menu.add_separator()
+        menu.add_command(label=f"💰 Saldar seleccionados ({n})", command=self._saldar_creditos_seleccionados)
+        
+        menu_estado = tk.Menu(menu, tearoff=0)
+        for estado in ("PENDIENTE", "PAGADO", "CANCELADA"):
+            menu_estado.add_command(label=estado,
+                                    command=lambda e=estado: self._cambiar_estado_creditos_seleccionados(e))
+        menu.add_cascade(label=f"🏷️ Cambiar estado ({n})", menu=menu_estado)
+        
+        menu_rep = tk.Menu(menu, tearoff=0)
+        menu_rep.add_command(label="(Sin repartidor)",
+                             command=lambda: self._asignar_repartidor_creditos_seleccionados(''))
+        for rep in sorted(self.ds.repartidores.keys()):
+            menu_rep.add_command(label=rep,
+                                 command=lambda r=rep: self._asignar_repartidor_creditos_seleccionados(r))
+        menu.add_cascade(label=f"🚚 Asignar repartidor ({n})", menu=menu_rep)
         
+        try:
+            menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            menu.grab_release()
+    
+    def _creditos_seleccionados(self) -> list:
+        """[(origen, fecha, folio)] de las filas seleccionadas en el tab de créditos."""
         creditos = []
-        header_visto = False
+        for item in self.tree_creditos.selection():
+            values = self.tree_creditos.item(item, 'values')
+            try:
+                creditos.append((values[10], values[0], int(values[1])))
+            except (IndexError, ValueError):
+                continue
+        return creditos
+    
+    def _mostrar_resultado_masivo(self, titulo: str, resultado: dict, etiqueta_total: str):
+        """Informa el resultado de una operación masiva y refresca el tab."""
+        if resultado['errores']:
+            messagebox.showerror("Error", "\n".join(resultado['errores']), parent=self.ventana)
+            return
+        lineas = [f"Se actualizaron {resultado['count']} créditos:\n"]
+        for origen, r in resultado['por_origen'].items():
+            if r['count']:
+                lineas.append(f"• {origen.capitalize()}: {r['count']} (${r['total']:,.2f})")
+        lineas.append(f"\n{etiqueta_total}: ${resultado['total']:,.2f}")
+        messagebox.showinfo(titulo, "\n".join(lineas), parent=self.ventana)
+        self._refrescar_creditos_tab()
+    
+    def _saldar_creditos_seleccionados(self):
+        """Salda (abono = valor crédito, estado PAGADO) los créditos seleccionados."""
+        creditos = self._creditos_seleccionados()
+        if not creditos:
+            return
+        if not messagebox.askyesno(
+                "Confirmar Saldado",
+                f"¿Saldar los {len(creditos)} créditos seleccionados?\n\n"
+                "El ABONO quedará igual al VALOR CRÉDITO y el estado en PAGADO.\n"
+                "Los que ya están pagados no se tocan.",
+                parent=self.ventana):
+            return
+        resultado = db_local.saldar_creditos(creditos)
+        self._mostrar_resultado_masivo("Saldado Completado", resultado, "Total saldado")
+    
+    def _cambiar_estado_creditos_seleccionados(self, estado: str):
+        """Cambia el estado de los créditos seleccionados."""
+        creditos = self._creditos_seleccionados()
+        if not creditos:
+            return
+        if len(creditos) > 1 and not messagebox.askyesno(
+                "Confirmar Cambio",
+                f"¿Cambiar a {estado} los {len(creditos)} créditos seleccionados?",
+                parent=self.ventana):
+            return
+        resultado = db_local.cambiar_estado_creditos(creditos, estado)
+        self._mostrar_resultado_masivo("Estado Actualizado", resultado, "Saldo de los créditos")
+    
+    def _asignar_repartidor_creditos_seleccionados(self, repartidor: str):
+        """Asigna el repartidor a los créditos seleccionados."""
+        creditos = self._creditos_seleccionados()
+        if not creditos:
+            return
+        resultado = db_local.asignar_repartidor_creditos(creditos, repartidor)
+        self._mostrar_resultado_masivo("Repartidor Asignado", resultado, "Saldo de los créditos")
+    
+    def _cargar_todos_creditos_eleventa(self):
+        """Consulta TODOS los créditos de Firebird y los guarda en SQLite (en segundo plano)."""
+        if not self.ruta_fdb or not os.path.exists(self.ruta_fdb):
+            messagebox.showerror("Error", "No se ha configurado la ruta de la base de datos Firebird.")
+            return
         
-        try:
-            for linea in stdout.split('\n'):
-                linea = linea.strip()
-                if not linea or linea.startswith('='):
-                    continue
-                # Detectar header
-                if 'ID' in linea and 'FOLIO' in linea:
-                    header_visto = True
-                    continue
-                if not header_visto:
-                    continue
-                
-                partes = linea.split()
-                if len(partes) < 5:
-                    continue
-                
-                try:
-                    id_v = int(partes[0])
-                    folio_s = partes[1]
-                    if folio_s == '<null>':
-                        continue
-                    folio = int(folio_s)
-                    
-                    # Fecha está al final
-                    fecha = partes[-1] if partes[-1] != '<null>' else ''
-                    # Total crédito está antes de la fecha
-                    total_credito = float(partes[-2]) if partes[-2] != '<null>' else 0.0
-                    # Subtotal está antes del total crédito
-                    subtotal = float(partes[-3]) if partes[-3] != '<null>' else 0.0
-                    # Nombre está entre FOLIO y SUBTOTAL
-                    nombre = ' '.join(partes[2:-3]).replace('<null>', '').strip()
-                    if not nombre:
-                        nombre = 'MOSTRADOR'
-                    
-                    if folio <= 0 or total_credito <= 0:
-                        continue
-                    
-                    creditos.append({
-                        'fecha': fecha,
-                        'folio': folio,
-                        'id': id_v,
-                        'nombre': nombre,
-                        'subtotal': subtotal,
-                        'total_credito': total_credito,
-                        'repartidor': ''
-                    })
-                except (ValueError, IndexError):
-                    continue
-            
-            if not creditos:
+        def on_ok(resultado):
+            total_guardados, num_fechas = resultado
+            if not total_guardados and not num_fechas:
                 messagebox.showinfo("Info", "No se encontraron créditos en el sistema Eleventa.")
                 return
-            
-            # Guardar en SQLite por fecha
-            creditos_por_fecha = {}
-            for c in creditos:
-                fecha = c['fecha']
-                if fecha not in creditos_por_fecha:
-                    creditos_por_fecha[fecha] = []
-                creditos_por_fecha[fecha].append(c)
-            
-            total_guardados = 0
-            for fecha, lista in creditos_por_fecha.items():
-                count = db_local.guardar_creditos_eleventa_bulk(fecha, lista)
-                total_guardados += count
-            
             messagebox.showinfo("Carga Completa", 
-                f"Se cargaron {total_guardados} créditos de {len(creditos_por_fecha)} fechas diferentes.")
-            
+                f"Se cargaron {total_guardados} créditos de {num_fechas} fechas diferentes.")
             # Refrescar vista
             self._refrescar_creditos_tab()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error procesando créditos: {e}")
+        
+        def on_error(e):
+            if isinstance(e, ErrorCargaDia):
+                messagebox.showerror("Error BD", f"No se pudo consultar créditos:\n{e}")
+            else:
+                messagebox.showerror("Error", f"Error procesando créditos: {e}")
+        
+        self.executor.submit(
+            self._consultar_todos_creditos_eleventa,
+            cola='firebird', prioridad=PRIORIDAD_UI, clave=('creditos_eleventa', self.ruta_fdb),
+            on_ok=on_ok, on_error=on_error
+        )
+    
+    def _consultar_todos_creditos_eleventa(self):
+        """Consulta y guarda los créditos (NO toca widgets). Retorna (guardados, num_fechas)."""
+        return consultar_creditos_eleventa(self._ejecutar_sql, db_local)
     
     def _refrescar_creditos_tab(self):
         """Refresca la lista unificada de créditos (Punteados + Eleventa)."""
@@ -2265,8 +2526,16 @@ class LiquidadorRepartidores:
         filtro_pagado_desde = self.filtro_fecha_pagado_desde.get().strip() if hasattr(self, 'filtro_fecha_pagado_desde') else ""
         filtro_pagado_hasta = self.filtro_fecha_pagado_hasta.get().strip() if hasattr(self, 'filtro_fecha_pagado_hasta') else ""
         
-        # Cargar asignaciones para obtener repartidores
-        asignaciones = cargar_asignaciones()
+        # Los años archivados solo tienen créditos cerrados: se leen si el filtro
+        # de estado puede mostrarlos y solo los que cruza el filtro de fecha venta
+        with db_local.leer_archivo(filtro_venta_desde or None, filtro_venta_hasta or None,
+                                   activo=filtro_estado != 'PENDIENTE'):
+            # Cargar asignaciones para obtener repartidores
+            asignaciones = cargar_asignaciones()
+            creditos_punt = (db_local.obtener_todos_creditos_punteados()
+                             if filtro_origen in ("Todos", "PUNTEADO") else [])
+            creditos_elev = (db_local.obtener_todos_creditos_eleventa()
+                             if filtro_origen in ("Todos", "ELEVENTA") else [])
         
         # Configurar tags para colores según estado - colores suaves y profesionales
         self.tree_creditos.tag_configure("pagado", background="#1b5e20", foreground="#a5d6a7")    # Verde
@@ -2280,7 +2549,6 @@ class LiquidadorRepartidores:
         # CRÉDITOS PUNTEADOS (Manuales)
         # ═══════════════════════════════════════════════════════════════
         if filtro_origen in ("Todos", "PUNTEADO"):
-            creditos_punt = db_local.obtener_todos_creditos_punteados()
             for cp in creditos_punt:
                 fecha = cp.get('fecha', '')
                 folio = cp.get('folio', '')
@@ -2309,7 +2577,6 @@ class LiquidadorRepartidores:
         # CRÉDITOS ELEVENTA (Sistema)
         # ═══════════════════════════════════════════════════════════════
         if filtro_origen in ("Todos", "ELEVENTA"):
-            creditos_elev = db_local.obtener_todos_creditos_eleventa()
             for ce in creditos_elev:
                 fecha = ce.get('fecha', '')
                 folio = ce.get('folio', '')
@@ -2439,6 +2706,11 @@ class LiquidadorRepartidores:
             self.lbl_cant_pagado_filtrado.config(text=str(count_pagado_filtrado))
             self.lbl_total_pendiente_filtrado.config(text=f"${total_pendiente_filtrado:,.0f}")
             self.lbl_cant_pendiente_filtrado.config(text=str(count_pendiente_filtrado))
+        
+        if hasattr(self, 'lbl_antiguedad_creditos'):
+            antiguedad = db_local.obtener_antiguedad_cartera(['ELEVENTA', 'PUNTEADO'])
+            self.lbl_antiguedad_creditos.config(text="  ".join(
+                f"{tramo} días: ${antiguedad[tramo]:,.0f}" for tramo in db_local.TRAMOS_CARTERA))
 
     # ------------------------------------------------------------------
     # CREAR PESTAÑA DE NO ENTREGADOS
@@ -2741,11 +3013,12 @@ class LiquidadorRepartidores:
                         f"El abono (${nuevo_abono:,.0f}) no puede ser mayor al valor (${valor:,.0f})",
                         parent=self.ventana)
                     return
-                
-                resultado = db_local.actualizar_abono_no_entregado(fecha, folio, nuevo_abono)
-                
+            except ValueError:
+                entry.config(background='#ffcccc')
+                return
+            
+            def al_guardar(resultado):
                 if isinstance(resultado, dict) and resultado.get('success'):
-                    nuevo_saldo = resultado.get('nuevo_saldo', 0)
                     nuevo_estado = resultado.get('nuevo_estado', '')
                     cambio_estado = resultado.get('cambio_estado', False)
                     
@@ -2758,11 +3031,15 @@ class LiquidadorRepartidores:
                             parent=self.ventana)
                 elif isinstance(resultado, dict):
                     messagebox.showerror("Error", resultado.get('error', 'Error desconocido'), parent=self.ventana)
-                
-                self._cerrar_edicion_ne()
                 self._refrescar_no_entregados_tab()
-            except ValueError:
-                entry.config(background='#ffcccc')
+            
+            def al_fallar(error):
+                messagebox.showerror("Error", str(error) or 'Error desconocido', parent=self.ventana)
+                self._refrescar_no_entregados_tab()
+            
+            self._cerrar_edicion_ne()
+            self.ds.persistir('actualizar_abono_no_entregado', fecha, folio, nuevo_abono,
+                              on_ok=al_guardar, on_error=al_fallar)
         
         def cancelar(event=None):
             self._cerrar_edicion_ne()
@@ -3401,13 +3678,20 @@ class LiquidadorRepartidores:
                 self._cerrar_edicion_prestamo()
                 return
             
-            resultado = db_local.actualizar_abono_prestamo(id_prestamo, nuevo_abono)
-            if resultado.get('success'):
-                if resultado.get('cambio_estado'):
-                    messagebox.showinfo("Estado Actualizado", 
-                                        f"El préstamo pasó a estado {resultado.get('nuevo_estado')}")
+            def al_guardar(resultado):
+                if resultado.get('success'):
+                    if resultado.get('cambio_estado'):
+                        messagebox.showinfo("Estado Actualizado", 
+                                            f"El préstamo pasó a estado {resultado.get('nuevo_estado')}")
+                self._refrescar_prestamos_tab()
+            
+            def al_fallar(error):
+                messagebox.showerror("Error", str(error) or 'Error desconocido')
+                self._refrescar_prestamos_tab()
+            
             self._cerrar_edicion_prestamo()
-            self._refrescar_prestamos_tab()
+            self.ds.persistir('actualizar_abono_prestamo', id_prestamo, nuevo_abono,
+                              on_ok=al_guardar, on_error=al_fallar)
         
         entry.bind("<Return>", guardar)
         entry.bind("<Escape>", lambda e: self._cerrar_edicion_prestamo())
@@ -4381,6 +4665,156 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
         self.entry_buscar_global.icursor(tk.END)
         return "break"
     
+    def _programar(self, nombre: str, ms: int, fn):
+        """Ejecuta `fn` cuando pasan `ms` sin otra llamada con el mismo nombre (debounce)."""
+        pendientes = self._after_debounce
+        if pendientes.get(nombre):
+            self.ventana.after_cancel(pendientes[nombre])
+        
+        def ejecutar():
+            pendientes[nombre] = None
+            fn()
+        pendientes[nombre] = self.ventana.after(ms, ejecutar)
+    
+    # ------------------------------------------------------------------
+    # COLA DE ESCRITURA DIFERIDA (core/escritura.py)
+    # ------------------------------------------------------------------
+    def _on_error_escritura(self, operacion: str, error: Exception):
+        """Una escritura diferida falló: la pantalla muestra un cambio que no quedó guardado."""
+        messagebox.showerror("Error al guardar",
+                             f"No se pudo guardar un cambio ({operacion}):\n{error}\n\n"
+                             "Recarga el día para ver los datos guardados.",
+                             parent=self.ventana)
+
+    def _al_cerrar_ventana(self):
+        """Termina de guardar lo que quede en la cola de escritura antes de cerrar."""
+        cola = get_cola_escritura()
+        if cola is not None:
+            cola.detener()
+        coordinacion = get_coordinacion()
+        if coordinacion is not None:
+            coordinacion.detener()
+        respaldo = get_respaldo()
+        if respaldo is not None:
+            respaldo.detener()
+        self.ventana.destroy()
+
+    def _on_cambio_externo_anotaciones(self, tabla: str, pid: int):
+        """Otro proceso (p. ej. run_anotaciones.py) cambió notas: recargar solo esa pestaña."""
+        widget = getattr(self, 'anotaciones_widget', None)
+        if widget is not None:
+            self._programar('anotaciones_externas', 300, widget.refrescar)
+
+    # ------------------------------------------------------------------
+    # BÚSQUEDA EN TODAS LAS FECHAS (índice FTS5 de database_local)
+    # ------------------------------------------------------------------
+    def _dialogo_busqueda_global(self):
+        """Busca clientes, folios, repartidores y notas en todas las fechas (Ctrl+F)."""
+        if getattr(self, '_win_busqueda', None) and self._win_busqueda.winfo_exists():
+            self._win_busqueda.lift()
+            self._entry_busqueda.focus_set()
+            return
+        win = tk.Toplevel(self.ventana)
+        win.title("Buscar en todas las fechas")
+        win.transient(self.ventana)
+        win.geometry("900x480")
+        self._win_busqueda = win
+        frame = ttk.Frame(win, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(1, weight=1)
+        
+        texto_var = tk.StringVar(value=self.buscar_global_var.get())
+        self._entry_busqueda = ttk.Entry(frame, textvariable=texto_var, font=("Segoe UI", 11))
+        self._entry_busqueda.grid(row=0, column=0, sticky="ew")
+        lbl_estado = ttk.Label(frame, text="", width=28, anchor=tk.E)
+        lbl_estado.grid(row=0, column=1, padx=(10, 0))
+        
+        columnas = ("origen", "fecha", "folio", "cliente", "repartidor", "detalle")
+        tree = ttk.Treeview(frame, columns=columnas, show="headings")
+        for col, titulo, ancho in (("origen", "Origen", 100), ("fecha", "Fecha", 90), ("folio", "Folio", 70),
+                                   ("cliente", "Cliente", 200), ("repartidor", "Repartidor", 110),
+                                   ("detalle", "Detalle", 300)):
+            tree.heading(col, text=titulo, anchor=tk.W)
+            tree.column(col, width=ancho, anchor=tk.W)
+        scrolly = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrolly.set)
+        tree.grid(row=1, column=0, columnspan=2, sticky="nsew", pady=(8, 0))
+        scrolly.grid(row=1, column=2, sticky="ns", pady=(8, 0))
+        
+        def consultar(texto):
+            inicio = time.perf_counter()
+            resultados = db_local.buscar_global(texto)
+            return resultados, (time.perf_counter() - inicio) * 1000
+
+        def buscar():
+            if not win.winfo_exists():
+                return
+            texto = texto_var.get()
+
+            def on_ok(resultado):
+                # Ventana cerrada o texto que ya cambió: lo pinta la búsqueda siguiente
+                if not win.winfo_exists() or texto_var.get() != texto:
+                    return
+                resultados, ms = resultado
+                tree.delete(*tree.get_children())
+                for r in resultados:
+                    tree.insert("", tk.END, values=(r['origen'], r['fecha'], r['folio'], r['cliente'],
+                                                    r['repartidor'], r['detalle']))
+                lbl_estado.config(text=f"{len(resultados)} resultados ({ms:.0f} ms)" if texto.strip() else "")
+
+            def on_error(e):
+                if isinstance(e, TareaCancelada):
+                    return
+                if win.winfo_exists() and texto_var.get() == texto:
+                    lbl_estado.config(text="Error al buscar")
+                print(f"⚠️ Búsqueda global: {e}")
+
+            if texto.strip():
+                lbl_estado.config(text="Buscando...")
+            self.executor.submit(
+                consultar, texto,
+                cola='sqlite', prioridad=PRIORIDAD_UI, clave=('busqueda_global', texto),
+                on_ok=on_ok, on_error=on_error
+            )
+        
+        def abrir(event=None):
+            seleccion = tree.selection()
+            if not seleccion:
+                return
+            _origen, fecha, folio = tree.item(seleccion[0], 'values')[:3]
+            win.destroy()
+            self._ir_a_resultado_busqueda(fecha, folio)
+        
+        texto_var.trace_add("write", lambda *a: self._programar("busqueda_global", DEBOUNCE_BUSQUEDA_MS, buscar))
+        tree.bind("<Double-1>", abrir)
+        tree.bind("<Return>", abrir)
+        
+        def ir_a_lista(event=None):
+            hijos = tree.get_children()
+            if hijos:
+                tree.focus_set()
+                tree.selection_set(hijos[0])
+                tree.focus(hijos[0])
+        self._entry_busqueda.bind("<Down>", ir_a_lista)
+        self._entry_busqueda.bind("<Return>", ir_a_lista)
+        win.bind("<Escape>", lambda e: win.destroy())
+        self._entry_busqueda.focus_set()
+        buscar()
+    
+    def _ir_a_resultado_busqueda(self, fecha: str, folio: str):
+        """Cambia a la fecha del resultado y filtra por su folio."""
+        try:
+            nueva = datetime.strptime(fecha, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            return
+        if HAS_CALENDAR:
+            self.fecha_global_entry.set_date(nueva)
+        else:
+            self.fecha_global_var.set(fecha)
+        self._on_fecha_global_cambio()
+        self.buscar_global_var.set(str(folio or ''))
+    
     def _saltar_al_listado(self, event=None):
         """Salta al listado de facturas para asignar repartidor (Enter en buscador)."""
         # Obtener la pestaña actual
@@ -4469,6 +4903,91 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
         except (ValueError, AttributeError):
             pass
     
+    def _recargar_fecha_global(self):
+        """Recarga la fecha global ignorando la caché de días."""
+        if HAS_CALENDAR:
+            fecha = self.fecha_global_entry.get_date().strftime('%Y-%m-%d')
+        else:
+            fecha = self.fecha_global_var.get().strip()
+        self.cache_dias.invalidar(fecha)
+        self._on_fecha_global_cambio()
+    
+    def _recargar_delta(self):
+        """
+        Recarga incremental del día seleccionado: consulta solo lo que cambió
+        desde la última carga y actualiza las filas afectadas del DataStore.
+        Si no hay una carga base (o es de archivo/offline) hace la carga completa.
+        """
+        fecha = self.ds.fecha
+        base = self.cache_dias.get(fecha, tocar=False) if fecha else None
+        if base is None or base.archivado or base.obsoleto:
+            if not self.auto_refresh_var.get():
+                self._on_fecha_global_cambio()
+            return
+        
+        def on_ok(delta):
+            actual = self.cache_dias.get(fecha, tocar=False)
+            if actual is not base:
+                return  # Hubo una carga completa mientras tanto
+            self._registrar_carga_ok(aplicar_delta(base, delta))
+            if delta.vacio or fecha != self.ds.fecha:
+                return
+            self._aplicar_delta_dia(delta)
+        
+        def on_error(e):
+            self._marcar_offline(e)
+            self.conexion.encolar(('delta', fecha), self._recargar_delta)
+        
+        self.executor.submit(
+            consultar_delta_dia, self._ejecutar_sql, base,
+            cola='firebird', prioridad=PRIORIDAD_NORMAL, clave=('delta', fecha),
+            on_ok=on_ok, on_error=on_error
+        )
+
+    def _aplicar_delta_dia(self, delta):
+        """Mezcla un DeltaDia en el DataStore con una sola notificación."""
+        fecha = delta.fecha
+        asignaciones = self.ds.get_asignaciones_fecha(fecha) if USE_SQLITE else {}
+        parcial = EstadoDia(fecha=fecha, ventas=delta.ventas_nuevas,
+                            canceladas_otro_dia=delta.canceladas_otro_dia or [])
+        nuevas, nuevos_cajero = armar_ventas(parcial, asignaciones, obtener_repartidor_factura)
+        for folio in nuevos_cajero:
+            asignar_repartidor(folio, fecha, 'CAJERO')
+        n_nuevas = len(delta.ventas_nuevas)
+        
+        self.ds.aplicar_cambios_ventas(
+            nuevas[:n_nuevas], delta.ventas_actualizadas,
+            canceladas_otro_dia=nuevas[n_nuevas:] if delta.canceladas_otro_dia is not None else None,
+            devoluciones=[dict(d) for d in delta.devoluciones_nuevas],
+            entradas=[dict(m) for m in delta.entradas_nuevas],
+            salidas=[dict(m) for m in delta.salidas_nuevas],
+            notificar=False
+        )
+        if delta.devoluciones_nuevas:
+            self._asignar_cajero_cancelaciones()
+        if delta.dev_parciales is not None:
+            self._guardar_devoluciones_parciales(fecha, delta.dev_parciales)
+        self.ds._notificar()
+        print(f"🔄 {fecha}: +{n_nuevas} tickets, {len(delta.ventas_actualizadas)} actualizados, "
+              f"+{len(delta.devoluciones_nuevas)} devoluciones")
+
+    def _on_auto_refresh_toggle(self):
+        if self._auto_refresh_after_id:
+            self.ventana.after_cancel(self._auto_refresh_after_id)
+            self._auto_refresh_after_id = None
+        if self.auto_refresh_var.get():
+            self._auto_refresh_tick()
+
+    def _auto_refresh_tick(self):
+        """Recarga incremental periódica mientras esté activada la casilla Auto."""
+        self._auto_refresh_after_id = None
+        if not self.auto_refresh_var.get():
+            return
+        if self.conexion.en_linea:
+            self._recargar_delta()
+        self._auto_refresh_after_id = self.ventana.after(self._auto_refresh_segundos * 1000,
+                                                         self._auto_refresh_tick)
+    
     def _ir_a_fecha_hoy(self):
         """Establece la fecha global a hoy."""
         hoy = datetime.now()
@@ -4496,17 +5015,16 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
             messagebox.showwarning("Fecha Inválida", "El formato debe ser YYYY-MM-DD")
             return
         
-        # Actualizar fecha en DataStore y variable de sincronización
-        self.ds.fecha = nueva_fecha
+        # Actualizar fecha en DataStore y variable de sincronización: se
+        # quitan las ventas del día anterior (y se refrescan los módulos
+        # SQLite: descuentos, gastos, conteo...) hasta que llegue el nuevo
+        self.ds.cambiar_fecha(nueva_fecha)
         if hasattr(self, 'fecha_asign_var'):
             self.fecha_asign_var.set(nueva_fecha)
         
         # Cargar facturas de Firebird (pestaña Asignación)
         self._cargar_facturas()
         
-        # Refrescar todos los módulos SQLite (descuentos, gastos, conteo, etc.)
-        self._on_data_changed()
-        
         # Actualizar corte cajero con la nueva fecha
         self._actualizar_corte_cajero_async()
 
@@ -4525,7 +5043,27 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
     # ------------------------------------------------------------------
     # CALLBACK GLOBAL: se ejecuta cada vez que el DataStore cambia
     # ------------------------------------------------------------------
+    def _ventas_para_liquidacion(self, fecha: str) -> VentasDia:
+        """Ventas de una fecha para el motor: el DataStore si es la fecha cargada,
+        si no la de otro día (caché, archivo o consulta)."""
+        if fecha == self.ds.fecha:
+            return VentasDia(self.ds.get_ventas(), self.ds.movimientos_entrada, self.ds.movimientos_salida)
+        return self._ventas_de_otro_dia(fecha, self.conexion.en_linea)
+
+    def _ventas_de_otro_dia(self, fecha: str, en_linea: bool) -> VentasDia:
+        """Ventas de una fecha que no es la cargada. Reutiliza la caché de días si está
+        fresca; si no, la carga del archivo, de Firebird (si `en_linea`) o de la copia
+        local y la guarda en la caché. Puede tardar: llamar desde el executor, con
+        `en_linea` tomado de self.conexion en el hilo de Tk."""
+        estado = self.cache_dias.get(fecha, tocar=False)
+        if estado is None or not DayStateCache.es_fresco(estado):
+            ejecutar_sql = self._ejecutar_sql if en_linea else None
+            estado = cargar_estado_dia(fecha, ejecutar_sql, db_local)
+            self.cache_dias.put(estado)
+        return ventas_desde_estado(estado, db_local)
+
     def _on_data_changed(self):
+        self.motor_liquidacion.invalidar(self.ds.fecha)
         self._refrescar_tree_asignacion()
         self._filtrar_facturas_asign()  # Actualiza TOTALES (Monto Efectivo, etc.)
         self._refrescar_liquidacion()
@@ -4570,9 +5108,11 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
         
         if ok and ('TEST' in stdout or 'COUNT' in stdout or stdout.strip()):
             self.lbl_estado_bd.config(text="● Conectado ✓", foreground="green")
+            self._marcar_en_linea()
             messagebox.showinfo("Conexión", "✓ Conexión a BD establecida correctamente")
         else:
             self.lbl_estado_bd.config(text="● Error de conexión ✗", foreground="red")
+            self._marcar_offline(stderr)
             # Mostrar error más detallado
             if "firebird" in stderr.lower() or "no se encontró" in stderr.lower():
                 error_msg = (
@@ -4605,6 +5145,8 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
         
         # Binding global F10 para enfocar buscador y seleccionar todo el texto
         self.ventana.bind("<F10>", self._enfocar_buscador_seleccionar)
+        self.ventana.bind("<Control-f>", lambda e: self._dialogo_busqueda_global())
+        self.ventana.bind("<Control-F>", lambda e: self._dialogo_busqueda_global())
         # Binding global Ctrl+S para guardar cambios pendientes
         self.ventana.bind("<Control-s>", lambda e: self._guardar_cambios_pendientes())
         self.ventana.bind("<Control-S>", lambda e: self._guardar_cambios_pendientes())
@@ -4782,6 +5324,13 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
         )
         self.btn_guardar_asign.pack()
         
+        # Llena los folios sin repartidor con el repartidor habitual del cliente
+        ttk.Button(
+            frame_guardar_inner,
+            text="✨ Auto-asignar sugeridos",
+            command=self._auto_asignar_sugeridos
+        ).pack(pady=(4, 0))
+        
         # Label indicador de cambios pendientes
         self.lbl_cambios_pendientes = ttk.Label(
             frame_guardar_inner, 
@@ -4883,138 +5432,359 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
             messagebox.showwarning("Fecha", "Ingresa una fecha válida (YYYY-MM-DD)")
             return
 
-        self.ds.fecha = fecha  # sincronizar fecha global
+        self.ds.cambiar_fecha(fecha)  # sincronizar fecha global
         
         # Limpiar cambios pendientes al cargar nuevas facturas
         if hasattr(self, '_cambios_pendientes'):
             self._cambios_pendientes.clear()
             self._actualizar_estado_boton_guardar()
 
-        # Consulta principal usando VENTATICKETS con campo TOTAL para coincidir con corte de caja
-        # Incluye TURNO_ID para identificar el turno de cada venta
-        sql = (
-            "SET HEADING ON;\n"
-            "SELECT V.ID, V.FOLIO, V.NOMBRE, V.SUBTOTAL, V.TOTAL, V.ESTA_CANCELADO, V.TOTAL_CREDITO, "
-            "CAST(V.CREADO_EN AS DATE) AS FECHA_CREACION, "
-            "CAST(D.DEVUELTO_EN AS DATE) AS FECHA_CANCELACION, "
-            "V.TURNO_ID\n"
-            "FROM VENTATICKETS V\n"
-            "LEFT JOIN DEVOLUCIONES D ON D.TICKET_ID = V.ID AND D.TIPO_DEVOLUCION = 'C'\n"
-            f"WHERE CAST(V.CREADO_EN AS DATE) = '{fecha}'\n"
-            "ORDER BY V.FOLIO;\n"
+        # Día en caché (o cerrado y archivado): aplicar al instante y
+        # revalidar en segundo plano si está viejo
+        estado = self.cache_dias.get(fecha)
+        if estado is not None and estado.archivado and not self._archivo_vigente(fecha):
+            # Se cambiaron asignaciones del día después de archivarlo
+            self.cache_dias.invalidar(fecha)
+            estado = None
+        estado = estado or self._cargar_archivo_dia(fecha)
+        if estado is not None:
+            self._on_estado_dia_cargado(estado)
+            if not self.cache_dias.es_fresco(estado):
+                self._revalidar_estado_dia(fecha, huella_estado(estado))
+            return
+
+        # Las consultas a Firebird corren en el executor compartido y el resultado
+        # se aplica en el hilo de Tk. Pedir la misma fecha mientras ya se está
+        # cargando (o precargando) reutiliza la consulta en vuelo.
+        self.executor.submit(
+            consultar_estado_dia, self._ejecutar_sql, fecha,
+            cola='firebird', prioridad=PRIORIDAD_UI, clave=('estado_dia', fecha),
+            on_ok=self._on_estado_dia_consultado,
+            on_error=lambda e: self._on_error_carga_dia(e, fecha),
+        )
+
+    def _cargar_archivo_dia(self, fecha: str) -> Optional[EstadoDia]:
+        """EstadoDia de un día cerrado desde su snapshot local (lo deja en caché)."""
+        if not USE_SQLITE or self.ds.tiene_asignaciones_en_cola(fecha):
+            return None
+        estado = self._leer_archivo_dia(fecha)
+        if estado is not None:
+            self.cache_dias.put(estado)
+        return estado
+
+    def _leer_archivo_dia(self, fecha: str) -> Optional[EstadoDia]:
+        """Lee y descomprime el snapshot local de un día (no toca Tk: apto para el executor)."""
+        archivo = db_local.obtener_archivo_dia(fecha)
+        if not archivo:
+            return None
+        try:
+            return estado_desde_snapshot(descomprimir_snapshot(archivo['datos']))
+        except ErrorArchivoDia as e:
+            print(f"⚠️ Archivo de {fecha} ignorado: {e}")
+            return None
+
+    def _archivo_vigente(self, fecha: str) -> bool:
+        """
+        True si el snapshot del día sigue activo: cambiar una asignación lo
+        desactiva (trigger de database_local), aunque siga en la cola.
+        """
+        return not self.ds.tiene_asignaciones_en_cola(fecha) and db_local.es_dia_archivado(fecha)
+
+    def _archivar_dia_si_cerrado(self, fecha: str) -> bool:
+        """
+        Archiva el día si todos sus repartidores (excepto CAJERO) ya tienen
+        liquidación guardada. Solo cuentan los que tienen ventas no
+        canceladas: las canceladas llevan como repartidor al cajero que las
+        canceló (ADMIN...), que no se liquida. Retorna True si se archivó.
+        """
+        if not USE_SQLITE or fecha != self.ds.fecha:
+            return False
+        estado = self.cache_dias.get(fecha, tocar=False)
+        if estado is None or (estado.archivado and self._archivo_vigente(fecha)):
+            return False
+        
+        repartidores = {v['repartidor'] for v in self.ds.get_ventas()
+                        if v.get('repartidor') and v['repartidor'] != 'CAJERO' and not v.get('cancelada')}
+        if not repartidores or repartidores - set(db_local.obtener_repartidores_liquidados(fecha)):
+            return False
+        
+        liquidaciones = db_local.obtener_historial_liquidaciones(fecha=fecha)
+        # Solo la última liquidación guardada de cada repartidor (vienen de la más nueva a la más vieja)
+        por_repartidor = {}
+        for liq in liquidaciones:
+            if liq['repartidor'] not in por_repartidor:
+                por_repartidor[liq['repartidor']] = json.loads(liq.get('datos_json') or '{}')
+        
+        ventas = self.ds.get_ventas()
+        totales = {
+            'num_ventas': len(ventas),
+            'total_facturas': round(sum(v.get('total_original', v['subtotal']) for v in ventas
+                                        if not v['cancelada']), 2),
+            'total_canceladas': round(self.ds.get_total_canceladas(), 2),
+            'total_dinero': round(db_local.obtener_total_general_conteos_fecha(fecha), 2),
+            'por_repartidor': {rep: {k: d.get(k, 0) for k in ('total_ventas', 'neto', 'diferencia')}
+                               for rep, d in por_repartidor.items()},
+        }
+        snapshot = construir_snapshot(estado, ventas, totales)
+        blob = comprimir_snapshot(snapshot)
+        version = db_local.guardar_archivo_dia(fecha, blob, FORMATO_ARCHIVO, totales)
+        if version < 0:
+            return False
+        # La caché debe servir desde ahora la versión archivada
+        self.cache_dias.put(estado_desde_snapshot(snapshot))
+        print(f"📦 Día {fecha} archivado (v{version}, {len(blob):,} bytes)")
+        return True
+
+    def _reabrir_dia(self):
+        """Invalida el archivo del día seleccionado y lo recarga desde Firebird."""
+        fecha = self.ds.fecha
+        if not fecha or not USE_SQLITE:
+            return
+        if not db_local.es_dia_archivado(fecha):
+            messagebox.showinfo("Reabrir día", f"El día {fecha} no está archivado.")
+            return
+        if not messagebox.askyesno("Reabrir día",
+                                   f"¿Reabrir el día {fecha}?\n\n"
+                                   "Se volverá a consultar Firebird y el día se archivará de nuevo "
+                                   "al guardar la liquidación de todos los repartidores."):
+            return
+        db_local.reabrir_dia(fecha)
+        self.cache_dias.invalidar(fecha)
+        self._on_fecha_global_cambio()
+
+    def _revalidar_estado_dia(self, fecha: str, huella_anterior: tuple):
+        """Vuelve a consultar un día servido desde caché; re-aplica solo si cambió."""
+        def on_ok(estado):
+            self._registrar_carga_ok(estado)
+            if estado.fecha == self.ds.fecha and huella_estado(estado) != huella_anterior:
+                self._aplicar_estado_dia(estado)
+        
+        def on_error(e):
+            print(f"⚠️ No se pudo revalidar {fecha}: {e}")
+            self._marcar_offline(e)
+            self.conexion.encolar(('estado_dia', fecha),
+                                  lambda: self._revalidar_estado_dia(fecha, huella_anterior))
+        
+        self.executor.submit(
+            consultar_estado_dia, self._ejecutar_sql, fecha,
+            cola='firebird', prioridad=PRIORIDAD_NORMAL, clave=('estado_dia', fecha),
+            on_ok=on_ok, on_error=on_error
         )
-        ok, stdout, stderr = self._ejecutar_sql(sql)
 
-        if not ok or not stdout:
-            error_msg = stderr or "No se recibieron datos de la BD"
-            messagebox.showerror("Error BD", f"No se pudo consultar:\n{error_msg}")
+    # ------------------------------------------------------------------
+    # Modo offline
+    # ------------------------------------------------------------------
+    def _registrar_carga_ok(self, estado: EstadoDia):
+        """Una consulta a Firebird funcionó: caché, copia local y estado en línea."""
+        self.cache_dias.put(estado)
+        self._persistir_estado_local(estado.fecha)
+        self._marcar_en_linea()
+
+    def _persistir_estado_local(self, fecha: str):
+        """Guarda en SQLite (en segundo plano) la copia local del día en caché."""
+        estado = self.cache_dias.get(fecha, tocar=False)
+        if not USE_SQLITE or estado is None or estado.obsoleto or estado.archivado:
             return
+        self.executor.submit(
+            lambda: db_local.guardar_cache_estado_dia(fecha, serializar_estado(estado)),
+            cola='sqlite', prioridad=PRIORIDAD_PREFETCH, clave=('cache_estado_dia', fecha)
+        )
 
-        ventas = []
-        header_visto = False
+    def _cargar_copia_local(self, fecha: str) -> Optional[EstadoDia]:
+        """Última carga buena de una fecha (marcada como obsoleta), o None."""
+        if not USE_SQLITE:
+            return None
+        blob = db_local.obtener_cache_estado_dia(fecha)
+        if not blob:
+            return None
         try:
-            for linea in stdout.split('\n'):
-                linea = linea.strip()
-                if not linea or linea.startswith('='):
-                    continue
-                # Detectar header de VENTATICKETS
-                if 'ID' in linea and 'FOLIO' in linea:
-                    header_visto = True
-                    continue
-                if not header_visto:
-                    continue
-                partes = linea.split()
-                if len(partes) < 9:  # Campos con TURNO_ID
-                    continue
-                try:
-                    # Formato: ID, FOLIO, NOMBRE..., SUBTOTAL, TOTAL, ESTA_CANCELADO, TOTAL_CREDITO, FECHA_CREACION, FECHA_CANCELACION, TURNO_ID
-                    id_v = int(partes[0])
-                    folio_s = partes[1]
-                    if folio_s == '<null>':
-                        continue
-                    folio = int(folio_s)
-                    
-                    # Obtener campos desde el final (más confiable)
-                    # Los últimos campos son: ..., FECHA_CANCELACION, TURNO_ID
-                    turno_id_venta = partes[-1] if partes[-1] != '<null>' else ''
-                    fecha_cancelacion = partes[-2] if partes[-2] != '<null>' else ''
-                    fecha_creacion = partes[-3] if partes[-3] != '<null>' else fecha
-                    total_credito = float(partes[-4]) if partes[-4] != '<null>' else 0.0
-                    # ESTA_CANCELADO puede ser 't'/'f' o 1/0
-                    cancelado_val = partes[-5].lower()
-                    esta_cancelado = cancelado_val == 't' or cancelado_val == '1'
-                    total_original = float(partes[-6]) if partes[-6] != '<null>' else 0.0
-                    subtotal = float(partes[-7]) if partes[-7] != '<null>' else 0.0
-                    # El nombre está entre FOLIO (índice 1) y SUBTOTAL (índice -7)
-                    nombre = ' '.join(partes[2:-7]).replace('<null>', '').strip()
-                    if not nombre:
-                        nombre = 'MOSTRADOR'
-                    
-                    # Usar turno_id como identificador de usuario (Turno X)
-                    usuario = f"Turno {turno_id_venta}" if turno_id_venta else ''
-                    
-                    if folio <= 0:
-                        continue
+            return deserializar_estado(blob)
+        except ErrorArchivoDia as e:
+            print(f"⚠️ Copia local de {fecha} ignorada: {e}")
+            return None
+
+    def _marcar_offline(self, error):
+        """Firebird no respondió: indicarlo y empezar a sondear la conexión."""
+        if self.conexion.marcar_caida(error):
+            print(f"⚠️ Firebird no disponible, modo offline: {error}")
+            self._programar_sondeo()
+        self._actualizar_indicador_conexion()
+
+    def _marcar_en_linea(self):
+        """Firebird volvió: restaurar indicador y repetir las recargas pendientes."""
+        if self.conexion.en_linea:
+            return
+        acciones = self.conexion.marcar_en_linea()
+        if self._sondeo_after_id:
+            self.ventana.after_cancel(self._sondeo_after_id)
+            self._sondeo_after_id = None
+        self._actualizar_indicador_conexion()
+        print(f"✅ Firebird disponible de nuevo, repitiendo {len(acciones)} recarga(s)")
+        for accion in acciones:
+            accion()
+
+    def _actualizar_indicador_conexion(self):
+        if self.conexion.en_linea:
+            self.lbl_estado_bd.config(text="● Conectado ✓", foreground="green")
+            return
+        estado = self.cache_dias.get(self.ds.fecha, tocar=False) if self.ds.fecha else None
+        if estado is not None and estado.obsoleto:
+            hora = datetime.fromtimestamp(estado.cargado_en).strftime('%d/%m %H:%M')
+            texto = f"● Offline: datos del {hora}"
+        else:
+            texto = "● Offline (sin datos locales)"
+        self.lbl_estado_bd.config(text=texto, foreground="orange")
 
-                    # Obtener repartidor asignado
-                    rep = obtener_repartidor_factura(folio, fecha) or ''
-                    
-                    # Si el nombre es "Ticket X", "MOSTRADOR" o similar, asignar a CAJERO
-                    nombre_lower = nombre.lower()
-                    if not rep and (nombre_lower.startswith('ticket ') or nombre_lower == 'ticket' or nombre_lower == 'mostrador'):
-                        rep = 'CAJERO'
-                        # Guardar automáticamente esta asignación
-                        asignar_repartidor(folio, fecha, 'CAJERO')
-                    
-                    es_credito = total_credito > 0
-                    
-                    # Para facturas canceladas del MISMO DÍA: subtotal = total
-                    # Esto hace que sumen al total de facturas
-                    subtotal_final = subtotal
-                    if esta_cancelado:
-                        subtotal_final = total_original  # Subtotal = Total para canceladas del día
-                    
-                    # Si la factura está cancelada y es del mismo día = cancelada normal
-                    # (Las canceladas de otro día vendrán de la segunda consulta)
-                    ventas.append({
-                        'id': id_v,
-                        'folio': folio,
-                        'nombre': nombre, 
-                        'subtotal': subtotal_final,  # Usar subtotal ajustado
-                        'total_original': total_original,
-                        'repartidor': rep, 
-                        'cancelada': esta_cancelado,
-                        'cancelada_otro_dia': False,  # Las del mismo día no son de otro día
-                        'total_credito': total_credito,
-                        'es_credito': es_credito,
-                        'fecha_creacion': fecha_creacion,
-                        'fecha_cancelacion': fecha_cancelacion,
-                        'turno_id': turno_id_venta,
-                        'usuario': usuario
-                    })
-                except (ValueError, IndexError):
-                    continue
+    def _programar_sondeo(self):
+        if self._sondeo_after_id is None:
+            self._sondeo_after_id = self.ventana.after(INTERVALO_SONDEO_MS, self._sondear_conexion)
 
-            # --- SEGUNDA CONSULTA: Facturas canceladas de otros días ---
-            # Buscar facturas canceladas cuya fecha de creación NO es la fecha consultada
-            # pero que el repartidor reporta como canceladas ese día (usando asignaciones previas)
-            canceladas_otro_dia = self._cargar_canceladas_otro_dia(fecha)
-            if canceladas_otro_dia:
-                ventas.extend(canceladas_otro_dia)
+    def _sondear_conexion(self):
+        """Prueba periódica de Firebird mientras se está offline."""
+        self._sondeo_after_id = None
+        if self.conexion.en_linea:
+            return
+        
+        def on_ok(resultado):
+            ok, _stdout, _stderr = resultado
+            if ok:
+                self._marcar_en_linea()
+            else:
+                self._programar_sondeo()
+        
+        self.executor.submit(
+            self._ejecutar_sql, SQL_SONDEO,
+            cola='firebird', prioridad=PRIORIDAD_NORMAL, clave=('sondeo_firebird',),
+            on_ok=on_ok, on_error=lambda e: self._programar_sondeo()
+        )
 
-            self.ds.set_ventas(ventas)
-            
-            # Cargar devoluciones del día
-            self._cargar_devoluciones(fecha)
-            
-            # Asignar cajero que canceló como repartidor en las canceladas
-            self._asignar_cajero_cancelaciones()
-            
-            # Cargar devoluciones parciales (artículos devueltos sin cancelar factura)
-            self._cargar_devoluciones_parciales(fecha)
-            
-            # Cargar movimientos (ingresos y salidas) del día
-            self._cargar_movimientos(fecha)
+    def _recargar_al_reconectar(self, fecha: str):
+        """Recarga pendiente de una fecha servida offline."""
+        estado = self.cache_dias.get(fecha, tocar=False)
+        huella = huella_estado(estado) if estado is not None else ()
+        self._revalidar_estado_dia(fecha, huella)
+        if fecha == self.ds.fecha:
+            self._actualizar_corte_cajero_async()
+
+    def _mantenimiento_sqlite(self):
+        """Optimiza la base local en la cola de SQLite y reprograma la siguiente pasada."""
+        if not USE_SQLITE:
+            return
+        self.executor.submit(
+            db_local.optimizar_base,
+            cola='sqlite', prioridad=PRIORIDAD_PREFETCH, clave=('optimizar_base',),
+            on_error=lambda e: print(f"⚠️ Mantenimiento de SQLite: {e}")
+        )
+        # Mudar los periodos cerrados a los archivos anuales (una vez cada ARCHIVAR_CADA_DIAS)
+        self.executor.submit(
+            db_local.archivar_si_corresponde,
+            cola='sqlite', prioridad=PRIORIDAD_PREFETCH, clave=('archivar_periodos',),
+            on_error=lambda e: print(f"⚠️ Archivado de periodos: {e}")
+        )
+        self.ventana.after(db_local.INTERVALO_OPTIMIZAR_MS, self._mantenimiento_sqlite)
+
+    def _respaldo_periodico(self):
+        """Toma una instantánea de la base local si ya pasó INTERVALO_RESPALDO_MS y reprograma."""
+        if not USE_SQLITE:
+            return
+        self.executor.submit(
+            iniciar_respaldo(db_local).respaldar_si_corresponde,
+            cola='respaldo', prioridad=PRIORIDAD_PREFETCH, clave=('respaldo',),
+            on_error=lambda e: print(f"⚠️ Respaldo de la base local: {e}")
+        )
+        self.ventana.after(INTERVALO_RESPALDO_MS, self._respaldo_periodico)
+
+    def _prefetch_dias_adyacentes(self, fecha: str):
+        """Precarga en segundo plano el día anterior y el siguiente (sin pasar de hoy)."""
+        from datetime import timedelta
+        if not self.conexion.en_linea:
+            return  # Sin Firebird no hay nada que precargar
+        # Las precargas de una fecha anterior ya no sirven
+        self.executor.cancelar_cola('firebird', prioridad_minima=PRIORIDAD_PREFETCH)
+        
+        base = datetime.strptime(fecha, '%Y-%m-%d')
+        hoy = datetime.now().strftime('%Y-%m-%d')
+        fdb_path = self.ruta_fdb
+        for dias in (-1, 1):
+            vecina = (base + timedelta(days=dias)).strftime('%Y-%m-%d')
+            if vecina > hoy:
+                continue
+            if self.cache_dias.get(vecina, tocar=False) is None:
+                self._prefetch_estado_dia(vecina)
+            self.executor.submit(
+                self._consultar_corte_cajero, fdb_path, vecina,
+                cola='firebird', prioridad=PRIORIDAD_PREFETCH, clave=('corte', fdb_path, vecina),
+                on_ok=lambda r, f=vecina: self._on_corte_consultado(f, r), on_error=lambda e: None
+            )
+
+    def _prefetch_estado_dia(self, fecha: str):
+        """
+        Precarga un día: primero su archivo local (cola sqlite) y, solo si no
+        está archivado, la consulta a Firebird.
+        """
+        def consultar_firebird():
+            if not self.conexion.en_linea or self.cache_dias.get(fecha, tocar=False) is not None:
+                return
+            self.executor.submit(
+                consultar_estado_dia, self._ejecutar_sql, fecha,
+                cola='firebird', prioridad=PRIORIDAD_PREFETCH, clave=('estado_dia', fecha),
+                on_ok=self._registrar_carga_ok, on_error=lambda e: None
+            )
+
+        def on_archivo(estado: Optional[EstadoDia]):
+            # Una asignación encolada mientras se leía invalida el snapshot
+            if estado is None or self.ds.tiene_asignaciones_en_cola(fecha):
+                consultar_firebird()
+            elif self.cache_dias.get(fecha, tocar=False) is None:
+                self.cache_dias.put(estado)
+
+        if not USE_SQLITE or self.ds.tiene_asignaciones_en_cola(fecha):
+            consultar_firebird()
+            return
+        self.executor.submit(
+            self._leer_archivo_dia, fecha,
+            cola='sqlite', prioridad=PRIORIDAD_PREFETCH, clave=('archivo_dia', fecha),
+            on_ok=on_archivo,
+            on_error=lambda e: isinstance(e, TareaCancelada) or print(f"⚠️ No se leyó el archivo de {fecha}: {e}")
+        )
+
+    def _precargar_productos_dia(self, fecha: str):
+        """Trae en segundo plano los productos de todas las facturas del día (pestaña descuentos)."""
+        if not self.conexion.en_linea or cache_productos.tiene_dia(fecha):
+            return
+        self.executor.submit(
+            precargar_productos_dia, self._ejecutar_sql, fecha,
+            cola='firebird', prioridad=PRIORIDAD_PREFETCH, clave=('productos_dia', fecha),
+            on_error=lambda e: isinstance(e, TareaCancelada) or print(f"⚠️ No se precargaron los productos de {fecha}: {e}")
+        )
+
+    def _indexar_ventas_busqueda(self, fecha: str):
+        """Guarda en segundo plano las ventas del día para la búsqueda en todas las fechas."""
+        ventas = [{'folio': v['folio'], 'nombre': v.get('nombre', ''), 'subtotal': v.get('subtotal', 0),
+                   'repartidor': v.get('repartidor', '')} for v in self.ds.get_ventas()]
+        self.executor.submit(
+            db_local.indexar_ventas_dia, fecha, ventas,
+            cola='sqlite', prioridad=PRIORIDAD_PREFETCH, clave=('indexar_ventas', fecha),
+            on_error=lambda e: print(f"⚠️ No se indexaron las ventas de {fecha}: {e}")
+        )
+
+    def _on_estado_dia_consultado(self, estado: EstadoDia):
+        """Resultado de una consulta a Firebird para la fecha seleccionada."""
+        self._registrar_carga_ok(estado)
+        self._on_estado_dia_cargado(estado)
+
+    def _on_estado_dia_cargado(self, estado: EstadoDia):
+        """Aplica la carga del día (hilo de Tk) y muestra el resumen."""
+        self.cache_dias.put(estado)
+        if estado.fecha != self.ds.fecha:
+            # El usuario cambió de fecha mientras se consultaba
+            return
+        try:
+            self._aplicar_estado_dia(estado)
+            self._prefetch_dias_adyacentes(estado.fecha)
+            self._precargar_productos_dia(estado.fecha)
+            self._indexar_ventas_busqueda(estado.fecha)
+            ventas = self.ds.ventas
 
             if ventas:
                 # Usar total_original para coincidir con Firebird
@@ -5024,140 +5794,71 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
                 total_credito = sum(v['total_credito'] for v in ventas if v['es_credito'])
                 
                 msg = f"Se cargaron {len(ventas)} facturas.\n"
-                msg += f"Total Facturas: ${total_facturas:,.2f}\n"
-                msg += f"Total Canceladas: ${total_canceladas:,.2f}\n"
-                if total_canceladas_otro_dia > 0:
-                    msg += f"Total Canceladas (otro día): ${total_canceladas_otro_dia:,.2f}\n"
-                msg += f"Total a Crédito: ${total_credito:,.2f}"
-                
-                messagebox.showinfo("Carga exitosa", msg)
-            else:
-                messagebox.showwarning("Sin datos", f"No hay ventas para {fecha}.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error procesando facturas:\n{str(e)}")
-
-    def _cargar_canceladas_otro_dia(self, fecha: str) -> list:
-        """
-        Carga facturas de días anteriores que fueron CANCELADAS el día consultado.
-        Estas son solo informativas y NO suman al total de facturas.
-        El movimiento de cancelación se hizo HOY pero la factura es de otro día.
-        """
-        # Buscar facturas que fueron creadas ANTES de hoy pero CANCELADAS hoy
-        # Usando VENTATICKETS con DEVOLUCIONES
-        sql = (
-            "SET HEADING ON;\n"
-            "SELECT V.ID, V.FOLIO, V.NOMBRE, V.SUBTOTAL, V.TOTAL, V.ESTA_CANCELADO, V.TOTAL_CREDITO, "
-            "CAST(V.CREADO_EN AS DATE) AS FECHA_CREACION, "
-            "CAST(D.DEVUELTO_EN AS DATE) AS FECHA_CANCELACION\n"
-            "FROM VENTATICKETS V\n"
-            "INNER JOIN DEVOLUCIONES D ON D.TICKET_ID = V.ID AND D.TIPO_DEVOLUCION = 'C'\n"
-            f"WHERE V.ESTA_CANCELADO = 't'\n"
-            f"AND CAST(V.CREADO_EN AS DATE) < '{fecha}'\n"
-            f"AND CAST(D.DEVUELTO_EN AS DATE) = '{fecha}'\n"  # Canceladas HOY
-            "ORDER BY V.FOLIO;\n"
-        )
-        ok, stdout, stderr = self._ejecutar_sql(sql)
-        
-        canceladas = []
-        if ok and stdout:
-            header_visto = False
-            for linea in stdout.split('\n'):
-                linea = linea.strip()
-                if not linea or linea.startswith('='):
-                    continue
-                if 'ID' in linea and 'FOLIO' in linea:
-                    header_visto = True
-                    continue
-                if not header_visto:
-                    continue
-                partes = linea.split()
-                if len(partes) < 8:
-                    continue
-                try:
-                    id_v = int(partes[0])
-                    folio_s = partes[1]
-                    if folio_s == '<null>':
-                        continue
-                    folio = int(folio_s)
-                    
-                    # Parsear campos (de derecha a izquierda)
-                    fecha_cancelacion = partes[-1] if partes[-1] != '<null>' else fecha
-                    fecha_creacion = partes[-2] if partes[-2] != '<null>' else ''
-                    total_credito = float(partes[-3]) if partes[-3] != '<null>' else 0.0
-                    total_original = float(partes[-5]) if partes[-5] != '<null>' else 0.0
-                    subtotal = float(partes[-6]) if partes[-6] != '<null>' else 0.0
-                    nombre = ' '.join(partes[2:-6]).replace('<null>', '').strip()
-                    if not nombre:
-                        nombre = 'MOSTRADOR'
-                    
-                    if folio <= 0:
-                        continue
-
-                    # Para canceladas de otro día, buscar si tiene repartidor asignado
-                    rep = obtener_repartidor_factura(folio, fecha_creacion) or ''
-                    
-                    canceladas.append({
-                        'id': id_v, 
-                        'folio': folio,
-                        'nombre': f"⚠️ {nombre}", 
-                        'subtotal': 0,  # NO suma al total (informativa)
-                        'total_original': total_original,
-                        'repartidor': rep, 
-                        'cancelada': True,
-                        'cancelada_otro_dia': True,  # Indica que es de otro día
-                        'total_credito': total_credito,
-                        'es_credito': total_credito > 0,
-                        'fecha_creacion': fecha_creacion,
-                        'fecha_cancelacion': fecha_cancelacion
-                    })
-                except (ValueError, IndexError):
-                    continue
-        
-        return canceladas
+                if estado.archivado:
+                    msg = f"📦 Día cerrado: se cargaron {len(ventas)} facturas del archivo.\n"
+                elif estado.obsoleto:
+                    hora = datetime.fromtimestamp(estado.cargado_en).strftime('%d/%m/%Y %H:%M')
+                    msg = (f"⚠️ Sin conexión a Firebird: se muestran {len(ventas)} facturas "
+                           f"de la última carga ({hora}).\n")
+                msg += f"Total Facturas: ${total_facturas:,.2f}\n"
+                msg += f"Total Canceladas: ${total_canceladas:,.2f}\n"
+                if total_canceladas_otro_dia > 0:
+                    msg += f"Total Canceladas (otro día): ${total_canceladas_otro_dia:,.2f}\n"
+                msg += f"Total a Crédito: ${total_credito:,.2f}"
+                
+                messagebox.showinfo("Carga exitosa", msg)
+            else:
+                messagebox.showwarning("Sin datos", f"No hay ventas para {estado.fecha}.")
+        except Exception as e:
+            messagebox.showerror("Error", f"Error procesando facturas:\n{str(e)}")
 
-    def _cargar_devoluciones(self, fecha: str):
-        """Carga las devoluciones del día desde la BD."""
-        sql = (
-            "SET HEADING ON;\n"
-            "SELECT ID, TICKET_ID, TOTAL_DEVUELTO, CAJERO, TIPO_DEVOLUCION\n"
-            "FROM DEVOLUCIONES\n"
-            f"WHERE CAST(DEVUELTO_EN AS DATE) = '{fecha}'\n"
-            "ORDER BY ID;\n"
+    def _on_error_carga_dia(self, error: Exception, fecha: str = None):
+        if isinstance(error, TareaCancelada):
+            return
+        if isinstance(error, ErrorCargaDia):
+            # Firebird no respondió: modo offline con la última carga buena de la fecha
+            fecha = fecha or self.ds.fecha
+            self._marcar_offline(error)
+            self.conexion.encolar(('estado_dia', fecha), lambda: self._recargar_al_reconectar(fecha))
+            estado = self._cargar_copia_local(fecha) if fecha == self.ds.fecha else None
+            if estado is not None:
+                self._on_estado_dia_cargado(estado)
+                self._actualizar_indicador_conexion()
+                return
+            messagebox.showerror("Error BD", f"No se pudo consultar:\n{error}\n\n"
+                                 "No hay copia local de esta fecha; se recargará al volver la conexión.")
+        else:
+            messagebox.showerror("Error", f"Error procesando facturas:\n{str(error)}")
+
+    def _aplicar_estado_dia(self, estado: EstadoDia):
+        """Vuelca un EstadoDia en el DataStore con una sola notificación a las pestañas."""
+        fecha = estado.fecha
+        if estado.asignaciones is not None:
+            # Día archivado: se usan las asignaciones tal como quedaron al cerrar
+            asignaciones = estado.asignaciones
+            ventas, _ = armar_ventas(estado, asignaciones, lambda folio, _fecha: asignaciones.get(folio))
+        else:
+            asignaciones = self.ds.get_asignaciones_fecha(fecha) if USE_SQLITE else {}
+            ventas, nuevos_cajero = armar_ventas(estado, asignaciones, obtener_repartidor_factura)
+            # Guardar automáticamente las asignaciones "Ticket X"/MOSTRADOR → CAJERO
+            for folio in nuevos_cajero:
+                asignar_repartidor(folio, fecha, 'CAJERO')
+
+        self.ds.set_estado_dia(
+            ventas,
+            [dict(d) for d in estado.devoluciones],
+            [dict(m) for m in estado.movimientos_entrada],
+            [dict(m) for m in estado.movimientos_salida],
+            notificar=False
         )
-        ok, stdout, stderr = self._ejecutar_sql(sql)
         
-        devoluciones = []
-        if ok and stdout:
-            header_visto = False
-            for linea in stdout.split('\n'):
-                linea = linea.strip()
-                if not linea or linea.startswith('='):
-                    continue
-                if 'ID' in linea and 'TICKET_ID' in linea:
-                    header_visto = True
-                    continue
-                if not header_visto:
-                    continue
-                partes = linea.split()
-                if len(partes) >= 5:
-                    try:
-                        dev_id = int(partes[0])
-                        ticket_id = int(partes[1]) if partes[1] != '<null>' else 0
-                        monto = float(partes[2]) if partes[2] != '<null>' else 0.0
-                        cajero = partes[3] if partes[3] != '<null>' else ''
-                        tipo = partes[4] if partes[4] != '<null>' else ''
-                        
-                        devoluciones.append({
-                            'id': dev_id,
-                            'ticket_id': ticket_id,
-                            'monto': monto,
-                            'cajero': cajero,
-                            'tipo': tipo
-                        })
-                    except (ValueError, IndexError):
-                        continue
+        # Asignar cajero que canceló como repartidor en las canceladas
+        self._asignar_cajero_cancelaciones()
         
-        self.ds.set_devoluciones(devoluciones)
+        # Devoluciones parciales (artículos devueltos sin cancelar factura)
+        self._guardar_devoluciones_parciales(fecha, estado.dev_parciales)
+
+        self.ds._notificar()
 
     def _asignar_cajero_cancelaciones(self):
         """
@@ -5232,165 +5933,22 @@ ORDER BY D.DEVUELTO_EN DESC, V.FOLIO;
                 for cajero, total in totales_efectivo_por_cajero.items():
                     print(f"   💰 {cajero}: ${total:,.2f} en cancelaciones efectivo")
 
-    def _cargar_devoluciones_parciales(self, fecha: str):
-        """Carga las devoluciones parciales de artículos desde Firebird y las guarda en SQLite.
+    def _guardar_devoluciones_parciales(self, fecha: str, dev_parciales):
+        """Guarda en SQLite las devoluciones parciales consultadas de Firebird.
         
-        Extrae: código, descripción, cantidad devuelta, precio de venta y total devuelto.
-        El Precio de Venta = DINERO_DEVUELTO / CANTIDAD_DEVUELTA (en centavos).
         Las devoluciones se asocian a la FECHA DE LA VENTA original.
+        Si la consulta falló (dev_parciales es None) se conservan las existentes.
         """
-        if not USE_SQLITE:
+        if not USE_SQLITE or dev_parciales is None:
             return
         
         # Limpiar devoluciones previas de esta fecha
         db_local.limpiar_devoluciones_parciales_fecha(fecha)
         
-        # Consultar devoluciones parciales (TIPO_DEVOLUCION = 'P')
-        # El Precio de Venta = DINERO_DEVUELTO / CANTIDAD_DEVUELTA
-        sql = f"""
-SELECT 
-    DA.DEVOLUCION_ID,
-    V.FOLIO,
-    DA.CODIGO_PRODUCTO,
-    DA.DESCRIPCION_PRODUCTO,
-    DA.CANTIDAD_DEVUELTA,
-    DA.DINERO_DEVUELTO,
-    D.DEVUELTO_EN
-FROM DEVOLUCIONES_ARTICULOS DA
-INNER JOIN DEVOLUCIONES D ON DA.DEVOLUCION_ID = D.ID
-INNER JOIN VENTATICKETS V ON DA.TICKET_ID = V.ID
-WHERE CAST(V.VENDIDO_EN AS DATE) = '{fecha}'
-AND D.TIPO_DEVOLUCION = 'P'
-ORDER BY V.FOLIO, DA.ID;
-"""
-        ok, stdout, stderr = self._ejecutar_sql(sql)
-        
-        if not ok or not stdout:
-            print(f"⚠️ No se pudieron cargar devoluciones parciales: {stderr}")
-            return
-        
-        # Parsear resultado
-        lineas = stdout.strip().split('\n')
-        datos_inicio = False
-        
-        for linea in lineas:
-            linea = linea.strip()
-            
-            # Saltar líneas vacías y separadores
-            if not linea or linea.startswith('=') or linea.startswith('-'):
-                continue
-            
-            # Detectar inicio de datos (después de la línea de encabezados)
-            if 'DEVOLUCION_ID' in linea or 'FOLIO' in linea:
-                datos_inicio = True
-                continue
-            
-            if not datos_inicio:
-                continue
-            
-            # Parsear la línea de datos
-            # Formato: DEVOLUCION_ID FOLIO CODIGO DESCRIPCION... CANTIDAD DINERO FECHA
-            partes = linea.split()
-            if len(partes) < 6:
-                continue
-            
-            try:
-                devolucion_id = int(partes[0])
-                folio = int(partes[1])
-                codigo = partes[2] if partes[2] else ""
-                
-                # Buscar la fecha al final (formato YYYY-MM-DD HH:MM:SS o similar)
-                fecha_dev = None
-                idx_fecha = -1
-                for i in range(len(partes) - 1, 2, -1):
-                    if '-' in partes[i] and len(partes[i]) >= 10:
-                        fecha_dev = partes[i][:10]  # Tomar solo la fecha
-                        idx_fecha = i
-                        break
-                
-                if idx_fecha == -1:
-                    continue
-                
-                # El dinero devuelto está antes de la fecha (en PESOS COLOMBIANOS)
-                dinero_raw = partes[idx_fecha - 1]
-                dinero = float(dinero_raw.replace(',', ''))
-                
-                # La cantidad está antes del dinero
-                cantidad_raw = partes[idx_fecha - 2]
-                cantidad = float(cantidad_raw.replace(',', ''))
-                
-                # La descripción es todo entre el código y la cantidad
-                descripcion = ' '.join(partes[3:idx_fecha - 2])
-                
-                # PRECIO DE VENTA = DINERO_DEVUELTO / CANTIDAD (ya en pesos colombianos)
-                # Ej: 48000 pesos / 10 unidades = $4,800 pesos por unidad
-                precio_venta = dinero / cantidad if cantidad > 0 else 0
-                
-                # Guardar en SQLite
-                db_local.guardar_devolucion_parcial(
-                    fecha=fecha,
-                    folio=folio,
-                    devolucion_id=devolucion_id,
-                    codigo=codigo,
-                    descripcion=descripcion.strip(),
-                    cantidad=cantidad,
-                    valor_unitario=precio_venta,
-                    dinero=dinero,
-                    fecha_devolucion=fecha_dev
-                )
-                print(f"✅ Dev: Folio {folio}, {descripcion.strip()[:25]}, Cant: {int(cantidad)}, Precio: ${precio_venta:,.0f}, Total: ${dinero:,.0f}")
-                
-            except (ValueError, IndexError) as e:
-                print(f"⚠️ Error parseando línea: {linea} - {e}")
-                continue
-
-    def _cargar_movimientos(self, fecha: str):
-        """Carga los movimientos (ingresos y salidas) del día desde la BD."""
-        sql = (
-            "SET HEADING ON;\n"
-            "SELECT ID, TIPO, MONTO, COMENTARIOS\n"
-            "FROM MOVIMIENTOS\n"
-            f"WHERE CAST(CUANDO_FUE AS DATE) = '{fecha}'\n"
-            "ORDER BY ID;\n"
-        )
-        ok, stdout, stderr = self._ejecutar_sql(sql)
-        
-        entradas = []
-        salidas = []
-        if ok and stdout:
-            header_visto = False
-            for linea in stdout.split('\n'):
-                linea = linea.strip()
-                if not linea or linea.startswith('='):
-                    continue
-                if 'ID' in linea and 'TIPO' in linea:
-                    header_visto = True
-                    continue
-                if not header_visto:
-                    continue
-                partes = linea.split()
-                if len(partes) >= 3:
-                    try:
-                        mov_id = int(partes[0])
-                        tipo = partes[1].upper()
-                        monto = float(partes[2]) if partes[2] != '<null>' else 0.0
-                        comentario = ' '.join(partes[3:]).replace('<null>', '').strip() if len(partes) > 3 else ''
-                        
-                        mov = {
-                            'id': mov_id,
-                            'tipo': tipo,
-                            'monto': monto,
-                            'comentario': comentario
-                        }
-                        
-                        if tipo == 'E':  # Entrada/Ingreso
-                            entradas.append(mov)
-                        elif tipo == 'S':  # Salida
-                            salidas.append(mov)
-                    except (ValueError, IndexError):
-                        continue
-        
-        self.ds.set_movimientos(entradas, salidas)
+        for dp in dev_parciales:
+            db_local.guardar_devolucion_parcial(fecha=fecha, **dp)
+            print(f"✅ Dev: Folio {dp['folio']}, {dp['descripcion'][:25]}, Cant: {int(dp['cantidad'])}, "
+                  f"Precio: ${dp['valor_unitario']:,.0f}, Total: ${dp['dinero']:,.0f}")
 
     def _get_repartidor_tag(self, repartidor):
         """Devuelve el tag de color según el nombre del repartidor."""
@@ -5573,20 +6131,14 @@ ORDER BY V.FOLIO, DA.ID;
         
         self.tree_asign.delete(*self.tree_asign.get_children())
         
-        # Obtener devoluciones parciales por folio para esta fecha
-        dev_parciales_por_folio = {}
+        # Obtener créditos punteados (las dev. parciales por folio ya están en el frame del día)
         creditos_punteados_folios = set()
         if USE_SQLITE and self.ds.fecha:
-            dev_parciales_por_folio = db_local.obtener_devoluciones_parciales_por_folio_fecha(self.ds.fecha)
-            # Obtener créditos punteados
             creditos_punteados = db_local.obtener_creditos_punteados_fecha(self.ds.fecha)
             creditos_punteados_folios = {c['folio'] for c in creditos_punteados}
         
-        # Variables para resumen del filtro
-        facturas_mostradas = 0
-        monto_efectivo_mostrado = 0
-        monto_canceladas_mostrado = 0
-        dev_parciales_mostradas = 0
+        # Variables para resumen del filtro (los montos salen del frame del día)
+        folios_mostrados = []
         asignadas_mostradas = 0
         sin_asignar_mostradas = 0
         canceladas_mostradas = 0
@@ -5690,16 +6242,8 @@ ORDER BY V.FOLIO, DA.ID;
                                            fecha_cancel),
                                    tags=(tag,))
             
-            # Acumular para resumen del filtro
-            facturas_mostradas += 1
-            # Separar: Efectivo (no crédito, no cancelado), Canceladas y Crédito
-            if cancelada or cancelada_otro_dia:
-                monto_canceladas_mostrado += subtotal
-            elif not es_credito:
-                # Solo facturas en efectivo (no crédito, no canceladas)
-                monto_efectivo_mostrado += subtotal
-            # Sumar devoluciones parciales de este folio si existen
-            dev_parciales_mostradas += dev_parciales_por_folio.get(folio, 0)
+            # Acumular para resumen del filtro (los conteos dependen de cambios pendientes)
+            folios_mostrados.append(folio)
             if not (cancelada or cancelada_otro_dia):
                 if repartidor:
                     asignadas_mostradas += 1
@@ -5710,9 +6254,12 @@ ORDER BY V.FOLIO, DA.ID;
             if es_credito:
                 credito_mostradas += 1
         
+        # Montos del filtro: efectivo (no crédito, no cancelado), canceladas y dev. parciales
+        totales = self.ds.frame().totales(folios=folios_mostrados)
+        
         # Actualizar resumen según filtro
-        self._actualizar_resumen_filtrado(estado_filtro, facturas_mostradas, monto_efectivo_mostrado,
-                                          monto_canceladas_mostrado, dev_parciales_mostradas, 
+        self._actualizar_resumen_filtrado(estado_filtro, len(folios_mostrados), totales['subtotal_efectivo'],
+                                          totales['subtotal_canceladas'], totales['dev_parciales'], 
                                           asignadas_mostradas, sin_asignar_mostradas,
                                           canceladas_mostradas, credito_mostradas)
     
@@ -5806,6 +6353,7 @@ ORDER BY V.FOLIO, DA.ID;
             return
         
         folio = int(valores[0])
+        cliente = str(valores[1])
         valor_actual = str(valores[4]) if valores[4] and valores[4] != '— Sin asignar' else ''
         reps_conocidos = self.ds.get_repartidores()
         
@@ -5814,7 +6362,7 @@ ORDER BY V.FOLIO, DA.ID;
         if not bbox:
             return
         
-        self._crear_editor_repartidor(folio, valor_actual, reps_conocidos, bbox)
+        self._crear_editor_repartidor(folio, valor_actual, reps_conocidos, bbox, cliente)
 
     def _on_tree_double_click(self, event):
         """Doble-clic también abre el editor (por compatibilidad)."""
@@ -5823,7 +6371,8 @@ ORDER BY V.FOLIO, DA.ID;
         if row:
             self._abrir_editor_en_fila(row)
     
-    def _crear_editor_repartidor(self, folio: int, valor_actual: str, reps_conocidos: list, bbox: tuple):
+    def _crear_editor_repartidor(self, folio: int, valor_actual: str, reps_conocidos: list, bbox: tuple,
+                                 cliente: str = ''):
         """Crea el editor de repartidor con autocompletado."""
         x, y, w, h = bbox
 
@@ -5834,8 +6383,12 @@ ORDER BY V.FOLIO, DA.ID;
             if vals and len(vals) > 4 and vals[4] and vals[4] != '— Sin asignar':
                 reps_en_uso.add(vals[4])
         
-        # Combinar: primero los usados en esta lista, luego los conocidos
-        reps_lista = sorted(reps_en_uso) + [r for r in sorted(reps_conocidos) if r not in reps_en_uso]
+        # Primero los habituales del cliente (historial), luego los usados en esta lista y los conocidos
+        sugeridos = []
+        if USE_SQLITE and cliente and self.ds.fecha:
+            sugeridos = [s['repartidor'] for s in db_local.sugerir_repartidores(cliente, self.ds.fecha)]
+        reps_lista = sugeridos + [r for r in sorted(reps_en_uso) if r not in sugeridos]
+        reps_lista += [r for r in sorted(reps_conocidos) if r not in reps_lista]
 
         # Crear Combobox flotante encima de la celda
         combo = ttk.Combobox(
@@ -5987,6 +6540,28 @@ ORDER BY V.FOLIO, DA.ID;
     # ================================================================
     # GESTIÓN DE CAMBIOS PENDIENTES EN REPARTIDORES
     # ================================================================
+    def _auto_asignar_sugeridos(self):
+        """Propone como cambios pendientes el repartidor habitual de cada folio sin asignar."""
+        if not USE_SQLITE or not self.ds.fecha:
+            return
+        sin_asignar = [v for v in self.ds.get_ventas()
+                       if not v.get('cancelada') and not (v.get('repartidor') or '')
+                       and v['folio'] not in self._cambios_pendientes]
+        sugeridos = db_local.sugerir_asignaciones(self.ds.fecha, [v.get('nombre', '') for v in sin_asignar])
+        asignados = 0
+        for v in sin_asignar:
+            repartidor = sugeridos.get(v.get('nombre', ''))
+            if repartidor:
+                self._registrar_cambio_pendiente(v['folio'], repartidor, '')
+                asignados += 1
+        if asignados:
+            messagebox.showinfo("Auto-asignar",
+                                f"Se sugirió repartidor para {asignados} de {len(sin_asignar)} facturas sin asignar.\n"
+                                "Revisa los cambios y presiona GUARDAR.")
+        else:
+            messagebox.showinfo("Auto-asignar",
+                                "No hay sugerencias confiables para las facturas sin asignar.")
+
     def _registrar_cambio_pendiente(self, folio: int, nuevo_valor: str, valor_original: str):
         """Registra un cambio pendiente de repartidor y actualiza la UI."""
         # Si el nuevo valor es igual al original guardado, eliminar de pendientes
@@ -7223,18 +7798,20 @@ ORDER BY V.FOLIO, DA.ID;
         # CALCULAR TODOS LOS TOTALES
         # ═══════════════════════════════════════════════════════════════════════
         
+        # Todos los totales de las ventas mostradas salen de una sola reducción columnar
+        totales_ventas = FrameDia(ventas, dev_parciales=dev_parciales_por_folio, ajustes=ajustes_por_folio,
+                                  punteados=creditos_punteados_folios,
+                                  no_entregados=no_entregados_folios).totales()
+        
         # 1. Total de TODAS las facturas del día (por fecha de venta) - canceladas + no canceladas
         # Esto debe coincidir con el corte de caja de Firebird
-        total_todas_facturas = sum(v.get('total_original', v['subtotal']) for v in ventas 
-                                   if not v.get('cancelada_otro_dia', False))
+        total_todas_facturas = totales_ventas['total_todas_facturas']
         
         # 2. Total Canceladas del mismo día (valor original de facturas canceladas con fecha de hoy)
-        total_canceladas = sum(v.get('total_original', 0) for v in ventas 
-                               if v.get('cancelada', False) and not v.get('cancelada_otro_dia', False))
+        total_canceladas = totales_ventas['total_canceladas']
         
         # 3. Total Canceladas de otro día (facturas de otros días canceladas hoy)
-        total_canceladas_otro_dia = sum(v.get('total_original', 0) for v in ventas 
-                                        if v.get('cancelada_otro_dia', False))
+        total_canceladas_otro_dia = totales_ventas['total_canceladas_otro_dia']
         
         # 4. Total Canceladas General = Canceladas + Canceladas otro día
         total_canceladas_general = total_canceladas + total_canceladas_otro_dia
@@ -7251,73 +7828,24 @@ ORDER BY V.FOLIO, DA.ID;
         total_mas_cancel = total_todas_facturas
         
         # 8. Total a Crédito (facturas con crédito, de las válidas/no canceladas)
-        total_credito = sum(v.get('total_credito', 0) for v in ventas if v.get('es_credito', False) and not v.get('cancelada', False))
+        total_credito = totales_ventas['total_credito_vigente']
         
-        # 9. Total en Efectivo = Total Vendido - Total a Crédito
-        total_efectivo = total_vendido - total_credito
-        
-        # 10. Total Créditos Punteados (desde SQLite) - dinámico según filtro
-        total_creditos_punteados = 0
-        if USE_SQLITE and self.ds.fecha:
-            if filtro and filtro not in ("(Todos)", "(Sin Asignar)"):
-                # Filtro específico: solo créditos punteados de los folios del repartidor
-                folios_repartidor = [v['folio'] for v in ventas]
-                total_creditos_punteados = db_local.obtener_total_creditos_punteados_por_folios(self.ds.fecha, folios_repartidor)
-            else:
-                # Sin filtro: todos los créditos punteados
-                total_creditos_punteados = db_local.obtener_total_creditos_punteados(self.ds.fecha)
-        
-        # 10b. Total No Entregados (desde SQLite) - dinámico según filtro
-        total_no_entregados = 0
-        if USE_SQLITE and self.ds.fecha:
-            if filtro and filtro not in ("(Todos)", "(Sin Asignar)"):
-                # Filtro específico: solo no entregados de los folios del repartidor
-                folios_repartidor = [v['folio'] for v in ventas]
-                total_no_entregados = db_local.obtener_total_no_entregados_por_folios(self.ds.fecha, folios_repartidor)
-            else:
-                # Sin filtro: todos los no entregados
-                total_no_entregados = db_local.obtener_total_no_entregados(self.ds.fecha)
-        
-        # Filtro para gastos: solo aplica si es un repartidor específico
+        # 10-18. Punteados, no entregados, descuentos, gastos, pagos y conteos salen del
+        # motor de liquidación (mismo cálculo que se guarda y que usan los reportes)
         filtro_gastos = filtro if filtro and filtro not in ("(Todos)", "(Sin Asignar)") else ''
-        
-        # 11. Total Ajustes de Precios (tipo 'ajuste' en descuentos)
-        total_ajustes = self.ds.get_total_ajustes(filtro_gastos)
-        
-        # 12. Total Gastos de repartidores (excluyendo cajero)
-        total_gastos = self.ds.get_total_gastos_repartidores(filtro_gastos)
-        
-        # 12b. Total Gastos de Cajero
-        total_gastos_cajero = self.ds.get_total_gastos_cajero(filtro_gastos)
-        
-        # 13. Pago a Proveedores (desde SQLite)
-        total_pago_proveedores = self.ds.get_total_pagos_proveedores(filtro_gastos)
-        
-        # 14. Préstamos (desde SQLite)
-        total_prestamos = self.ds.get_total_prestamos(filtro_gastos)
-        
-        # 15. Ingresos extras y Salidas (DataStore - movimientos generales)
-        total_ingresos = self.ds.get_total_ingresos_extras()
-        total_salidas = self.ds.get_total_salidas()
-        
-        # 16. Pagos de Nómina (desde SQLite)
-        total_pago_nomina = self.ds.get_total_pagos_nomina(filtro_gastos)
-        
-        # 17. Pagos a Socios (desde SQLite)
-        total_pago_socios = self.ds.get_total_pagos_socios(filtro_gastos)
-        
-        # 18. Transferencias (desde SQLite)
-        total_transferencias = self.ds.get_total_transferencias(filtro_gastos)
-        
-        # ═══════════════════════════════════════════════════════════════════════
-        # CÁLCULOS FINALES
-        # ═══════════════════════════════════════════════════════════════════════
-        
-        # Total Después de Ajustes = Efectivo - Ajustes de Precios  
-        total_despues_ajustes = total_efectivo - total_ajustes
-        
-        # NETO A ENTREGAR = Total Después Ajustes + Ingresos - Gastos - Gastos Cajero - Pago Proveedores - Préstamos - Nómina - Socios - Transferencias - Salidas
-        neto = total_despues_ajustes + total_ingresos - total_gastos - total_gastos_cajero - total_pago_proveedores - total_prestamos - total_pago_nomina - total_pago_socios - total_transferencias - total_salidas
+        self.motor_liquidacion.invalidar(self.ds.fecha)
+        res = self.motor_liquidacion.calcular(self.ds.fecha, filtro_gastos)
+        res_general = self.motor_liquidacion.calcular(self.ds.fecha) if filtro_gastos else res
+        total_creditos_punteados = res.total_creditos_punteados
+        total_no_entregados = res.total_no_entregados
+        total_ajustes = res.total_ajustes
+        total_gastos = res.total_gastos
+        total_gastos_cajero = res.total_gastos_cajero
+        total_pago_proveedores = res.total_pago_proveedores
+        total_prestamos = res.total_prestamos
+        total_pago_nomina = res.total_pago_nomina
+        total_pago_socios = res.total_pago_socios
+        total_transferencias = res.total_transferencias
 
         # ═══════════════════════════════════════════════════════════════════════
         # ACTUALIZAR LABELS
@@ -7333,7 +7861,7 @@ ORDER BY V.FOLIO, DA.ID;
         self.lbl_total_socios_desc.config(text=f"${total_pago_socios:,.2f}")  # Socios
         self.lbl_total_transferencias_desc.config(text=f"${total_transferencias:,.2f}")  # Transferencias
         # Total Descuentos = Ajustes + Gastos + Gastos Cajero + Proveedores + Préstamos + Nómina + Socios + Transferencias
-        total_descuentos_col2 = total_ajustes + total_gastos + total_gastos_cajero + total_pago_proveedores + total_prestamos + total_pago_nomina + total_pago_socios + total_transferencias
+        total_descuentos_col2 = res.total_descuentos
         self.lbl_total_devoluciones.config(text=f"${total_descuentos_col2:,.2f}")
         
         # COLUMNA 2: CUADRE GENERAL
@@ -7347,30 +7875,10 @@ ORDER BY V.FOLIO, DA.ID;
                 total_dinero_caja = 0
         self.lbl_total_dinero_cuadre.config(text=f"${total_dinero_caja:,.2f}")
         
-        # Para CUADRE GENERAL: calcular Total Descuentos de TODOS (sin filtro de repartidor)
-        total_ajustes_general = self.ds.get_total_ajustes('')
-        total_gastos_general = self.ds.get_total_gastos_repartidores('')
-        total_gastos_cajero_general = self.ds.get_total_gastos_cajero('')
-        total_pago_proveedores_general = self.ds.get_total_pagos_proveedores('')
-        total_prestamos_general = self.ds.get_total_prestamos('')
-        total_pago_nomina_general = self.ds.get_total_pagos_nomina()
-        total_pago_socios_general = self.ds.get_total_pagos_socios()
-        total_transferencias_general = self.ds.get_total_transferencias()
-        
-        total_descuentos_cuadre_general = (total_ajustes_general + total_gastos_general + 
-                                           total_gastos_cajero_general + total_pago_proveedores_general + 
-                                           total_prestamos_general + total_pago_nomina_general + 
-                                           total_pago_socios_general + total_transferencias_general)
-        
-        # Créditos punteados general (sin filtro)
-        total_creditos_punteados_general = 0
-        if USE_SQLITE and self.ds.fecha:
-            total_creditos_punteados_general = db_local.obtener_total_creditos_punteados(self.ds.fecha)
-        
-        # No entregados general (sin filtro)
-        total_no_entregados_general = 0
-        if USE_SQLITE and self.ds.fecha:
-            total_no_entregados_general = db_local.obtener_total_no_entregados(self.ds.fecha)
+        # Para CUADRE GENERAL: Total Descuentos de TODOS (sin filtro de repartidor)
+        total_descuentos_cuadre_general = res_general.total_descuentos
+        total_creditos_punteados_general = res_general.total_creditos_punteados
+        total_no_entregados_general = res_general.total_no_entregados
         
         self.lbl_total_desc_cuadre.config(text=f"${total_descuentos_cuadre_general:,.2f}")
         self.lbl_total_creditos_punteados.config(text=f"${total_creditos_punteados_general:,.2f}")
@@ -7383,7 +7891,7 @@ ORDER BY V.FOLIO, DA.ID;
         
         # CONTEO DE DINERO Y DIFERENCIA EN CUADRE GENERAL
         # Obtener total de conteo de dinero para el cuadre (SIN filtro, todos los repartidores)
-        total_conteo_cuadre = self.ds.get_total_dinero('')  # Sin filtro para obtener el total general
+        total_conteo_cuadre = res_general.dinero_contado
         self.lbl_conteo_dinero_cuadre.config(text=f"${total_conteo_cuadre:,.2f}")
         
         # La diferencia se calculará después cuando se cargue el corte cajero
@@ -7391,20 +7899,11 @@ ORDER BY V.FOLIO, DA.ID;
         
         # COLUMNA 3: CUADRE REPARTIDOR
         # Obtener total de conteo de dinero
-        filtro_dinero = filtro if filtro and filtro not in ("(Todos)", "(Sin Asignar)") else ''
-        total_conteo_dinero = self.ds.get_total_dinero(filtro_dinero)
+        total_conteo_dinero = res.dinero_contado
         self.lbl_conteo_dinero_resultado.config(text=f"${total_conteo_dinero:,.2f}")
         
-        # Monto Facturas: pintar el valor de la etiqueta "Monto Efectivo" de TOTALES
-        # Forzar actualización de UI para asegurar que el valor esté sincronizado
-        self.ventana.update_idletasks()
-        monto_facturas_resultado = 0
-        if hasattr(self, 'lbl_monto_efectivo_asign'):
-            try:
-                texto_monto = self.lbl_monto_efectivo_asign.cget("text")
-                monto_facturas_resultado = float(texto_monto.replace("$", "").replace(",", ""))
-            except (ValueError, AttributeError):
-                monto_facturas_resultado = 0
+        # Monto Facturas: subtotal en efectivo de las facturas válidas del filtro
+        monto_facturas_resultado = res.monto_facturas
         
         self.lbl_monto_facturas_resultado.config(text=f"${monto_facturas_resultado:,.2f}",
                                                   foreground="#2e7d32" if monto_facturas_resultado >= 0 else "#c62828")
@@ -7419,13 +7918,13 @@ ORDER BY V.FOLIO, DA.ID;
         self.lbl_no_entreg_resultado.config(text=f"${total_no_entregados:,.2f}")
         
         # TOTAL DINERO A ENTREGAR = Monto Facturas - Total Descuentos - Créditos Punteados - No Entregados
-        total_dinero_entregar = monto_facturas_resultado - total_descuentos_col2 - total_creditos_punteados - total_no_entregados
+        total_dinero_entregar = res.neto
         
         self.lbl_neto.config(text=f"${total_dinero_entregar:,.2f}",
                              foreground="#2e7d32" if total_dinero_entregar >= 0 else "#c62828")
 
         # Diferencia con dinero contado
-        diferencia = total_conteo_dinero - total_dinero_entregar
+        diferencia = res.diferencia
         if abs(diferencia) < 0.01:
             self.lbl_diferencia_global.config(text="$0.00 ✓", foreground="#2e7d32")
         elif diferencia > 0:
@@ -7485,136 +7984,173 @@ ORDER BY V.FOLIO, DA.ID;
     
     def _actualizar_corte_cajero_async(self):
         """
-        Versión asíncrona que ejecuta la consulta en un hilo separado
+        Versión asíncrona que ejecuta la consulta en el executor compartido
         para no bloquear la interfaz gráfica.
         Obtiene el corte COMBINADO de TODOS los turnos del día.
+        Llamadas repetidas para la misma fecha reutilizan la consulta en vuelo.
         """
-        import threading
+        fdb_path = self.ruta_fdb
+        # Usar la fecha seleccionada o la actual
+        fecha = self.ds.fecha if hasattr(self.ds, 'fecha') and self.ds.fecha else None
+        
+        # Corte ya consultado para este día (caché de días): aplicar sin ir a Firebird
+        estado = self.cache_dias.get(fecha, tocar=False) if fecha else None
+        if estado is not None and estado.corte is not None and self.cache_dias.es_fresco(estado):
+            corte, turno_id, num_turnos = estado.corte
+            self._aplicar_datos_corte(corte, turno_id, num_turnos)
+            return
         
-        def cargar_en_hilo():
-            try:
-                from corte_cajero import CorteCajeroManager
-                import database_local as db
-                
-                # Usar la misma ruta FDB que el resto de la app (self.ruta_fdb)
-                fdb_path = self.ruta_fdb
-                print(f"[Corte Cajero] Usando FDB: {fdb_path}")
-                
-                if not fdb_path or not os.path.exists(fdb_path):
-                    print(f"[Corte Cajero] ERROR: FDB no encontrado: {fdb_path}")
-                    self.ventana.after(0, lambda: self._mostrar_error_corte_cajero("FDB no configurado"))
+        def on_ok(resultado):
+            if fecha and resultado is not None:
+                self._on_corte_consultado(fecha, resultado)
+            if fecha != (self.ds.fecha or None):
+                return  # Cambió la fecha mientras se consultaba
+            if resultado is None:
+                if not self.conexion.en_linea and self._aplicar_corte_local(fecha):
                     return
-                
-                manager = CorteCajeroManager(db_path=fdb_path)
-                
-                # Usar la fecha seleccionada o la actual
-                fecha = self.ds.fecha if hasattr(self.ds, 'fecha') and self.ds.fecha else None
-                print(f"[Corte Cajero] Fecha: {fecha}")
-                
-                if fecha:
-                    # Primero intentar obtener turnos del día
-                    print(f"[Corte Cajero] Buscando turnos para fecha: {fecha}")
-                    turnos = manager.obtener_todos_turnos_por_fecha(fecha)
-                    print(f"[Corte Cajero] Turnos encontrados: {turnos}")
-                    
-                    if turnos:
-                        # Hay turnos para esta fecha, usar método por turno
-                        print(f"[Corte Cajero] Obteniendo corte completo por turnos...")
-                        corte = manager.obtener_corte_completo_por_fecha(fecha)
-                        turno_id = turnos[-1]
-                        num_turnos = len(turnos)
-                    else:
-                        # NO hay turnos para esta fecha - usar método por FECHA DE VENTAS
-                        # Esto resuelve el caso donde el cajero dejó el turno abierto de un día anterior
-                        print(f"[Corte Cajero] No hay turnos, usando método por fecha de ventas...")
-                        corte = manager.obtener_corte_por_fecha_ventas(fecha)
-                        turno_id = 0
-                        num_turnos = 0
-                    
-                    if corte is None:
-                        print(f"[Corte Cajero] No se encontraron datos para la fecha {fecha}")
-                        self.ventana.after(0, self._limpiar_corte_cajero)
-                        return
-                else:
-                    # Sin fecha, usar turno actual
-                    turno_id = manager.obtener_turno_actual()
-                    if turno_id is None:
-                        turno_id = manager.obtener_ultimo_turno()
-                    
-                    if turno_id is None:
-                        self.ventana.after(0, self._limpiar_corte_cajero)
-                        return
-                    
-                    corte = manager.obtener_corte_por_turno(turno_id)
-                    num_turnos = 1
+                self._limpiar_corte_cajero()
+                return
+            corte, turno_id, num_turnos = resultado
+            self._aplicar_datos_corte(corte, turno_id, num_turnos)
+        
+        def on_error(e):
+            if fecha and not self.conexion.en_linea:
+                self.conexion.encolar(('corte', fecha), self._actualizar_corte_cajero_async)
+                if self._aplicar_corte_local(fecha):
+                    return
+            # Mostrar el error en la interfaz
+            self._mostrar_error_corte_cajero(str(e))
+            if not isinstance(e, ErrorCargaDia):
+                self._limpiar_corte_cajero()
+        
+        self.executor.submit(
+            self._consultar_corte_cajero, fdb_path, fecha,
+            cola='firebird', prioridad=PRIORIDAD_UI, clave=('corte', fdb_path, fecha),
+            on_ok=on_ok, on_error=on_error
+        )
+    
+    def _on_corte_consultado(self, fecha: str, resultado):
+        """Asocia el corte consultado al día en caché y actualiza su copia local."""
+        if resultado is None:
+            return
+        self.cache_dias.set_corte(fecha, resultado)
+        self._persistir_estado_local(fecha)
+
+    def _aplicar_corte_local(self, fecha: str) -> bool:
+        """Modo offline: muestra el corte de la copia local del día, si existe."""
+        estado = self.cache_dias.get(fecha, tocar=False)
+        if estado is None or estado.corte is None:
+            return False
+        corte, turno_id, num_turnos = estado.corte
+        self._aplicar_datos_corte(corte, turno_id, num_turnos)
+        return True
+
+    def _consultar_corte_cajero(self, fdb_path: str, fecha: str):
+        """
+        Consulta el corte en segundo plano (NO toca widgets).
+        Retorna (corte, turno_id, num_turnos) o None si no hay datos.
+        """
+        try:
+            from corte_cajero import CorteCajeroManager
+            import database_local as db
+            
+            print(f"[Corte Cajero] Usando FDB: {fdb_path}")
+            
+            if not fdb_path or not os.path.exists(fdb_path):
+                print(f"[Corte Cajero] ERROR: FDB no encontrado: {fdb_path}")
+                raise ErrorCargaDia("FDB no configurado")
+            
+            manager = CorteCajeroManager(db_path=fdb_path)
+            print(f"[Corte Cajero] Fecha: {fecha}")
+            
+            resumen_cancel = None
+            if fecha:
+                # Turnos, corte (por turnos o, sin turnos del día, por FECHA DE VENTAS)
+                # y cancelaciones por usuario en un solo viaje a Firebird
+                corte_dia = manager.obtener_corte_dia(fecha)
+                print(f"[Corte Cajero] Turnos encontrados: {corte_dia.turnos}")
+                corte = corte_dia.corte
+                turno_id = corte_dia.turno_id
+                num_turnos = corte_dia.num_turnos
+                resumen_cancel = corte_dia.cancelaciones_por_usuario
                 
                 if corte is None:
-                    self.ventana.after(0, self._limpiar_corte_cajero)
-                    return
+                    print(f"[Corte Cajero] No se encontraron datos para la fecha {fecha}")
+                    return None
+            else:
+                # Sin fecha, usar turno actual
+                turno_id = manager.obtener_turno_actual()
+                if turno_id is None:
+                    turno_id = manager.obtener_ultimo_turno()
                 
-                # ═══════════════════════════════════════════════════════════
-                # GUARDAR EN SQLite - Persistir los datos del corte cajero
-                # ═══════════════════════════════════════════════════════════
-                datos_guardar = {
-                    'dinero_en_caja': {
-                        'fondo_de_caja': corte.dinero_en_caja.fondo_de_caja,
-                        'ventas_en_efectivo': corte.dinero_en_caja.ventas_en_efectivo,
-                        'abonos_en_efectivo': corte.dinero_en_caja.abonos_en_efectivo,
-                        'entradas': corte.dinero_en_caja.entradas,
-                        'salidas': corte.dinero_en_caja.salidas,
-                        'devoluciones_en_efectivo': corte.dinero_en_caja.devoluciones_en_efectivo,
-                        'total': corte.dinero_en_caja.total
-                    },
-                    'ventas': {
-                        'ventas_efectivo': corte.ventas.ventas_efectivo,
-                        'ventas_tarjeta': corte.ventas.ventas_tarjeta,
-                        'ventas_credito': corte.ventas.ventas_credito,
-                        'ventas_vales': corte.ventas.ventas_vales,
-                        'devoluciones_ventas': corte.ventas.devoluciones_ventas,
-                        'total': corte.ventas.total
-                    },
-                    'devoluciones_por_forma_pago': corte.ventas.devoluciones_por_forma_pago,
-                    'ganancia': corte.ganancia,
-                    'num_turnos': num_turnos
-                }
+                if turno_id is None:
+                    return None
+                
+                corte = manager.obtener_corte_por_turno(turno_id)
+                num_turnos = 1
+            
+            if corte is None:
+                return None
+            
+            # ═══════════════════════════════════════════════════════════
+            # GUARDAR EN SQLite - Persistir los datos del corte cajero
+            # ═══════════════════════════════════════════════════════════
+            datos_guardar = {
+                'dinero_en_caja': {
+                    'fondo_de_caja': corte.dinero_en_caja.fondo_de_caja,
+                    'ventas_en_efectivo': corte.dinero_en_caja.ventas_en_efectivo,
+                    'abonos_en_efectivo': corte.dinero_en_caja.abonos_en_efectivo,
+                    'entradas': corte.dinero_en_caja.entradas,
+                    'salidas': corte.dinero_en_caja.salidas,
+                    'devoluciones_en_efectivo': corte.dinero_en_caja.devoluciones_en_efectivo,
+                    'total': corte.dinero_en_caja.total
+                },
+                'ventas': {
+                    'ventas_efectivo': corte.ventas.ventas_efectivo,
+                    'ventas_tarjeta': corte.ventas.ventas_tarjeta,
+                    'ventas_credito': corte.ventas.ventas_credito,
+                    'ventas_vales': corte.ventas.ventas_vales,
+                    'devoluciones_ventas': corte.ventas.devoluciones_ventas,
+                    'total': corte.ventas.total
+                },
+                'devoluciones_por_forma_pago': corte.ventas.devoluciones_por_forma_pago,
+                'ganancia': corte.ganancia,
+                'num_turnos': num_turnos
+            }
 
-                db.guardar_corte_cajero(self.ds.fecha, turno_id, datos_guardar)
+            db.guardar_corte_cajero(fecha, turno_id, datos_guardar)
 
-                # Guardar resumen de cancelaciones por usuario en SQLite
+            # Guardar resumen de cancelaciones por usuario en SQLite
+            if resumen_cancel is None:
                 from corte_cajero import obtener_cancelaciones_por_usuario
-                resumen_cancel = obtener_cancelaciones_por_usuario(self.ds.fecha)
-                db.guardar_cancelaciones_usuario(self.ds.fecha, resumen_cancel)
+                resumen_cancel = obtener_cancelaciones_por_usuario(fecha)
+            db.guardar_cancelaciones_usuario(fecha, resumen_cancel)
 
-                # ═══════════════════════════════════════════════════════════
-                # DETECTAR Y GUARDAR BUGS DE ELEVENTA
-                # ═══════════════════════════════════════════════════════════
-                try:
-                    from utils_devoluciones import detectar_bugs_devoluciones
-                    bugs_info = detectar_bugs_devoluciones(self.ds.fecha)
-                    if bugs_info and bugs_info.get('total_bugs', 0) > 0:
-                        db.guardar_bugs_eleventa_lote(self.ds.fecha, bugs_info.get('bugs', []))
-                        print(f"[Bugs Eleventa] Detectados {len(bugs_info.get('bugs', []))} bugs, total: ${bugs_info.get('total_bugs', 0):,.2f}")
-                    else:
-                        # Limpiar bugs previos si ya no hay bugs
-                        db.guardar_bugs_eleventa_lote(self.ds.fecha, [])
-                        print(f"[Bugs Eleventa] Sin bugs detectados para {self.ds.fecha}")
-                except Exception as bug_err:
-                    print(f"⚠️ Error al detectar bugs Eleventa: {bug_err}")
-
-                # Actualizar GUI en el hilo principal (pasar turno_id y num_turnos para mostrar)
-                self.ventana.after(0, lambda t=turno_id, c=corte, n=num_turnos: self._aplicar_datos_corte(c, t, n))
-                
-            except Exception as e:
-                import traceback
-                print(f"⚠️ Error al cargar corte cajero: {e}")
-                traceback.print_exc()
-                # Mostrar el error en la interfaz
-                self.ventana.after(0, lambda err=str(e): self._mostrar_error_corte_cajero(err))
-                self.ventana.after(0, self._limpiar_corte_cajero)
-        
-        # Ejecutar en hilo separado
-        hilo = threading.Thread(target=cargar_en_hilo, daemon=True)
-        hilo.start()
+            # ═══════════════════════════════════════════════════════════
+            # DETECTAR Y GUARDAR BUGS DE ELEVENTA
+            # ═══════════════════════════════════════════════════════════
+            try:
+                from utils_devoluciones import detectar_bugs_devoluciones
+                bugs_info = detectar_bugs_devoluciones(fecha)
+                if bugs_info and bugs_info.get('total_bugs', 0) > 0:
+                    db.guardar_bugs_eleventa_lote(fecha, bugs_info.get('bugs', []))
+                    print(f"[Bugs Eleventa] Detectados {len(bugs_info.get('bugs', []))} bugs, total: ${bugs_info.get('total_bugs', 0):,.2f}")
+                else:
+                    # Limpiar bugs previos si ya no hay bugs
+                    db.guardar_bugs_eleventa_lote(fecha, [])
+                    print(f"[Bugs Eleventa] Sin bugs detectados para {fecha}")
+            except Exception as bug_err:
+                print(f"⚠️ Error al detectar bugs Eleventa: {bug_err}")
+
+            return corte, turno_id, num_turnos
+            
+        except ErrorCargaDia:
+            raise
+        except Exception as e:
+            import traceback
+            print(f"⚠️ Error al cargar corte cajero: {e}")
+            traceback.print_exc()
+            raise
     
     def _aplicar_datos_corte(self, corte, turno_id=None, num_turnos=1):
         """Aplica los datos del corte a los labels de la GUI."""
@@ -8412,7 +8948,8 @@ ORDER BY V.FOLIO, DA.ID;
         
         self.tree_buscar.bind("<Control-c>", lambda e: self._copiar_seleccion_tree(self.tree_buscar))
         self.tree_buscar.bind("<<TreeviewSelect>>", self._on_tree_buscar_select)
-        self.buscar_var.trace_add("write", lambda *a: self._filtrar_resultados())
+        self.buscar_var.trace_add(
+            "write", lambda *a: self._programar("filtrar_descuentos", DEBOUNCE_BUSQUEDA_MS, self._filtrar_resultados))
 
         # --- DATOS FACTURA ---
         frame_fac = ttk.LabelFrame(frame_izq, text="🧾 FACTURA SELECCIONADA", padding=8)
@@ -8861,51 +9398,18 @@ ORDER BY V.FOLIO, DA.ID;
             messagebox.showerror("Error", "No se pudo eliminar el descuento.")
 
     def _cargar_productos_factura(self, folio: int):
-        """Carga los productos de una factura desde la BD."""
+        """Carga los productos de una factura (precargados del día o desde la BD)."""
         self.tree_productos.delete(*self.tree_productos.get_children())
         
-        # Consulta correcta usando VENTATICKETS_ARTICULOS
-        sql = (
-            "SET HEADING ON;\n"
-            "SELECT VA.PRODUCTO_NOMBRE, VA.CANTIDAD, VA.PRECIO_FINAL\n"
-            "FROM VENTATICKETS_ARTICULOS VA\n"
-            "INNER JOIN VENTATICKETS V ON VA.TICKET_ID = V.ID\n"
-            f"WHERE V.FOLIO = {folio}\n"
-            "ORDER BY VA.PRODUCTO_NOMBRE;\n"
-        )
-        
-        ok, stdout, stderr = self._ejecutar_sql(sql)
-        if not ok:
+        lineas, error = productos_factura(self._ejecutar_sql, folio)
+        if error:
             return
         
-        header_visto = False
-        for linea in stdout.split('\n'):
-            linea = linea.strip()
-            if not linea or linea.startswith('='):
-                continue
-            if 'PRODUCTO_NOMBRE' in linea and 'CANTIDAD' in linea:
-                header_visto = True
-                continue
-            if not header_visto:
-                continue
-            
-            partes = linea.split()
-            if len(partes) < 3:
-                continue
-            
-            try:
-                # Precio en pesos colombianos (NO dividir por 100)
-                precio = float(partes[-1])
-                cantidad = float(partes[-2])
-                nombre = ' '.join(partes[:-2]).replace('<null>', '').strip()
-                
-                if nombre:
-                    self.tree_productos.insert("", tk.END,
-                                              values=(nombre, 
-                                                     f"{cantidad:.0f}",
-                                                     f"${precio:,.0f}"))
-            except (ValueError, IndexError):
-                continue
+        for linea in lineas:
+            self.tree_productos.insert("", tk.END,
+                                      values=(linea['nombre'],
+                                             f"{linea['cantidad']:.0f}",
+                                             f"${linea['precio']:,.0f}"))
 
     def _on_producto_seleccionado(self, event=None):
         """Al seleccionar un producto de la lista, llena los campos del formulario de ajuste."""
@@ -9930,8 +10434,7 @@ ORDER BY V.FOLIO, DA.ID;
         ])
     ]
     # Lista plana de valores para iterar en orden
-    _VALORES_ORDEN = [100000, 50000, 20000, 10000, 5000, 2000,
-                      1000, 500, 200, 100, 50]
+    _VALORES_ORDEN = VALORES_ORDEN
 
     def _crear_tab_dinero(self):
         # Colores del modo oscuro
@@ -10701,139 +11204,7 @@ ORDER BY V.FOLIO, DA.ID;
 
     def _obtener_datos_auditoria(self, fecha):
         """Obtiene todos los datos necesarios para la auditoría"""
-        import subprocess
-        import os
-        import shutil
-
-        isql_path = "/opt/firebird/bin/isql"
-        original_db = os.path.join(os.path.dirname(__file__), "PDVDATA.FDB")
-        user_id = os.getuid()
-        tmp_db = f"/tmp/PDVDATA_{user_id}.FDB"
-
-        # Copiar BD si no existe
-        if not os.path.exists(tmp_db):
-            shutil.copy2(original_db, tmp_db)
-            os.chmod(tmp_db, 0o666)
-
-        dsn = f"localhost:{tmp_db}"
-
-        def ejecutar_sql(sql):
-            cmd = [isql_path, "-u", "SYSDBA", "-p", "masterkey", "-ch", "UTF8", dsn]
-            proc = subprocess.run(cmd, input=sql, capture_output=True, text=True)
-            return proc.stdout
-
-        # 1. Total de facturas del día (TODAS)
-        sql_total = f"""
-        SET HEADING ON;
-        SELECT COUNT(*) AS TOTAL_FACTURAS, 
-               COALESCE(SUM(TOTAL), 0) AS TOTAL_MONTO
-        FROM FACTURAS 
-        WHERE CAST(FECHA AS DATE) = '{fecha}';
-        """
-
-        # 2. Facturas canceladas del mismo día
-        sql_canceladas_dia = f"""
-        SET HEADING ON;
-        SELECT COUNT(*) AS CANCELADAS_DIA,
-               COALESCE(SUM(TOTAL), 0) AS MONTO_CANCELADAS
-        FROM FACTURAS 
-        WHERE CAST(FECHA AS DATE) = '{fecha}'
-        AND CANCELADO = 1;
-        """
-
-        # 3. Facturas NO canceladas del día
-        sql_no_canceladas = f"""
-        SET HEADING ON;
-        SELECT COUNT(*) AS NO_CANCELADAS,
-               COALESCE(SUM(TOTAL), 0) AS MONTO_NO_CANCELADAS
-        FROM FACTURAS 
-        WHERE CAST(FECHA AS DATE) = '{fecha}'
-        AND (CANCELADO = 0 OR CANCELADO IS NULL);
-        """
-
-        # 4. Facturas de OTRO día canceladas EN esta fecha
-        sql_cancel_otro_dia = f"""
-        SET HEADING ON;
-        SELECT F.FOLIO, F.TOTAL, CAST(F.FECHA AS DATE) AS FECHA_CREACION,
-               CAST(F.CANCELADO_FECHA AS DATE) AS FECHA_CANCELACION
-        FROM FACTURAS F
-        WHERE CAST(F.CANCELADO_FECHA AS DATE) = '{fecha}'
-        AND CAST(F.FECHA AS DATE) <> '{fecha}'
-        AND F.CANCELADO = 1
-        ORDER BY F.FOLIO;
-        """
-
-        # 5. Detalle de facturas canceladas del día
-        sql_detalle_cancel = f"""
-        SET HEADING ON;
-        SELECT F.FOLIO, F.TOTAL, F.CLIENTE, F.FORMAPAGO
-        FROM FACTURAS F
-        WHERE CAST(F.FECHA AS DATE) = '{fecha}'
-        AND F.CANCELADO = 1
-        ORDER BY F.FOLIO;
-        """
-
-        # 6. Resumen por forma de pago (NO canceladas)
-        sql_por_formapago = f"""
-        SET HEADING ON;
-        SELECT FORMAPAGO, COUNT(*) AS CANTIDAD, COALESCE(SUM(TOTAL), 0) AS MONTO
-        FROM FACTURAS
-        WHERE CAST(FECHA AS DATE) = '{fecha}'
-        AND (CANCELADO = 0 OR CANCELADO IS NULL)
-        GROUP BY FORMAPAGO
-        ORDER BY FORMAPAGO;
-        """
-
-        # Ejecutar todas las consultas
-        result_total = ejecutar_sql(sql_total)
-        result_cancel_dia = ejecutar_sql(sql_canceladas_dia)
-        result_no_cancel = ejecutar_sql(sql_no_canceladas)
-        result_otro_dia = ejecutar_sql(sql_cancel_otro_dia)
-        result_detalle = ejecutar_sql(sql_detalle_cancel)
-        result_formapago = ejecutar_sql(sql_por_formapago)
-
-        # Parsear resultados
-        def parsear_numeros(texto, num_valores=2):
-            lineas = [l.strip() for l in texto.strip().split('\n') if l.strip() and not l.startswith('=')]
-            for linea in lineas:
-                if any(c.isdigit() for c in linea):
-                    partes = linea.split()
-                    valores = []
-                    for p in partes:
-                        try:
-                            valores.append(float(p.replace(',', '')))
-                        except:
-                            pass
-                    if len(valores) >= num_valores:
-                        return valores[:num_valores]
-            return [0] * num_valores
-
-        def parsear_tabla(texto):
-            lineas = [l for l in texto.strip().split('\n') if l.strip() and not l.startswith('=')]
-            filas = []
-            for linea in lineas:
-                if any(c.isdigit() for c in linea):
-                    filas.append(linea)
-            return filas
-
-        total_facturas, monto_total = parsear_numeros(result_total)
-        cancel_dia, monto_cancel = parsear_numeros(result_cancel_dia)
-        no_cancel, monto_no_cancel = parsear_numeros(result_no_cancel)
-
-        return {
-            'total_facturas': int(total_facturas),
-            'monto_total': monto_total,
-            'canceladas_dia': int(cancel_dia),
-            'monto_canceladas': monto_cancel,
-            'no_canceladas': int(no_cancel),
-            'monto_no_canceladas': monto_no_cancel,
-            'facturas_otro_dia': parsear_tabla(result_otro_dia),
-            'detalle_canceladas': parsear_tabla(result_detalle),
-            'por_formapago': parsear_tabla(result_formapago),
-            'raw_otro_dia': result_otro_dia,
-            'raw_detalle': result_detalle,
-            'raw_formapago': result_formapago
-        }
+        return obtener_datos_auditoria(self._ejecutar_sql, fecha)
 
     def _mostrar_resultados_auditoria(self, datos, fecha):
         """Muestra los resultados del análisis de auditoría"""
@@ -11003,21 +11374,6 @@ Estado: {estado}
             return
 
         # Buscar el folio
-        import subprocess
-        import os
-        import shutil
-
-        isql_path = "/opt/firebird/bin/isql"
-        original_db = os.path.join(os.path.dirname(__file__), "PDVDATA.FDB")
-        user_id = os.getuid()
-        tmp_db = f"/tmp/PDVDATA_{user_id}.FDB"
-
-        if not os.path.exists(tmp_db):
-            shutil.copy2(original_db, tmp_db)
-            os.chmod(tmp_db, 0o666)
-
-        dsn = f"localhost:{tmp_db}"
-
         sql = f"""
 SET HEADING ON;
 SELECT 
@@ -11037,9 +11393,7 @@ FROM FACTURAS F
 WHERE F.FOLIO = {folio_int};
 """
 
-        cmd = [isql_path, "-u", "SYSDBA", "-p", "masterkey", "-ch", "UTF8", dsn]
-        proc = subprocess.run(cmd, input=sql, capture_output=True, text=True)
-        resultado = proc.stdout
+        _, resultado, _ = self._ejecutar_sql(sql)
 
         if "FOLIO" not in resultado or str(folio_int) not in resultado:
             messagebox.showinfo("No encontrado", f"No se encontró la factura con folio {folio_int}")
@@ -11077,46 +11431,47 @@ WHERE F.FOLIO = {folio_int};
                                    "Debes seleccionar un repartidor específico para guardar la liquidación.")
             return
         
-        # Obtener datos del resumen financiero
-        try:
-            # Total vendido
-            total_vendido = float(self.lbl_total_subtotal.cget("text").replace("$", "").replace(",", ""))
-            # Total descuentos
-            total_descuentos = float(self.lbl_total_descuentos.cget("text").replace("$", "").replace(",", ""))
-            # Total gastos
-            total_gastos = float(self.lbl_total_gastos.cget("text").replace("$", "").replace(",", ""))
-            # Neto a entregar
-            neto = float(self.lbl_neto.cget("text").replace("$", "").replace(",", ""))
-            # Dinero contado
-            dinero_contado = float(self.lbl_dinero_contado.cget("text").replace("$", "").replace(",", ""))
-            # Diferencia
-            diferencia_text = self.lbl_diferencia.cget("text").replace("$", "").replace(",", "")
-            diferencia = float(diferencia_text) if diferencia_text and diferencia_text != "N/A" else 0
-            
-            # Datos adicionales
-            total_creditos = float(self.lbl_total_creditos.cget("text").replace("$", "").replace(",", ""))
-            total_devoluciones = float(self.lbl_total_devoluciones.cget("text").replace("$", "").replace(",", ""))
-            total_ajustes = float(self.lbl_total_ajustes.cget("text").replace("$", "").replace(",", ""))
-            total_canceladas = float(self.lbl_total_canceladas.cget("text").replace("$", "").replace(",", ""))
-            
-        except (ValueError, AttributeError) as e:
-            messagebox.showerror("Error", f"Error al obtener datos de liquidación: {e}")
-            return
-        
-        # Preparar datos para guardar
-        datos = {
-            'total_ventas': total_vendido,
-            'total_descuentos': total_descuentos,
-            'total_creditos': total_creditos,
-            'total_devoluciones': total_devoluciones,
-            'total_ajustes': total_ajustes,
-            'total_gastos': total_gastos,
-            'total_canceladas': total_canceladas,
-            'total_dinero': dinero_contado,
-            'neto': neto,
-            'diferencia': diferencia,
-            'fecha_guardado': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        clave = ('guardar_liquidacion', fecha, rep_filtro)
+        if getattr(self, '_liquidacion_en_calculo', None) == clave:
+            return  # Doble clic: ya se está calculando
+        self._liquidacion_en_calculo = clave
+
+        # Ventas del día cargado tomadas aquí, en el hilo de Tk; el cálculo va
+        # al executor, que sí espera a que la cola de escritura confirme lo
+        # pendiente (gastos, pagos, conteos, asignaciones...) antes de leer
+        actual = VentasDia(list(self.ds.get_ventas()), list(self.ds.movimientos_entrada),
+                           list(self.ds.movimientos_salida))
+        motor = LiquidacionEngine(lambda f: actual, db_local)
+
+        def calcular():
+            cola = get_cola_escritura()
+            if cola is not None and not cola.esperar():
+                raise RuntimeError("La cola de escritura no terminó de guardar los cambios; intenta de nuevo")
+            return motor.calcular(fecha, rep_filtro).datos_historial()
+
+        def on_ok(datos):
+            self._liquidacion_en_calculo = None
+            self._confirmar_guardar_liquidacion(fecha, rep_filtro, datos)
+
+        def on_error(e):
+            self._liquidacion_en_calculo = None
+            if not isinstance(e, TareaCancelada):
+                messagebox.showerror("Error", f"Error al obtener datos de liquidación: {e}")
+
+        self.executor.submit(
+            calcular,
+            cola='sqlite', prioridad=PRIORIDAD_UI, clave=clave,
+            on_ok=on_ok, on_error=on_error
+        )
+
+    def _confirmar_guardar_liquidacion(self, fecha: str, rep_filtro: str, datos: dict):
+        """Muestra los totales calculados (con la cola de escritura al día) y guarda si se confirma."""
+        total_vendido = datos['total_ventas']
+        total_descuentos = datos['total_descuentos']
+        total_gastos = datos['total_gastos']
+        neto = datos['neto']
+        dinero_contado = datos['total_dinero']
+        diferencia = datos['diferencia']
         
         # Confirmar
         msg = f"¿Guardar liquidación de {rep_filtro} para {fecha}?\n\n"
@@ -11134,11 +11489,13 @@ WHERE F.FOLIO = {folio_int};
         liq_id = db_local.guardar_liquidacion(fecha, rep_filtro, datos)
         
         if liq_id > 0:
+            archivado = self._archivar_dia_si_cerrado(fecha)
             messagebox.showinfo("Guardado", 
                 f"✅ Liquidación guardada correctamente.\n\n"
                 f"ID: {liq_id}\n"
                 f"Repartidor: {rep_filtro}\n"
-                f"Fecha: {fecha}")
+                f"Fecha: {fecha}"
+                + ("\n\n📦 Todos los repartidores están liquidados: el día quedó archivado." if archivado else ""))
         else:
             messagebox.showerror("Error", "No se pudo guardar la liquidación.")
 
@@ -11153,102 +11510,10 @@ WHERE F.FOLIO = {folio_int};
             messagebox.showwarning("Sin datos", "No hay repartidores asignados.")
             return
 
-        tipo_map = {"credito": "Crédito", "devolucion": "Devolución", "ajuste": "Ajuste"}
-        desc_todos = cargar_descuentos()
-
-        # ── construir datos por repartidor ──────────────────────────────
-        datos_por_rep = {}   # rep → { ventas, descuentos, gastos, dinero, totales }
-
-        for rep in reps:
-            ventas_rep = [v for v in self.ds.get_ventas() if v['repartidor'] == rep]
-
-            # descuentos filtrados
-            desc_rep = []
-            for fk, datos in desc_todos.items():
-                for d in datos.get("descuentos", []):
-                    if d.get("fecha", "").startswith(fecha) and d.get("repartidor") == rep:
-                        desc_rep.append({
-                            'folio': fk,
-                            'tipo': tipo_map.get(d['tipo'], d['tipo']),
-                            'monto': d.get('monto', 0),
-                            'observacion': d.get('observacion', '')
-                        })
-
-            gastos_rep  = self.ds.get_gastos(rep)
-            dinero_rep  = self.ds.get_dinero(rep)   # {valor_int: cantidad}
-
-            total_sub   = sum(v['subtotal'] for v in ventas_rep)
-            total_desc  = sum(d['monto'] for d in desc_rep)
-            total_gasto = sum(g['monto'] for g in gastos_rep)
-            total_din   = self.ds.get_total_dinero(rep)
-            neto        = total_sub - total_desc - total_gasto
-            diferencia  = total_din - neto
-
-            datos_por_rep[rep] = {
-                'ventas':      ventas_rep,
-                'descuentos':  desc_rep,
-                'gastos':      gastos_rep,
-                'dinero':      dinero_rep,
-                'total_sub':   total_sub,
-                'total_desc':  total_desc,
-                'total_gasto': total_gasto,
-                'total_din':   total_din,
-                'neto':        neto,
-                'diferencia':  diferencia,
-            }
-
-        # ── texto preview (todos los reps concatenados) ─────────────────
-        sep  = "═" * 64
-        thin = "─" * 64
-        texto_total = ""
-
-        for rep, d in datos_por_rep.items():
-            texto_total += (
-                f"\n{sep}\n"
-                f"  LIQUIDACIÓN DE REPARTIDOR\n"
-                f"  Repartidor : {rep}\n"
-                f"  Fecha      : {fecha}\n"
-                f"{sep}\n\n"
-                f"VENTAS DEL DÍA\n"
-            )
-            for v in d['ventas']:
-                cancelada_txt = " [CANCELADA]" if v.get('cancelada', False) else ""
-                texto_total += f"  Folio {v['folio']:>6}  {v['nombre']:<40} ${v['subtotal']:>12,.2f}{cancelada_txt}\n"
-            texto_total += f"  {thin}\n  Total Subtotal          ${d['total_sub']:>18,.2f}\n\n"
-
-            texto_total += "DESCUENTOS\n"
-            if d['descuentos']:
-                for desc in d['descuentos']:
-                    texto_total += (f"  Folio {desc['folio']:>6}: {desc['tipo']:<12} "
-                                    f"${desc['monto']:>12,.2f}   {desc['observacion']}\n")
-            else:
-                texto_total += "  Ninguno\n"
-            texto_total += f"  {thin}\n  Total Descuentos        ${d['total_desc']:>18,.2f}\n\n"
-
-            texto_total += "GASTOS ADICIONALES\n"
-            if d['gastos']:
-                for g in d['gastos']:
-                    texto_total += f"  {g['concepto']:<40} ${g['monto']:>12,.2f}\n"
-            else:
-                texto_total += "  Ninguno\n"
-            texto_total += f"  {thin}\n  Total Gastos            ${d['total_gasto']:>18,.2f}\n"
-            texto_total += f"  {thin}\n  Total a Descontar       ${d['total_desc']+d['total_gasto']:>18,.2f}\n\n"
-
-            texto_total += (
-                f"{sep}\n"
-                f"  TOTAL NETO A PAGAR      ${d['neto']:>18,.2f}\n"
-                f"{sep}\n\n"
-                f"CONTEO DE DINERO\n"
-            )
-            for valor in self._VALORES_ORDEN:
-                cant = d['dinero'].get(valor, 0)
-                if cant > 0:
-                    texto_total += f"  ${valor:>7,} × {cant:>4} = ${cant*valor:>13,}\n"
-            texto_total += f"  {thin}\n  TOTAL DINERO            ${d['total_din']:>18,.2f}\n\n"
-            texto_total += f"  DIFERENCIA              ${d['diferencia']:>18,.2f}\n"
-            if abs(d['diferencia']) < 0.01:
-                texto_total += "\n  ✓  LIQUIDACIÓN CUADRADA\n"
-            texto_total += "\n"
+        # Datos por repartidor (ventas, descuentos, gastos, dinero y totales) y su texto
+        datos_por_rep = datos_reporte(fecha, self.ds.get_ventas(), db_local, reps,
+                                      totales_por_rep=self.ds.frame().por_repartidor())
+        texto_total = texto_reporte(datos_por_rep, fecha)
 
         # ── ventana de preview ───────────────────────────────────────────
         win = tk.Toplevel(self.ventana)
@@ -11276,324 +11541,7 @@ WHERE F.FOLIO = {folio_int};
 
     # ── exportar a Excel ─────────────────────────────────────────────────
     def _exportar_excel(self, datos_por_rep: dict, fecha: str):
-        # ─ estilos reutilizables ─
-        font_title   = Font(name='Arial', size=14, bold=True, color='FFFFFF')
-        font_header  = Font(name='Arial', size=10, bold=True, color='FFFFFF')
-        font_seccion = Font(name='Arial', size=11, bold=True)
-        font_normal  = Font(name='Arial', size=10)
-        font_monto   = Font(name='Arial', size=10)
-        font_neto    = Font(name='Arial', size=12, bold=True, color='2E7D32')
-        font_dif_ok  = Font(name='Arial', size=11, bold=True, color='2E7D32')
-        font_dif_no  = Font(name='Arial', size=11, bold=True, color='C62828')
-
-        fill_title   = PatternFill('solid', fgColor='1565C0')
-        fill_header  = PatternFill('solid', fgColor='1976D2')
-        fill_seccion = PatternFill('solid', fgColor='E3F2FD')
-        fill_resumen = PatternFill('solid', fgColor='FFF3E0')
-        fill_neto    = PatternFill('solid', fgColor='E8F5E9')
-        fill_dinero  = PatternFill('solid', fgColor='F3E5F5')
-        fill_par     = PatternFill('solid', fgColor='FFFFFF')
-        fill_impar   = PatternFill('solid', fgColor='F5F5F5')
-
-        align_c = Alignment(horizontal='center', vertical='center')
-        align_l = Alignment(horizontal='left',   vertical='center')
-        align_r = Alignment(horizontal='right',  vertical='center')
-
-        borde_fino = Border(
-            left=Side(style='thin', color='BDBDBD'),
-            right=Side(style='thin', color='BDBDBD'),
-            top=Side(style='thin', color='BDBDBD'),
-            bottom=Side(style='thin', color='BDBDBD')
-        )
-
-        fmt_moneda = '#,##0.00'
-
-        wb = Workbook()
-        wb.remove(wb.active)   # eliminar hoja vacía por defecto
-
-        for rep, d in datos_por_rep.items():
-            # nombre de hoja: máximo 31 chars, sin caracteres ilegales
-            nombre_hoja = rep[:31].replace('/', '-').replace('\\', '-').replace('[', '').replace(']', '')
-            ws = wb.create_sheet(title=nombre_hoja)
-
-            ws.column_dimensions['A'].width = 12   # Folio
-            ws.column_dimensions['B'].width = 35   # Cliente
-            ws.column_dimensions['C'].width = 16   # Subtotal
-            ws.column_dimensions['D'].width = 12   # Cancelada
-            ws.column_dimensions['E'].width = 22   # Observación (descuentos)
-            ws.column_dimensions['F'].width = 18   # Extra
-
-            r = 1   # cursor de fila
-
-            # ══ TÍTULO ═══════════════════════════════════════════════════
-            ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=5)
-            ws.cell(r, 1, value=f"LIQUIDACIÓN DE REPARTIDOR — {rep}")
-            ws.cell(r, 1).font = font_title
-            ws.cell(r, 1).fill = fill_title
-            ws.cell(r, 1).alignment = align_c
-            for c in range(1, 6):
-                ws.cell(r, c).fill = fill_title
-            r += 1
-
-            ws.cell(r, 1, value="Fecha:")
-            ws.cell(r, 1).font = font_seccion
-            ws.cell(r, 2, value=fecha)
-            ws.cell(r, 2).font = font_normal
-            r += 2
-
-            # ══ VENTAS DEL DÍA ═══════════════════════════════════════════
-            ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=4)
-            ws.cell(r, 1, value="VENTAS DEL DÍA")
-            ws.cell(r, 1).font = font_seccion
-            ws.cell(r, 1).fill = fill_seccion
-            for c in range(1, 5):
-                ws.cell(r, c).fill = fill_seccion
-                ws.cell(r, c).border = borde_fino
-            r += 1
-
-            # headers ventas
-            hdrs_ventas = ["Folio", "Cliente", "Subtotal", "Cancelada"]
-            fila_hdr_ventas = r
-            for i, h in enumerate(hdrs_ventas, 1):
-                cell = ws.cell(r, i, value=h)
-                cell.font = font_header
-                cell.fill = fill_header
-                cell.alignment = align_c
-                cell.border = borde_fino
-            r += 1
-
-            fila_inicio_ventas = r
-            for idx, v in enumerate(d['ventas']):
-                fill_f = fill_par if idx % 2 == 0 else fill_impar
-                cancelada = v.get('cancelada', False)
-                ws.cell(r, 1, value=v['folio']);      ws.cell(r, 1).alignment = align_c
-                ws.cell(r, 2, value=v['nombre']);     ws.cell(r, 2).alignment = align_l
-                ws.cell(r, 3, value=v['subtotal']);   ws.cell(r, 3).number_format = fmt_moneda
-                ws.cell(r, 3).alignment = align_r
-                ws.cell(r, 4, value="SÍ" if cancelada else "NO"); ws.cell(r, 4).alignment = align_c
-                for c in range(1, 5):
-                    ws.cell(r, c).font  = font_normal
-                    ws.cell(r, c).fill  = fill_f
-                    ws.cell(r, c).border = borde_fino
-                r += 1
-            fila_fin_ventas = r - 1
-
-            # fila Total Subtotal con fórmula SUM
-            ws.cell(r, 2, value="Total Subtotal:")
-            ws.cell(r, 2).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 2).alignment = align_r
-            if fila_inicio_ventas <= fila_fin_ventas:
-                ws.cell(r, 3, value=f"=SUM(C{fila_inicio_ventas}:C{fila_fin_ventas})")
-            else:
-                ws.cell(r, 3, value=0)
-            ws.cell(r, 3).number_format = fmt_moneda
-            ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 3).alignment = align_r
-            for c in range(1, 5):
-                ws.cell(r, c).fill  = fill_resumen
-                ws.cell(r, c).border = borde_fino
-            r += 2
-
-            # ══ DESCUENTOS ════════════════════════════════════════════════
-            ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=4)
-            ws.cell(r, 1, value="DESCUENTOS")
-            ws.cell(r, 1).font = font_seccion
-            ws.cell(r, 1).fill = fill_seccion
-            for c in range(1, 5):
-                ws.cell(r, c).fill = fill_seccion
-                ws.cell(r, c).border = borde_fino
-            r += 1
-
-            hdrs_desc = ["Folio", "Tipo", "Monto", "Observación"]
-            for i, h in enumerate(hdrs_desc, 1):
-                cell = ws.cell(r, i, value=h)
-                cell.font = font_header
-                cell.fill = fill_header
-                cell.alignment = align_c
-                cell.border = borde_fino
-            r += 1
-
-            fila_inicio_desc = r
-            for idx, desc in enumerate(d['descuentos']):
-                fill_f = fill_par if idx % 2 == 0 else fill_impar
-                ws.cell(r, 1, value=desc['folio']);       ws.cell(r, 1).alignment = align_c
-                ws.cell(r, 2, value=desc['tipo']);        ws.cell(r, 2).alignment = align_c
-                ws.cell(r, 3, value=desc['monto']);       ws.cell(r, 3).number_format = fmt_moneda
-                ws.cell(r, 3).alignment = align_r
-                ws.cell(r, 4, value=desc['observacion']); ws.cell(r, 4).alignment = align_l
-                for c in range(1, 5):
-                    ws.cell(r, c).font  = font_normal
-                    ws.cell(r, c).fill  = fill_f
-                    ws.cell(r, c).border = borde_fino
-                r += 1
-            fila_fin_desc = r - 1
-
-            ws.cell(r, 3, value="Total Descuentos:")
-            ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 3).alignment = align_r
-            if fila_inicio_desc <= fila_fin_desc:
-                ws.cell(r, 4, value=f"=SUM(C{fila_inicio_desc}:C{fila_fin_desc})")
-            else:
-                ws.cell(r, 4, value=0)
-            ws.cell(r, 4).number_format = fmt_moneda
-            ws.cell(r, 4).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 4).alignment = align_r
-            for c in range(1, 5):
-                ws.cell(r, c).fill  = fill_resumen
-                ws.cell(r, c).border = borde_fino
-            r += 2
-
-            # ══ GASTOS ADICIONALES ════════════════════════════════════════
-            ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=3)
-            ws.cell(r, 1, value="GASTOS ADICIONALES")
-            ws.cell(r, 1).font = font_seccion
-            ws.cell(r, 1).fill = fill_seccion
-            for c in range(1, 4):
-                ws.cell(r, c).fill = fill_seccion
-                ws.cell(r, c).border = borde_fino
-            r += 1
-
-            hdrs_gasto = ["#", "Concepto", "Monto"]
-            for i, h in enumerate(hdrs_gasto, 1):
-                cell = ws.cell(r, i, value=h)
-                cell.font = font_header
-                cell.fill = fill_header
-                cell.alignment = align_c
-                cell.border = borde_fino
-            r += 1
-
-            fila_inicio_gasto = r
-            for idx, g in enumerate(d['gastos']):
-                fill_f = fill_par if idx % 2 == 0 else fill_impar
-                ws.cell(r, 1, value=idx + 1);           ws.cell(r, 1).alignment = align_c
-                ws.cell(r, 2, value=g['concepto']);      ws.cell(r, 2).alignment = align_l
-                ws.cell(r, 3, value=g['monto']);         ws.cell(r, 3).number_format = fmt_moneda
-                ws.cell(r, 3).alignment = align_r
-                for c in range(1, 4):
-                    ws.cell(r, c).font  = font_normal
-                    ws.cell(r, c).fill  = fill_f
-                    ws.cell(r, c).border = borde_fino
-                r += 1
-            fila_fin_gasto = r - 1
-
-            ws.cell(r, 2, value="Total Gastos:")
-            ws.cell(r, 2).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 2).alignment = align_r
-            if fila_inicio_gasto <= fila_fin_gasto:
-                ws.cell(r, 3, value=f"=SUM(C{fila_inicio_gasto}:C{fila_fin_gasto})")
-            else:
-                ws.cell(r, 3, value=0)
-            ws.cell(r, 3).number_format = fmt_moneda
-            ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 3).alignment = align_r
-            for c in range(1, 4):
-                ws.cell(r, c).fill  = fill_resumen
-                ws.cell(r, c).border = borde_fino
-            r += 2
-
-            # ══ RESUMEN FINANCIERO ════════════════════════════════════════
-            ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=3)
-            ws.cell(r, 1, value="RESUMEN FINANCIERO")
-            ws.cell(r, 1).font = font_seccion
-            ws.cell(r, 1).fill = fill_seccion
-            for c in range(1, 4):
-                ws.cell(r, c).fill = fill_seccion
-                ws.cell(r, c).border = borde_fino
-            r += 1
-
-            resumen_items = [
-                ("Total Subtotal",     d['total_sub']),
-                ("Total Descuentos",   d['total_desc']),
-                ("Total Gastos",       d['total_gasto']),
-                ("Total a Descontar",  d['total_desc'] + d['total_gasto']),
-            ]
-            for label, valor in resumen_items:
-                ws.cell(r, 1, value=label)
-                ws.cell(r, 1).font = font_normal
-                ws.cell(r, 1).alignment = align_l
-                ws.cell(r, 2, value=valor)
-                ws.cell(r, 2).number_format = fmt_moneda
-                ws.cell(r, 2).font = font_normal
-                ws.cell(r, 2).alignment = align_r
-                for c in range(1, 3):
-                    ws.cell(r, c).fill  = fill_resumen
-                    ws.cell(r, c).border = borde_fino
-                r += 1
-
-            # NETO
-            ws.cell(r, 1, value="TOTAL NETO A PAGAR")
-            ws.cell(r, 1).font = font_neto
-            ws.cell(r, 1).fill = fill_neto
-            ws.cell(r, 1).alignment = align_l
-            ws.cell(r, 1).border = borde_fino
-            ws.cell(r, 2, value=d['neto'])
-            ws.cell(r, 2).number_format = fmt_moneda
-            ws.cell(r, 2).font = font_neto
-            ws.cell(r, 2).fill = fill_neto
-            ws.cell(r, 2).alignment = align_r
-            ws.cell(r, 2).border = borde_fino
-            r += 2
-
-            # ══ CONTEO DE DINERO ══════════════════════════════════════════
-            ws.merge_cells(start_row=r, start_column=1, end_row=r, end_column=3)
-            ws.cell(r, 1, value="CONTEO DE DINERO")
-            ws.cell(r, 1).font = font_seccion
-            ws.cell(r, 1).fill = fill_dinero
-            for c in range(1, 4):
-                ws.cell(r, c).fill = fill_dinero
-                ws.cell(r, c).border = borde_fino
-            r += 1
-
-            hdrs_din = ["Denominación", "Cantidad", "Subtotal"]
-            for i, h in enumerate(hdrs_din, 1):
-                cell = ws.cell(r, i, value=h)
-                cell.font = font_header
-                cell.fill = fill_header
-                cell.alignment = align_c
-                cell.border = borde_fino
-            r += 1
-
-            fila_inicio_din = r
-            for idx, valor in enumerate(self._VALORES_ORDEN):
-                cant = d['dinero'].get(valor, 0)
-                fill_f = fill_par if idx % 2 == 0 else fill_impar
-                ws.cell(r, 1, value=f"${valor:,}");   ws.cell(r, 1).alignment = align_l
-                ws.cell(r, 2, value=cant);             ws.cell(r, 2).alignment = align_c
-                ws.cell(r, 3, value=cant * valor);     ws.cell(r, 3).number_format = fmt_moneda
-                ws.cell(r, 3).alignment = align_r
-                for c in range(1, 4):
-                    ws.cell(r, c).font  = font_normal
-                    ws.cell(r, c).fill  = fill_f
-                    ws.cell(r, c).border = borde_fino
-                r += 1
-            fila_fin_din = r - 1
-
-            ws.cell(r, 2, value="TOTAL DINERO:")
-            ws.cell(r, 2).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 2).alignment = align_r
-            ws.cell(r, 3, value=f"=SUM(C{fila_inicio_din}:C{fila_fin_din})")
-            ws.cell(r, 3).number_format = fmt_moneda
-            ws.cell(r, 3).font = Font(name='Arial', size=10, bold=True)
-            ws.cell(r, 3).alignment = align_r
-            for c in range(1, 4):
-                ws.cell(r, c).fill  = fill_dinero
-                ws.cell(r, c).border = borde_fino
-            r += 2
-
-            # ══ DIFERENCIA ════════════════════════════════════════════════
-            ws.cell(r, 1, value="DIFERENCIA")
-            ws.cell(r, 1).font = Font(name='Arial', size=11, bold=True)
-            ws.cell(r, 1).alignment = align_l
-            ws.cell(r, 1).border = borde_fino
-            ws.cell(r, 2, value=d['diferencia'])
-            ws.cell(r, 2).number_format = fmt_moneda
-            ws.cell(r, 2).font = font_dif_ok if abs(d['diferencia']) < 0.01 else font_dif_no
-            ws.cell(r, 2).alignment = align_r
-            ws.cell(r, 2).border = borde_fino
-            if abs(d['diferencia']) < 0.01:
-                ws.cell(r, 3, value="✓ CUADRADA")
-                ws.cell(r, 3).font = font_dif_ok
-            r += 1
+        wb = construir_libro(datos_por_rep, fecha)
 
         # ── guardar archivo ──────────────────────────────────────────────
         nombre_archivo = f"Liquidacion_{fecha}.xlsx"
@@ -11607,158 +11555,117 @@ WHERE F.FOLIO = {folio_int};
             messagebox.showerror("Error", f"No se pudo guardar el archivo:\n{e}")
 
     # ==================================================================
-    # EJECUCIÓN SQL (Firebird via isql)
+    # REPORTE POR RANGO DE FECHAS (cierre de mes)
     # ==================================================================
-    def _ejecutar_sql(self, sql: str):
-        try:
-            if not os.path.exists(self.ruta_fdb):
-                return False, "", f"Archivo no encontrado: {self.ruta_fdb}"
-            
-            # Detectar sistema operativo
-            es_windows = sys.platform.startswith('win')
-            
-            if es_windows:
-                # En Windows, buscar isql.exe en rutas comunes de instalación
-                posibles_isql = [
-                    r"C:\Program Files\Firebird\Firebird_5_0\isql.exe",  # Firebird 5.0
-                    r"C:\Program Files\Firebird\Firebird_4_0\isql.exe",
-                    r"C:\Program Files (x86)\Firebird\Firebird_4_0\bin\isql.exe",
-                    r"C:\Program Files\Firebird\Firebird_3_0\isql.exe",
-                    r"C:\Program Files (x86)\Firebird\Firebird_3_0\bin\isql.exe",
-                    r"C:\Program Files\Firebird\Firebird_2_5\bin\isql.exe",
-                    r"C:\Program Files (x86)\Firebird\Firebird_2_5\bin\isql.exe",
-                    r"C:\Program Files\Firebird\bin\isql.exe",
-                    r"C:\Program Files (x86)\Firebird\bin\isql.exe",
-                ]
-                
-                # Buscar isql en rutas estándar
-                isql_path = None
-                for ruta in posibles_isql:
-                    if os.path.exists(ruta):
-                        isql_path = ruta
-                        break
-                
-                # Si no encuentra, intentar ejecutar 'isql' directamente (puede estar en PATH)
-                if not isql_path:
-                    try:
-                        # Verificar si isql está en PATH
-                        resultado_test = subprocess.run(
-                            ['isql', '-version'],
-                            capture_output=True,
-                            timeout=2,
-                            encoding='utf-8',
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        if resultado_test.returncode == 0:
-                            isql_path = 'isql'
-                    except:
-                        pass
-                
-                if not isql_path:
-                    return False, "", (
-                        "No se encontró isql de Firebird.\n\n"
-                        "Firebird no parece estar instalado correctamente.\n"
-                        "Verifica la instalación en:\n"
-                        "https://www.firebirdsql.org/download/\n\n"
-                        "O agrega Firebird\\bin al PATH de tu sistema."
-                    )
-                
-                # En Windows: NO usar sudo, ejecutar directamente
-                cmd = [isql_path, '-u', 'SYSDBA', '-p', 'masterkey', self.ruta_fdb]
+    def _dialogo_reporte_rango(self):
+        """Pide el rango de fechas; por defecto del día 1 del mes a la fecha cargada."""
+        hasta = self.ds.fecha or datetime.now().strftime('%Y-%m-%d')
+        desde = hasta[:8] + '01'
+
+        win = tk.Toplevel(self.ventana)
+        win.title("Reporte por Rango")
+        win.transient(self.ventana)
+        win.resizable(False, False)
+        frame = ttk.Frame(win, padding=15)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        entradas = []
+        for fila, (texto, valor) in enumerate((("Desde:", desde), ("Hasta:", hasta))):
+            ttk.Label(frame, text=texto).grid(row=fila, column=0, sticky=tk.W, pady=3)
+            if HAS_CALENDAR:
+                entry = DateEntry(frame, width=12, date_pattern='yyyy-mm-dd',
+                                  background='#1e88e5', foreground='white', borderwidth=2)
+                entry.set_date(datetime.strptime(valor, '%Y-%m-%d').date())
             else:
-                # En Linux/Unix: conectar via TCP/IP al servidor Firebird
-                # Firebird necesita acceso al archivo, así que copiamos a /tmp
-                import shutil
-                import tempfile
-                
-                # Usar un nombre único en /tmp para evitar conflictos de permisos
-                tmp_fdb = f'/tmp/PDVDATA_{os.getuid()}.FDB'
-                
-                # Intentar copiar el archivo
-                try:
-                    # Si el archivo temporal existe y podemos escribir, lo eliminamos primero
-                    if os.path.exists(tmp_fdb):
-                        try:
-                            os.remove(tmp_fdb)
-                        except:
-                            pass
-                    
-                    if os.path.exists(self.ruta_fdb):
-                        shutil.copy2(self.ruta_fdb, tmp_fdb)
-                        # Dar permisos completos al archivo
-                        os.chmod(tmp_fdb, 0o666)
-                except Exception as e:
-                    return False, "", f"Error copiando archivo a /tmp: {str(e)}"
-                
-                # Usar siempre /tmp para la conexión TCP/IP
-                fdb_path = tmp_fdb
-                
-                # El comando de isql para conexión TCP/IP
-                cmd = [self.isql_path]
-                # El SQL debe incluir el CONNECT con localhost
-                sql = f"CONNECT 'localhost:{fdb_path}' USER 'SYSDBA' PASSWORD 'masterkey';\n" + sql
-            
-            # Agregar QUIT al final del SQL para que isql termine correctamente
-            sql_completo = sql.strip()
-            if not sql_completo.endswith(';'):
-                sql_completo += ';'
-            sql_completo += '\nQUIT;'
-            
-            # En Windows usar cp1252 (Windows-1252) en lugar de utf-8
-            # porque Firebird a menudo devuelve datos en esa codificación
-            encoding_usar = 'cp1252' if es_windows else 'utf-8'
-            
-            # Configurar kwargs para subprocess
-            run_kwargs = {
-                'input': sql_completo,
-                'capture_output': True,
-                'text': True,
-                'timeout': 30,
-                'encoding': encoding_usar,
-                'errors': 'ignore'
-            }
-            # En Windows, ocultar ventana de CMD
-            if es_windows:
-                run_kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
-            
-            resultado = subprocess.run(cmd, **run_kwargs)
-            
-            # En Linux con conexión TCP/IP, isql siempre muestra "Use CONNECT..." en stderr
-            # pero eso no es un error si hay datos válidos en stdout
-            stdout = resultado.stdout or ""
-            stderr = resultado.stderr or ""
-            
-            # Verificar si hay datos válidos en la salida
-            # Buscar líneas de separación (===) o datos numéricos típicos de resultados
-            tiene_datos = '===' in stdout or any(
-                keyword in stdout.upper() for keyword in ['COUNT', 'FOLIO', 'NOMBRE', 'TOTAL', 'SUBTOTAL']
+                entry = ttk.Entry(frame, width=14)
+                entry.insert(0, valor)
+            entry.grid(row=fila, column=1, padx=(8, 0), pady=3)
+            entradas.append(entry)
+
+        def generar():
+            desde_txt, hasta_txt = (e.get().strip() for e in entradas)
+            try:
+                fechas = rango_fechas(desde_txt, hasta_txt)
+            except ValueError:
+                messagebox.showerror("Fecha inválida", "Usa el formato AAAA-MM-DD.", parent=win)
+                return
+            if not fechas:
+                messagebox.showerror("Rango inválido", "'Desde' debe ser anterior a 'Hasta'.", parent=win)
+                return
+            win.destroy()
+            self._generar_reporte_rango(fechas)
+
+        ttk.Button(frame, text="📊 Generar Excel", command=generar,
+                   style="Success.TButton").grid(row=2, column=0, columnspan=2, pady=(12, 0))
+
+    def _generar_reporte_rango(self, fechas: list):
+        """Liquida cada día del rango en el executor (los días en caché o archivados no
+        consultan Firebird) y arma un solo libro con resumen y matrices día × repartidor."""
+        # Datos del día cargado y estado de la conexión tomados aquí, en el hilo de Tk
+        fecha_actual = self.ds.fecha
+        actual = VentasDia(list(self.ds.get_ventas()), list(self.ds.movimientos_entrada),
+                           list(self.ds.movimientos_salida))
+        en_linea = self.conexion.en_linea
+        motor = LiquidacionEngine(lambda f: actual if f == fecha_actual else self._ventas_de_otro_dia(f, en_linea),
+                                  db_local)
+        dias, errores = {}, {}
+
+        progreso = tk.Toplevel(self.ventana)
+        progreso.title("Reporte por Rango")
+        progreso.transient(self.ventana)
+        lbl = ttk.Label(progreso, text=f"Calculando 0/{len(fechas)} días…", padding=15)
+        lbl.pack()
+        barra = ttk.Progressbar(progreso, length=280, maximum=len(fechas))
+        barra.pack(padx=15, pady=(0, 15))
+
+        def terminado(fecha, resumen, error):
+            if resumen is not None:
+                dias[fecha] = resumen
+            else:
+                errores[fecha] = str(error)
+            n = len(dias) + len(errores)
+            if progreso.winfo_exists():
+                lbl.config(text=f"Calculando {n}/{len(fechas)} días…")
+                barra['value'] = n
+            if n == len(fechas):
+                if progreso.winfo_exists():
+                    progreso.destroy()
+                self._guardar_reporte_rango(fechas, dias, errores)
+
+        for fecha in fechas:
+            estado = self.cache_dias.get(fecha, tocar=False)
+            sin_firebird = fecha == fecha_actual or (estado is not None and DayStateCache.es_fresco(estado))
+            self.executor.submit(
+                motor.resumen_dia, fecha,
+                cola='sqlite' if sin_firebird else 'firebird', prioridad=PRIORIDAD_NORMAL,
+                clave=('reporte_rango', fecha),
+                on_ok=lambda r, f=fecha: terminado(f, r, None),
+                on_error=lambda e, f=fecha: terminado(f, None, e)
             )
-            
-            # También verificar si hay líneas con datos numéricos (típico de resultados)
-            if not tiene_datos:
-                for linea in stdout.split('\n'):
-                    linea = linea.strip()
-                    # Si hay una línea con números que parece ser un resultado de consulta
-                    if linea and any(c.isdigit() for c in linea) and not linea.startswith('Use '):
-                        tiene_datos = True
-                        break
-            
-            # Es exitoso si: returncode es 0, O si hay datos válidos en stdout
-            exito = resultado.returncode == 0 or tiene_datos
-            
-            # Si hay datos válidos, limpiar el stderr del mensaje "Use CONNECT..."
-            # ya que ese mensaje no es un error real cuando hay datos
-            if tiene_datos and 'Use CONNECT' in stderr:
-                stderr = ""
-            
-            return exito, stdout, stderr
-            
-        except subprocess.TimeoutExpired:
-            return False, "", "Timeout: La consulta SQL tardó demasiado (>30s)"
-        except FileNotFoundError:
-            return False, "", "No se pudo ejecutar isql. Verifica que Firebird esté instalado."
+
+    def _guardar_reporte_rango(self, fechas: list, dias: dict, errores: dict):
+        if not dias:
+            messagebox.showerror("Reporte por Rango",
+                                 "No se pudo calcular ningún día del rango.\n\n" +
+                                 "\n".join(f"{f}: {e}" for f, e in sorted(errores.items())[:10]))
+            return
+        nombre_archivo = f"Liquidacion_{fechas[0]}_a_{fechas[-1]}.xlsx"
+        try:
+            construir_libro_rango(dias, ETIQUETA_GENERAL, errores,
+                                  titulo=f"LIQUIDACIÓN {fechas[0]} — {fechas[-1]}").save(nombre_archivo)
         except Exception as e:
-            return False, "", str(e)
+            messagebox.showerror("Error", f"No se pudo guardar el archivo:\n{e}")
+            return
+        msg = f"Archivo Excel generado exitosamente:\n\n{nombre_archivo}\n\n{len(dias)} día(s) liquidados"
+        if errores:
+            msg += f"\n⚠️ {len(errores)} día(s) sin datos (ver hoja Errores)"
+        messagebox.showinfo("Exportado", msg)
+
+    # ==================================================================
+    # EJECUCIÓN SQL (Firebird via isql)
+    # ==================================================================
+    def _ejecutar_sql(self, sql: str):
+        return ejecutar_sql(self.ruta_fdb, self.isql_path, sql)
 
 
 # ===========================================================================
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+LiquiVentas en línea de comandos
+================================
+
+Modo por lotes sin interfaz gráfica (no importa tkinter):
+
+    python -m liquiventas liquidar --desde 2026-09-01 --hasta 2026-09-30 --xlsx out/
+    python -m liquiventas corte --fecha 2026-09-15
+
+Ver `python -m liquiventas --help`.
+"""
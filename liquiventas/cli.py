@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Línea de comandos de LiquiVentas (modo por lotes, sin Tk)
+=========================================================
+
+Comandos:
+    liquidar  Calcula la liquidación de cada fecha (general y por repartidor),
+              opcionalmente la guarda en el historial y exporta un Excel por día.
+    corte     Consulta el corte de caja de cada fecha.
+
+Varias fechas se procesan en paralelo con un pool de procesos. El resumen
+se escribe en JSON (stdout o --salida); los mensajes de avance van a stderr.
+
+Códigos de salida:
+    0  todas las fechas se procesaron
+    1  ninguna fecha se pudo procesar (o error general)
+    2  argumentos inválidos
+    3  algunas fechas fallaron
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List
+
+# Agregar el directorio del proyecto al path (igual que main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+SALIDA_OK = 0
+SALIDA_ERROR = 1
+SALIDA_USO = 2
+SALIDA_PARCIAL = 3
+
+MAX_WORKERS_DEFAULT = min(4, os.cpu_count() or 1)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# FECHAS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _fecha(valor: str) -> str:
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida (use AAAA-MM-DD): {valor}")
+
+
+def _fechas_de(args) -> List[str]:
+    from core.liquidacion import rango_fechas
+    fechas = list(args.fecha or [])
+    if args.desde or args.hasta:
+        fechas += rango_fechas(args.desde or args.hasta, args.hasta or args.desde)
+    if not fechas:
+        fechas = [date.today().strftime('%Y-%m-%d')]
+    return sorted(set(fechas))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# TRABAJO POR DÍA (se ejecuta en los procesos del pool)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _inicializar_worker() -> None:
+    """Los prints de los módulos compartidos no deben mezclarse con el JSON de stdout."""
+    sys.stdout = sys.stderr
+    from core.grabacion import activar_desde_entorno
+    activar_desde_entorno()
+
+
+def _ejecutor_sql(tarea: Dict[str, Any]):
+    if tarea.get('sin_firebird'):
+        return None
+    from core.firebird import ejecutar_sql, rutas_por_defecto
+    ruta_fdb, isql_path = rutas_por_defecto()
+    ruta_fdb = tarea.get('fdb') or ruta_fdb
+    isql_path = tarea.get('isql') or isql_path
+    return lambda sql: ejecutar_sql(ruta_fdb, isql_path, sql)
+
+
+def _origen(estado) -> str:
+    if estado.archivado:
+        return 'archivo'
+    if estado.obsoleto:
+        return 'copia_local'
+    return 'firebird'
+
+
+def liquidar_dia(tarea: Dict[str, Any]) -> Dict[str, Any]:
+    """Liquidación de una fecha: {fecha, ok, origen, repartidores, archivo, guardadas, error}."""
+    import database_local as db
+    from core.liquidacion import ETIQUETA_GENERAL, LiquidacionEngine, cargar_estado_dia, ventas_desde_estado
+    from core.reporte import construir_libro, datos_reporte
+
+    fecha = tarea['fecha']
+    resultado: Dict[str, Any] = {'fecha': fecha, 'ok': False}
+    inicio = time.perf_counter()
+    try:
+        estado = cargar_estado_dia(fecha, _ejecutor_sql(tarea), db)
+        dia = ventas_desde_estado(estado, db)
+        motor = LiquidacionEngine(lambda _fecha: dia, db)
+
+        if tarea.get('repartidor'):
+            liquidaciones = {tarea['repartidor']: motor.calcular(fecha, tarea['repartidor'])}
+        else:
+            liquidaciones = motor.calcular_todos(fecha)
+        resultado['origen'] = _origen(estado)
+        resultado['repartidores'] = {rep or ETIQUETA_GENERAL: r.to_dict() for rep, r in liquidaciones.items()}
+
+        if tarea.get('guardar'):
+            guardadas = 0
+            for rep, r in liquidaciones.items():
+                if not rep:
+                    continue
+                datos = dict(r.datos_historial(), origen='liquiventas')
+                if db.guardar_liquidacion(fecha, rep, datos) > 0:
+                    guardadas += 1
+            resultado['guardadas'] = guardadas
+
+        if tarea.get('xlsx'):
+            reps = [rep for rep in liquidaciones if rep]
+            datos_por_rep = datos_reporte(fecha, dia.ventas, db, reps,
+                                          totales_por_rep=motor.entradas(fecha).frame.por_repartidor())
+            if datos_por_rep:
+                os.makedirs(tarea['xlsx'], exist_ok=True)
+                ruta = os.path.join(tarea['xlsx'], f"Liquidacion_{fecha}.xlsx")
+                construir_libro(datos_por_rep, fecha).save(ruta)
+                resultado['archivo'] = ruta
+        resultado['ok'] = True
+    except Exception as e:
+        resultado['error'] = f"{type(e).__name__}: {e}"
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+def corte_dia(tarea: Dict[str, Any]) -> Dict[str, Any]:
+    """Corte de caja de una fecha: {fecha, ok, turno_id, num_turnos, corte, cancelaciones_por_usuario, error}."""
+    from core.firebird import rutas_por_defecto
+    from corte_cajero import CorteCajeroManager
+
+    fecha = tarea['fecha']
+    resultado: Dict[str, Any] = {'fecha': fecha, 'ok': False}
+    inicio = time.perf_counter()
+    try:
+        ruta_fdb, isql_path = rutas_por_defecto()
+        manager = CorteCajeroManager(db_path=tarea.get('fdb') or ruta_fdb,
+                                     isql_path=tarea.get('isql') or isql_path)
+        corte_dia = manager.obtener_corte_dia(fecha)
+        if corte_dia.corte is None:
+            resultado['error'] = 'Sin datos de corte para la fecha'
+        else:
+            resultado.update(ok=True, turno_id=corte_dia.turno_id, num_turnos=corte_dia.num_turnos,
+                             corte=corte_dia.corte.to_dict(),
+                             cancelaciones_por_usuario=corte_dia.cancelaciones_por_usuario)
+    except Exception as e:
+        resultado['error'] = f"{type(e).__name__}: {e}"
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# EJECUCIÓN
+# ══════════════════════════════════════════════════════════════════════════════
+
+def ejecutar_dias(trabajo: Callable[[Dict[str, Any]], Dict[str, Any]],
+                  tareas: List[Dict[str, Any]], workers: int) -> List[Dict[str, Any]]:
+    """Ejecuta el trabajo de cada día, en paralelo si hay más de una fecha."""
+    if workers <= 1 or len(tareas) <= 1:
+        return [_avance(trabajo(t)) for t in tareas]
+    resultados = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(tareas)),
+                             initializer=_inicializar_worker) as pool:
+        for r in pool.map(trabajo, tareas):
+            resultados.append(_avance(r))
+    return resultados
+
+
+def _avance(resultado: Dict[str, Any]) -> Dict[str, Any]:
+    marca = '✓' if resultado['ok'] else '✗'
+    detalle = resultado.get('origen', '') if resultado['ok'] else resultado.get('error', '')
+    print(f"{marca} {resultado['fecha']} {detalle}", file=sys.stderr)
+    return resultado
+
+
+def escribir_libro_rango(resultados: List[Dict[str, Any]], ruta: str) -> str:
+    """Un solo libro con el resumen del rango y las matrices día × repartidor."""
+    from core.liquidacion import ETIQUETA_GENERAL
+    from core.reporte import construir_libro_rango
+
+    dias = {r['fecha']: r['repartidores'] for r in resultados if r['ok']}
+    errores = {r['fecha']: r.get('error', '') for r in resultados if not r['ok']}
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    construir_libro_rango(dias, ETIQUETA_GENERAL, errores).save(ruta)
+    return ruta
+
+
+def _codigo_salida(resultados: List[Dict[str, Any]]) -> int:
+    ok = sum(1 for r in resultados if r['ok'])
+    if ok == len(resultados):
+        return SALIDA_OK
+    return SALIDA_ERROR if ok == 0 else SALIDA_PARCIAL
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='liquiventas',
+                                     description='LiquiVentas en modo por lotes (sin interfaz gráfica).')
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument('--fecha', type=_fecha, action='append', help='fecha AAAA-MM-DD (repetible)')
+    comunes.add_argument('--desde', type=_fecha, help='inicio del rango AAAA-MM-DD')
+    comunes.add_argument('--hasta', type=_fecha, help='fin del rango AAAA-MM-DD (inclusive)')
+    comunes.add_argument('--fdb', help='ruta de PDVDATA.FDB (por defecto la configurada)')
+    comunes.add_argument('--isql', help='ruta de isql (por defecto la del sistema)')
+    comunes.add_argument('--workers', type=int, default=MAX_WORKERS_DEFAULT,
+                         help=f'procesos en paralelo (default {MAX_WORKERS_DEFAULT})')
+    comunes.add_argument('--salida', help='archivo donde escribir el resumen JSON (default stdout)')
+    comunes.add_argument('--grabar', metavar='ARCHIVO',
+                         help='grabar las respuestas de Firebird (gzip) para reproducirlas en benchmarks')
+
+    sub = parser.add_subparsers(dest='comando', required=True)
+    liq = sub.add_parser('liquidar', parents=[comunes], help='liquidación por fecha y repartidor')
+    liq.add_argument('--repartidor', help='solo este repartidor')
+    liq.add_argument('--xlsx', metavar='DIR', help='exportar un Excel por fecha a este directorio')
+    liq.add_argument('--libro', metavar='ARCHIVO',
+                     help='un solo Excel con el resumen y las matrices día × repartidor del rango')
+    liq.add_argument('--guardar', action='store_true', help='guardar cada liquidación en el historial')
+    liq.add_argument('--sin-firebird', action='store_true',
+                     help='no consultar Firebird: solo días archivados o copias locales')
+    sub.add_parser('corte', parents=[comunes], help='corte de caja por fecha')
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    try:
+        args = construir_parser().parse_args(argv)
+    except SystemExit as e:
+        return SALIDA_USO if e.code else SALIDA_OK
+    if args.desde and args.hasta and args.desde > args.hasta:
+        print("--desde no puede ser posterior a --hasta", file=sys.stderr)
+        return SALIDA_USO
+
+    fechas = _fechas_de(args)
+    if args.grabar:
+        # Por entorno para que también graben los procesos del pool
+        from core.grabacion import VAR_ENTORNO
+        os.environ[VAR_ENTORNO] = os.path.abspath(args.grabar)
+    base = {'fdb': args.fdb, 'isql': args.isql}
+    if args.comando == 'liquidar':
+        base.update(repartidor=args.repartidor, xlsx=args.xlsx, guardar=args.guardar,
+                    sin_firebird=args.sin_firebird)
+        trabajo = liquidar_dia
+    else:
+        trabajo = corte_dia
+    tareas = [dict(base, fecha=f) for f in fechas]
+
+    inicio = time.perf_counter()
+    try:
+        # Los módulos compartidos imprimen avisos; stdout queda solo para el JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            from core.grabacion import activar_desde_entorno
+            activar_desde_entorno()
+            if args.comando == 'liquidar':
+                # Crea o migra el esquema una vez, antes de que los hilos del pool lo abran
+                import database_local
+                database_local.init_database()
+            resultados = ejecutar_dias(trabajo, tareas, args.workers)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return SALIDA_ERROR
+
+    codigo = _codigo_salida(resultados)
+    libro = None
+    if args.comando == 'liquidar' and args.libro:
+        try:
+            libro = escribir_libro_rango(resultados, args.libro)
+        except Exception as e:
+            print(f"Error al escribir {args.libro}: {e}", file=sys.stderr)
+            codigo = SALIDA_ERROR
+    resumen = {
+        'comando': args.comando,
+        'fechas': len(fechas),
+        'ok': sum(1 for r in resultados if r['ok']),
+        'errores': sum(1 for r in resultados if not r['ok']),
+        'codigo': codigo,
+        'segundos': round(time.perf_counter() - inicio, 3),
+        'libro': libro,
+        'dias': resultados,
+    }
+    texto = json.dumps(resumen, ensure_ascii=False, indent=2, default=str)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    else:
+        print(texto)
+    return codigo
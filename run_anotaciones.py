@@ -19,6 +19,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 # Importar dependencias
 import database_local as db_local
 from core.datastore import DataStore
+from core.executor import get_executor
+from core.coordinacion import iniciar_coordinacion
 
 # Importar TabAnotaciones directamente del archivo
 import importlib.util
@@ -80,6 +82,14 @@ class AppAnotacionesStandalone:
             # Cargar notas existentes
             self._cargar_notas_al_inicio()
             
+            # Escrituras por el proceso coordinador (el liquidador, si está abierto)
+            # y recarga cuando otro proceso cambia notas
+            executor = get_executor()
+            executor.conectar_tk(self.root)
+            self.coordinacion = iniciar_coordinacion(db_local, despachar=executor.llamar_en_ui)
+            self.coordinacion.suscribir('anotaciones', lambda tabla, pid: self.tab_anotaciones.refrescar())
+            self.root.protocol("WM_DELETE_WINDOW", self._al_cerrar)
+            
         except Exception as e:
             print(f"[ERROR] Error inicializando TabAnotaciones: {e}")
             import traceback
@@ -91,6 +101,11 @@ class AppAnotacionesStandalone:
                                    font=("Arial", 10), foreground="red")
             error_label.pack(padx=20, pady=20)
     
+    def _al_cerrar(self):
+        """Suelta el rol de coordinador (si lo tenía) antes de cerrar."""
+        self.coordinacion.detener()
+        self.root.destroy()
+    
     def _cargar_notas_al_inicio(self):
         """Carga las notas existentes de la BD al iniciar la aplicación."""
         try:
@@ -7,7 +7,6 @@ Versión mejorada con mejor rendimiento, filtrado por fecha, y soporte de imáge
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import shutil
 import mimetypes
 import webbrowser
 import time
@@ -15,9 +14,11 @@ import os
 import re
 import json
 from datetime import datetime, timedelta
-import threading
 from typing import Dict, List, Tuple, Optional
 
+from core.executor import get_executor, PRIORIDAD_UI, PRIORIDAD_PREFETCH
+from core.adjuntos import es_imagen, iniciar_almacen_adjuntos
+
 # Intentar soporte DnD (tkinterdnd2)
 try:
     from tkinterdnd2 import DND_FILES
@@ -52,6 +53,7 @@ class TabAnotaciones:
     MARGEN_X = 20
     MARGEN_Y = 20
     COLUMNAS_MAX = 6
+    MAX_MINIATURAS_NOTA = 4
     
     def __init__(self, parent: ttk.Frame, app, datastore):
         """
@@ -83,8 +85,20 @@ class TabAnotaciones:
         self._cargando = False  # Flag para evitar carga simultánea
         self._pending_refresh = False  # Flag para refresh pendiente
         self._drag_data = {}  # Datos de arrastre temporal
+        self._miniaturas = {}  # {hash: tk.PhotoImage} (referencias para que Tk no las pierda)
+        self._miniaturas_pedidas = set()
+        
+        # Almacén de adjuntos por contenido (core/adjuntos.py)
+        self.almacen = iniciar_almacen_adjuntos(db_local) if HAS_DB else None
         
         self._crear_interfaz()
+        
+        # Pasar al almacén los adjuntos guardados por la versión anterior
+        if HAS_DB:
+            get_executor().submit(self._preparar_almacen, cola='sqlite', prioridad=PRIORIDAD_PREFETCH,
+                                  clave=('migrar_adjuntos',),
+                                  on_ok=lambda migrados: migrados and self._cargar_anotaciones(),
+                                  on_error=lambda e: print(f"⚠️ Migración de adjuntos: {e}"))
 
     def _fecha_actual(self) -> str:
         """Retorna la fecha actual usada por la pestaña (preferir DataStore)."""
@@ -98,39 +112,52 @@ class TabAnotaciones:
             pass
         return datetime.now().strftime('%Y-%m-%d')
 
-    def _ensure_attachments_dir(self):
-        base = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-        attach_dir = os.path.join(base, 'attachments')
-        os.makedirs(attach_dir, exist_ok=True)
-        return attach_dir
+    def _preparar_almacen(self) -> int:
+        """Migra los adjuntos de la versión anterior y borra contenidos que ya nadie usa (executor)."""
+        migrados = self.almacen.migrar_legado()
+        self.almacen.purgar()  # Notas borradas de verdad sueltan sus adjuntos sin purgar
+        return migrados
 
-    def _save_file_to_attachments(self, nota_id: int, src_path: str) -> str:
-        """Copia src_path a attachments/ y actualiza DB; retorna ruta relativa guardada."""
+    def _save_file_to_attachments(self, nota_id: int, src_path: str, al_adjuntar=None):
+        """Guarda src_path en el almacén de adjuntos (el contenido repetido no se copia otra vez)."""
         if not HAS_DB:
-            return ''
-        try:
-            attach_dir = self._ensure_attachments_dir()
-            nombre = os.path.basename(src_path)
-            prefijo = time.strftime('%Y%m%d%H%M%S')
-            dest_name = f"{prefijo}_{nombre}"
-            dest_path = os.path.join(attach_dir, dest_name)
-            shutil.copy2(src_path, dest_path)
-            rel_path = os.path.relpath(dest_path, start=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+            return
+        self._adjuntar_en_segundo_plano(nota_id, lambda: self.almacen.adjuntar(nota_id, src_path), al_adjuntar)
 
-            # Actualizar DB: obtener lista actual y anexar
-            fecha = self._fecha_actual()
-            notas = db_local.obtener_anotaciones(incluir_archivadas=True, fecha=fecha)
-            nota = next((n for n in notas if n['id'] == nota_id), None)
-            attachments = nota.get('attachments') or [] if nota else []
-            attachments.append(rel_path)
-            db_local.actualizar_anotacion(nota_id, attachments=attachments)
+    def _adjuntar_en_segundo_plano(self, nota_id: int, guardar, al_adjuntar=None):
+        """
+        Corre guardar() (hash, copia y registro del adjunto) en el executor y
+        repinta solo las miniaturas de esa nota.
+        """
+        def on_ok(adjunto):
+            if adjunto is None:
+                messagebox.showerror('Error', 'No se pudo guardar el adjunto')
+                return
+            nota = self._notas_cache.get(nota_id)
+            if nota is not None:
+                nota.setdefault('adjuntos', []).append(adjunto)
+                self._pintar_adjuntos(nota_id)
+            if al_adjuntar is not None:
+                al_adjuntar(adjunto)
 
-            # Refrescar UI
-            self._cargar_anotaciones()
-            return rel_path
-        except Exception as e:
-            messagebox.showerror('Error', f'No se pudo guardar adjunto: {e}')
-            return ''
+        executor = get_executor()
+        executor.conectar_tk(self.parent)
+        executor.submit(guardar, cola='sqlite', prioridad=PRIORIDAD_UI, on_ok=on_ok,
+                        on_error=lambda e: messagebox.showerror('Error', f'No se pudo guardar adjunto: {e}'))
+
+    def _quitar_adjunto(self, adjunto: dict):
+        """Desliga un adjunto de su nota; el archivo se borra si ya ninguna nota lo usa."""
+        nota_id = adjunto['nota_id']
+
+        def on_ok(ok):
+            nota = self._notas_cache.get(nota_id)
+            if ok and nota is not None:
+                nota['adjuntos'] = [a for a in nota.get('adjuntos') or [] if a['id'] != adjunto['id']]
+                self._pintar_adjuntos(nota_id)
+
+        get_executor().submit(self.almacen.quitar, adjunto['id'], cola='sqlite', prioridad=PRIORIDAD_UI,
+                              on_ok=on_ok,
+                              on_error=lambda e: messagebox.showerror('Error', f'No se pudo quitar adjunto: {e}'))
 
     def _handle_drop(self, event, nota_id: int):
         """Maneja archivos arrastrados sobre una nota (requiere tkinterdnd2)."""
@@ -146,45 +173,95 @@ class TabAnotaciones:
                 # Aceptar solo archivos (imágenes/videos/otros)
                 self._save_file_to_attachments(nota_id, p)
 
-    def _handle_paste(self, event, nota_id: int, text_widget=None):
+    def _handle_paste(self, event, nota_id: int, text_widget=None, al_adjuntar=None):
         """Maneja pegar en el editor: si hay imagen en portapapeles, la guarda."""
-        if not HAS_PIL:
+        if not HAS_PIL or not HAS_DB:
             return None
         try:
             img = ImageGrab.grabclipboard()
             if img is None:
                 return None  # No hay imagen en portapapeles
+            if isinstance(img, list):
+                # Archivos copiados en el explorador: adjuntarlos tal cual
+                for p in img:
+                    if os.path.isfile(p):
+                        self._save_file_to_attachments(nota_id, p, al_adjuntar)
+                return 'break'
             
-            # Guardar imagen en attachments
-            attach_dir = self._ensure_attachments_dir()
             fname = f"img_{time.strftime('%Y%m%d%H%M%S')}.png"
-            dest_path = os.path.join(attach_dir, fname)
-            
-            # Convertir a RGB si es necesario
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            img.save(dest_path, 'PNG')
-            
-            rel_path = os.path.relpath(dest_path, 
-                start=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-            # Actualizar DB
-            if HAS_DB:
-                fecha = self._fecha_actual()
-                notas = db_local.obtener_anotaciones(incluir_archivadas=True, fecha=fecha)
-                nota = next((n for n in notas if n['id'] == nota_id), None)
-                if nota:
-                    attachments = nota.get('attachments') or []
-                    attachments.append(rel_path)
-                    db_local.actualizar_anotacion(nota_id, attachments=attachments)
+            def al_guardar(adjunto):
+                if al_adjuntar is not None:
+                    al_adjuntar(adjunto)
+                messagebox.showinfo('✓ Imagen pegada', f'Imagen guardada: {fname}')
 
-            # Refrescar UI
-            self._cargar_anotaciones()
-            messagebox.showinfo('✓ Imagen pegada', f'Imagen guardada: {fname}')
+            self._adjuntar_en_segundo_plano(
+                nota_id, lambda: self.almacen.adjuntar_imagen(nota_id, img, fname), al_guardar)
             return 'break'
         except Exception as e:
             messagebox.showerror('Error', f'Error pegando imagen: {e}')
             return None
+
+    def _pintar_adjuntos(self, nota_id: int):
+        """Pinta la tira de miniaturas de una nota; las que faltan se generan en segundo plano."""
+        tira = next((w['adjuntos'] for w in self.notas_widgets.values() if w['nota_id'] == nota_id), None)
+        nota = self._notas_cache.get(nota_id)
+        if tira is None or nota is None or not tira.winfo_exists():
+            return
+        for hijo in tira.winfo_children():
+            hijo.destroy()
+        adjuntos = nota.get('adjuntos') or []
+        for adjunto in adjuntos[:self.MAX_MINIATURAS_NOTA]:
+            imagen = self._miniaturas.get(adjunto['hash'])
+            if imagen is not None:
+                lbl = tk.Label(tira, image=imagen, bg=tira['bg'], cursor='hand2')
+            else:
+                lbl = tk.Label(tira, text='🖼️' if es_imagen(adjunto) else '📄', bg=tira['bg'],
+                               font=("Segoe UI", 12), cursor='hand2')
+                if es_imagen(adjunto):
+                    self._pedir_miniatura(adjunto)
+            lbl.pack(side=tk.LEFT, padx=1, pady=1)
+            lbl.bind('<Button-1>', lambda e, a=adjunto: self._abrir_archivo(self.almacen.ruta(a)))
+        if len(adjuntos) > self.MAX_MINIATURAS_NOTA:
+            tk.Label(tira, text=f"+{len(adjuntos) - self.MAX_MINIATURAS_NOTA}", bg=tira['bg'],
+                     font=("Segoe UI", 8)).pack(side=tk.LEFT, padx=2)
+
+    def _pedir_miniatura(self, adjunto: dict):
+        """Genera (o lee del caché) la miniatura en la cola 'miniaturas' y repinta las notas que la usan."""
+        hash_contenido = adjunto['hash']
+        if hash_contenido in self._miniaturas_pedidas:
+            return
+        self._miniaturas_pedidas.add(hash_contenido)
+
+        def on_ok(ruta):
+            if not ruta:
+                return
+            try:
+                self._miniaturas[hash_contenido] = tk.PhotoImage(file=ruta)
+            except tk.TclError:
+                return
+            for nota_id, nota in self._notas_cache.items():
+                if any(a['hash'] == hash_contenido for a in nota.get('adjuntos') or []):
+                    self._pintar_adjuntos(nota_id)
+
+        get_executor().submit(self.almacen.miniatura, hash_contenido, adjunto['extension'],
+                              cola='miniaturas', prioridad=PRIORIDAD_PREFETCH,
+                              clave=('miniatura', hash_contenido), on_ok=on_ok,
+                              on_error=lambda e: print(f"⚠️ Miniatura de {adjunto['nombre']}: {e}"))
+
+    def _abrir_archivo(self, path: str):
+        """Abre un adjunto con la aplicación del sistema."""
+        if not os.path.exists(path):
+            messagebox.showwarning('No encontrado', 'El archivo no existe en disco')
+            return
+        try:
+            if os.name == 'nt':
+                os.startfile(path)
+            else:
+                import subprocess
+                subprocess.Popen(['xdg-open', path])
+        except Exception as e:
+            messagebox.showerror('Error', f'No se pudo abrir: {e}')
     
     def _crear_interfaz(self):
         """Crea la interfaz de la pestaña."""
@@ -416,8 +493,9 @@ class TabAnotaciones:
     def _cargar_anotaciones(self):
         """
         Carga las anotaciones desde SQLite de forma eficiente.
-        Evita bloqueos UI usando threading si hay muchas notas.
-        Garantiza que todas las notas se cargan correctamente.
+        La consulta corre en el executor compartido; el canvas se actualiza
+        en el hilo de Tk. Si llega otra petición mientras se carga, se
+        repite una sola vez al terminar.
         """
         if not HAS_DB:
             return
@@ -429,51 +507,59 @@ class TabAnotaciones:
         
         self._cargando = True
         
-        def cargar_en_background():
-            try:
-                # Obtener filtro y fecha
-                filtro = self.filtro_notas_var.get()
-                fecha = self._fecha_actual()
-                
-                print(f"[DEBUG] Cargando anotaciones para fecha: {fecha}, filtro: {filtro}")
-                
-                # Obtener notas con la fecha específica
-                notas = db_local.obtener_anotaciones(incluir_archivadas=True, fecha=fecha)
-                
-                print(f"[DEBUG] Total de notas en BD para {fecha}: {len(notas)}")
-                
-                # Filtrar por estado de archivo y eliminación
-                if filtro == "Eliminadas":
-                    notas = [n for n in notas if n.get('eliminada', 0) == 1]
-                elif filtro == "Archivadas":
-                    notas = [n for n in notas if n.get('archivada', 0) == 1 and n.get('eliminada', 0) == 0]
-                elif filtro == "Activas":
-                    notas = [n for n in notas if n.get('archivada', 0) == 0 and n.get('eliminada', 0) == 0]
-                # Si filtro == "Todas", mantener todas las notas excepto eliminadas por defecto
-                elif filtro == "Todas":
-                    notas = [n for n in notas if n.get('eliminada', 0) == 0]
-                
-                print(f"[DEBUG] Notas después de filtro '{filtro}': {len(notas)}")
-                
-                # Actualizar cache
-                self._notas_cache = {n['id']: n for n in notas}
-                
-                # Actualizar UI en thread principal
-                self.parent.after(0, self._actualizar_canvas_notas, notas)
-                
-            except Exception as e:
-                print(f"[ERROR] Error cargando anotaciones: {e}")
-                import traceback
-                traceback.print_exc()
-            finally:
-                self._cargando = False
-                if self._pending_refresh:
-                    self._pending_refresh = False
-                    self.parent.after(100, self._cargar_anotaciones)
-        
-        # Usar thread si hay muchas notas
-        thread = threading.Thread(target=cargar_en_background, daemon=True)
-        thread.start()
+        # Leer variables de Tk aquí (hilo principal), nunca desde el executor
+        filtro = self.filtro_notas_var.get()
+        fecha = self._fecha_actual()
+        
+        def consultar():
+            print(f"[DEBUG] Cargando anotaciones para fecha: {fecha}, filtro: {filtro}")
+            
+            # Obtener notas con la fecha específica
+            notas = db_local.obtener_anotaciones(incluir_archivadas=True, fecha=fecha)
+            
+            print(f"[DEBUG] Total de notas en BD para {fecha}: {len(notas)}")
+            
+            # Filtrar por estado de archivo y eliminación
+            if filtro == "Eliminadas":
+                notas = [n for n in notas if n.get('eliminada', 0) == 1]
+            elif filtro == "Archivadas":
+                notas = [n for n in notas if n.get('archivada', 0) == 1 and n.get('eliminada', 0) == 0]
+            elif filtro == "Activas":
+                notas = [n for n in notas if n.get('archivada', 0) == 0 and n.get('eliminada', 0) == 0]
+            # Si filtro == "Todas", mantener todas las notas excepto eliminadas por defecto
+            elif filtro == "Todas":
+                notas = [n for n in notas if n.get('eliminada', 0) == 0]
+            
+            print(f"[DEBUG] Notas después de filtro '{filtro}': {len(notas)}")
+            return notas
+        
+        def terminar():
+            self._cargando = False
+            if self._pending_refresh:
+                self._pending_refresh = False
+                self.parent.after(100, self._cargar_anotaciones)
+        
+        def on_ok(notas):
+            # Actualizar cache
+            anteriores = self._notas_cache
+            self._notas_cache = {n['id']: n for n in notas}
+            self._actualizar_canvas_notas(notas)
+            # Las notas que ya estaban no se recrean: repintar las que cambiaron de adjuntos
+            for nota in notas:
+                previa = anteriores.get(nota['id'])
+                if previa is not None and ([a['id'] for a in previa.get('adjuntos') or []]
+                                           != [a['id'] for a in nota['adjuntos']]):
+                    self._pintar_adjuntos(nota['id'])
+            terminar()
+        
+        def on_error(e):
+            print(f"[ERROR] Error cargando anotaciones: {e}")
+            terminar()
+        
+        executor = get_executor()
+        executor.conectar_tk(self.parent)
+        executor.submit(consultar, cola='sqlite', prioridad=PRIORIDAD_UI,
+                        on_ok=on_ok, on_error=on_error)
 
     def _actualizar_canvas_notas(self, notas: List[Dict]):
         """Actualiza el canvas con las notas (debe ejecutarse en thread principal)."""
@@ -608,6 +694,10 @@ class TabAnotaciones:
                   bg=self._oscurecer_color(color), 
                   command=lambda: self._eliminar_anotacion(nota_id)).pack(side=tk.LEFT)
         
+        # Tira de miniaturas de los adjuntos, abajo (se pinta en _pintar_adjuntos)
+        tira_adjuntos = tk.Frame(frame, bg=color)
+        tira_adjuntos.pack(side=tk.BOTTOM, fill=tk.X)
+        
         # Contenido de la nota
         if es_checklist:
             self._crear_contenido_checklist(frame, nota_id, contenido, color)
@@ -618,7 +708,8 @@ class TabAnotaciones:
         window_id = self.canvas_notas.create_window(x, y, window=frame, anchor="nw", 
                                                      width=ancho, height=altura)
         
-        self.notas_widgets[window_id] = {'nota_id': nota_id, 'frame': frame}
+        self.notas_widgets[window_id] = {'nota_id': nota_id, 'frame': frame, 'adjuntos': tira_adjuntos}
+        self._pintar_adjuntos(nota_id)
         
         # Hacer la nota arrastrable desde la barra de título y el label
         self._hacer_arrastrable(window_id, barra, nota_id)
@@ -996,8 +1087,10 @@ class TabAnotaciones:
         txt_contenido.insert("1.0", nota.get('contenido', ''))
         txt_contenido.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         # Permitir pegar imágenes desde portapapeles en el editor
-        txt_contenido.bind('<Control-v>', lambda e, nid=nota_id, t=txt_contenido: self._handle_paste(e, nid, t))
-        txt_contenido.bind('<Control-V>', lambda e, nid=nota_id, t=txt_contenido: self._handle_paste(e, nid, t))
+        txt_contenido.bind('<Control-v>', lambda e, nid=nota_id, t=txt_contenido:
+                           self._handle_paste(e, nid, t, al_adjuntar=agregar_a_lista))
+        txt_contenido.bind('<Control-V>', lambda e, nid=nota_id, t=txt_contenido:
+                           self._handle_paste(e, nid, t, al_adjuntar=agregar_a_lista))
         
         # Info para checklist
         lbl_info = ttk.Label(frame, text="Para listas: usa [ ] para items pendientes y [x] para completados",
@@ -1015,69 +1108,49 @@ class TabAnotaciones:
         attach_btns = ttk.Frame(attach_frame)
         attach_btns.pack(side=tk.RIGHT, padx=5)
 
-        def ensure_attachments_dir():
-            base = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-            attach_dir = os.path.join(base, 'attachments')
-            os.makedirs(attach_dir, exist_ok=True)
-            return attach_dir
+        # Adjuntos del almacén (dict; se guardan y se quitan al momento) y rutas
+        # de la versión anterior (str; se guardan con la nota)
+        elementos = list(nota.get('adjuntos') or []) + list(nota.get('attachments') or [])
+        for e in elementos:
+            attachments_listbox.insert(tk.END, e['nombre'] if isinstance(e, dict) else e)
 
-        # Cargar attachments existentes
-        nota_attachments = nota.get('attachments') or []
-        for a in nota_attachments:
-            attachments_listbox.insert(tk.END, a)
+        def agregar_a_lista(adjunto):
+            if attachments_listbox.winfo_exists():
+                elementos.append(adjunto)
+                attachments_listbox.insert(tk.END, adjunto['nombre'])
 
         def agregar_adjuntos():
             files = filedialog.askopenfilenames(title='Seleccionar archivos')
-            if not files:
-                return
-            attach_dir = ensure_attachments_dir()
             for f in files:
-                try:
-                    nombre = os.path.basename(f)
-                    # prefijo para evitar colisiones
-                    prefijo = time.strftime('%Y%m%d%H%M%S%f')[-6:]
-                    dest_name = f"{prefijo}_{nombre}"
-                    dest_path = os.path.join(attach_dir, dest_name)
-                    shutil.copy2(f, dest_path)
-                    rel_path = os.path.relpath(dest_path, start=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-                    attachments_listbox.insert(tk.END, rel_path)
-                except Exception as e:
-                    messagebox.showerror('Error', f'No se pudo adjuntar {f}: {e}')
+                self._save_file_to_attachments(nota_id, f, al_adjuntar=agregar_a_lista)
+
+        def ruta_elemento(item):
+            if isinstance(item, dict):
+                return self.almacen.ruta(item)
+            return os.path.join(os.path.dirname(db_local.RUTA_ADJUNTOS), item)
 
         def abrir_attachment():
             sel = attachments_listbox.curselection()
             if not sel:
                 return
-            item = attachments_listbox.get(sel[0])
-            base = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-            path = os.path.join(base, item)
-            if os.path.exists(path):
-                try:
-                    if os.name == 'nt':
-                        os.startfile(path)
-                    else:
-                        import subprocess
-                        subprocess.Popen(['xdg-open', path])
-                except Exception as e:
-                    messagebox.showerror('Error', f'No se pudo abrir: {e}')
-            else:
-                messagebox.showwarning('No encontrado', 'El archivo no existe en disco')
+            self._abrir_archivo(ruta_elemento(elementos[sel[0]]))
 
         def eliminar_attachment():
             sel = attachments_listbox.curselection()
             if not sel:
                 return
             idx = sel[0]
-            item = attachments_listbox.get(idx)
-            if messagebox.askyesno('Eliminar', f'¿Eliminar {os.path.basename(item)}?'):
-                # Intentar borrar archivo físico
-                base = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-                path = os.path.join(base, item)
-                try:
-                    if os.path.exists(path):
-                        os.remove(path)
-                except Exception:
-                    pass
+            item = elementos[idx]
+            if messagebox.askyesno('Eliminar', f'¿Eliminar {attachments_listbox.get(idx)}?'):
+                if isinstance(item, dict):
+                    self._quitar_adjunto(item)
+                else:
+                    # Ruta de la versión anterior: el archivo es solo de esta nota
+                    try:
+                        os.remove(ruta_elemento(item))
+                    except OSError:
+                        pass
+                del elementos[idx]
                 attachments_listbox.delete(idx)
 
         ttk.Button(attach_btns, text='📎 Adjuntar', command=agregar_adjuntos).pack(fill=tk.X, pady=2)
@@ -1100,8 +1173,8 @@ class TabAnotaciones:
                         contenido_formateado.append(linea)
                 contenido = '\n'.join(contenido_formateado)
             
-            # Obtener lista de attachments desde el listbox
-            attachments = list(attachments_listbox.get(0, tk.END))
+            # Rutas de la versión anterior que quedan (los adjuntos del almacén ya están guardados)
+            attachments = [e for e in elementos if isinstance(e, str)]
             db_local.actualizar_anotacion(
                 nota_id,
                 titulo=titulo_var.get(),
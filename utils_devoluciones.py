@@ -9,15 +9,27 @@ El problema identificado:
 
 Esta función calcula el valor REAL descontando duplicados.
 """
-import fdb
 from typing import Dict, Tuple, List
 from decimal import Decimal
 
+from core.firebird import backend_activo
+
+try:
+    import fdb
+    HAS_FDB = True
+except ImportError:
+    HAS_FDB = False
+
 DB_PATH = r"D:\BDEV\PDVDATA.FDB"
 
 
 def conectar_db():
-    """Conecta a la base de datos Firebird."""
+    """Conecta a la base de datos Firebird (o al backend instalado con usar_backend)."""
+    backend = backend_activo()
+    if backend is not None and hasattr(backend, 'conectar'):
+        return backend.conectar()
+    if not HAS_FDB:
+        raise ImportError("El driver fdb no está instalado: pip install fdb")
     return fdb.connect(
         dsn=DB_PATH,
         user='SYSDBA',